@@ -1,19 +1,191 @@
+import os
+import time
+
 from flask import Flask
 
 import routes.habits
 import routes.analytics
+import routes.admin
+import routes.profiling
+import routes.metrics
+
+from classes.catalog import habit_catalog, replicate_catalog
+from classes.leaderboard import leaderboard
+from classes.partitions import partitions_for, tracker_partitions
+from classes.response_cache import VERSION_SCOPES, response_cache
+from db.db import squlite_db
+from db.shards import shard_router
+
+def check_schema():
+    """
+    Checks that every migration was applied to every shard of the database.
+
+    Raises:
+    -------
+    RuntimeError
+        If a shard's schema version is older than the latest migration.
+    """
+    # Imported here, as db/migrate.py loads the .env file when imported
+    from db.migrate import latestVersion
+
+    latest = latestVersion()
+    for db in shard_router.shards:
+        try:
+            version = db.cursor_for('tuple').execute("PRAGMA user_version").fetchone()[0]
+        finally:
+            db.release_thread_connection()
+        if version < latest:
+            raise RuntimeError(f"The database {db.pool.database} is at schema version {version} but the app needs version {latest}, "
+                               "run python3 ./db/migrate.py first")
+
+def warm_up(connections=None):
+    """
+    Opens pool connections and loads the in-process caches, so the first requests of a worker don't pay for them.
+
+    Python's sqlite3 module has no way to prepare a statement without running it, so each connection runs a
+    query on sqlite_master instead: parsing the schema is the costly part of a connection's first statement.
+    Call it in every worker process, e.g. from gunicorn's post_worker_init hook when the app is preloaded,
+    as connections opened before a fork are not used by the forked workers.
+
+    Parameters:
+    ----------
+    connections : int, optional
+        The number of pool connections to open on each shard. Defaults to the pool size.
+
+    Returns:
+    -------
+    dict
+        The number of connections opened over every shard and the seconds the warm-up took.
+    """
+    start = time.perf_counter()
+    count = 0
+    for db in shard_router.shards:
+        pool = db.pool
+        checked_out = []
+        try:
+            for _ in range(min(connections or pool.size, pool.size)):
+                connection = pool.acquire()
+                checked_out.append(connection)
+                connection.execute("SELECT count(*) FROM sqlite_master").fetchone()
+        finally:
+            for connection in checked_out:
+                pool.release(connection)
+        count += len(checked_out)
+
+    try:
+        if shard_router.sharded:
+            # Shards added since the last habit was created get the catalog before any user is routed to them
+            replicate_catalog(shard_router)
+        habit_catalog.all()
+        for db in shard_router.shards:
+            partitions_for(db).tables()
+        leaderboard.top('longest', 1)
+        response_cache.etag('', VERSION_SCOPES)
+    finally:
+        shard_router.release_thread_connections()
+    return {'connections': count, 'seconds': time.perf_counter() - start}
+
+# The database of the apps created in this process, see create_app
+_database = None
+
+def use_database(database):
+    """
+    Points the process's connection pool at another database file and drops everything cached from the previous one.
+
+    Parameters:
+    ----------
+    database : str
+        The path to the SQLite database file.
+    """
+    squlite_db.use_database(database)
+    # Nothing cached from the previous database applies to this one
+    habit_catalog.invalidate()
+    tracker_partitions.invalidate()
+    leaderboard.invalidate()
+    response_cache.clear()
+
+def create_app(config=None):
+    """
+    Creates the Flask app and registers its routes.
+
+    Nothing touches the database unless the schema check or the warm-up is enabled: connections are opened
+    on first use, by the process that uses them, so the app can be imported and preloaded before forking workers.
+    The connection pools, caches and writer threads are per process, so every app created in a process must
+    serve the same database: run one app per process.
+
+    Parameters:
+    ----------
+    config : dict, optional
+        Settings of the app, on top of the defaults:
+        - DATABASE: path to the SQLite database file (default DB_FILE_NAME).
+        - SCHEMA_CHECK: whether to check that every migration was applied (default DB_SCHEMA_CHECK, off).
+        - WARM_UP: whether to open the pool connections and load the caches (default DB_WARM_UP, off).
+        - WARM_UP_CONNECTIONS: the number of connections the warm-up opens (default DB_WARM_UP_CONNECTIONS, the pool size).
+        - ADMIN_TOKEN: the bearer token of the /api/admin routes, which are not registered without one (default ADMIN_TOKEN).
+
+    Returns:
+    -------
+    Flask
+        The app.
+
+    Raises:
+    -------
+    RuntimeError
+        If another app of this process serves another database, or the schema check fails.
+    """
+    app = Flask(__name__)
+    app.config.from_mapping(
+        DATABASE=os.getenv("DB_FILE_NAME"),
+        SCHEMA_CHECK=os.getenv("DB_SCHEMA_CHECK", "0").lower() in ("1", "true", "yes"),
+        WARM_UP=os.getenv("DB_WARM_UP", "0").lower() in ("1", "true", "yes"),
+        WARM_UP_CONNECTIONS=int(os.getenv("DB_WARM_UP_CONNECTIONS", 0)) or None,
+        ADMIN_TOKEN=os.getenv("ADMIN_TOKEN"),
+    )
+    if config:
+        app.config.update(config)
+
+    # The pools, caches and writer threads are shared by the whole process, so all its apps serve one database
+    global _database
+    database = app.config['DATABASE'] or squlite_db.pool.database
+    if _database is not None and database != _database:
+        raise RuntimeError(f"An app serving {_database} was already created in this process, "
+                           f"another one can't serve {database}: run one app per process")
+    if database != squlite_db.pool.database:
+        use_database(database)
+
+    # Pass the app to the habits, analytics and admin app, to register their respective routes
+    routes.habits.load(app)
+    routes.analytics.load(app)
+    routes.admin.load(app)
+
+    # Request profiling hooks, only registered when REQUEST_PROFILING or PROFILE_SAMPLER is enabled
+    routes.profiling.load(app)
+
+    # Prometheus metrics at /metrics, the request hooks are only registered when METRICS is enabled
+    routes.metrics.load(app)
 
-# Create Flask app
-app = Flask(__name__)
+    # Test route
+    @app.route('/')
+    def root():
+        return {'author': 'Opeyemi Oginni', 'message': 'Welcome to Habit Tracker API'}
 
-# Pass the app to the habits and analytics app, to register their respective routes
-routes.habits.load(app)
-routes.analytics.load(app)
+    if app.config['SCHEMA_CHECK']:
+        check_schema()
+    if app.config['WARM_UP']:
+        warm_up(app.config['WARM_UP_CONNECTIONS'])
+    _database = database
+    return app
 
-# Test route
-@app.route('/')
-def root():
-    return {'author': 'Opeyemi Oginni', 'message': 'Welcome to Habit Tracker API'}
+def __getattr__(name):
+    """
+    Builds the app served by `flask run` and WSGI servers (e.g. gunicorn app:app) the first time it is looked up,
+    so importing this module doesn't build one.
+    """
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == "__main__":
-  app.run(debug=True)
\ No newline at end of file
+  create_app().run(debug=True)
@@ -0,0 +1,24 @@
+from db.executor import db_executor
+from routes.asgi import AsyncApp
+
+import routes.async_habits
+import routes.async_analytics
+import routes.async_admin
+
+# Create the async (ASGI) app, an optional serving mode with the same routes as app.py
+app = AsyncApp()
+
+# Pass the app to the async habits, analytics and admin app, to register their respective routes
+routes.async_habits.load(app)
+routes.async_analytics.load(app)
+routes.async_admin.load(app)
+
+# Stop the DB executor's threads when the server shuts down
+app.on_shutdown(db_executor.shutdown)
+
+# Test route
+@app.route('/')
+async def root(request):
+    return {'author': 'Opeyemi Oginni', 'message': 'Welcome to Habit Tracker API'}
+
+# Command to run this app -> uvicorn asgi:app
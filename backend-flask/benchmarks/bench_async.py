@@ -0,0 +1,149 @@
+import argparse
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+from benchmarks.common import use_database, summarize, print_summary, write_results
+from benchmarks.datagen import add_arguments, generate_database, sample_user_habits
+
+# Side-by-side benchmark of the WSGI app (app.py) and the async ASGI app (asgi.py).
+# Both serve the same read-mostly dashboard mix in process (no sockets), with `concurrency` requests in flight:
+# the WSGI app needs one OS thread per request in flight, the ASGI app runs them all as tasks on one event loop
+# and hands the DB work to the DB executor's fixed set of threads.
+
+def dashboard_urls(pairs, requests):
+    """
+    Builds the URLs of a dashboard-like mix of read requests.
+
+    Returns:
+    -------
+    list
+        The URLs, one per request.
+    """
+    urls = []
+    for i in range(requests):
+        user_name, habit_name = (quote(name) for name in pairs[i % len(pairs)])
+        urls.append([
+            f'/api/analytics/user/{user_name}/summary',
+            f'/api/habits/user/{user_name}/streaks/{habit_name}',
+            f'/api/analytics/user/{user_name}/longest-streak',
+            f'/api/analytics/user/{user_name}/tracked-timestamps/{habit_name}?limit=30',
+        ][i % 4])
+    return urls
+
+class ThreadCounter:
+    """
+    Samples the number of live threads in the background and keeps the highest.
+    """
+    def __init__(self):
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self.__sample, daemon=True)
+
+    def __sample(self):
+        while not self._stop.wait(0.005):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+def run_wsgi(app, urls, concurrency):
+    """
+    Sends the requests to the WSGI app from `concurrency` threads.
+    """
+    local = threading.local()
+    latencies = []
+    errors = []
+
+    def send(url):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        start = time.perf_counter()
+        response = client.get(url)
+        response.get_data()
+        latencies.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            errors.append(response.status_code)
+
+    with ThreadCounter() as threads:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(send, urls))
+        elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed, threads.peak
+
+def run_asgi(app, urls, concurrency):
+    """
+    Sends the requests to the ASGI app as tasks, at most `concurrency` at a time.
+    """
+    client = app.test_client()
+    latencies = []
+    errors = []
+
+    async def send(url, slots):
+        async with slots:
+            start = time.perf_counter()
+            try:
+                response = await client.get(url)
+                status = response.status_code
+            except Exception:
+                status = 500
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+
+    async def main():
+        slots = asyncio.Semaphore(concurrency)
+        await asyncio.gather(*[send(url, slots) for url in urls])
+
+    with ThreadCounter() as threads:
+        start = time.perf_counter()
+        asyncio.run(main())
+        elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed, threads.peak
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the WSGI and ASGI apps under concurrent read requests.')
+    add_arguments(parser)
+    parser.add_argument('--requests', type=int, default=5000, help='requests per run')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[8, 64, 256],
+                        help='requests in flight at a time, one run per value')
+    parser.add_argument('--output', help='file to write the JSON results to')
+    args = parser.parse_args()
+
+    db_file_path, counts = generate_database(args)
+    use_database(db_file_path)
+
+    # The app's modules read DB_FILE_NAME when they are imported
+    from app import app as wsgi_app
+    from asgi import app as asgi_app
+    from db.executor import db_executor
+
+    urls = dashboard_urls(sample_user_habits(db_file_path), args.requests)
+
+    results = {}
+    for concurrency in args.concurrency:
+        for mode, run in (('wsgi', run_wsgi), ('asgi', run_asgi)):
+            latencies, errors, elapsed, peak_threads = run(wsgi_app if mode == 'wsgi' else asgi_app, urls, concurrency)
+            name = f'{mode} concurrency={concurrency}'
+            results[name] = summarize(latencies, elapsed)
+            results[name]['peak_threads'] = peak_threads
+            # e.g. PoolTimeoutError when threads wait on the connection pool for longer than DB_POOL_TIMEOUT
+            results[name]['errors'] = len(errors)
+            print_summary(name, results[name])
+            print(f"{'':<40} peak threads {peak_threads}, errors {len(errors)}")
+    db_executor.shutdown()
+
+    params = dict(vars(args), **counts)
+    print('Results written to', write_results('bench_async', params, results, args.output))
+
+# Command to run this script -> python3 -m benchmarks.bench_async --users 1000 --concurrency 8 64 256 1024
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import sqlite3
+import time
+from benchmarks.common import create_database, use_database, track_for_users
+
+# Number of users checking off their habit in each run
+USER_COUNT = 2000
+
+def legacy_check_off(connection, user_name, habit_name):
+    """
+    Replays the statements the previous Habit.check_off_habit issued for a habit with a
+    broken streak: the habit id is resolved by name over and over, every streak update is
+    its own statement, and each update is committed on its own.
+    """
+    cur = connection.cursor()
+
+    def habit_id():
+        return cur.execute("SELECT id FROM habits WHERE name = ?", (habit_name,)).fetchone()
+
+    _habit_id = habit_id()['id']
+    user_habit_id = cur.execute("SELECT id FROM user_habits WHERE user_name = ? AND habit_id = ?", (user_name, _habit_id,)).fetchone()['id']
+    # track_habit was called with the user habit id instead of the habit name
+    cur.execute("SELECT id FROM habits WHERE name = ?", (user_habit_id,)).fetchone()
+    cur.execute("SELECT completed_at FROM habit_tracker WHERE user_habit_id = ? ORDER BY completed_at DESC LIMIT 1", (user_habit_id,)).fetchone()
+    cur.execute("SELECT periodicity FROM habits WHERE id = ?", (_habit_id,)).fetchone()
+    habit_id()
+    current_streak = cur.execute("SELECT current_streak FROM user_habits WHERE habit_id = ? AND user_name = ?", (_habit_id, user_name,)).fetchone()['current_streak']
+    habit_id()
+    longest_streak = cur.execute("SELECT longest_streak FROM user_habits WHERE habit_id = ? AND user_name = ?", (_habit_id, user_name,)).fetchone()['longest_streak']
+
+    habit_id()
+    cur.execute("UPDATE user_habits SET current_streak = 0 WHERE habit_id = ? AND user_name = ?", (_habit_id, user_name,))
+    connection.commit()
+    habit_id()
+    cur.execute("UPDATE user_habits SET current_streak = current_streak + 1 WHERE habit_id = ? AND user_name = ?", (_habit_id, user_name,))
+    connection.commit()
+    if current_streak + 1 > longest_streak:
+        habit_id()
+        cur.execute("UPDATE user_habits SET longest_streak = current_streak WHERE habit_id = ? AND user_name = ?", (_habit_id, user_name,))
+        connection.commit()
+
+def run(label, check_off, user_names):
+    start = time.perf_counter()
+    for user_name in user_names:
+        check_off(user_name)
+    elapsed = time.perf_counter() - start
+    print(f'{label:<8} {len(user_names)} check-offs in {elapsed:.3f}s -> {len(user_names) / elapsed:,.0f} check-offs/s')
+
+def main():
+    db_file_path = create_database()
+    use_database(db_file_path)
+
+    # The app's modules read DB_FILE_NAME when they are imported
+    from db.db import squlite_db
+    from classes.habits import Habit
+
+    legacy_users = track_for_users(db_file_path, 'Read', USER_COUNT, prefix='legacy')
+    new_users = track_for_users(db_file_path, 'Read', USER_COUNT, prefix='new')
+
+    connection = squlite_db.pool.acquire()
+    run('before', lambda user_name: legacy_check_off(connection, user_name, 'Read'), legacy_users)
+    squlite_db.pool.release(connection)
+
+    run('after', lambda user_name: Habit(user_name).check_off_habit('Read'), new_users)
+
+# Command to run this script -> python3 -m benchmarks.bench_check_off
+if __name__ == "__main__":
+    main()
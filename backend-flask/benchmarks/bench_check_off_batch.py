@@ -0,0 +1,33 @@
+import datetime
+import random
+import time
+from benchmarks.common import create_database, use_database, track_for_users
+
+# Number of users syncing offline check-offs, and days of check-offs each of them syncs
+USER_COUNT = 1000
+DAY_COUNT = 30
+
+def main():
+    db_file_path = create_database()
+    use_database(db_file_path)
+
+    # The app's modules read DB_FILE_NAME when they are imported
+    from classes.habits import Habit
+
+    user_names = track_for_users(db_file_path, 'Read', USER_COUNT)
+    start_day = datetime.datetime(2024, 1, 1, 9, 0, 0)
+    events = [(user_name, 'Read', start_day + datetime.timedelta(days=day))
+              for user_name in user_names for day in range(DAY_COUNT)]
+    # Offline clients sync out of order
+    random.Random(0).shuffle(events)
+
+    start = time.perf_counter()
+    results = Habit().check_off_many(events)
+    elapsed = time.perf_counter() - start
+
+    checked_off = sum(1 for result in results if not result.get('error'))
+    print(f'{checked_off} of {len(events)} events checked off in {elapsed:.3f}s -> {len(events) / elapsed:,.0f} events/s')
+
+# Command to run this script -> python3 -m benchmarks.bench_check_off_batch
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import os
+import resource
+import sqlite3
+import time
+from benchmarks.common import create_database, use_database, write_results
+from benchmarks.datagen import add_arguments, generate_database
+
+# Export of a synthetic database to a history file and bulk load of that file into an empty database,
+# with rows per second, bytes per completion and the peak memory of the process.
+
+def peak_memory_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the history file export and import.')
+    add_arguments(parser)
+    parser.add_argument('--output', help='file to write the JSON results to')
+    args = parser.parse_args()
+
+    db_file_path, counts = generate_database(args)
+    use_database(db_file_path)
+
+    # The app's modules read DB_FILE_NAME when they are imported
+    from classes.history_file import export_history, import_history
+
+    history_file_path = os.path.join(os.path.dirname(db_file_path), 'history.bin')
+    results = {}
+
+    connection = sqlite3.connect(db_file_path)
+    start = time.perf_counter()
+    with open(history_file_path, 'wb') as file:
+        exported = export_history(connection, file)
+    elapsed = time.perf_counter() - start
+    connection.close()
+    size = os.path.getsize(history_file_path)
+    results['export'] = {'count': exported['completions'], 'throughput': exported['completions'] / elapsed,
+                         'bytes_per_completion': size / max(exported['completions'], 1), 'peak_memory_mb': peak_memory_mb()}
+    print(f"export {exported['completions']:,} completions in {elapsed:.2f}s -> {results['export']['throughput']:,.0f} rows/s, "
+          f"{size:,} bytes ({results['export']['bytes_per_completion']:.2f} bytes/completion, "
+          f"database {os.path.getsize(db_file_path):,} bytes), peak memory {results['export']['peak_memory_mb']:.0f} MB")
+
+    connection = sqlite3.connect(create_database('import.db', seed=False))
+    start = time.perf_counter()
+    with open(history_file_path, 'rb') as file:
+        imported = import_history(connection, file)
+    elapsed = time.perf_counter() - start
+    connection.close()
+    results['import'] = {'count': imported['completions'], 'throughput': imported['completions'] / elapsed,
+                         'peak_memory_mb': peak_memory_mb()}
+    print(f"import {imported['completions']:,} completions in {elapsed:.2f}s -> {results['import']['throughput']:,.0f} rows/s, "
+          f"peak memory {results['import']['peak_memory_mb']:.0f} MB")
+
+    params = dict(vars(args), **counts)
+    print('Results written to', write_results('bench_history_file', params, results, args.output))
+
+# Command to run this script -> python3 -m benchmarks.bench_history_file --users 10000 --habits 20 --years 3
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import argparse
+import collections
+import datetime
+import http.client
+import itertools
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+from benchmarks.common import use_database, summarize, print_summary, write_results
+from benchmarks.datagen import END_DATE, add_arguments, generate_database, sample_user_habits
+
+# Concurrent load driver for the Flask API.
+# A pool of worker threads sends a weighted mix of read and write requests, either through Flask's test client
+# (in process, no sockets) or over HTTP to a local threaded werkzeug server, and every request's latency is recorded.
+
+# Relative weights of the read requests in the mix
+READ_WEIGHTS = {
+    'GET /api/habits': 5,
+    'GET streaks': 20,
+    'GET tracking': 15,
+    'GET longest-streak': 15,
+    'GET summary': 15,
+    'GET tracked-timestamps?limit=100': 10,
+}
+
+class TestClientTransport:
+    """
+    Sends requests through a Flask test client, one per worker thread.
+    """
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, url, body=None):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(url, method=method, json=body)
+        response.get_data()
+        return response.status_code
+
+    def close(self):
+        pass
+
+class ServerTransport:
+    """
+    Serves the app with a threaded werkzeug server on a local port and sends requests over
+    keep-alive HTTP connections, one per worker thread.
+    """
+    def __init__(self, app):
+        from werkzeug.serving import make_server, WSGIRequestHandler
+        # Keep-alive connections need HTTP/1.1, and request logging would dominate the timings
+        WSGIRequestHandler.protocol_version = 'HTTP/1.1'
+        WSGIRequestHandler.log_request = lambda *args, **kwargs: None
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self._local = threading.local()
+
+    def request(self, method, url, body=None):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection('127.0.0.1', self.server.server_port)
+        headers = {}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        try:
+            connection.request(method, url, payload, headers)
+            response = connection.getresponse()
+            response.read()
+        except (http.client.HTTPException, OSError):
+            connection.close()
+            self._local.connection = None
+            raise
+        return response.status
+
+    def close(self):
+        self.server.shutdown()
+
+def build_mix(pairs, daily_pairs, write_percent):
+    """
+    Builds the weighted request mix.
+
+    Parameters:
+    ----------
+    pairs : list
+        (user_name, habit_name) tuples the read requests are spread over.
+    daily_pairs : list
+        (user_name, habit_name) tuples of DAILY habits the check-offs are spread over.
+    write_percent : int
+        Share of check-off requests in the mix, in percent.
+
+    Returns:
+    -------
+    tuple
+        The request builders and their weights. A builder takes the number of the request and
+        returns (method, url, body).
+    """
+    first_day = datetime.datetime.strptime(END_DATE, '%Y-%m-%d') + datetime.timedelta(days=1, hours=9)
+    # Every check-off lands one day after the previous check-off of the same habit, so none of them is a repeat
+    check_off_counter = itertools.count()
+    check_off_lock = threading.Lock()
+
+    def check_off(i):
+        with check_off_lock:
+            n = next(check_off_counter)
+        user_name, habit_name = daily_pairs[n % len(daily_pairs)]
+        completed_at = first_day + datetime.timedelta(days=n // len(daily_pairs))
+        event = {'username': user_name, 'habit_name': habit_name, 'completed_at': completed_at.isoformat(' ')}
+        return 'POST', '/api/habits/check-off/batch', {'events': [event]}
+
+    def pair(i):
+        # Habit names can contain spaces
+        user_name, habit_name = pairs[i % len(pairs)]
+        return quote(user_name), quote(habit_name)
+
+    builders = {
+        'GET /api/habits': lambda i: ('GET', '/api/habits', None),
+        'GET streaks': lambda i: ('GET', '/api/habits/user/{}/streaks/{}'.format(*pair(i)), None),
+        'GET tracking': lambda i: ('GET', f'/api/analytics/habits/tracking/{pair(i)[0]}', None),
+        'GET longest-streak': lambda i: ('GET', f'/api/analytics/user/{pair(i)[0]}/longest-streak', None),
+        'GET summary': lambda i: ('GET', f'/api/analytics/user/{pair(i)[0]}/summary', None),
+        'GET tracked-timestamps?limit=100': lambda i: (
+            'GET', '/api/analytics/user/{}/tracked-timestamps/{}?limit=100'.format(*pair(i)), None),
+        'POST check-off/batch': check_off,
+    }
+    read_total = sum(READ_WEIGHTS.values())
+    weights = {name: (100 - write_percent) * weight / read_total for name, weight in READ_WEIGHTS.items()}
+    weights['POST check-off/batch'] = write_percent
+    return builders, weights
+
+def run_load(transport, builders, weights, requests, threads, seed=0):
+    """
+    Sends `requests` requests from `threads` worker threads.
+
+    Returns:
+    -------
+    tuple
+        The latencies of each kind of request, the count of each (kind, status code), the number of
+        failed requests, and the wall-clock seconds the run took.
+    """
+    names = list(weights)
+    schedule = random.Random(seed).choices(names, weights=[weights[name] for name in names], k=requests)
+
+    latencies = collections.defaultdict(list)
+    statuses = collections.Counter()
+    errors = collections.Counter()
+    lock = threading.Lock()
+
+    def send(i):
+        name = schedule[i]
+        method, url, body = builders[name](i)
+        start = time.perf_counter()
+        try:
+            status = transport.request(method, url, body)
+        except Exception as error:
+            with lock:
+                errors[f'{name}: {type(error).__name__}'] += 1
+            return
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies[name].append(elapsed)
+            statuses[(name, status)] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(send, range(requests)))
+    return latencies, statuses, errors, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the Flask API with concurrent requests.')
+    add_arguments(parser)
+    parser.add_argument('--requests', type=int, default=5000, help='total number of requests')
+    parser.add_argument('--threads', type=int, default=8, help='number of concurrent worker threads')
+    parser.add_argument('--write-percent', type=int, default=20, help='share of check-off requests, in percent')
+    parser.add_argument('--server', action='store_true',
+                        help='send requests over HTTP to a local werkzeug server instead of the test client')
+    parser.add_argument('--output', help='file to write the JSON results to')
+    args = parser.parse_args()
+
+    db_file_path, counts = generate_database(args)
+    use_database(db_file_path)
+
+    # The app's modules read DB_FILE_NAME when they are imported
+    from app import app
+    from db.db import squlite_db
+
+    builders, weights = build_mix(sample_user_habits(db_file_path), sample_user_habits(db_file_path, periodicity='DAILY'),
+                                  args.write_percent)
+    transport = ServerTransport(app) if args.server else TestClientTransport(app)
+    try:
+        latencies, statuses, errors, elapsed = run_load(transport, builders, weights, args.requests, args.threads)
+    finally:
+        transport.close()
+
+    results = {}
+    for name in weights:
+        if name in latencies:
+            results[name] = summarize(latencies[name], elapsed)
+            results[name]['statuses'] = {str(status): count for (kind, status), count in statuses.items() if kind == name}
+            print_summary(name, results[name])
+    results['total'] = summarize([latency for values in latencies.values() for latency in values], elapsed)
+    results['total']['errors'] = dict(errors)
+    results['total']['pool'] = squlite_db.pool.metrics()
+    print_summary('total', results['total'])
+    if errors:
+        print('Errors:', dict(errors))
+
+    params = dict(vars(args), **counts)
+    print('Results written to', write_results('bench_load', params, results, args.output))
+
+# Command to run this script -> python3 -m benchmarks.bench_load --users 1000 --habits 20 --years 3 --threads 16
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import argparse
+import datetime
+import os
+from urllib.parse import quote
+from benchmarks.common import use_database, time_calls, summarize, print_summary, write_results
+from benchmarks.datagen import END_DATE, add_arguments, generate_database, sample_user_habits
+
+# Micro-benchmarks of every Habit method and every analytics route, one operation at a time,
+# on a database built by the synthetic data generator.
+
+def habit_operations(Habit, pairs, daily_pairs, batch_size):
+    """
+    Builds the Habit method calls to time, each taking the number of the iteration.
+
+    Returns:
+    -------
+    dict
+        The calls, keyed by operation name.
+    """
+    first_day = datetime.datetime.strptime(END_DATE, '%Y-%m-%d') + datetime.timedelta(days=1, hours=9)
+
+    def pair(i):
+        return pairs[i % len(pairs)]
+
+    def check_off(i):
+        # Each call checks off a DAILY habit one day after the previous check-off of the same habit
+        user_name, habit_name = daily_pairs[i % len(daily_pairs)]
+        completed_at = first_day + datetime.timedelta(days=i // len(daily_pairs))
+        Habit(user_name).check_off_habit(habit_name, completed_at)
+
+    def check_off_many(i):
+        completed_at = first_day + datetime.timedelta(days=1000 + i)
+        events = [(user_name, habit_name, completed_at) for user_name, habit_name in daily_pairs[:batch_size]]
+        Habit().check_off_many(events)
+
+    def track_and_untrack(i):
+        habit = Habit(f'bench-tracker{i}')
+        habit.track_habit('Read')
+        habit.untrack_habit('Read')
+
+    return {
+        'Habit.get_all_habits': lambda i: Habit().get_all_habits(),
+        'Habit.get_habit': lambda i: Habit().get_habit(pair(i)[1]),
+        'Habit.get_habit_by_periodicity': lambda i: Habit().get_habit_by_periodicity('WEEKLY' if i % 2 else 'DAILY'),
+        'Habit.create_habit': lambda i: Habit().create_habit(f'Bench habit {i}', 'Created by bench_micro', 'DAILY'),
+        'Habit.get_habit_current_streak': lambda i: Habit(pair(i)[0]).get_habit_current_streak(pair(i)[1]),
+        'Habit.get_habit_longest_streak': lambda i: Habit(pair(i)[0]).get_habit_longest_streak(pair(i)[1]),
+        'Habit.track_habit + untrack_habit': track_and_untrack,
+        'Habit.check_off_habit': check_off,
+        f'Habit.check_off_many ({batch_size} events)': check_off_many,
+    }
+
+def route_operations(client, pairs):
+    """
+    Builds the analytics route requests to time, each taking the number of the iteration.
+
+    Returns:
+    -------
+    dict
+        The requests, keyed by operation name.
+    """
+    def get(url):
+        response = client.get(url)
+        # Streamed responses are only produced once their body is read
+        response.get_data()
+        assert response.status_code == 200, (url, response.status_code)
+
+    def user(i):
+        return quote(pairs[i % len(pairs)][0])
+
+    def habit(i):
+        # Habit names can contain spaces
+        return quote(pairs[i % len(pairs)][1])
+
+    return {
+        'GET tracking': lambda i: get(f'/api/analytics/habits/tracking/{user(i)}'),
+        'GET longest-streak': lambda i: get(f'/api/analytics/user/{user(i)}/longest-streak'),
+        'GET longest-streak/<habit>': lambda i: get(f'/api/analytics/user/{user(i)}/longest-streak/{habit(i)}'),
+        'GET summary': lambda i: get(f'/api/analytics/user/{user(i)}/summary'),
+        'GET tracked-timestamps': lambda i: get(f'/api/analytics/user/{user(i)}/tracked-timestamps/{habit(i)}'),
+        'GET tracked-timestamps?limit=100': lambda i: get(
+            f'/api/analytics/user/{user(i)}/tracked-timestamps/{habit(i)}?limit=100'),
+        'GET tracked-timestamps?stream=1': lambda i: get(
+            f'/api/analytics/user/{user(i)}/tracked-timestamps/{habit(i)}?stream=1'),
+        'GET heatmap (365 days)': lambda i: get(f'/api/analytics/user/{user(i)}/heatmap?end={END_DATE}'),
+        'GET heatmap/<habit>?bucket=week': lambda i: get(f'/api/analytics/user/{user(i)}/heatmap/{habit(i)}?end={END_DATE}&bucket=week'),
+        'GET leaderboard': lambda i: get('/api/analytics/leaderboard'),
+        'GET leaderboard/<habit>?metric=current': lambda i: get(f'/api/analytics/leaderboard/{habit(i)}?metric=current'),
+        'GET rank': lambda i: get(f'/api/analytics/user/{user(i)}/rank'),
+    }
+
+def revalidation_operations(client, pairs):
+    """
+    Builds requests that send the ETag of a previous response, answered with 304 by the response cache.
+
+    Returns:
+    -------
+    dict
+        The requests, keyed by operation name.
+    """
+    etags = {}
+
+    def revalidate(url):
+        response = client.get(url, headers={'If-None-Match': etags.get(url, '')})
+        if response.status_code == 200:
+            etags[url] = response.headers['ETag']
+        else:
+            assert response.status_code == 304, (url, response.status_code)
+
+    def user(i):
+        return quote(pairs[i % len(pairs)][0])
+
+    return {
+        'GET habits (If-None-Match)': lambda i: revalidate('/api/habits'),
+        'GET summary (If-None-Match)': lambda i: revalidate(f'/api/analytics/user/{user(i)}/summary'),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmark the Habit methods and analytics routes.')
+    add_arguments(parser)
+    parser.add_argument('--iterations', type=int, default=500, help='timed calls per operation')
+    parser.add_argument('--batch-size', type=int, default=100, help='events per check_off_many call')
+    parser.add_argument('--output', help='file to write the JSON results to')
+    parser.add_argument('--response-cache', action='store_true',
+                        help='serve the routes through the response cache, and time ETag revalidations')
+    args = parser.parse_args()
+
+    db_file_path, counts = generate_database(args)
+    use_database(db_file_path)
+    os.environ["RESPONSE_CACHE"] = '1' if args.response_cache else '0'
+
+    # The app's modules read DB_FILE_NAME when they are imported
+    from app import app
+    from classes.habits import Habit
+    from db.db import squlite_db
+
+    pairs = sample_user_habits(db_file_path)
+    daily_pairs = sample_user_habits(db_file_path, periodicity='DAILY')
+
+    results = {}
+    for name, call in habit_operations(Habit, pairs, daily_pairs, args.batch_size).items():
+        results[name] = summarize(time_calls(call, args.iterations))
+        print_summary(name, results[name])
+    squlite_db.release_thread_connection()
+
+    client = app.test_client()
+    operations = route_operations(client, pairs)
+    if args.response_cache:
+        operations.update(revalidation_operations(client, pairs))
+    for name, call in operations.items():
+        results[name] = summarize(time_calls(call, args.iterations))
+        print_summary(name, results[name])
+
+    params = dict(vars(args), **counts)
+    print('Results written to', write_results('bench_micro', params, results, args.output))
+
+# Command to run this script -> python3 -m benchmarks.bench_micro --users 1000 --habits 20 --years 3
+if __name__ == "__main__":
+    main()
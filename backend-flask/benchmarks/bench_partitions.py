@@ -0,0 +1,82 @@
+import argparse
+import datetime
+import sqlite3
+from urllib.parse import quote
+from benchmarks.common import use_database, time_calls, summarize, print_summary, write_results
+from benchmarks.datagen import END_DATE, add_arguments, generate_database, sample_user_habits
+
+# Latency of check-offs and history reads with the whole history in the hot habit_tracker table,
+# and again once everything but the last `--keep-months` months is archived into yearly partitions.
+
+def operations(Habit, client, daily_pairs, pairs, offset):
+    """
+    Builds the calls to time, each taking the number of the iteration.
+
+    Returns:
+    -------
+    dict
+        The calls, keyed by operation name.
+    """
+    first_day = datetime.datetime.strptime(END_DATE, '%Y-%m-%d') + datetime.timedelta(days=1 + offset, hours=9)
+
+    def check_off(i):
+        # Each call checks off a DAILY habit one day after the previous check-off of the same habit
+        user_name, habit_name = daily_pairs[i % len(daily_pairs)]
+        Habit(user_name).check_off_habit(habit_name, first_day + datetime.timedelta(days=i // len(daily_pairs)))
+
+    def url(template, i):
+        user_name, habit_name = (quote(name) for name in pairs[i % len(pairs)])
+        return template.format(user=user_name, habit=habit_name)
+
+    return {
+        'Habit.check_off_habit': check_off,
+        'Habit.get_habit_current_streak': lambda i: Habit(pairs[i % len(pairs)][0]).get_habit_current_streak(pairs[i % len(pairs)][1]),
+        'GET tracked-timestamps?limit=30': lambda i: client.get(url('/api/analytics/user/{user}/tracked-timestamps/{habit}?limit=30', i)),
+        'GET tracked-timestamps (full history)': lambda i: client.get(url('/api/analytics/user/{user}/tracked-timestamps/{habit}', i)),
+        'GET summary': lambda i: client.get(url('/api/analytics/user/{user}/summary', i)),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark check-offs and history reads before and after archiving cold completions.')
+    add_arguments(parser)
+    parser.add_argument('--keep-months', type=int, default=3, help='months of completions kept in the hot table')
+    parser.add_argument('--iterations', type=int, default=500, help='timed calls per operation')
+    parser.add_argument('--output', help='file to write the JSON results to')
+    args = parser.parse_args()
+
+    db_file_path, counts = generate_database(args)
+    use_database(db_file_path)
+
+    # The app's modules read DB_FILE_NAME when they are imported
+    from app import app
+    from classes.habits import Habit
+    from classes.partitions import archive_tracker, month_start, tracker_partitions
+
+    client = app.test_client()
+    pairs = sample_user_habits(db_file_path)
+    daily_pairs = sample_user_habits(db_file_path, periodicity='DAILY')
+
+    results = {}
+    for step, mode in enumerate(('unpartitioned', 'archived')):
+        if mode == 'archived':
+            connection = sqlite3.connect(db_file_path)
+            cutoff = month_start(datetime.datetime.strptime(END_DATE, '%Y-%m-%d'), args.keep_months)
+            moved = archive_tracker(connection, cutoff)
+            hot_rows = connection.execute("SELECT COUNT(*) FROM habit_tracker").fetchone()[0]
+            connection.execute("ANALYZE")
+            connection.close()
+            tracker_partitions.invalidate()
+            print(f'Archived {sum(moved.values())} completions before {cutoff:%Y-%m-%d} into {len(moved)} partitions, {hot_rows} left in habit_tracker')
+
+        # Each mode checks off days after the ones checked off by the previous mode
+        for name, call in operations(Habit, client, daily_pairs, pairs, step * 10_000).items():
+            label = f'{mode} {name}'
+            results[label] = summarize(time_calls(call, args.iterations))
+            print_summary(label, results[label])
+
+    params = dict(vars(args), **counts)
+    print('Results written to', write_results('bench_partitions', params, results, args.output))
+
+# Command to run this script -> python3 -m benchmarks.bench_partitions --users 1000 --years 5 --keep-months 3
+if __name__ == "__main__":
+    main()
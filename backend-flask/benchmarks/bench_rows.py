@@ -0,0 +1,54 @@
+import sqlite3
+import time
+from benchmarks.common import create_database
+from db.db import ROW_FACTORIES, RowModeConnection, rows_to_dicts
+
+# Number of habit_tracker rows fetched in each run
+ROW_COUNT = 200_000
+
+def legacy_row_to_dict(cursor, row):
+    """
+    The previous row factory, which walked cursor.description for every row.
+    """
+    data = {}
+    for idx, col in enumerate(cursor.description):
+        data[col[0]] = row[idx]
+    return data
+
+def run(label, connection, fetch):
+    start = time.perf_counter()
+    rows = fetch(connection)
+    elapsed = time.perf_counter() - start
+    print(f'{label:<22} {len(rows):,} rows in {elapsed:.3f}s -> {len(rows) / elapsed:,.0f} rows/s')
+
+def fetch_with(row_factory):
+    def fetch(connection):
+        cur = connection.cursor()
+        cur.row_factory = row_factory
+        return cur.execute("SELECT * FROM habit_tracker").fetchall()
+    return fetch
+
+def fetch_tuples_then_dicts(connection):
+    cur = connection.cursor()
+    cur.row_factory = None
+    return rows_to_dicts(cur, cur.execute("SELECT * FROM habit_tracker").fetchall())
+
+def main():
+    db_file_path = create_database()
+    connection = sqlite3.connect(db_file_path, factory=RowModeConnection)
+    connection.execute(
+        """WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+           INSERT INTO habit_tracker (user_habit_id, completed_at)
+           SELECT 1 + i % 5, datetime('2020-01-01 09:00:00', '+' || i || ' minutes') FROM n""",
+        (ROW_COUNT,)
+    )
+    connection.commit()
+
+    run('legacy dict factory', connection, fetch_with(legacy_row_to_dict))
+    for mode, row_factory in ROW_FACTORIES.items():
+        run(f'{mode}', connection, fetch_with(row_factory))
+    run('tuple + rows_to_dicts', connection, fetch_tuples_then_dicts)
+
+# Command to run this script -> python3 -m benchmarks.bench_rows
+if __name__ == "__main__":
+    main()
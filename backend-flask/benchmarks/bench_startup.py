@@ -0,0 +1,76 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from benchmarks.common import create_database, summarize, print_summary, write_results
+
+# Cold start benchmark: each run starts a new Python process that imports the app and serves its first
+# requests, as a freshly forked or restarted worker does. Runs with the warm-up enabled move the cost of
+# opening connections and loading the caches from the first request to the startup.
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+
+# Runs in the new process: times the import of the app and its first two requests, and prints them as JSON
+STARTUP_SCRIPT = '''
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+first = client.get('/api/habits/Read')
+first_done = time.perf_counter()
+second = client.get('/api/habits/periodicity/DAILY')
+second_done = time.perf_counter()
+print(json.dumps({
+    'import app': imported - start,
+    'first request': first_done - imported,
+    'second request': second_done - first_done,
+    'import to first response': first_done - start,
+    'status': [first.status_code, second.status_code],
+}))
+'''
+
+def start_process(db_file_path, warm_up):
+    """
+    Starts the app in a new process and times it.
+
+    Returns:
+    -------
+    dict
+        The seconds each step took, including 'process start to first response', the time from starting the process.
+    """
+    env = dict(os.environ, DB_FILE_NAME=db_file_path, DB_WARM_UP='1' if warm_up else '0')
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    elapsed = time.perf_counter() - start
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    if timings.pop('status') != [200, 200]:
+        raise RuntimeError('The app did not serve its first requests')
+    timings['process start to exit'] = elapsed
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the cold start of the app, from import to first response.')
+    parser.add_argument('--runs', type=int, default=10, help='processes started per mode')
+    parser.add_argument('--output', help='file to write the JSON results to')
+    args = parser.parse_args()
+
+    db_file_path = create_database()
+    results = {}
+    for warm_up in (False, True):
+        mode = 'warm-up' if warm_up else 'lazy'
+        runs = [start_process(db_file_path, warm_up) for _ in range(args.runs)]
+        for step in runs[0]:
+            summary = summarize([run[step] for run in runs])
+            results[f'{mode}: {step}'] = summary
+            print_summary(f'{mode}: {step}', summary)
+
+    path = write_results('bench_startup', vars(args), results, args.output)
+    print(f'Results written to {path}')
+
+# Command to run this script -> python3 -m benchmarks.bench_startup --runs 10
+if __name__ == "__main__":
+    main()
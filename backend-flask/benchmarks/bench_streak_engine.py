@@ -0,0 +1,45 @@
+import sqlite3
+import sys
+import time
+from benchmarks.common import create_database
+from classes.streak_engine import recompute_streaks
+
+# Number of habit_tracker rows to generate, can be overridden with the first argument
+TRACKER_ROW_COUNT = 1_000_000
+# Completions of each tracked habit, one per day
+DAYS_PER_USER_HABIT = 1000
+
+def main():
+    tracker_row_count = int(sys.argv[1]) if len(sys.argv) > 1 else TRACKER_ROW_COUNT
+    user_habit_count = tracker_row_count // DAYS_PER_USER_HABIT
+
+    db_file_path = create_database()
+    connection = sqlite3.connect(db_file_path)
+
+    start = time.perf_counter()
+    connection.execute(
+        """WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+           INSERT INTO user_habits (habit_id, user_name) SELECT 1 + i % 5, 'user' || i FROM n""",
+        (user_habit_count,)
+    )
+    # Every user habit gets a day with no completion every 50 days
+    connection.execute(
+        """WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i < ? - 1)
+           INSERT INTO habit_tracker (user_habit_id, completed_at)
+           SELECT user_habits.id, datetime('2020-01-01 09:00:00', '+' || n.i || ' days')
+           FROM user_habits, n WHERE user_habits.id > 5 AND n.i % 50 != 49""",
+        (DAYS_PER_USER_HABIT,)
+    )
+    connection.commit()
+    rows = connection.execute("SELECT COUNT(*) FROM habit_tracker").fetchone()[0]
+    print(f'Generated {rows:,} completions for {user_habit_count:,} tracked habits in {time.perf_counter() - start:.1f}s')
+
+    start = time.perf_counter()
+    result = recompute_streaks(connection)
+    elapsed = time.perf_counter() - start
+    print(f"Recomputed {result['user_habits']:,} tracked habits from {result['tracker_rows']:,} completions "
+          f"in {elapsed:.2f}s -> {result['tracker_rows'] / elapsed:,.0f} completions/s, {result['updated']:,} updated")
+
+# Command to run this script -> python3 -m benchmarks.bench_streak_engine [tracker rows]
+if __name__ == "__main__":
+    main()
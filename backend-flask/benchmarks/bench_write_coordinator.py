@@ -0,0 +1,68 @@
+import argparse
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.common import create_database, use_database, track_for_users
+
+# Concurrent check-offs from many request threads, each committing its own transaction
+# against the same check-offs queued to the write coordinator and group committed.
+
+def run(user_names, habit_name, threads, days):
+    """
+    Checks off `days` days of the habit for every user, from `threads` threads at a time.
+
+    Returns:
+    -------
+    tuple
+        The seconds it took and the number of check-offs that failed.
+    """
+    from classes.habits import Habit
+    from db.db import squlite_db
+
+    start_day = datetime.datetime(2024, 1, 1, 9, 0, 0)
+
+    def check_off(user_name):
+        errors = 0
+        for day in range(days):
+            try:
+                Habit(user_name).check_off_habit(habit_name, start_day + datetime.timedelta(days=day))
+            except Exception:
+                errors += 1
+        squlite_db.release_thread_connection()
+        return errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        errors = sum(executor.map(check_off, user_names))
+    return time.perf_counter() - start, errors
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare check-offs committed one by one with group committed ones.')
+    parser.add_argument('--users', type=int, default=400, help='users checking off concurrently')
+    parser.add_argument('--days', type=int, default=5, help='check-offs per user')
+    parser.add_argument('--threads', type=int, default=16, help='request threads')
+    args = parser.parse_args()
+
+    db_file_path = create_database()
+    use_database(db_file_path)
+
+    # The app's modules read DB_FILE_NAME when they are imported
+    from db.writer import write_coordinator
+
+    # Each mode checks off a different group of users, so both start from the same state
+    for mode in ('direct', 'coordinator'):
+        user_names = track_for_users(db_file_path, 'Read', args.users, prefix=f'{mode}_user')
+        write_coordinator.enabled = mode == 'coordinator'
+        elapsed, errors = run(user_names, 'Read', args.threads, args.days)
+        write_coordinator.stop()
+
+        check_offs = len(user_names) * args.days
+        print(f'{mode:<12} {check_offs} check-offs in {elapsed:.3f}s -> {check_offs / elapsed:,.0f} check-offs/s, {errors} errors')
+        if mode == 'coordinator':
+            metrics = write_coordinator.metrics()
+            print(f"{'':<12} {metrics['batches']} batches, mean batch size {metrics['mean_batch_size']:.1f}, "
+                  f"max batch size {metrics['max_batch_size']}, max queue depth {metrics['max_queue_depth']}")
+
+# Command to run this script -> python3 -m benchmarks.bench_write_coordinator --threads 32
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+import datetime
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import tempfile
+import time
+
+__location__ = os.path.realpath(
+    os.path.join(os.getcwd(), os.path.dirname(__file__)))
+
+SCHEMA_FILE_PATH = os.path.join(__location__, '..', 'db', 'sql', 'schema.sql')
+SEED_FILE_PATH = os.path.join(__location__, '..', 'db', 'sql', 'seed.sql')
+
+def create_database(file_name='bench.db', seed=True):
+    """
+    Creates a file-backed SQLite database in a temporary directory and loads the schema into it.
+
+    Parameters:
+    ----------
+    file_name : str, optional
+        The name of the database file.
+    seed : bool, optional
+        Whether to load the seed data (the five habits) as well.
+
+    Returns:
+    -------
+    str
+        The path of the database file.
+    """
+    db_file_path = os.path.join(tempfile.mkdtemp(prefix='habit-tracker-bench-'), file_name)
+    connection = sqlite3.connect(db_file_path)
+    connection.executescript(open(SCHEMA_FILE_PATH).read())
+    if seed:
+        connection.executescript(open(SEED_FILE_PATH).read())
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.commit()
+    connection.close()
+    return db_file_path
+
+def use_database(db_file_path):
+    """
+    Points the app at a database file. Must be called before the db module is imported.
+
+    Parameters:
+    ----------
+    db_file_path : str
+        The path of the database file.
+    """
+    os.environ["DB_FILE_NAME"] = db_file_path
+
+def track_for_users(db_file_path, habit_name, user_count, prefix='user'):
+    """
+    Makes `user_count` synthetic users track a habit.
+
+    Returns:
+    -------
+    list
+        The names of the users.
+    """
+    user_names = [f'{prefix}{i}' for i in range(user_count)]
+    connection = sqlite3.connect(db_file_path)
+    habit_id = connection.execute("SELECT id FROM habits WHERE name = ?", (habit_name,)).fetchone()[0]
+    connection.executemany("INSERT INTO user_habits (habit_id, user_name) VALUES (?, ?)",
+                           [(habit_id, user_name) for user_name in user_names])
+    connection.commit()
+    connection.close()
+    return user_names
+
+RESULTS_DIR = os.path.join(__location__, 'results')
+
+def time_calls(call, iterations, warmup=10):
+    """
+    Times repeated calls of a function.
+
+    Parameters:
+    ----------
+    call : callable
+        The function to time. It is passed the number of the iteration.
+    iterations : int
+        The number of timed calls.
+    warmup : int, optional
+        The number of untimed calls made first.
+
+    Returns:
+    -------
+    list
+        The latency of each timed call in seconds.
+    """
+    for i in range(warmup):
+        call(i)
+    latencies = []
+    for i in range(warmup, warmup + iterations):
+        start = time.perf_counter()
+        call(i)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def percentile(sorted_values, fraction):
+    """
+    Gets a percentile of sorted values, by nearest rank.
+
+    Parameters:
+    ----------
+    sorted_values : list
+        The values, sorted ascending.
+    fraction : float
+        The percentile as a fraction (e.g., 0.95).
+
+    Returns:
+    -------
+    float
+        The value at the percentile, or 0 if there are no values.
+    """
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def summarize(latencies, elapsed=None):
+    """
+    Summarizes request or call latencies.
+
+    Parameters:
+    ----------
+    latencies : list
+        The latencies in seconds.
+    elapsed : float, optional
+        The wall-clock seconds the latencies were recorded over. Defaults to their sum (sequential calls).
+
+    Returns:
+    -------
+    dict
+        The count, throughput per second, and mean, p50, p95, p99 and max latencies in milliseconds.
+    """
+    latencies = sorted(latencies)
+    if elapsed is None:
+        elapsed = sum(latencies)
+    count = len(latencies)
+    return {
+        'count': count,
+        'throughput': count / elapsed if elapsed else 0.0,
+        'mean_ms': (sum(latencies) / count * 1000) if count else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': (latencies[-1] * 1000) if count else 0.0,
+    }
+
+def print_summary(label, summary):
+    """
+    Prints one line of a latency summary.
+    """
+    print(f"{label:<40} n={summary['count']:<6} {summary['throughput']:>10,.0f}/s "
+          f"p50={summary['p50_ms']:.3f}ms p95={summary['p95_ms']:.3f}ms p99={summary['p99_ms']:.3f}ms")
+
+def git_commit():
+    """
+    Gets the commit the benchmarks run on.
+
+    Returns:
+    -------
+    str or None
+        The short commit hash, with a '-dirty' suffix if there are uncommitted changes, or None outside a git checkout.
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=__location__, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True,
+                               cwd=__location__, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f'{commit}-dirty' if dirty else commit
+
+def write_results(benchmark, params, results, output=None):
+    """
+    Writes benchmark results as JSON, so runs on different commits can be compared with benchmarks/compare.py.
+
+    Parameters:
+    ----------
+    benchmark : str
+        The name of the benchmark.
+    params : dict
+        The parameters the benchmark ran with.
+    results : dict
+        The latency summaries, keyed by operation.
+    output : str, optional
+        The file to write. Defaults to benchmarks/results/<benchmark>-<commit>-<time>.json.
+
+    Returns:
+    -------
+    str
+        The path of the written file.
+    """
+    commit = git_commit()
+    run_at = datetime.datetime.now(datetime.timezone.utc)
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{benchmark}-{commit or 'nogit'}-{run_at.strftime('%Y%m%dT%H%M%S')}.json")
+
+    document = {
+        'benchmark': benchmark,
+        'commit': commit,
+        'run_at': run_at.isoformat(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'params': params,
+        'results': results,
+    }
+    with open(output, 'w') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+    return output
@@ -0,0 +1,80 @@
+import argparse
+import json
+
+# Compares two result files written by the benchmarks (e.g. the same benchmark run on two commits).
+
+# Latency metrics compared, in milliseconds (lower is better)
+LATENCY_METRICS = ('p50_ms', 'p95_ms', 'p99_ms')
+
+def load_results(file_path):
+    """
+    Reads a result file written by benchmarks.common.write_results.
+    """
+    with open(file_path) as f:
+        return json.load(f)
+
+def change(base, head):
+    """
+    Gets the relative change from base to head, in percent.
+    """
+    if not base:
+        return 0.0
+    return (head - base) / base * 100
+
+def compare(base, head, threshold=10.0):
+    """
+    Compares the operations two result documents have in common.
+
+    Parameters:
+    ----------
+    base : dict
+        The result document of the base run.
+    head : dict
+        The result document of the new run.
+    threshold : float, optional
+        Slowdown (in percent, of p50 latency or throughput) above which an operation counts as a regression.
+
+    Returns:
+    -------
+    list
+        One dict per operation with the base and head values, their change in percent, and whether it regressed.
+    """
+    rows = []
+    for name, head_summary in head['results'].items():
+        base_summary = base['results'].get(name)
+        if base_summary is None:
+            continue
+        row = {'operation': name}
+        for metric in LATENCY_METRICS + ('throughput',):
+            row[metric] = (base_summary[metric], head_summary[metric], change(base_summary[metric], head_summary[metric]))
+        row['regressed'] = row['p50_ms'][2] > threshold or row['throughput'][2] < -threshold
+        rows.append(row)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files.')
+    parser.add_argument('base', help='result file of the base run')
+    parser.add_argument('head', help='result file of the new run')
+    parser.add_argument('--threshold', type=float, default=10.0, help='regression threshold, in percent')
+    args = parser.parse_args()
+
+    base = load_results(args.base)
+    head = load_results(args.head)
+    if base['benchmark'] != head['benchmark'] or base['params'] != head['params']:
+        print('Warning: the runs used different benchmarks or parameters')
+    print(f"{base['benchmark']}: {base['commit']} -> {head['commit']}")
+
+    rows = compare(base, head, args.threshold)
+    for row in rows:
+        cells = ' '.join(f"{metric}={row[metric][0]:.3f}->{row[metric][1]:.3f} ({row[metric][2]:+.1f}%)"
+                         for metric in LATENCY_METRICS)
+        flag = ' REGRESSION' if row['regressed'] else ''
+        print(f"{row['operation']:<40} {cells} throughput {row['throughput'][2]:+.1f}%{flag}")
+
+    # A non-zero exit status lets CI fail on regressions
+    if any(row['regressed'] for row in rows):
+        raise SystemExit(1)
+
+# Command to run this script -> python3 -m benchmarks.compare benchmarks/results/<base>.json benchmarks/results/<head>.json
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import argparse
+import sqlite3
+import time
+from benchmarks.common import create_database
+from classes.streak_engine import recompute_streaks
+
+# Synthetic data generator for the benchmarks.
+# It builds a database of `users` users, `habits` habits (the five seeded ones first, then generated ones,
+# every third of them WEEKLY) and `years` years of habit_tracker history ending on END_DATE.
+# Everything is generated inside SQLite with recursive CTEs and a deterministic hash in place of a random
+# number generator, so the same parameters always give the same database.
+
+END_DATE = '2024-07-14'
+
+# Chance (in percent) that a user tracks a given habit, and that a tracked habit is completed in a given period
+TRACK_PERCENT = 60
+COMPLETION_PERCENT = 75
+
+def generate(db_file_path, users=100, habits=5, years=1, track_percent=TRACK_PERCENT,
+             completion_percent=COMPLETION_PERCENT):
+    """
+    Fills a database created by benchmarks.common.create_database with synthetic users, habits and history,
+    then recomputes the streaks so they match the history.
+
+    Parameters:
+    ----------
+    db_file_path : str
+        The path of the database file.
+    users : int, optional
+        The number of users.
+    habits : int, optional
+        The number of habits, including the five seeded ones.
+    years : int, optional
+        The number of years of history.
+    track_percent : int, optional
+        Chance (in percent) that a user tracks a habit.
+    completion_percent : int, optional
+        Chance (in percent) that a tracked habit is completed in a day (DAILY) or week (WEEKLY).
+
+    Returns:
+    -------
+    dict
+        The number of users, habits, user habits and tracker rows in the database.
+    """
+    connection = sqlite3.connect(db_file_path)
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("PRAGMA synchronous = OFF")
+
+    connection.execute(
+        """WITH RECURSIVE n(i) AS (SELECT (SELECT COUNT(*) FROM habits) + 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+           INSERT INTO habits (name, description, periodicity)
+           SELECT 'Habit ' || i, 'Generated habit ' || i, CASE WHEN i % 3 = 0 THEN 'WEEKLY' ELSE 'DAILY' END FROM n""",
+        (habits,)
+    )
+
+    # The seed's user habits are replaced, their streaks would not match the generated history
+    connection.execute("DELETE FROM habit_tracker")
+    connection.execute("DELETE FROM user_habits")
+    connection.execute(
+        """WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i < ? - 1)
+           INSERT INTO user_habits (habit_id, user_name)
+           SELECT habits.id, 'user' || n.i
+           FROM n JOIN habits
+           -- Every user tracks at least one of the seeded habits
+           WHERE (n.i * 2654435761 + habits.id * 40503) % 100 < ? OR habits.id = 1 + n.i % 5
+           ORDER BY n.i, habits.id""",
+        (users, track_percent)
+    )
+
+    # One candidate completion per day for DAILY habits and per week (on a varying weekday) for WEEKLY habits
+    connection.execute(
+        """WITH RECURSIVE d(day) AS (SELECT 0 UNION ALL SELECT day + 1 FROM d WHERE day < ? - 1)
+           INSERT INTO habit_tracker (user_habit_id, completed_at)
+           SELECT
+              user_habits.id,
+              datetime(?, '-' || d.day || ' days', '+' || (6 + (user_habits.id + d.day) % 14) || ' hours')
+           FROM user_habits
+           JOIN habits ON user_habits.habit_id = habits.id
+           JOIN d
+           WHERE (habits.periodicity = 'DAILY' OR d.day % 7 = user_habits.id % 7)
+             AND (user_habits.id * 2654435761 + d.day * 40503) % 100 < ?
+           ORDER BY user_habits.id, d.day DESC""",
+        (years * 365, END_DATE, completion_percent)
+    )
+    connection.commit()
+
+    recompute_streaks(connection)
+    connection.execute("ANALYZE")
+    connection.commit()
+
+    counts = connection.execute(
+        """SELECT
+              (SELECT COUNT(DISTINCT user_name) FROM user_habits),
+              (SELECT COUNT(*) FROM habits),
+              (SELECT COUNT(*) FROM user_habits),
+              (SELECT COUNT(*) FROM habit_tracker)"""
+    ).fetchone()
+    connection.close()
+    return dict(zip(('users', 'habits', 'user_habits', 'tracker_rows'), counts))
+
+def sample_user_habits(db_file_path, count=1000, periodicity=None):
+    """
+    Picks tracked habits spread over the users of a generated database, for the benchmarks to replay requests on.
+
+    Parameters:
+    ----------
+    db_file_path : str
+        The path of the database file.
+    count : int, optional
+        The maximum number of tracked habits to pick.
+    periodicity : str, optional
+        Only pick habits with this periodicity.
+
+    Returns:
+    -------
+    list
+        A list of (user_name, habit_name) tuples.
+    """
+    connection = sqlite3.connect(db_file_path)
+    total = connection.execute("SELECT COUNT(*) FROM user_habits").fetchone()[0]
+    step = max(1, total // count)
+    rows = connection.execute(
+        """SELECT user_habits.user_name, habits.name
+           FROM user_habits
+           JOIN habits ON user_habits.habit_id = habits.id
+           WHERE user_habits.id % ? = 0 AND (? IS NULL OR habits.periodicity = ?)
+           ORDER BY user_habits.id
+           LIMIT ?""",
+        (step, periodicity, periodicity, count)
+    ).fetchall()
+    connection.close()
+    return rows
+
+def add_arguments(parser):
+    """
+    Adds the data generator options to a benchmark's argument parser.
+    """
+    parser.add_argument('--users', type=int, default=100, help='number of users')
+    parser.add_argument('--habits', type=int, default=5, help='number of habits, including the five seeded ones')
+    parser.add_argument('--years', type=int, default=1, help='years of habit_tracker history')
+
+def generate_database(args):
+    """
+    Creates and fills a database for a benchmark from its parsed arguments.
+
+    Returns:
+    -------
+    tuple
+        The path of the database file and the counts returned by generate.
+    """
+    db_file_path = create_database()
+    start = time.perf_counter()
+    counts = generate(db_file_path, users=args.users, habits=args.habits, years=args.years)
+    print(f"Generated {counts['users']} users, {counts['habits']} habits, {counts['user_habits']} user habits "
+          f"and {counts['tracker_rows']:,} tracker rows in {time.perf_counter() - start:.1f}s")
+    return db_file_path, counts
+
+# Command to run this script -> python3 -m benchmarks.datagen --users 1000 --habits 20 --years 3
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate a synthetic habit tracker database.')
+    add_arguments(parser)
+    db_file_path, _ = generate_database(parser.parse_args())
+    print(db_file_path)
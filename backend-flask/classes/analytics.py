@@ -0,0 +1,465 @@
+import datetime
+import os
+from db.db import rows_to_dicts
+from db.readers import read_routing
+from db.shards import shard_router
+from classes.catalog import habit_catalog
+from classes.leaderboard import leaderboard
+from classes.partitions import partitions_for
+from classes.periods import period_engine, user_timezone
+from classes.summary import COMPLETION_RATE_WINDOWS, expected_completions
+from classes.streaks import TIMESTAMP_FORMAT, day_key, epoch_seconds, format_epoch
+
+# Whether heatmaps are read from the user_habit_daily rollup (kept current by check-offs)
+# instead of grouping the habit_tracker rows by day
+HEATMAP_USE_ROLLUP = os.getenv("HEATMAP_USE_ROLLUP", "1").lower() in ("1", "true", "yes")
+
+# Days in a heatmap bucket
+HEATMAP_BUCKET_DAYS = {'day': 1, 'week': 7}
+
+# Analytics class that encasulates all the read-only analytics queries
+# The routes (WSGI and ASGI) only parse the request and shape the response
+# Each query reads from the database db/readers.py routes its query class to, never from the writers' connections unless configured so
+class Analytics:
+    """
+    A class to handle the analytics queries over the habits tracked by users.
+
+    Methods:
+    -------
+    get_user_tracked_habits(user_name):
+        Fetches the habits tracked by a user.
+
+    get_user_longest_streaks(user_name):
+        Fetches the longest streak of every habit tracked by a user.
+
+    get_user_habit_longest_streak(user_name, habit_name):
+        Fetches the longest streak of one habit tracked by a user.
+
+    get_user_summary(user_name):
+        Builds the dashboard summary of a user.
+
+    get_tracked_timestamps(user_name, habit_id, before=None, limit=None):
+        Fetches the completion timestamps of a habit tracked by a user, newest first.
+
+    get_user_heatmap(user_name, start, end, bucket='day', habit_name=None):
+        Counts the completions of a user's habits per day or week of a date range.
+
+    get_leaderboard(metric, limit, habit_name=None):
+        Ranks the users with the highest current or longest streaks.
+
+    get_user_rank(user_name, metric, habit_name=None):
+        Gets the rank of a user on a leaderboard.
+
+    get_habit_stats():
+        Counts the users tracking each habit and their completions, over every shard.
+    """
+
+    def get_user_tracked_habits(self, user_name):
+        """
+        Fetches the habits tracked by a user.
+
+        Parameters:
+        ----------
+        user_name : str
+            The name of the user.
+
+        Returns:
+        -------
+        list
+            The user_habits rows of the user.
+        """
+        cur = read_routing.db_for(user_name, 'history').cursor_for('tuple')
+        data = cur.execute("SELECT * FROM user_habits WHERE user_name = ?", (user_name,))
+        return rows_to_dicts(cur, data.fetchall())
+
+    def get_user_longest_streaks(self, user_name):
+        """
+        Fetches the longest streak of every habit tracked by a user.
+
+        Parameters:
+        ----------
+        user_name : str
+            The name of the user.
+
+        Returns:
+        -------
+        list
+            The user name, habit name and longest streak of each tracked habit.
+        """
+        cur = read_routing.db_for(user_name, 'history').cursor_for('tuple')
+        data = cur.execute(
+            """SELECT
+                   user_habits.user_name,
+                   habits.name AS habit_name,
+                   user_habits.longest_streak
+                FROM
+                   user_habits
+                JOIN
+                   habits ON user_habits.habit_id = habits.id
+                WHERE
+                   user_name = ?""",
+            (user_name,)
+        )
+        return rows_to_dicts(cur, data.fetchall())
+
+    def get_user_habit_longest_streak(self, user_name, habit_name):
+        """
+        Fetches the longest streak of one habit tracked by a user.
+
+        Parameters:
+        ----------
+        user_name : str
+            The name of the user.
+        habit_name : str
+            The name of the habit.
+
+        Returns:
+        -------
+        dict or None
+            The longest streak, None if the user doesn't track the habit, or an error message if the habit doesn't exist.
+        """
+        habit = habit_catalog.by_name(habit_name)
+        if habit is None:
+            return {"error": "Habit not found", "code": 404}
+
+        data = read_routing.db_for(user_name, 'history').cursor.execute("SELECT longest_streak FROM user_habits WHERE user_name = ? AND habit_id = ?", (user_name, habit['id'],))
+        return data.fetchone()
+
+    def get_user_summary(self, user_name):
+        """
+        Builds the dashboard summary of a user: totals, and for every tracked habit its completions,
+        first and last completion, streaks and 7/30-day completion rates.
+        Answered with two queries however long the user's history is.
+
+        Parameters:
+        ----------
+        user_name : str
+            The name of the user.
+
+        Returns:
+        -------
+        dict
+            The user's totals and per habit summaries.
+        """
+        db = read_routing.db_for(user_name, 'dashboard')
+        cur = db.cursor_for('row')
+        data = cur.execute(
+            """SELECT
+                   user_habits.id,
+                   user_habits.habit_id,
+                   user_habits.current_streak,
+                   user_habits.longest_streak,
+                   user_habit_stats.completion_count,
+                   user_habit_stats.first_completed_at,
+                   user_habit_stats.last_completed_at,
+                   user_timezones.timezone
+                FROM
+                   user_habits
+                LEFT JOIN
+                   user_habit_stats ON user_habit_stats.user_habit_id = user_habits.id
+                LEFT JOIN
+                   user_timezones ON user_timezones.user_name = user_habits.user_name
+                WHERE
+                   user_habits.user_name = ?""",
+            (user_name,)
+        )
+        tracked_habits = data.fetchall()
+
+        # Completions in each window of days ending today in the user's timezone,
+        # read from the index entries of the longest window only
+        timezone = tracked_habits[0]['timezone'] if tracked_habits else None
+        today = period_engine.today(timezone)
+        windows = sorted(COMPLETION_RATE_WINDOWS)
+        # Only the partitions overlapping the longest window are read, usually just the hot one
+        since = period_engine.day_start(today - windows[-1] + 1, timezone)
+        window_columns = ', '.join(f"SUM(day_key >= ?) AS completions_{days}d" for days in windows)
+        partitions_query, partition_count = partitions_for(db).select(
+            "user_habit_id, day_key",
+            "user_habit_id IN (SELECT id FROM user_habits WHERE user_name = ?) AND completed_epoch >= ?",
+            since=format_epoch(since)
+        )
+        data = cur.execute(
+            f"""SELECT
+                   user_habit_id,
+                   {window_columns}
+                FROM
+                   ({partitions_query})
+                GROUP BY user_habit_id""",
+            [today - days + 1 for days in windows] + [user_name, since] * partition_count
+        )
+        window_completions = {row['user_habit_id']: row for row in data.fetchall()}
+
+        habits = []
+        totals = {'tracked_habits': len(tracked_habits), 'completions': 0, 'best_streak': 0}
+        for days in windows:
+            totals[f'completions_{days}d'] = 0
+        for tracked_habit in tracked_habits:
+            habit = habit_catalog.by_id(tracked_habit['habit_id'])
+            completions = tracked_habit['completion_count'] or 0
+            summary = {
+                'habit_name': habit['name'] if habit else None,
+                'periodicity': habit['periodicity'] if habit else None,
+                'current_streak': tracked_habit['current_streak'],
+                'longest_streak': tracked_habit['longest_streak'],
+                'completions': completions,
+                'first_completed_at': tracked_habit['first_completed_at'],
+                'last_completed_at': tracked_habit['last_completed_at'],
+            }
+            totals['completions'] += completions
+            totals['best_streak'] = max(totals['best_streak'], tracked_habit['longest_streak'])
+
+            window = window_completions.get(tracked_habit['id'])
+            for days in windows:
+                count = window[f'completions_{days}d'] if window else 0
+                totals[f'completions_{days}d'] += count
+                rate = count / expected_completions(summary['periodicity'], days)
+                summary[f'completion_rate_{days}d'] = round(min(rate, 1.0), 4)
+            habits.append(summary)
+
+        return {'user': user_name, 'totals': totals, 'habits': habits}
+
+    def get_tracked_timestamps(self, user_name, habit_id, before=None, limit=None):
+        """
+        Fetches the completion timestamps of a habit tracked by a user, newest first.
+
+        Parameters:
+        ----------
+        user_name : str
+            The name of the user.
+        habit_id : int
+            The ID of the habit.
+        before : str, optional
+            Only fetch timestamps older than this one, in ISO 8601 format (e.g., '2024-07-13 09:00:00').
+        limit : int, optional
+            Maximum number of timestamps to fetch.
+
+        Returns:
+        -------
+        sqlite3.Cursor
+            A cursor over (completed_at, completed_epoch) tuples, so callers can fetch all of them or stream them in chunks.
+
+        Raises:
+        -------
+        ValueError
+            If `before` is not an ISO 8601 timestamp.
+        """
+        if before is not None:
+            before = datetime.datetime.fromisoformat(before)
+        # Each partition is read newest first through its (user_habit_id, completed_epoch) index and the results are merged,
+        # so a page only reads the rows it returns; archive partitions entirely after `before` are skipped
+        db = read_routing.db_for(user_name, 'history')
+        query, partition_count = partitions_for(db).select(
+            "completed_at, completed_epoch",
+            "user_habit_id = (SELECT id FROM user_habits WHERE user_name = ? AND habit_id = ?)"
+            + (" AND completed_epoch < ?" if before is not None else ""),
+            before=before.strftime(TIMESTAMP_FORMAT) if before is not None else None
+        )
+        params = [user_name, habit_id] + ([epoch_seconds(before)] if before is not None else [])
+        params = params * partition_count
+        query += " ORDER BY completed_epoch DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        return db.cursor_for('tuple').execute(query, params)
+
+    def get_user_heatmap(self, user_name, start, end, bucket='day', habit_name=None):
+        """
+        Counts the completions of a user's habits per day or week of a date range, for a contribution calendar.
+
+        The counts are aggregated in SQL, from the user_habit_daily rollup or by grouping the habit_tracker
+        rows of the range by day, and returned as one dense array per habit instead of one row per completion.
+
+        Parameters:
+        ----------
+        user_name : str
+            The name of the user.
+        start : datetime.date
+            The first day of the range. Weekly buckets start on the Monday of its week.
+        end : datetime.date
+            The last day of the range.
+        bucket : str, optional
+            'day' or 'week'.
+        habit_name : str, optional
+            Only count this habit. Defaults to every habit the user tracks.
+
+        Returns:
+        -------
+        dict
+            The range, and the counts of every habit and their totals, one per bucket;
+            or an error message if the habit doesn't exist or isn't tracked by the user.
+        """
+        bucket_days = HEATMAP_BUCKET_DAYS[bucket]
+        start -= datetime.timedelta(days=start.weekday() if bucket == 'week' else 0)
+        bucket_count = (end - start).days // bucket_days + 1
+
+        habit_filter = ''
+        params = [user_name]
+        if habit_name is not None:
+            habit = habit_catalog.by_name(habit_name)
+            if habit is None:
+                return {"error": "Habit not found", "code": 404}
+            habit_filter = ' AND habit_id = ?'
+            params.append(habit['id'])
+
+        db = read_routing.db_for(user_name, 'dashboard')
+        cur = db.cursor_for('tuple')
+        data = cur.execute(f"SELECT id, habit_id FROM user_habits WHERE user_name = ?{habit_filter} ORDER BY habit_id", params)
+        tracked_habits = data.fetchall()
+        if habit_name is not None and not tracked_habits:
+            return {"error": "Habit Not Tracked By User", "code": 404}
+
+        first_day = start.isoformat()
+        user_habit_filter = f"user_habit_id IN (SELECT id FROM user_habits WHERE user_name = ?{habit_filter})"
+        if HEATMAP_USE_ROLLUP:
+            bucket_column = f"CAST(julianday(day) - julianday(?) AS INTEGER) / {bucket_days}"
+            data = cur.execute(
+                f"""SELECT user_habit_id, {bucket_column} AS bucket, SUM(completions)
+                    FROM user_habit_daily
+                    WHERE {user_habit_filter} AND day >= ? AND day <= ?
+                    GROUP BY user_habit_id, bucket""",
+                [first_day] + params + [first_day, end.isoformat()]
+            )
+        else:
+            # The range runs from the local midnight starting `start` to the one ending `end`
+            timezone = user_timezone(cur, user_name)
+            since = period_engine.day_start(day_key(start), timezone)
+            before = period_engine.day_start(day_key(end) + 1, timezone)
+            partitions_query, partition_count = partitions_for(db).select(
+                "user_habit_id, day_key",
+                f"{user_habit_filter} AND completed_epoch >= ? AND completed_epoch < ?",
+                since=format_epoch(since), before=format_epoch(before)
+            )
+            data = cur.execute(
+                f"""SELECT user_habit_id, (day_key - ?) / {bucket_days} AS bucket, COUNT(*)
+                    FROM ({partitions_query})
+                    GROUP BY user_habit_id, bucket""",
+                [day_key(start)] + (params + [since, before]) * partition_count
+            )
+
+        counts = {user_habit_id: [0] * bucket_count for user_habit_id, _ in tracked_habits}
+        totals = [0] * bucket_count
+        for user_habit_id, index, completions in data.fetchall():
+            counts[user_habit_id][index] = completions
+            totals[index] += completions
+
+        habits = []
+        for user_habit_id, habit_id in tracked_habits:
+            habit = habit_catalog.by_id(habit_id)
+            habits.append({'habit': habit['name'], 'periodicity': habit['periodicity'], 'counts': counts[user_habit_id]})
+        return {'user_name': user_name, 'bucket': bucket, 'start': first_day, 'end': end.isoformat(),
+                'habits': habits, 'totals': totals}
+
+    def get_leaderboard(self, metric, limit, habit_name=None):
+        """
+        Ranks the users with the highest current or longest streaks, from the in-process leaderboards.
+
+        Parameters:
+        ----------
+        metric : str
+            'current' or 'longest'.
+        limit : int
+            The number of entries.
+        habit_name : str, optional
+            Only rank the users tracking this habit. Defaults to every tracked habit, so a user
+            can appear once per habit they track.
+
+        Returns:
+        -------
+        dict
+            The metric, the habit and the entries, highest streak first, or an error message if the habit doesn't exist.
+        """
+        habit_id = None
+        if habit_name is not None:
+            habit = habit_catalog.by_name(habit_name)
+            if habit is None:
+                return {"error": "Habit not found", "code": 404}
+            habit_id = habit['id']
+
+        entries = []
+        for rank, user_name, entry_habit_id, streak in leaderboard.top(metric, limit, habit_id):
+            habit = habit_catalog.by_id(entry_habit_id)
+            entries.append({'rank': rank, 'user_name': user_name, 'habit': habit['name'] if habit else None, 'streak': streak})
+        return {'metric': metric, 'habit': habit_name, 'entries': entries}
+
+    def get_user_rank(self, user_name, metric, habit_name=None):
+        """
+        Gets the rank of a user on a leaderboard. Users with the same streak share a rank.
+
+        Parameters:
+        ----------
+        user_name : str
+            The name of the user.
+        metric : str
+            'current' or 'longest'.
+        habit_name : str, optional
+            Rank the user among the users tracking this habit. Defaults to the user's best
+            tracked habit, ranked among every tracked habit.
+
+        Returns:
+        -------
+        dict
+            The user's rank, the number of ranked entries, the habit and its streak, or an error message
+            if the habit doesn't exist or the user doesn't track it (or any habit).
+        """
+        habit_id = None
+        if habit_name is not None:
+            habit = habit_catalog.by_name(habit_name)
+            if habit is None:
+                return {"error": "Habit not found", "code": 404}
+            habit_id = habit['id']
+
+        rank = leaderboard.rank(user_name, metric, habit_id)
+        if rank is None:
+            if habit_name is not None:
+                return {"error": "Habit Not Tracked By User", "code": 404}
+            return {"error": "User is not tracking any habit", "code": 404}
+        position, ranked, entry_habit_id, streak = rank
+        habit = habit_catalog.by_id(entry_habit_id)
+        return {'user_name': user_name, 'metric': metric, 'habit': habit['name'] if habit else None,
+                'streak': streak, 'rank': position, 'ranked': ranked}
+
+    def get_habit_stats(self):
+        """
+        Counts, for every habit of the catalog, the users tracking it, those on a streak and their completions.
+        Each shard is aggregated in its own thread and the per-shard counts are added up.
+
+        Returns:
+        -------
+        dict
+            One entry per habit, with its tracking users, active streaks, completions and best streak,
+            and the number of shards counted.
+        """
+        def count(index, db, connection):
+            cur = db.cursor_for('tuple', connection)
+            data = cur.execute(
+                """SELECT
+                       user_habits.habit_id,
+                       COUNT(*),
+                       SUM(user_habits.current_streak > 0),
+                       TOTAL(user_habit_stats.completion_count),
+                       MAX(user_habits.longest_streak)
+                    FROM
+                       user_habits
+                    LEFT JOIN
+                       user_habit_stats ON user_habit_stats.user_habit_id = user_habits.id
+                    GROUP BY user_habits.habit_id"""
+            )
+            return data.fetchall()
+
+        totals = {}
+        shard_counts = shard_router.fan_out(count, via=lambda db: read_routing.reader(db, 'stats'))
+        for rows in shard_counts:
+            for habit_id, tracked_by, active_streaks, completions, best_streak in rows:
+                total = totals.setdefault(habit_id, [0, 0, 0, 0])
+                total[0] += tracked_by
+                total[1] += active_streaks
+                total[2] += int(completions)
+                total[3] = max(total[3], best_streak)
+
+        habits = []
+        for habit in habit_catalog.all():
+            tracked_by, active_streaks, completions, best_streak = totals.get(habit['id'], (0, 0, 0, 0))
+            habits.append({'habit': habit['name'], 'periodicity': habit['periodicity'], 'tracked_by': tracked_by,
+                           'active_streaks': active_streaks, 'completions': completions, 'best_streak': best_streak})
+        return {'habits': habits, 'shards': len(shard_counts)}
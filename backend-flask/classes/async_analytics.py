@@ -0,0 +1,114 @@
+from db.executor import db_executor
+from classes.analytics import Analytics
+from classes.catalog import habit_catalog
+
+# Async counterpart of the Analytics class, for the ASGI app.
+# Every query runs on a reader thread of the DB executor.
+class AsyncAnalytics:
+    """
+    An async wrapper of the Analytics class that keeps SQLite work off the event loop.
+
+    Attributes:
+    ----------
+    executor : DBExecutor
+        The executor the DB work runs on.
+    """
+
+    def __init__(self, executor=db_executor):
+        self.executor = executor
+
+    async def __read(self, method_name, *args):
+        return await self.executor.read(lambda: getattr(Analytics(), method_name)(*args))
+
+    async def get_user_tracked_habits(self, user_name):
+        """
+        Fetches the habits tracked by a user. See Analytics.get_user_tracked_habits.
+        """
+        return await self.__read('get_user_tracked_habits', user_name)
+
+    async def get_user_longest_streaks(self, user_name):
+        """
+        Fetches the longest streak of every habit tracked by a user. See Analytics.get_user_longest_streaks.
+        """
+        return await self.__read('get_user_longest_streaks', user_name)
+
+    async def get_user_habit_longest_streak(self, user_name, habit_name):
+        """
+        Fetches the longest streak of one habit tracked by a user. See Analytics.get_user_habit_longest_streak.
+        """
+        return await self.__read('get_user_habit_longest_streak', user_name, habit_name)
+
+    async def get_user_summary(self, user_name):
+        """
+        Builds the dashboard summary of a user. See Analytics.get_user_summary.
+        """
+        return await self.__read('get_user_summary', user_name)
+
+    async def get_user_heatmap(self, user_name, start, end, bucket='day', habit_name=None):
+        """
+        Counts the completions of a user's habits per day or week of a date range. See Analytics.get_user_heatmap.
+        """
+        return await self.__read('get_user_heatmap', user_name, start, end, bucket, habit_name)
+
+    async def get_leaderboard(self, metric, limit, habit_name=None):
+        """
+        Ranks the users with the highest current or longest streaks. See Analytics.get_leaderboard.
+        """
+        return await self.__read('get_leaderboard', metric, limit, habit_name)
+
+    async def get_user_rank(self, user_name, metric, habit_name=None):
+        """
+        Gets the rank of a user on a leaderboard. See Analytics.get_user_rank.
+        """
+        return await self.__read('get_user_rank', user_name, metric, habit_name)
+
+    async def get_habit_stats(self):
+        """
+        Counts the users tracking each habit and their completions, over every shard. See Analytics.get_habit_stats.
+        """
+        return await self.__read('get_habit_stats')
+
+    async def get_habit(self, habit_name):
+        """
+        Looks a habit up in the habit catalog, which may reload it from the DB.
+
+        Returns:
+        -------
+        dict or None
+            The habit, or None if it doesn't exist.
+        """
+        return await self.executor.read(habit_catalog.by_name, habit_name)
+
+    async def get_tracked_timestamps(self, user_name, habit_id, before=None, limit=None):
+        """
+        Fetches the completion timestamps of a habit tracked by a user, newest first.
+
+        Returns:
+        -------
+        list
+            The timestamps.
+        """
+        def fetch():
+            return [row[0] for row in Analytics().get_tracked_timestamps(user_name, habit_id, before, limit).fetchall()]
+        return await self.executor.read(fetch)
+
+    async def iter_tracked_timestamps(self, user_name, habit_id, before=None, chunk_size=1000):
+        """
+        Fetches the completion timestamps of a habit tracked by a user, newest first, a chunk at a time.
+
+        Each chunk is its own keyset query (`before` the last timestamp of the previous chunk), so no connection
+        or cursor is held while the event loop waits on the client. A completion at exactly the same second as the
+        last timestamp of a chunk can therefore be skipped, as with paging by `next_before`.
+
+        Yields:
+        -------
+        list
+            The timestamps of a chunk.
+        """
+        while True:
+            timestamps = await self.get_tracked_timestamps(user_name, habit_id, before, chunk_size)
+            if timestamps:
+                yield timestamps
+            if len(timestamps) < chunk_size:
+                break
+            before = timestamps[-1]
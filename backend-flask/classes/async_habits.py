@@ -0,0 +1,125 @@
+from db.executor import db_executor
+from classes.check_off_events import recent_check_offs
+from classes.habits import Habit
+
+# Async counterpart of the Habit class, for the ASGI app.
+# Each method runs the matching Habit method on the DB executor: reads on a reader thread,
+# writes on the single writer thread. The Habit is created on that thread, so it uses the thread's connection.
+class AsyncHabit:
+    """
+    An async wrapper of the Habit class that keeps SQLite work off the event loop.
+
+    Attributes:
+    ----------
+    user_name : str
+        Name of the user who owns the habit.
+    executor : DBExecutor
+        The executor the DB work runs on.
+    """
+
+    def __init__(self, user_name=None, executor=db_executor):
+        self.user_name = user_name
+        self.executor = executor
+
+    def __call(self, method_name, args):
+        """
+        Calls a Habit method on the current (executor) thread.
+        """
+        return getattr(Habit(self.user_name), method_name)(*args)
+
+    async def __read(self, method_name, *args):
+        return await self.executor.read(self.__call, method_name, args)
+
+    async def __write(self, method_name, *args):
+        return await self.executor.write(self.__call, method_name, args)
+
+    async def get_all_habits(self):
+        """
+        Fetches all habits. See Habit.get_all_habits.
+        """
+        return await self.__read('get_all_habits')
+
+    async def get_habit(self, habit_name):
+        """
+        Fetches a specific habit by name. See Habit.get_habit.
+        """
+        return await self.__read('get_habit', habit_name)
+
+    async def get_habit_by_periodicity(self, periodicity):
+        """
+        Fetches habits based on their periodicity. See Habit.get_habit_by_periodicity.
+        """
+        return await self.__read('get_habit_by_periodicity', periodicity)
+
+    async def create_habit(self, habit_name, description, periodicity):
+        """
+        Creates a new habit. See Habit.create_habit.
+        """
+        return await self.__write('create_habit', habit_name, description, periodicity)
+
+    async def get_habit_current_streak(self, habit_name):
+        """
+        Gets the current streak for a user's specific habit. See Habit.get_habit_current_streak.
+        """
+        return await self.__read('get_habit_current_streak', habit_name)
+
+    async def get_habit_longest_streak(self, habit_name):
+        """
+        Gets the longest streak for a user's specific habit. See Habit.get_habit_longest_streak.
+        """
+        return await self.__read('get_habit_longest_streak', habit_name)
+
+    async def get_habit_streaks(self, habit_name):
+        """
+        Gets the current and longest streak for a user's specific habit, with one trip to a reader thread.
+
+        Returns:
+        -------
+        tuple
+            The results of get_habit_current_streak and get_habit_longest_streak.
+        """
+        def streaks():
+            habit = Habit(self.user_name)
+            return habit.get_habit_current_streak(habit_name), habit.get_habit_longest_streak(habit_name)
+        return await self.executor.read(streaks)
+
+    async def track_habit(self, habit_name):
+        """
+        Tracks a new habit for the user. See Habit.track_habit.
+        """
+        return await self.__write('track_habit', habit_name)
+
+    async def untrack_habit(self, habit_name):
+        """
+        Stops tracking a habit for the user. See Habit.untrack_habit.
+        """
+        return await self.__write('untrack_habit', habit_name)
+
+    async def check_off_habit(self, habit_name, completed_at=None, event_id=None):
+        """
+        Checks off a habit as completed for the day/week. See Habit.check_off_habit.
+        Retries the recent check-offs remember are answered on the event loop, without queuing a write.
+        """
+        if event_id is not None and self.user_name is not None:
+            result = recent_check_offs.get(self.user_name, habit_name, event_id)
+            if result is not None:
+                return result
+        return await self.__write('check_off_habit', habit_name, completed_at, event_id)
+
+    async def check_off_many(self, events):
+        """
+        Checks off a batch of (user_name, habit_name, completed_at) events in one transaction. See Habit.check_off_many.
+        """
+        return await self.__write('check_off_many', events)
+
+    async def get_timezone(self):
+        """
+        Gets the timezone the user's days and weeks are counted in. See Habit.get_timezone.
+        """
+        return await self.__read('get_timezone')
+
+    async def set_timezone(self, timezone):
+        """
+        Sets the user's timezone and rekeys their history. See Habit.set_timezone.
+        """
+        return await self.__write('set_timezone', timezone)
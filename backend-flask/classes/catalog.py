@@ -0,0 +1,201 @@
+import os
+import threading
+import time
+from classes.metrics import ThreadCounters
+from db.db import squlite_db
+from db.writer import write
+
+# Habit Catalog class that keeps the (small, rarely written) habits table in memory.
+# Every habit lookup by name, id or periodicity is answered from here instead of the SQLite DB.
+class HabitCatalog:
+    """
+    An in-process cache of the habits table, indexed by name, id and periodicity.
+
+    Every write to the habits table bumps the 'catalog' row of the data_versions table (through triggers).
+    The cache compares that version, together with the database's schema version, at most once every
+    `check_interval` seconds and reloads the whole table when either changed, so worker processes pick up
+    habits created by other processes. Writes done through this process call invalidate() and are seen immediately.
+
+    Attributes:
+    ----------
+    db : SqliteDB
+        The database the habits are loaded from.
+    check_interval : float
+        Seconds between two checks of the catalog version.
+    """
+
+    def __init__(self, db, check_interval=None):
+        self.db = db
+        if check_interval is None:
+            check_interval = float(os.getenv("HABIT_CATALOG_CHECK_INTERVAL", 1))
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        # (version, all habits, by name, by id, by periodicity), swapped in one assignment on reload
+        self._snapshot = None
+        self._checked_at = 0.0
+        # Counted per thread, as hits are counted without the lock
+        self._stats = ThreadCounters(('hits', 'misses', 'reloads', 'version_checks'))
+
+    def __current_version(self):
+        """
+        Fetches the catalog version and the schema version of the database.
+
+        Returns:
+        -------
+        tuple
+            The (catalog version, schema version).
+        """
+        data = self.db.cursor_for('tuple').execute("SELECT (SELECT version FROM data_versions WHERE scope = 'catalog'), schema_version FROM pragma_schema_version")
+        return data.fetchone()
+
+    def __load(self, version):
+        """
+        Loads every habit and builds the name, id and periodicity indexes.
+        """
+        data = self.db.cursor.execute("SELECT * FROM habits ORDER BY id")
+        habits = data.fetchall()
+        by_periodicity = {}
+        for habit in habits:
+            by_periodicity.setdefault(habit['periodicity'], []).append(habit)
+        self._snapshot = (
+            version,
+            habits,
+            {habit['name']: habit for habit in habits},
+            {habit['id']: habit for habit in habits},
+            by_periodicity,
+        )
+        self._stats.inc('reloads')
+
+    def __fresh_snapshot(self):
+        """
+        Gets the cached snapshot, reloading it if it is missing or the catalog version changed.
+        """
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self.check_interval:
+            self._stats.inc('hits')
+            return snapshot
+
+        with self._lock:
+            version = self.__current_version()
+            self._stats.inc('version_checks')
+            if self._snapshot is None or self._snapshot[0] != version:
+                self._stats.inc('misses')
+                self.__load(version)
+            else:
+                self._stats.inc('hits')
+            self._checked_at = time.monotonic()
+            return self._snapshot
+
+    def all(self):
+        """
+        Gets every habit.
+
+        Returns:
+        -------
+        list
+            A list of all habits. The habit dicts are shared and must not be modified.
+        """
+        return list(self.__fresh_snapshot()[1])
+
+    def by_name(self, habit_name):
+        """
+        Gets a habit by name.
+
+        Returns:
+        -------
+        dict or None
+            The habit, or None if there is no habit with that name.
+        """
+        return self.__fresh_snapshot()[2].get(habit_name)
+
+    def by_id(self, habit_id):
+        """
+        Gets a habit by ID.
+
+        Returns:
+        -------
+        dict or None
+            The habit, or None if there is no habit with that ID.
+        """
+        return self.__fresh_snapshot()[3].get(habit_id)
+
+    def by_periodicity(self, periodicity):
+        """
+        Gets the habits with a periodicity.
+
+        Returns:
+        -------
+        list
+            A list of the habits with the periodicity.
+        """
+        return list(self.__fresh_snapshot()[4].get(periodicity, []))
+
+    def invalidate(self):
+        """
+        Drops the cached habits, so the next lookup reloads them. Called after writes to the habits table.
+        """
+        with self._lock:
+            self._snapshot = None
+
+    def metrics(self):
+        """
+        Gets the cache counters.
+
+        Returns:
+        -------
+        dict
+            Hits (lookups answered from memory), misses (lookups that loaded the habits table),
+            reloads, version checks and the cached catalog version.
+        """
+        stats = self._stats.totals()
+        snapshot = self._snapshot
+        stats['version'] = snapshot[0][0] if snapshot is not None else None
+        return stats
+
+# Columns copied from the primary's habits table to the other shards
+HABIT_COLUMNS = ('id', 'name', 'description', 'periodicity', 'created_at')
+
+def replicate_catalog(router):
+    """
+    Copies the habits table of the primary shard to every other shard, with the same IDs,
+    so each shard can join the habits its users track. Unchanged habits are left alone,
+    so the catalog version of a shard only moves when one of its habits did.
+
+    Parameters:
+    ----------
+    router : ShardRouter
+        The shards to copy the habits to (see db/shards.py).
+
+    Returns:
+    -------
+    int
+        The number of habits copied to each shard.
+    """
+    columns = ', '.join(HABIT_COLUMNS)
+    habits = router.primary.cursor_for('tuple').execute(f"SELECT {columns} FROM habits ORDER BY id").fetchall()
+    if not router.sharded:
+        return len(habits)
+
+    def copy(index, db, connection):
+        if index == 0:
+            return
+        def operation(con):
+            con.executemany(
+                f"""
+                INSERT INTO habits ({columns}) VALUES ({', '.join('?' for _ in HABIT_COLUMNS)})
+                ON CONFLICT (id) DO UPDATE SET
+                    name = excluded.name, description = excluded.description,
+                    periodicity = excluded.periodicity, created_at = excluded.created_at
+                WHERE habits.name IS NOT excluded.name OR habits.description IS NOT excluded.description
+                    OR habits.periodicity IS NOT excluded.periodicity OR habits.created_at IS NOT excluded.created_at
+                """,
+                habits,
+            )
+        write(connection, operation, router.coordinator_for(db))
+
+    router.fan_out(copy)
+    return len(habits)
+
+# Global instance of the HabitCatalog class
+habit_catalog = HabitCatalog(squlite_db)
@@ -0,0 +1,109 @@
+import collections
+import datetime
+import os
+import threading
+
+# Longest client event ID accepted with a check-off
+MAX_EVENT_ID_LENGTH = 64
+
+# Days after a check-off its retries can still arrive. Archive tables whose completions all end before that
+# window are not probed for the event ID of a check-off.
+RETRY_WINDOW = datetime.timedelta(days=float(os.getenv("CHECK_OFF_RETRY_WINDOW_DAYS", 7)))
+
+def is_event_id(event_id):
+    """
+    Checks whether a client event ID can be stored: a non-empty string of at most MAX_EVENT_ID_LENGTH characters.
+    """
+    return isinstance(event_id, str) and 0 < len(event_id) <= MAX_EVENT_ID_LENGTH
+
+# Recent Check-Offs class that remembers the results of the latest check-offs sent with a client event ID.
+# Mobile clients resend a check-off when they didn't get its response, usually within seconds, so most retries
+# are answered from here with the original result, before a connection is checked out or the writer is queued.
+# Retries it doesn't remember (evicted, or checked off by another worker) are still caught by the unique
+# (user_habit_id, event_id) index of habit_tracker.
+class RecentCheckOffs:
+    """
+    An LRU map of (user name, habit name, event ID) to the result of the check-off.
+
+    Attributes:
+    ----------
+    max_entries : int
+        Number of check-offs remembered, the least recently used ones are evicted first.
+    """
+
+    def __init__(self, max_entries=None):
+        if max_entries is None:
+            max_entries = int(os.getenv("CHECK_OFF_EVENTS_MAX_ENTRIES", 100_000))
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._results = collections.OrderedDict()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    def get(self, user_name, habit_name, event_id):
+        """
+        Gets the result of a remembered check-off.
+
+        Parameters:
+        ----------
+        user_name : str
+            The name of the user.
+        habit_name : str
+            The name of the habit, as sent by the client.
+        event_id : str
+            The client event ID of the check-off.
+
+        Returns:
+        -------
+        dict or None
+            A copy of the result of the check-off, or None if it isn't remembered.
+        """
+        key = (user_name, habit_name, event_id)
+        with self._lock:
+            result = self._results.get(key)
+            if result is None:
+                self._stats['misses'] += 1
+                return None
+            self._results.move_to_end(key)
+            self._stats['hits'] += 1
+            return dict(result)
+
+    def put(self, user_name, habit_name, event_id, result):
+        """
+        Remembers the result of a check-off, evicting the least recently used ones beyond `max_entries`.
+        """
+        if self.max_entries <= 0:
+            return
+        key = (user_name, habit_name, event_id)
+        with self._lock:
+            self._results[key] = dict(result)
+            self._results.move_to_end(key)
+            self._stats['stores'] += 1
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        """
+        Forgets every check-off.
+        """
+        with self._lock:
+            self._results.clear()
+
+    def metrics(self):
+        """
+        Gets the counters of the map.
+
+        Returns:
+        -------
+        dict
+            Hits, misses, stored and evicted check-offs, and the number of check-offs remembered.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._results)
+            stats['max_entries'] = self.max_entries
+        return stats
+
+# Global instance of the RecentCheckOffs class
+recent_check_offs = RecentCheckOffs()
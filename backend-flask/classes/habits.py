@@ -1,8 +1,25 @@
 import datetime
-from db.db import squlite_db
+import os
+import sqlite3
+from db.shards import shard_router
+from db.writer import write
+from classes.catalog import habit_catalog, replicate_catalog
+from classes.check_off_events import MAX_EVENT_ID_LENGTH, RETRY_WINDOW, is_event_id, recent_check_offs
+from classes.partitions import partitions_for
+from classes.leaderboard import leaderboard, streaks_version
+from classes.response_cache import response_cache
+from classes.periods import DEFAULT_TIMEZONE, is_timezone, period_engine, rekey_user, user_timezone
+from classes.streaks import TIMESTAMP_FORMAT, next_streak, period_from_day, streaks_from_keys
+
+# Most events a batch check-off takes, larger batches are refused by the routes
+MAX_BATCH_EVENTS = int(os.getenv("CHECK_OFF_BATCH_MAX_EVENTS", 1000))
 
 # Habit class that encasulates all habit related queries and updates
 # The habit class handles all direct calls to the SQLite DB
+# Every write is a function of a connection, handed to db.writer.write: it runs in its own transaction,
+# or is queued to the write coordinator and group committed with other writes when that is enabled.
+# Once committed, writes report their streak changes to the leaderboards and make the response cache recheck versions
+# A user's data lives on the shard the shard router picks for them (db/shards.py), the habits catalog on the primary
 class Habit:
     """
     A class to represent a habit and handle all related queries and updates in the SQLite database.
@@ -38,26 +55,23 @@ class Habit:
     untrack_habit(habit_name):
         Stops tracking a habit for the user.
         
-    check_off_habit(habit_name):
+    check_off_habit(habit_name, completed_at=None):
         Checks off a habit as completed for the day/week.
         
-    __increment_habit_streak(habit_name):
-        Increments the current streak for a habit.
+    check_off_many(events):
+        Checks off a batch of (user_name, habit_name, completed_at) events in one transaction.
         
-    __reset_habit_streak(habit_name):
-        Resets the current streak for a habit.
+    get_timezone():
+        Gets the timezone the user's days and weeks are counted in.
         
-    __increment_longest_streak(habit_name):
-        Updates the longest streak for a habit if the current streak is longer.
-        
-    __get_last_completed_habit_tracked_date(user_habit_id):
-        Fetches the last completed date for a tracked habit.
-        
-    __get_habit_periodicity(habit_id):
-        Fetches the periodicity of a habit by its ID.
+    set_timezone(timezone):
+        Sets the user's timezone and recomputes the keys and streaks of their history.
         
     __get_habit_id(habit_name):
         Fetches the ID of a habit by its name.
+        
+    __get_user_tracked_habit_id(habit_id):
+        Fetches the user's tracked habit ID based on the habit ID.
     """
 
     def __init__(self, user_name=None):
@@ -70,8 +84,12 @@ class Habit:
             Name of the user who owns the habit.
         """
         self.user_name = user_name
-        self.cur = squlite_db.cursor
-        self.con = squlite_db.conn
+        # The shard of the user, the primary without a user
+        self.db = shard_router.db_for(user_name)
+        self.shard = shard_router.index_of(self.db)
+        # Each instance gets its own cursor on the connection checked out for the current request
+        self.con = self.db.conn
+        self.cur = self.con.cursor()
 
     def get_all_habits(self):
         """
@@ -82,8 +100,7 @@ class Habit:
         list
             A list of all habits.
         """
-        data = self.cur.execute("SELECT * FROM habits")
-        return data.fetchall()
+        return habit_catalog.all()
 
     def get_habit(self, habit_name):
         """
@@ -99,8 +116,7 @@ class Habit:
         dict or tuple
             The habit details or an error message if not found.
         """
-        data = self.cur.execute("SELECT * FROM habits WHERE name = ?", (habit_name,))
-        habit = data.fetchone()
+        habit = habit_catalog.by_name(habit_name)
         if habit is None:
             return {"error": "Habit not found", "code": 404}
         return habit
@@ -119,8 +135,7 @@ class Habit:
         list
             A list of habits with the specified periodicity.
         """
-        data = self.cur.execute("SELECT * FROM habits WHERE periodicity = ?", (periodicity,))
-        return data.fetchall()
+        return habit_catalog.by_periodicity(periodicity)
 
     def create_habit(self, habit_name, description, periodicity):
         """
@@ -140,14 +155,24 @@ class Habit:
         dict
             A success message or an error message if the habit already exists.
         """
-        data = self.cur.execute("SELECT * FROM habits WHERE name = ?", (habit_name,))
-        habit = data.fetchone()
-        if habit is not None:
+        if habit_catalog.by_name(habit_name) is not None:
             return {"error": "Habit with the same name already exists", "code": 400}
-        
-        self.cur.execute("INSERT INTO habits (name, description, periodicity) VALUES (?, ?, ?)", (habit_name, description, periodicity,))
-        self.con.commit()
-        
+
+        def operation(con):
+            con.execute("INSERT INTO habits (name, description, periodicity) VALUES (?, ?, ?)", (habit_name, description, periodicity,))
+
+        try:
+            write(shard_router.primary.conn, operation)
+        except sqlite3.IntegrityError:
+            # Another process created a habit with the same name since the catalog was last checked
+            return {"error": "Habit with the same name already exists", "code": 400}
+        finally:
+            habit_catalog.invalidate()
+            response_cache.invalidate()
+
+        # Every shard gets the habit, with the same ID
+        if shard_router.sharded:
+            replicate_catalog(shard_router)
         return {"message": "Habit Created"}
 
     def get_habit_current_streak(self, habit_name):
@@ -224,14 +249,18 @@ class Habit:
         
         habit_id = _habit_id['id']
         
-        user_tracked_habit_id = self.__get_user_tracked_habit_id(habit_id)
-        
-        if user_tracked_habit_id.get('error'):
-            self.cur.execute("INSERT INTO user_habits (habit_id, user_name) VALUES (?, ?)", (habit_id, self.user_name,))
-            self.con.commit()
+        streak_changes = []
+        def operation(con):
+            user_tracked_habit_id = self.__get_user_tracked_habit_id(habit_id, con)
+            if not user_tracked_habit_id.get('error'):
+                return {"error": "User is already tracking this habit", "code": 400}
+            cur = con.execute("INSERT INTO user_habits (habit_id, user_name) VALUES (?, ?)", (habit_id, self.user_name,))
+            streak_changes.append((streaks_version(con), [(cur.lastrowid, self.user_name, habit_id, (0, 0))]))
             return {"message": "Started Tracking Habit"}
-        else:
-            return {"error": "User is already tracking this habit", "code": 400}
+
+        result = self.__write(operation)
+        after_write(streak_changes, self.shard)
+        return result
         
 
     def untrack_habit(self, habit_name):
@@ -256,194 +285,367 @@ class Habit:
         
         habit_id = _habit_id['id']
         
-        user_tracked_habit_id = self.__get_user_tracked_habit_id(habit_id)
-        
-        if user_tracked_habit_id.get('error'):
-            return user_tracked_habit_id
+        streak_changes = []
+        def operation(con):
+            user_tracked_habit_id = self.__get_user_tracked_habit_id(habit_id, con)
+            if user_tracked_habit_id.get('error'):
+                return user_tracked_habit_id
+            con.execute("DELETE FROM user_habits WHERE habit_id = ? AND user_name = ?", (habit_id, self.user_name,))
+            streak_changes.append((streaks_version(con), [(user_tracked_habit_id['id'], self.user_name, habit_id, None)]))
 
-        self.cur.execute("DELETE FROM user_habits WHERE habit_id = ? AND user_name = ?", (habit_id, self.user_name,))
-        self.con.commit()
+        result = self.__write(operation)
+        after_write(streak_changes, self.shard)
+        return result
 
-    def check_off_habit(self, habit_name):
+    def check_off_habit(self, habit_name, completed_at=None, event_id=None):
         """
         Checks off a habit as completed for the day/week.
 
+        The whole check-off is one transaction of three statements: a lookup of the tracked habit's
+        streaks and last completion, the insert into habit_tracker, and a single update of both streaks.
+        The habit itself comes from the in-process habit catalog.
+
+        A check-off sent with a client event ID is done once: a retry with the same ID gets the result
+        of the first check-off, from the recent check-offs of this process or, failing that, from the
+        lookup, which also probes the (user_habit_id, event_id) index of habit_tracker and then of the archive
+        tables covering the last RETRY_WINDOW, if there are any. The streaks a check-off returned are stored with its event ID, so later
+        check-offs don't change what its retries get.
+
         Parameters:
         ----------
         habit_name : str
             The name of the habit to check off.
+        completed_at : datetime.datetime, optional
+            When the habit was completed, a naive datetime being a local time of the user's timezone. Defaults to now.
+        event_id : str, optional
+            The client's ID of the check-off, so retries of it are not counted again.
 
         Returns:
         -------
         dict
-            A success message or an error message if user_name is not provided or habit is already checked off for the period.
+            A success message with the new streaks (flagged as a duplicate for a retried event ID), or an error
+            message if user_name is not provided, the event ID is invalid, the habit is not tracked,
+            or the habit is already checked off for the period.
         """
         if self.user_name is None:
             return {"error": "user_name must be provided", "code": 400}
-        _habit_id = self.__get_habit_id(habit_name)
-        if _habit_id.get('error'):
-            return _habit_id
-        
-        habit_id = _habit_id['id']
-        
-        user_tracked_habit_id = self.__get_user_tracked_habit_id(habit_id)
-        
-        if user_tracked_habit_id.get('error'):
-            return user_tracked_habit_id
-
-        # Track Habit
-        self.track_habit(user_tracked_habit_id['id'])
-
-        last_completed_date = self.__get_last_completed_habit_tracked_date(user_tracked_habit_id['id'])
-        periodicity = self.__get_habit_periodicity(habit_id)
-        _current_steak = self.get_habit_current_streak(habit_name)
-        current_streak = _current_steak['current_streak']
-        _longest_streak = self.get_habit_longest_streak(habit_name)
-        longest_streak = _longest_streak['longest_streak']
-        
-        print('last_completed_date', last_completed_date)
-
-        if last_completed_date:
-            last_completed_date_time_obj = datetime.datetime.strptime(last_completed_date, '%Y-%m-%d %H:%M:%S')
-            
-            last_completed_date_str = last_completed_date_time_obj.strftime('%Y-%m-%d')
-
-            today = datetime.date.today()
-            
-            yesterday = today - datetime.timedelta(days=1)
-            last_week = today - datetime.timedelta(days=7)
+        if event_id is not None and not is_event_id(event_id):
+            return {"error": f"event_id must be a string of at most {MAX_EVENT_ID_LENGTH} characters", "code": 400}
+        if event_id is not None:
+            # Most retries are answered here, without touching SQLite
+            result = recent_check_offs.get(self.user_name, habit_name, event_id)
+            if result is not None:
+                return result
+        if completed_at is None:
+            completed_at = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+
+        habit = habit_catalog.by_name(habit_name)
+        if habit is None:
+            return {"error": "Habit not found", "code": 404}
 
-            if last_completed_date_str == today:
+        # A retry comes within RETRY_WINDOW of its check-off, so only the archive tables reaching into that window
+        # can hold it, usually none. The partitions are read here, not on the write coordinator's thread,
+        # which must not check out pooled connections
+        archives = []
+        if event_id is not None:
+            since = (completed_at - RETRY_WINDOW).strftime(TIMESTAMP_FORMAT)
+            archives = partitions_for(self.db).tables(since=since)[1:]
+
+        # The write lock is taken up front, so the streaks can't change between the lookup and the update
+        streak_changes = []
+        def operation(con):
+            data = self.db.cursor_for('row', con).execute(
+                """SELECT
+                       user_habits.id AS user_habit_id,
+                       user_habits.current_streak,
+                       user_habits.longest_streak,
+                       user_habit_stats.last_day_key,
+                       user_timezones.timezone,
+                       (SELECT version FROM data_versions WHERE scope = 'streaks') AS streaks_version,
+                       checked_off.id AS checked_off_id,
+                       checked_off.event_current_streak,
+                       checked_off.event_longest_streak
+                    FROM
+                       user_habits
+                    LEFT JOIN
+                       user_habit_stats ON user_habit_stats.user_habit_id = user_habits.id
+                    LEFT JOIN
+                       user_timezones ON user_timezones.user_name = user_habits.user_name
+                    LEFT JOIN
+                       habit_tracker AS checked_off ON checked_off.user_habit_id = user_habits.id AND checked_off.event_id = ?
+                    WHERE
+                       user_habits.user_name = ? AND user_habits.habit_id = ?""",
+                (event_id, self.user_name, habit['id'],)
+            )
+            state = data.fetchone()
+            if state is None:
+                return {"error": "Habit Not Tracked By User", "code": 404}
+            # A retry of a check-off that is already stored changes nothing
+            if state['checked_off_id'] is not None:
+                return duplicate_result(state)
+            # Or of one that was archived since
+            if archives:
+                checked_off = self.db.cursor_for('row', con).execute(
+                    " UNION ALL ".join(f"SELECT event_current_streak, event_longest_streak FROM {table} WHERE user_habit_id = ?1 AND event_id = ?2"
+                                       for table in archives) + " LIMIT 1",
+                    (state['user_habit_id'], event_id,)
+                ).fetchone()
+                if checked_off is not None:
+                    return duplicate_result(checked_off)
+
+            periodicity = habit['periodicity']
+            # The period is the day or week of the user's timezone the completion falls in
+            keys = period_engine.completion_keys(completed_at, state['timezone'])
+            key = period_from_day(keys[2], periodicity)
+            last_key = None
+            if state['last_day_key'] is not None:
+                last_key = period_from_day(state['last_day_key'], periodicity)
+                if key < last_key:
+                    return {"error": "Habit was already checked off after this time", "code": 400}
+
+            streaks = next_streak(last_key, key, state['current_streak'], state['longest_streak'])
+            if streaks is None:
+                if periodicity == 'WEEKLY':
+                    return {"error": "Habit already checked off this week", "code": 400}
                 return {"error": "Habit already checked off today", "code": 400}
-            elif periodicity == 'DAILY' and last_completed_date_str == yesterday:
-                self.__increment_habit_streak(habit_name)
-            elif periodicity == 'WEEKLY' and last_week <= last_completed_date_str <= yesterday:
-                self.__increment_habit_streak(habit_name)
-            else:
-                self.__reset_habit_streak(habit_name)
-                self.__increment_habit_streak(habit_name)
-        else:
-            self.__increment_habit_streak(habit_name)
-
-        if (current_streak + 1) > longest_streak:
-            self.__increment_longest_streak(habit_name)
-
-    def __increment_habit_streak(self, habit_name):
-        """
-        Increments the current streak for a habit.
+            current_streak, longest_streak = streaks
+
+            cur = con.execute(
+                """INSERT INTO habit_tracker (user_habit_id, completed_at, completed_epoch, day_key, iso_week_key,
+                                              event_id, event_current_streak, event_longest_streak)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT DO NOTHING""",
+                (state['user_habit_id'],) + keys + (event_id,) + ((current_streak, longest_streak) if event_id is not None else (None, None))
+            )
+            if cur.rowcount == 0:
+                checked_off = self.db.cursor_for('row', con).execute(
+                    "SELECT event_current_streak, event_longest_streak FROM habit_tracker WHERE user_habit_id = ? AND event_id = ?",
+                    (state['user_habit_id'], event_id,)
+                ).fetchone()
+                return duplicate_result(checked_off)
+            con.execute("UPDATE user_habits SET current_streak = ?, longest_streak = ? WHERE id = ?",
+                        (current_streak, longest_streak, state['user_habit_id'],))
+            # The update bumped the streaks version once, and nothing else could since the lookup
+            streak_changes.append((state['streaks_version'] + 1, [(state['user_habit_id'], self.user_name, habit['id'], (current_streak, longest_streak))]))
+            return {"message": "Habit checked off", "current_streak": current_streak, "longest_streak": longest_streak}
+
+        result = self.__write(operation)
+        after_write(streak_changes, self.shard)
+        if event_id is not None and not result.get('error'):
+            recent_check_offs.put(self.user_name, habit_name, event_id, dict(result, duplicate=True))
+        return result
+
+    def check_off_many(self, events):
+        """
+        Checks off a batch of habits, for any number of users, in one transaction per shard.
+
+        Events may arrive in any order. Events of a tracked habit that all come after its last
+        completion extend the stored streaks; otherwise the streaks are recomputed from the
+        habit's full history. All rows are written with executemany and committed once.
 
         Parameters:
         ----------
-        habit_name : str
-            The name of the habit.
+        events : list
+            A list of (user_name, habit_name, completed_at) tuples, where completed_at is a
+            datetime.datetime or an ISO 8601 string (e.g., '2024-07-13 09:00:00'). Times without
+            an offset are local times of the user's timezone.
 
         Returns:
         -------
-        dict
-            A success message or an error message if user_name is not provided.
-        """
-        if self.user_name is None:
-            return {"error": "user_name must be provided", "code": 400}
-
-        _habit_id = self.__get_habit_id(habit_name)
-        if _habit_id.get('error'):
-            return _habit_id
-        
-        habit_id = _habit_id['id']
-        
-        self.cur.execute("UPDATE user_habits SET current_streak = current_streak + 1 WHERE habit_id = ? AND user_name = ?", (habit_id, self.user_name,))
-        self.con.commit()
-
-    def __reset_habit_streak(self, habit_name):
-        """
-        Resets the current streak for a habit.
+        list
+            One result per event, in the order of the events. A result is a success message
+            with the streaks of the user's habit once the whole batch is applied, or an error message.
+        """
+        results = [None] * len(events)
+        pending = []
+        for index, event in enumerate(events):
+            try:
+                user_name, habit_name, completed_at = event
+                if isinstance(completed_at, str):
+                    completed_at = datetime.datetime.fromisoformat(completed_at)
+                if not isinstance(completed_at, datetime.datetime):
+                    raise ValueError
+                # Names are looked up and sorted, so anything but a non-empty string fails this event alone
+                if not isinstance(user_name, str) or not isinstance(habit_name, str) or not user_name or not habit_name:
+                    raise ValueError
+            except (TypeError, ValueError):
+                results[index] = {"error": "Event must have a user_name, habit_name and completed_at timestamp", "code": 400}
+                continue
+            pending.append((index, user_name, habit_name, completed_at.replace(microsecond=0)))
+
+        if not pending:
+            return results
+
+        # The catalog is read here, as the operations may run on the write coordinator's thread,
+        # which must not check out pooled connections
+        habits = {habit['id']: habit for habit in habit_catalog.all()}
+
+        # The events of each shard are written in their own transaction
+        by_shard = {}
+        for event in pending:
+            by_shard.setdefault(shard_router.shard_index(event[1]), []).append(event)
+        for shard, shard_events in sorted(by_shard.items()):
+            db = shard_router.shards[shard]
+            streak_changes = []
+            write(db.conn, self.__check_off_events(db, shard_events, habits, results, streak_changes), shard_router.coordinator_for(db))
+            after_write(streak_changes, shard)
+        return results
+
+    def __check_off_events(self, db, pending, habits, results, streak_changes):
+        """
+        Builds the write operation of check_off_many for the events of the users of one shard.
 
         Parameters:
         ----------
-        habit_name : str
-            The name of the habit.
+        db : SqliteDB
+            The shard of the users.
+        pending : list
+            The (index, user_name, habit_name, completed_at) of the valid events.
+        habits : dict
+            The habits of the catalog, keyed by ID.
+        results : list
+            The results of the batch, filled in by the operation.
+        streak_changes : list
+            Collects the (streaks version, changes) of the operation.
+
+        Returns:
+        -------
+        callable
+            The write operation.
+        """
+        habit_names = {habit['name'] for habit in habits.values()}
+        def operation(con):
+            tracked = self.__get_user_tracked_habits_state({user_name for _, user_name, _, _ in pending}, habits, con)
+
+            # Group the events by the user's tracked habit, with the keys of the user's timezone
+            groups = {}
+            for index, user_name, habit_name, completed_at in pending:
+                state = tracked.get((user_name, habit_name))
+                if state is None:
+                    if habit_name not in habit_names:
+                        results[index] = {"error": "Habit not found", "code": 404}
+                    else:
+                        results[index] = {"error": "Habit Not Tracked By User", "code": 404}
+                    continue
+                keys = period_engine.completion_keys(completed_at, state['timezone'])
+                groups.setdefault(state['user_habit_id'], (state, []))[1].append((index, keys))
+
+            tracker_rows = []
+            streak_rows = []
+            changes = []
+            for user_habit_id, (state, group_events) in groups.items():
+                periodicity = state['periodicity']
+                last_key = None
+                if state['last_day_key'] is not None:
+                    last_key = period_from_day(state['last_day_key'], periodicity)
+
+                # In completion order
+                group_events.sort(key=lambda event: event[1][1])
+                incremental = last_key is None or period_from_day(group_events[0][1][2], periodicity) > last_key
+                if incremental:
+                    # Every event is newer than the history, so the stored streaks are extended
+                    current_streak, longest_streak = state['current_streak'], state['longest_streak']
+                else:
+                    # An event lands inside the history, so the streaks are recomputed from all of it, archived partitions included
+                    data = db.cursor_for('tuple', con).execute("SELECT day_key FROM habit_tracker_history WHERE user_habit_id = ?", (user_habit_id,))
+                    completed_keys = {period_from_day(row[0], periodicity) for row in data.fetchall()}
+
+                accepted = []
+                for index, keys in group_events:
+                    key = period_from_day(keys[2], periodicity)
+                    if incremental:
+                        streaks = next_streak(last_key, key, current_streak, longest_streak)
+                        duplicate = streaks is None
+                        if not duplicate:
+                            current_streak, longest_streak = streaks
+                            last_key = key
+                    else:
+                        duplicate = key in completed_keys
+                        completed_keys.add(key)
+
+                    if duplicate:
+                        if periodicity == 'WEEKLY':
+                            results[index] = {"error": "Habit already checked off this week", "code": 400}
+                        else:
+                            results[index] = {"error": "Habit already checked off today", "code": 400}
+                        continue
+                    accepted.append(index)
+                    tracker_rows.append((user_habit_id,) + keys)
+
+                if not accepted:
+                    continue
+                if not incremental:
+                    current_streak, longest_streak = streaks_from_keys(sorted(completed_keys))
+                    longest_streak = max(longest_streak, state['longest_streak'])
+                streak_rows.append((current_streak, longest_streak, user_habit_id))
+                changes.append((user_habit_id, state['user_name'], state['habit_id'], (current_streak, longest_streak)))
+                for index in accepted:
+                    results[index] = {"message": "Habit checked off", "current_streak": current_streak, "longest_streak": longest_streak}
+
+            con.executemany("INSERT INTO habit_tracker (user_habit_id, completed_at, completed_epoch, day_key, iso_week_key) VALUES (?, ?, ?, ?, ?)",
+                            tracker_rows)
+            con.executemany("UPDATE user_habits SET current_streak = ?, longest_streak = ? WHERE id = ?", streak_rows)
+            if changes:
+                streak_changes.append((streaks_version(con), changes))
+            return results
+
+        return operation
+
+    def get_timezone(self):
+        """
+        Gets the timezone the user's days and weeks are counted in.
 
         Returns:
         -------
         dict
-            A success message or an error message if user_name is not provided.
+            The user's name and timezone, or an error message if user_name is not provided.
         """
         if self.user_name is None:
             return {"error": "user_name must be provided", "code": 400}
-        _habit_id = self.__get_habit_id(habit_name)
-        if _habit_id.get('error'):
-            return _habit_id
-        
-        habit_id = _habit_id['id']
-        
-        self.cur.execute("UPDATE user_habits SET current_streak = 0 WHERE habit_id = ? AND user_name = ?", (habit_id, self.user_name,))
-        self.con.commit()
+        timezone = user_timezone(self.db.cursor_for('tuple', self.con), self.user_name)
+        return {"user_name": self.user_name, "timezone": timezone or DEFAULT_TIMEZONE}
 
-    def __increment_longest_streak(self, habit_name):
+    def set_timezone(self, timezone):
         """
-        Updates the longest streak for a habit if the current streak is longer.
+        Sets the timezone the user's days and weeks are counted in.
+
+        The day and week keys of the user's whole history, their streaks and their heatmap days are
+        recomputed for the new timezone in the same transaction.
 
         Parameters:
         ----------
-        habit_name : str
-            The name of the habit.
+        timezone : str
+            The IANA name of the timezone (e.g., 'America/New_York').
 
         Returns:
         -------
         dict
-            A success message or an error message if user_name is not provided.
+            A success message, or an error message if user_name is not provided or the timezone is unknown.
         """
         if self.user_name is None:
             return {"error": "user_name must be provided", "code": 400}
-        _habit_id = self.__get_habit_id(habit_name)
-        if _habit_id.get('error'):
-            return _habit_id
-        
-        habit_id = _habit_id['id']
-        
-        self.cur.execute("UPDATE user_habits SET longest_streak = current_streak WHERE habit_id = ? AND user_name = ?", (habit_id, self.user_name,))
-        self.con.commit()
-
-    def __get_last_completed_habit_tracked_date(self, user_habit_id):
-        """
-        Fetches the last completed date for a tracked habit.
+        if not is_timezone(timezone):
+            return {"error": "Unknown timezone", "code": 400}
 
-        Parameters:
-        ----------
-        user_habit_id : int
-            The ID of the user's tracked habit.
-
-        Returns:
-        -------
-        dict or tuple
-            The last completed date or an error message if not found.
-        """
-        data = self.cur.execute("SELECT completed_at FROM habit_tracker WHERE user_habit_id = ? ORDER BY completed_at DESC LIMIT 1", (user_habit_id,))
-        last_completed = data.fetchone()
-        if last_completed is None:
-            return None
+        streak_changes = []
+        def operation(con):
+            if user_timezone(self.db.cursor_for('tuple', con), self.user_name) == timezone:
+                return {"message": "Timezone updated", "timezone": timezone}
+            con.execute("INSERT INTO user_timezones (user_name, timezone) VALUES (?, ?) ON CONFLICT (user_name) DO UPDATE SET timezone = excluded.timezone",
+                        (self.user_name, timezone,))
+            changes = rekey_user(con, self.user_name, timezone)
+            if changes:
+                streak_changes.append((streaks_version(con), changes))
+            return {"message": "Timezone updated", "timezone": timezone}
 
-        return last_completed['completed_at']
+        result = self.__write(operation)
+        after_write(streak_changes, self.shard)
+        return result
 
-    def __get_habit_periodicity(self, habit_id):
+    def __write(self, operation):
         """
-        Fetches the periodicity of a habit by its ID.
-
-        Parameters:
-        ----------
-        habit_id : int
-            The ID of the habit.
-
-        Returns:
-        -------
-        dict or tuple
-            The periodicity of the habit or an error message if not found.
+        Runs a write operation on the user's shard, see db.writer.write.
         """
-        data = self.cur.execute("SELECT periodicity FROM habits WHERE id = ?", (habit_id,))
-        habit = data.fetchone()
-        if habit is None:
-            return {"error": "Habit not found", "code": 404}
-        return habit['periodicity']
+        return write(self.con, operation, shard_router.coordinator_for(self.db))
 
     def __get_habit_id(self, habit_name):
         """
@@ -459,13 +661,12 @@ class Habit:
         dict or tuple
             The ID of the habit or an error message if not found.
         """
-        data = self.cur.execute("SELECT id FROM habits WHERE name = ?", (habit_name,))
-        habit = data.fetchone()
+        habit = habit_catalog.by_name(habit_name)
         if habit is None:
             return {"error": "Habit not found", "code": 404}
-        return habit
+        return {"id": habit['id']}
     
-    def __get_user_tracked_habit_id(self, habit_id):
+    def __get_user_tracked_habit_id(self, habit_id, con=None):
         """
         Fetches the user's tracked habit ID based on the habit ID.
 
@@ -473,14 +674,106 @@ class Habit:
         ----------
         habit_id : int
             The ID of the habit.
+        con : sqlite3.Connection, optional
+            The connection to query, e.g. the one a write operation runs on.
 
         Returns:
         -------
         dict or int
             The user's tracked habit ID or an error message if not found.
         """
-        data = self.cur.execute("SELECT id FROM user_habits WHERE user_name = ? AND habit_id = ?", (self.user_name, habit_id,))
+        cur = self.db.cursor_for('tuple', con)
+        data = cur.execute("SELECT id FROM user_habits WHERE user_name = ? AND habit_id = ?", (self.user_name, habit_id,))
         user_habit = data.fetchone()
         if user_habit is None:
             return {"error": "Habit Not Tracked By User", "code": 404}
-        return user_habit
+        return {"id": user_habit[0]}
+
+    def __get_user_tracked_habits_state(self, user_names, habits, con):
+        """
+        Fetches the periodicity, streaks and last completion of every habit tracked by the given users.
+
+        Parameters:
+        ----------
+        user_names : set
+            The names of the users.
+        habits : dict
+            The habits of the catalog, keyed by ID.
+        con : sqlite3.Connection
+            The connection to query.
+
+        Returns:
+        -------
+        dict
+            The state of each tracked habit, keyed by (user_name, habit_name).
+        """
+        tracked = {}
+        for chunk in chunked(sorted(user_names)):
+            placeholders = ', '.join('?' * len(chunk))
+            data = self.db.cursor_for('dict', con).execute(
+                f"""SELECT
+                       user_habits.id AS user_habit_id,
+                       user_habits.user_name,
+                       user_habits.habit_id,
+                       user_habits.current_streak,
+                       user_habits.longest_streak,
+                       user_habit_stats.last_day_key,
+                       user_timezones.timezone
+                    FROM
+                       user_habits
+                    LEFT JOIN
+                       user_habit_stats ON user_habit_stats.user_habit_id = user_habits.id
+                    LEFT JOIN
+                       user_timezones ON user_timezones.user_name = user_habits.user_name
+                    WHERE
+                       user_habits.user_name IN ({placeholders})""",
+                chunk
+            )
+            for row in data.fetchall():
+                habit = habits.get(row['habit_id'])
+                if habit is None:
+                    continue
+                row['periodicity'] = habit['periodicity']
+                tracked[(row['user_name'], habit['name'])] = row
+        return tracked
+
+
+def duplicate_result(checked_off):
+    """
+    Builds the result of a retried check-off from the streaks stored with its event ID.
+
+    Parameters:
+    ----------
+    checked_off : sqlite3.Row
+        The event_current_streak and event_longest_streak of the stored check-off.
+
+    Returns:
+    -------
+    dict
+        A success message flagged as a duplicate.
+    """
+    return {"message": "Habit checked off", "current_streak": checked_off['event_current_streak'],
+            "longest_streak": checked_off['event_longest_streak'], "duplicate": True}
+
+def after_write(streak_changes, shard=0):
+    """
+    Tells the in-process caches about a committed write: the leaderboards apply its streak changes,
+    and the response cache checks the data versions on its next lookup.
+
+    Parameters:
+    ----------
+    streak_changes : list
+        The (streaks version, changes) a write operation collected. Empty if it changed no streaks.
+    shard : int, optional
+        The position of the shard the write went to.
+    """
+    for version, changes in streak_changes:
+        leaderboard.record(version, changes, shard)
+    response_cache.invalidate()
+
+def chunked(values, size=500):
+    """
+    Splits a list into lists of at most `size` values, to stay under SQLite's bound parameter limit.
+    """
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
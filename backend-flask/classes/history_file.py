@@ -0,0 +1,429 @@
+import datetime
+import json
+import struct
+import zlib
+import numpy as np
+from classes.partitions import HOT_TABLE
+from classes.periods import rekey_user
+from classes.streak_engine import recompute_streaks
+
+# Compact columnar file of the tracked habits and their completions, for backups, analytics offload
+# and moving users between databases. The file is a header followed by zlib compressed blocks, written and
+# read one chunk at a time, so memory stays bounded by the chunk size however many completions are exported.
+#
+#   MAGIC
+#   header length (uint32) + header (JSON: format version, export time, the habits)
+#   blocks: kind (1 byte) + row count (uint32) + payload length (uint32) + zlib compressed payload
+#
+#   'N' user names: int32 byte lengths, then the UTF-8 names. Names get consecutive codes in file order.
+#   'U' user habits: id, habit_id (int64), user name code, current_streak, longest_streak (int32), created_at (int64)
+#   'T' completions: user_habit_id and completed_at (int64), both delta encoded within the block
+#   'E' end: the number of user habits and completions in the file
+#
+# Timestamps are seconds since 1970-01-01 (UTC, like the stored timestamps). Completions are written in
+# (user_habit_id, completed_epoch) index order, so their deltas are small and compress well.
+
+MAGIC = b'HABITHIST'
+FORMAT_VERSION = 1
+
+# Rows read from SQLite and written as one block
+CHUNK_SIZE = 100_000
+
+# Completions loaded between two commits of an import
+COMMIT_ROWS = 1_000_000
+
+# Settings of the importing connection while it bulk loads: no fsync per commit, a bigger page cache
+# and temporary tables in memory. The previous values are restored once the import is done.
+BULK_LOAD_PRAGMAS = {'synchronous': 'OFF', 'cache_size': -65536, 'temp_store': 'MEMORY'}
+
+BLOCK_HEADER = struct.Struct('<cII')
+LENGTH = struct.Struct('<I')
+
+USER_HABIT_COLUMNS = (('id', '<i8'), ('habit_id', '<i8'), ('user_name', '<i4'),
+                      ('current_streak', '<i4'), ('longest_streak', '<i4'), ('created_at', '<i8'))
+
+class HistoryFileError(Exception):
+    """Raised when a file is not a habit history file, or is truncated."""
+
+def pack_columns(columns, dtypes):
+    """
+    Packs equally long columns into one buffer, one column after the other.
+    """
+    return b''.join(np.ascontiguousarray(column, dtype=dtype).tobytes() for column, dtype in zip(columns, dtypes))
+
+def unpack_columns(payload, count, dtypes):
+    """
+    Unpacks the columns packed by pack_columns.
+
+    Returns:
+    -------
+    list
+        One numpy.ndarray per column.
+    """
+    columns = []
+    offset = 0
+    for dtype in dtypes:
+        column = np.frombuffer(payload, dtype=dtype, count=count, offset=offset)
+        offset += column.nbytes
+        columns.append(column)
+    return columns
+
+def delta_encode(values):
+    """
+    Replaces every value but the first by its difference to the previous one.
+    """
+    return np.diff(values, prepend=np.int64(0))
+
+def delta_decode(deltas):
+    """
+    Reverts delta_encode.
+    """
+    return np.cumsum(deltas, dtype=np.int64)
+
+class HistoryWriter:
+    """
+    Writes the blocks of a habit history file.
+
+    Attributes:
+    ----------
+    file : file object
+        The binary file written to.
+    level : int
+        The zlib compression level.
+    """
+
+    def __init__(self, file, habits, level=6):
+        self.file = file
+        self.level = level
+        self.user_habits = 0
+        self.completions = 0
+        self._name_codes = {}
+        header = json.dumps({
+            'format_version': FORMAT_VERSION,
+            'exported_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'habits': habits,
+        }).encode()
+        file.write(MAGIC + LENGTH.pack(len(header)) + header)
+
+    def __block(self, kind, count, payload):
+        payload = zlib.compress(payload, self.level)
+        self.file.write(BLOCK_HEADER.pack(kind, count, len(payload)) + payload)
+
+    def write_user_habits(self, rows):
+        """
+        Writes a chunk of user habits, with the user names that were not written yet.
+
+        Parameters:
+        ----------
+        rows : list
+            (id, habit_id, user_name, current_streak, longest_streak, created_at epoch) tuples.
+        """
+        new_names = []
+        codes = []
+        for row in rows:
+            code = self._name_codes.get(row[2])
+            if code is None:
+                code = self._name_codes[row[2]] = len(self._name_codes)
+                new_names.append(row[2].encode())
+            codes.append(code)
+        if new_names:
+            lengths = np.array([len(name) for name in new_names], dtype='<i4')
+            self.__block(b'N', len(new_names), lengths.tobytes() + b''.join(new_names))
+
+        columns = list(zip(*rows))
+        columns[2] = codes
+        self.__block(b'U', len(rows), pack_columns(columns, [dtype for _, dtype in USER_HABIT_COLUMNS]))
+        self.user_habits += len(rows)
+
+    def write_completions(self, user_habit_ids, completed_at):
+        """
+        Writes a chunk of completions.
+
+        Parameters:
+        ----------
+        user_habit_ids : numpy.ndarray
+            The user habit of each completion.
+        completed_at : numpy.ndarray
+            When each completion happened, in seconds since 1970-01-01.
+        """
+        payload = pack_columns([delta_encode(user_habit_ids), delta_encode(completed_at)], ['<i8', '<i8'])
+        self.__block(b'T', len(user_habit_ids), payload)
+        self.completions += len(user_habit_ids)
+
+    def close(self):
+        """
+        Writes the end block.
+        """
+        self.__block(b'E', 0, pack_columns([[self.user_habits], [self.completions]], ['<i8', '<i8']))
+
+class HistoryReader:
+    """
+    Reads the blocks of a habit history file one at a time.
+
+    Attributes:
+    ----------
+    header : dict
+        The file header: format version, export time and the habits.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        if file.read(len(MAGIC)) != MAGIC:
+            raise HistoryFileError('Not a habit history file')
+        (length,) = LENGTH.unpack(self.__read(LENGTH.size))
+        self.header = json.loads(self.__read(length))
+        if self.header.get('format_version') != FORMAT_VERSION:
+            raise HistoryFileError(f"Unsupported format version {self.header.get('format_version')}")
+        self.user_names = []
+
+    def __read(self, size):
+        data = self.file.read(size)
+        if len(data) != size:
+            raise HistoryFileError('Truncated habit history file')
+        return data
+
+    def blocks(self):
+        """
+        Reads the blocks of the file, decoding user names and delta encoded completions.
+
+        Yields:
+        -------
+        tuple
+            ('U', columns) for a chunk of user habits, with the user names decoded, ('T', (user_habit_ids, completed_at))
+            for a chunk of completions, and ('E', (user habits, completions)) at the end of the file.
+        """
+        while True:
+            kind, count, length = BLOCK_HEADER.unpack(self.__read(BLOCK_HEADER.size))
+            payload = zlib.decompress(self.__read(length))
+            if kind == b'N':
+                lengths = np.frombuffer(payload, dtype='<i4', count=count)
+                offsets = np.concatenate(([0], np.cumsum(lengths))) + lengths.nbytes
+                self.user_names.extend(payload[start:end].decode() for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist()))
+            elif kind == b'U':
+                columns = unpack_columns(payload, count, [dtype for _, dtype in USER_HABIT_COLUMNS])
+                columns[2] = [self.user_names[code] for code in columns[2].tolist()]
+                yield 'U', columns
+            elif kind == b'T':
+                user_habit_ids, completed_at = unpack_columns(payload, count, ['<i8', '<i8'])
+                yield 'T', (delta_decode(user_habit_ids), delta_decode(completed_at))
+            elif kind == b'E':
+                user_habits, completions = unpack_columns(payload, 1, ['<i8', '<i8'])
+                yield 'E', (int(user_habits[0]), int(completions[0]))
+                return
+            else:
+                raise HistoryFileError(f'Unknown block {kind!r}')
+
+def export_history(connection, file, user_names=None, chunk_size=CHUNK_SIZE):
+    """
+    Streams the habits, the tracked habits and their completions (archived partitions included) to a history file.
+
+    Parameters:
+    ----------
+    connection : sqlite3.Connection
+        The connection to the database.
+    file : file object
+        The binary file to write to.
+    user_names : list, optional
+        Only export the habits tracked by these users. Defaults to all users.
+    chunk_size : int, optional
+        Rows read and written at a time.
+
+    Returns:
+    -------
+    dict
+        The number of user habits and completions exported.
+    """
+    cur = connection.cursor()
+    cur.row_factory = None
+
+    habits = [dict(zip(('id', 'name', 'description', 'periodicity', 'created_at'), row))
+              for row in cur.execute("SELECT id, name, description, periodicity, created_at FROM habits ORDER BY id")]
+    writer = HistoryWriter(file, habits)
+
+    # A read transaction, so the user habits and the completions are exported from the same snapshot
+    cur.execute("BEGIN")
+    try:
+        user_filter = ''
+        if user_names is not None:
+            cur.execute("CREATE TEMP TABLE IF NOT EXISTS export_users (user_name VARCHAR(255) PRIMARY KEY)")
+            cur.execute("DELETE FROM temp.export_users")
+            cur.executemany("INSERT OR IGNORE INTO temp.export_users (user_name) VALUES (?)", [(name,) for name in user_names])
+            user_filter = "WHERE user_name IN (SELECT user_name FROM temp.export_users)"
+
+        data = cur.execute(
+            f"""SELECT id, habit_id, user_name, current_streak, longest_streak, CAST(strftime('%s', created_at) AS INTEGER)
+                FROM user_habits
+                {user_filter}
+                ORDER BY user_name, habit_id"""
+        )
+        while True:
+            rows = data.fetchmany(chunk_size)
+            if not rows:
+                break
+            writer.write_user_habits(rows)
+
+        tables = [HOT_TABLE] + [row[0] for row in cur.execute("SELECT name FROM habit_tracker_partitions ORDER BY starts_at")]
+        for table in tables:
+            data = cur.execute(
+                f"""SELECT user_habit_id, completed_epoch
+                    FROM {table}
+                    WHERE user_habit_id IN (SELECT id FROM user_habits {user_filter})
+                    ORDER BY user_habit_id, completed_epoch"""
+            )
+            while True:
+                rows = data.fetchmany(chunk_size)
+                if not rows:
+                    break
+                columns = np.array(rows, dtype=np.int64)
+                writer.write_completions(columns[:, 0], columns[:, 1])
+    finally:
+        connection.rollback()
+
+    writer.close()
+    return {'user_habits': writer.user_habits, 'completions': writer.completions}
+
+def import_history(connection, file, commit_rows=COMMIT_ROWS):
+    """
+    Bulk loads a history file, one block at a time, with the connection tuned for bulk loading.
+
+    Habits are matched by name (missing ones are created) and tracked habits by user name and habit,
+    so the file can be loaded into a database that already has data. Tracked habits that already existed
+    are merged: their completions that are not in the database yet are added and their streaks recomputed,
+    so loading the same file twice changes nothing. Completions of users with a stored timezone are rekeyed
+    to their local days once loaded. Completions are inserted with
+    executemany and committed every `commit_rows` rows; the summary table is kept up to date by its triggers.
+
+    Parameters:
+    ----------
+    connection : sqlite3.Connection
+        The connection to the database.
+    file : file object
+        The binary file to read from.
+    commit_rows : int, optional
+        Completions loaded between two commits.
+
+    Returns:
+    -------
+    dict
+        The number of user habits created and merged, and the number of completions loaded.
+    """
+    reader = HistoryReader(file)
+    cur = connection.cursor()
+    cur.row_factory = None
+
+    previous_pragmas = {name: cur.execute(f"PRAGMA {name}").fetchone()[0] for name in BULK_LOAD_PRAGMAS}
+    for name, value in BULK_LOAD_PRAGMAS.items():
+        cur.execute(f"PRAGMA {name} = {value}")
+
+    # ID of each user habit of the file in this database, indexed by its ID in the file (-1 when not loaded)
+    user_habit_map = np.full(0, -1, dtype=np.int64)
+    merged = np.zeros(0, dtype=np.int64)
+    imported_users = set()
+    result = {'user_habits': 0, 'merged_user_habits': 0, 'completions': 0}
+    try:
+        habit_map = {}
+        for habit in reader.header['habits']:
+            cur.execute("INSERT INTO habits (name, description, periodicity) VALUES (?, ?, ?) ON CONFLICT (name) DO NOTHING",
+                        (habit['name'], habit['description'], habit['periodicity']))
+            habit_map[habit['id']] = cur.execute("SELECT id FROM habits WHERE name = ?", (habit['name'],)).fetchone()[0]
+
+        cur.execute(
+            """CREATE TEMP TABLE IF NOT EXISTS import_user_habits (
+                   file_id INTEGER PRIMARY KEY,
+                   habit_id INTEGER NOT NULL,
+                   user_name VARCHAR(255) NOT NULL,
+                   current_streak INTEGER NOT NULL,
+                   longest_streak INTEGER NOT NULL,
+                   created_at INTEGER NOT NULL
+               )"""
+        )
+
+        uncommitted = 0
+        for kind, block in reader.blocks():
+            if kind == 'U':
+                ids, habit_ids, user_names, current_streaks, longest_streaks, created_at = block
+                imported_users.update(user_names)
+                cur.execute("DELETE FROM temp.import_user_habits")
+                cur.executemany("INSERT INTO temp.import_user_habits VALUES (?, ?, ?, ?, ?, ?)",
+                                zip(ids.tolist(), [habit_map[habit_id] for habit_id in habit_ids.tolist()], user_names,
+                                    current_streaks.tolist(), longest_streaks.tolist(), created_at.tolist()))
+
+                join = """FROM temp.import_user_habits
+                          JOIN user_habits ON user_habits.user_name = import_user_habits.user_name
+                                          AND user_habits.habit_id = import_user_habits.habit_id"""
+                existing = [row[0] for row in cur.execute(f"SELECT user_habits.id {join}")]
+                cur.execute(
+                    """INSERT INTO user_habits (habit_id, user_name, current_streak, longest_streak, created_at)
+                       SELECT habit_id, user_name, current_streak, longest_streak, datetime(created_at, 'unixepoch')
+                       FROM temp.import_user_habits WHERE true
+                       ON CONFLICT (user_name, habit_id) DO NOTHING"""
+                )
+                mapping = np.array(cur.execute(f"SELECT import_user_habits.file_id, user_habits.id {join}").fetchall(),
+                                   dtype=np.int64).reshape(-1, 2)
+
+                if len(mapping) and mapping[:, 0].max() >= len(user_habit_map):
+                    grown = np.full(int(mapping[:, 0].max()) + 1, -1, dtype=np.int64)
+                    grown[:len(user_habit_map)] = user_habit_map
+                    user_habit_map = grown
+                user_habit_map[mapping[:, 0]] = mapping[:, 1]
+                merged = np.concatenate((merged, np.array(existing, dtype=np.int64)))
+                result['user_habits'] += len(mapping) - len(existing)
+                result['merged_user_habits'] += len(existing)
+
+            elif kind == 'T':
+                file_ids, completed_at = block
+                known = file_ids < len(user_habit_map)
+                user_habit_ids = np.full(len(file_ids), -1, dtype=np.int64)
+                user_habit_ids[known] = user_habit_map[file_ids[known]]
+                loaded = user_habit_ids >= 0
+                # Completions of merged user habits that are already in this database are skipped
+                to_merge = loaded & np.isin(user_habit_ids, merged)
+                loaded &= ~to_merge
+                cur.executemany(
+                    """INSERT INTO habit_tracker (user_habit_id, completed_at, completed_epoch, day_key, iso_week_key)
+                       VALUES (?1, datetime(?2, 'unixepoch'), ?2, ?2 / 86400, (?2 / 86400 + 3) / 7)""",
+                    zip(user_habit_ids[loaded].tolist(), completed_at[loaded].tolist()))
+                inserted = cur.rowcount
+                if to_merge.any():
+                    cur.executemany(
+                        """INSERT INTO habit_tracker (user_habit_id, completed_at, completed_epoch, day_key, iso_week_key)
+                           SELECT ?1, datetime(?2, 'unixepoch'), ?2, ?2 / 86400, (?2 / 86400 + 3) / 7
+                           WHERE NOT EXISTS (SELECT 1 FROM habit_tracker_history WHERE user_habit_id = ?1 AND completed_epoch = ?2)""",
+                        zip(user_habit_ids[to_merge].tolist(), completed_at[to_merge].tolist()))
+                    inserted += cur.rowcount
+                result['completions'] += inserted
+                uncommitted += inserted
+                if uncommitted >= commit_rows:
+                    connection.commit()
+                    uncommitted = 0
+
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cur.execute("DROP TABLE IF EXISTS temp.import_user_habits")
+        for name, value in previous_pragmas.items():
+            cur.execute(f"PRAGMA {name} = {value}")
+
+    # Completions are loaded with UTC keys, users with a timezone get theirs rekeyed to their local days
+    if imported_users:
+        cur.execute("CREATE TEMP TABLE IF NOT EXISTS import_users (user_name VARCHAR(255) PRIMARY KEY)")
+        cur.executemany("INSERT OR IGNORE INTO temp.import_users (user_name) VALUES (?)", [(name,) for name in imported_users])
+        timezones = cur.execute(
+            "SELECT user_name, timezone FROM user_timezones WHERE user_name IN (SELECT user_name FROM temp.import_users)"
+        ).fetchall()
+        cur.execute("DROP TABLE temp.import_users")
+        try:
+            for user_name, timezone in timezones:
+                rekey_user(connection, user_name, timezone)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+
+    # The streaks of merged user habits now cover the completions of both databases
+    merged = merged.tolist()
+    for start in range(0, len(merged), 10_000):
+        recompute_streaks(connection, merged[start:start + 10_000])
+    return result
@@ -0,0 +1,485 @@
+import bisect
+import heapq
+import os
+import threading
+import time
+from db.db import squlite_db
+from db.shards import shard_router
+
+# Streaks a leaderboard ranks users by
+METRICS = ('current', 'longest')
+
+def streaks_version(con):
+    """
+    Fetches the 'streaks' row of the data_versions table, which triggers bump once per inserted,
+    deleted or streak-updated user_habits row.
+
+    Parameters:
+    ----------
+    con : sqlite3.Connection
+        The connection to query, e.g. the one a write operation runs on.
+
+    Returns:
+    -------
+    int
+        The streaks version.
+    """
+    return squlite_db.cursor_for('tuple', con).execute("SELECT version FROM data_versions WHERE scope = 'streaks'").fetchone()[0]
+
+class RankedStreaks:
+    """
+    Entries ranked by streak, highest first.
+
+    A Fenwick tree counts the entries per streak value, so the rank of a streak (1 + the number of entries
+    with a higher streak) is found in O(log n) of the highest streak. The entries of each streak value are
+    kept in a set, and the distinct values in a sorted list, so the top N are read from the highest value down.
+    """
+
+    def __init__(self, size=64):
+        self._tree = [0] * (size + 1)
+        self._members = {}
+        self._values = []
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def __grow(self, streak):
+        """
+        Rebuilds the Fenwick tree so it can count `streak`, doubling its size.
+        """
+        size = len(self._tree) - 1
+        while size <= streak:
+            size *= 2
+        self._tree = [0] * (size + 1)
+        for value, members in self._members.items():
+            self.__update(value, len(members))
+
+    def __update(self, streak, delta):
+        index = streak + 1
+        while index < len(self._tree):
+            self._tree[index] += delta
+            index += index & -index
+
+    def __count_up_to(self, streak):
+        """
+        Counts the entries with a streak of at most `streak`.
+        """
+        index = min(streak + 1, len(self._tree) - 1)
+        count = 0
+        while index > 0:
+            count += self._tree[index]
+            index -= index & -index
+        return count
+
+    def add(self, key, streak):
+        """
+        Adds an entry.
+        """
+        if streak >= len(self._tree) - 1:
+            self.__grow(streak)
+        members = self._members.get(streak)
+        if members is None:
+            members = self._members[streak] = set()
+            bisect.insort(self._values, streak)
+        members.add(key)
+        self.__update(streak, 1)
+        self._count += 1
+
+    def remove(self, key, streak):
+        """
+        Removes an entry added with the same streak.
+        """
+        members = self._members[streak]
+        members.remove(key)
+        if not members:
+            del self._members[streak]
+            del self._values[bisect.bisect_left(self._values, streak)]
+        self.__update(streak, -1)
+        self._count -= 1
+
+    def rank(self, streak):
+        """
+        Gets the rank of a streak: entries with the same streak share a rank.
+
+        Returns:
+        -------
+        int
+            1 + the number of entries with a higher streak.
+        """
+        return self._count - self.__count_up_to(streak) + 1
+
+    def top(self, limit, sort_key=None):
+        """
+        Gets the entries with the highest streaks.
+
+        Parameters:
+        ----------
+        limit : int
+            The number of entries.
+        sort_key : callable, optional
+            Orders the entries that have the same streak.
+
+        Returns:
+        -------
+        list
+            (key, streak, rank) tuples, highest streak first.
+        """
+        entries = []
+        for streak in reversed(self._values):
+            if len(entries) >= limit:
+                break
+            rank = len(entries) + 1
+            members = heapq.nsmallest(limit - len(entries), self._members[streak], key=sort_key)
+            entries.extend((key, streak, rank) for key in members)
+        return entries
+
+class Leaderboard:
+    """
+    In-process leaderboards of the current and longest streaks, per habit and over all habits.
+
+    Every tracked habit is an entry, ranked per habit and overall. The leaderboards are loaded from user_habits
+    once, then kept current by the writes of this process: each write reports its streak changes together with
+    the 'streaks' data version it brought the database to, and changes are applied in version order. At most once
+    every `check_interval` seconds, a lookup compares the database's version with the applied one and reloads
+    the leaderboards when other processes (or bulk jobs like the streak recompute) changed streaks since.
+
+    Attributes:
+    ----------
+    db : SqliteDB
+        The database the streaks are loaded from.
+    check_interval : float
+        Seconds between two checks of the streaks version.
+    """
+
+    def __init__(self, db, check_interval=None):
+        self.db = db
+        if check_interval is None:
+            check_interval = float(os.getenv("LEADERBOARD_CHECK_INTERVAL", 1))
+        self.check_interval = check_interval
+
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._version = None
+        self._schema_version = None
+        self._checked_at = 0.0
+        # user_habit_id -> (user_name, habit_id, current_streak, longest_streak)
+        self._entries = {}
+        self._by_user = {}
+        self._rankings = {}
+        # Changes reported out of order, keyed by the first version they cover
+        self._pending = {}
+        self._stats = {'reloads': 0, 'version_checks': 0, 'applied_changes': 0}
+
+    def __ranking(self, habit_id, metric):
+        ranking = self._rankings.get((habit_id, metric))
+        if ranking is None:
+            ranking = self._rankings[(habit_id, metric)] = RankedStreaks()
+        return ranking
+
+    def __add(self, user_habit_id, user_name, habit_id, current_streak, longest_streak):
+        self._entries[user_habit_id] = (user_name, habit_id, current_streak, longest_streak)
+        self._by_user.setdefault(user_name, set()).add(user_habit_id)
+        for metric, streak in zip(METRICS, (current_streak, longest_streak)):
+            self.__ranking(habit_id, metric).add(user_habit_id, streak)
+            self.__ranking(None, metric).add(user_habit_id, streak)
+
+    def __remove(self, user_habit_id):
+        user_name, habit_id, current_streak, longest_streak = self._entries.pop(user_habit_id)
+        self._by_user[user_name].discard(user_habit_id)
+        if not self._by_user[user_name]:
+            del self._by_user[user_name]
+        for metric, streak in zip(METRICS, (current_streak, longest_streak)):
+            self._rankings[(habit_id, metric)].remove(user_habit_id, streak)
+            self._rankings[(None, metric)].remove(user_habit_id, streak)
+
+    def __load(self):
+        """
+        Loads every tracked habit's streaks, together with the version they are at, from one read transaction.
+        """
+        con = self.db.conn
+        own_transaction = not con.in_transaction
+        if own_transaction:
+            con.execute("BEGIN")
+        try:
+            cur = self.db.cursor_for('tuple', con)
+            version, schema_version = cur.execute(
+                "SELECT (SELECT version FROM data_versions WHERE scope = 'streaks'), schema_version FROM pragma_schema_version"
+            ).fetchone()
+            rows = cur.execute("SELECT id, user_name, habit_id, current_streak, longest_streak FROM user_habits").fetchall()
+        finally:
+            if own_transaction:
+                con.rollback()
+
+        self._entries, self._by_user, self._rankings = {}, {}, {}
+        for row in rows:
+            self.__add(*row)
+        self._version, self._schema_version = version, schema_version
+        self._pending = {first: change for first, change in self._pending.items() if first > version}
+        self.__apply_pending()
+        self._loaded = True
+        self._stats['reloads'] += 1
+
+    def __apply_pending(self):
+        """
+        Applies the reported changes that follow the applied version, in version order.
+        """
+        while self._version + 1 in self._pending:
+            version, changes = self._pending.pop(self._version + 1)
+            for user_habit_id, user_name, habit_id, streaks in changes:
+                if user_habit_id in self._entries:
+                    self.__remove(user_habit_id)
+                if streaks is not None:
+                    self.__add(user_habit_id, user_name, habit_id, *streaks)
+            self._version = version
+            self._stats['applied_changes'] += len(changes)
+
+    def __fresh(self):
+        """
+        Loads the leaderboards, or reloads them if the database's streaks changed in ways this process didn't report.
+        """
+        if self._loaded and time.monotonic() - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            version, schema_version = self.db.cursor_for('tuple').execute(
+                "SELECT (SELECT version FROM data_versions WHERE scope = 'streaks'), schema_version FROM pragma_schema_version"
+            ).fetchone()
+            self._stats['version_checks'] += 1
+            if not self._loaded or schema_version != self._schema_version or version != self._version:
+                self.__load()
+            self._checked_at = time.monotonic()
+
+    def record(self, version, changes):
+        """
+        Applies the streak changes of a committed write.
+
+        Parameters:
+        ----------
+        version : int
+            The streaks version right after the write, read in its transaction.
+        changes : list
+            One (user_habit_id, user_name, habit_id, (current_streak, longest_streak)) tuple per user_habits row
+            the write inserted or updated, in the order it wrote them; the streaks are None for a deleted row.
+        """
+        if not changes:
+            return
+        with self._lock:
+            if not self._loaded or version <= self._version:
+                return
+            self._pending[version - len(changes) + 1] = (version, changes)
+            self.__apply_pending()
+
+    def top(self, metric, limit, habit_id=None):
+        """
+        Gets the tracked habits with the highest streaks.
+
+        Parameters:
+        ----------
+        metric : str
+            'current' or 'longest'.
+        limit : int
+            The number of entries.
+        habit_id : int, optional
+            Only rank the users tracking this habit. Defaults to all tracked habits.
+
+        Returns:
+        -------
+        list
+            (rank, user_name, habit_id, streak) tuples, highest streak first. Ties share a rank and are ordered by user name.
+        """
+        self.__fresh()
+        with self._lock:
+            ranking = self._rankings.get((habit_id, metric))
+            if ranking is None:
+                return []
+            entries = self._entries
+            top = ranking.top(limit, sort_key=lambda user_habit_id: entries[user_habit_id][:2])
+            return [(rank, entries[user_habit_id][0], entries[user_habit_id][1], streak) for user_habit_id, streak, rank in top]
+
+    def rank(self, user_name, metric, habit_id=None):
+        """
+        Gets the rank of a user.
+
+        Parameters:
+        ----------
+        user_name : str
+            The name of the user.
+        metric : str
+            'current' or 'longest'.
+        habit_id : int, optional
+            Rank the user among the users tracking this habit. Defaults to the user's best tracked habit
+            ranked among all tracked habits.
+
+        Returns:
+        -------
+        tuple or None
+            The (rank, number of ranked entries, habit_id, streak), or None if the user doesn't track the habit (or any habit).
+        """
+        self.__fresh()
+        index = METRICS.index(metric) + 2
+        with self._lock:
+            user_habits = [self._entries[user_habit_id] for user_habit_id in self._by_user.get(user_name, ())]
+            if habit_id is not None:
+                user_habits = [entry for entry in user_habits if entry[1] == habit_id]
+            if not user_habits:
+                return None
+            best = max(user_habits, key=lambda entry: (entry[index], -entry[1]))
+            ranking = self._rankings[(habit_id, metric)]
+            return ranking.rank(best[index]), len(ranking), best[1], best[index]
+
+    def standing(self, metric, streak, habit_id=None):
+        """
+        Counts the entries ranked above a streak, e.g. to rank a user of another shard among these entries.
+
+        Returns:
+        -------
+        tuple
+            The number of entries with a higher streak and the number of ranked entries.
+        """
+        self.__fresh()
+        with self._lock:
+            ranking = self._rankings.get((habit_id, metric))
+            if ranking is None:
+                return 0, 0
+            return ranking.rank(streak) - 1, len(ranking)
+
+    def invalidate(self):
+        """
+        Drops the loaded leaderboards, so the next lookup reloads them.
+        """
+        with self._lock:
+            self._loaded = False
+
+    def metrics(self):
+        """
+        Gets the leaderboard counters.
+
+        Returns:
+        -------
+        dict
+            Reloads, version checks, changes applied from this process's writes, the applied version and the number of entries.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['version'] = self._version
+            stats['entries'] = len(self._entries)
+            stats['pending'] = len(self._pending)
+        return stats
+
+# This is the Sharded Leaderboard Class.
+# Each shard's user_habits rows (and streak versions) are independent, so each shard gets its own Leaderboard,
+# and lookups merge them: the global top N is among the top N of every shard, and a user's global rank adds
+# the entries of the other shards that have a higher streak. With a single shard it is the primary's Leaderboard.
+class ShardedLeaderboard:
+    """
+    The leaderboards of every shard, looked up as one.
+
+    Attributes:
+    ----------
+    router : ShardRouter
+        The shards to rank the users of (see db/shards.py).
+    check_interval : float, optional
+        Seconds between two checks of each shard's streaks version.
+    """
+
+    def __init__(self, router, check_interval=None):
+        self.router = router
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._boards = {id(router.primary): Leaderboard(router.primary, check_interval)}
+
+    def board(self, shard):
+        """
+        Gets the leaderboard of a shard, created on first use.
+
+        Parameters:
+        ----------
+        shard : int
+            The position of the shard.
+
+        Returns:
+        -------
+        Leaderboard
+            The leaderboard of the shard.
+        """
+        db = self.router.shards[shard]
+        with self._lock:
+            board = self._boards.get(id(db))
+            if board is None or board.db is not db:
+                board = self._boards[id(db)] = Leaderboard(db, self.check_interval)
+            return board
+
+    def boards(self):
+        """
+        Gets the leaderboard of every shard, in shard order.
+        """
+        return [self.board(shard) for shard in range(len(self.router.shards))]
+
+    def record(self, version, changes, shard=0):
+        """
+        Applies the streak changes of a committed write to the leaderboard of its shard. See Leaderboard.record.
+        """
+        self.board(shard).record(version, changes)
+
+    def top(self, metric, limit, habit_id=None):
+        """
+        Gets the tracked habits with the highest streaks over every shard. See Leaderboard.top.
+        """
+        boards = self.boards()
+        if len(boards) == 1:
+            return boards[0].top(metric, limit, habit_id)
+        merged = sorted(
+            (entry for board in boards for entry in board.top(metric, limit, habit_id)),
+            key=lambda entry: (-entry[3], entry[1], entry[2]),
+        )[:limit]
+        top = []
+        for position, (_, user_name, entry_habit_id, streak) in enumerate(merged):
+            # Ties share the rank of their first entry
+            rank = top[-1][0] if top and top[-1][3] == streak else position + 1
+            top.append((rank, user_name, entry_habit_id, streak))
+        return top
+
+    def rank(self, user_name, metric, habit_id=None):
+        """
+        Gets the rank of a user over every shard. See Leaderboard.rank.
+        """
+        shard = self.router.shard_index(user_name)
+        found = self.board(shard).rank(user_name, metric, habit_id)
+        if found is None or not self.router.sharded:
+            return found
+        rank, count, best_habit_id, streak = found
+        for other, board in enumerate(self.boards()):
+            if other != shard:
+                above, entries = board.standing(metric, streak, habit_id)
+                rank += above
+                count += entries
+        return rank, count, best_habit_id, streak
+
+    def invalidate(self):
+        """
+        Drops the loaded leaderboards of every shard.
+        """
+        with self._lock:
+            boards = list(self._boards.values())
+        for board in boards:
+            board.invalidate()
+
+    def metrics(self):
+        """
+        Gets the leaderboard counters, summed over the shards. See Leaderboard.metrics.
+
+        Returns:
+        -------
+        dict
+            The counters, and those of each shard when there is more than one.
+        """
+        shards = [board.metrics() for board in self.boards()]
+        if len(shards) == 1:
+            return shards[0]
+        stats = {key: sum(shard[key] for shard in shards) for key in ('reloads', 'version_checks', 'applied_changes', 'entries', 'pending')}
+        stats['version'] = shards[0]['version']
+        stats['shards'] = shards
+        return stats
+
+# Global instance of the ShardedLeaderboard class
+leaderboard = ShardedLeaderboard(shard_router)
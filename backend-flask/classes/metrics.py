@@ -0,0 +1,401 @@
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+
+# Upper bounds of the latency histograms, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds of the row count histograms
+ROW_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000)
+
+def format_labels(labels, extra=()):
+    """
+    Formats the labels of a series in the Prometheus text format, e.g. '{route="get_habits",le="0.1"}'.
+    """
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def format_value(value):
+    """
+    Formats a sample value, integers without a decimal point.
+    """
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+def process_alive(pid):
+    """
+    Whether a process with the given ID is running.
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+# Thread Counters class for the counters of the in-process caches, whose lookups take no lock on their fast path.
+# Like the metrics registry, every thread counts into its own dict, so counting takes no lock and no increment
+# is lost to a race; the dicts are only summed when the counters are read.
+class ThreadCounters:
+    """
+    A set of counters, each thread incrementing its own copy.
+
+    Attributes:
+    ----------
+    names : tuple
+        The names of the counters.
+    """
+
+    def __init__(self, names):
+        self.names = tuple(names)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # (thread, counts) of every thread that counted something
+        self._shards = []
+        # Counts of the threads that exited
+        self._retired = dict.fromkeys(self.names, 0)
+
+    def inc(self, name, amount=1):
+        """
+        Increments a counter.
+        """
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = dict.fromkeys(self.names, 0)
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+        shard[name] += amount
+
+    def totals(self):
+        """
+        Sums the counts of every thread.
+
+        Returns:
+        -------
+        dict
+            The total of each counter.
+        """
+        with self._lock:
+            totals = dict(self._retired)
+            live = []
+            for thread, shard in self._shards:
+                alive = thread.is_alive()
+                for name, value in shard.items():
+                    totals[name] += value
+                    if not alive:
+                        # The counts of a thread that exited won't change anymore
+                        self._retired[name] += value
+                if alive:
+                    live.append((thread, shard))
+            self._shards = live
+        return totals
+
+# Metrics Registry class that keeps the counters and histograms exported by /metrics.
+# Every thread records into its own shard, so recording takes no lock and threads never contend on it;
+# shards are only merged when the metrics are exported. With `directory` set (e.g. on /dev/shm), every
+# worker process also writes its merged values to its own file there, and the export of any worker sums
+# the files of all of them, so a scrape sees the whole server and not just the worker that answered it.
+class MetricsRegistry:
+    """
+    A registry of counters, histograms and callback gauges, exported in the Prometheus text format.
+
+    Attributes:
+    ----------
+    enabled : bool
+        Whether observations are recorded.
+    directory : str or None
+        The directory the worker processes share their values through, or None for a single process.
+    flush_interval : float
+        Seconds between two writes of this process's values to its file.
+    """
+
+    def __init__(self, enabled=None, directory=None, flush_interval=None):
+        if enabled is None:
+            enabled = os.getenv("METRICS", "0").lower() in ("1", "true", "yes")
+        if directory is None:
+            directory = os.getenv("METRICS_DIR") or None
+        if flush_interval is None:
+            flush_interval = float(os.getenv("METRICS_FLUSH_INTERVAL", 1))
+        self.enabled = enabled
+        self.directory = directory
+        self.flush_interval = flush_interval
+
+        # name -> (type, help, buckets)
+        self._families = {}
+        # name -> (type, help, callback), read when exported
+        self._collectors = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # (thread, shard) of every thread that recorded something
+        self._shards = []
+        # Values of the threads that exited
+        self._retired = {}
+        self._flushed_at = 0.0
+        self._pid = os.getpid()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self.__after_fork)
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        """
+        Declares a histogram.
+
+        Parameters:
+        ----------
+        name : str
+            The metric name, e.g. 'habit_http_request_duration_seconds'.
+        help : str
+            What the metric measures.
+        buckets : tuple, optional
+            The upper bounds of the buckets, in increasing order. +Inf is added.
+        """
+        self._families[name] = ('histogram', help, tuple(buckets))
+
+    def counter(self, name, help):
+        """
+        Declares a counter. Its name should end with _total.
+        """
+        self._families[name] = ('counter', help, None)
+
+    def collector(self, name, help, callback, type='gauge'):
+        """
+        Declares a metric whose value is read from a callback when the metrics are exported,
+        e.g. the occupancy of the connection pool.
+
+        Parameters:
+        ----------
+        name : str
+            The metric name.
+        help : str
+            What the metric measures.
+        callback : callable
+            Returns the value, or a dict of values keyed by tuples of (label, value) pairs.
+        type : str, optional
+            The Prometheus type of the metric, 'gauge' or 'counter'.
+        """
+        self._collectors[name] = (type, help, callback)
+
+    def __shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def observe(self, name, value, **labels):
+        """
+        Records an observation of a histogram.
+        """
+        if not self.enabled:
+            return
+        buckets = self._families[name][2]
+        key = (name, tuple(sorted((label, str(label_value)) for label, label_value in labels.items())))
+        shard = self.__shard()
+        series = shard.get(key)
+        if series is None:
+            # One count per bucket and +Inf, then the sum and the count of the observations
+            series = shard[key] = [0] * (len(buckets) + 1) + [0.0, 0]
+        series[bisect.bisect_left(buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def inc(self, name, amount=1, **labels):
+        """
+        Increments a counter.
+        """
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted((label, str(label_value)) for label, label_value in labels.items())))
+        shard = self.__shard()
+        series = shard.get(key)
+        if series is None:
+            series = shard[key] = [0]
+        series[0] += amount
+
+    def __after_fork(self):
+        # A forked worker starts from zero, the values of its parent are the parent's
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}
+        self._flushed_at = 0.0
+        self._pid = os.getpid()
+
+    def collect(self):
+        """
+        Merges the shards of this process.
+
+        Returns:
+        -------
+        dict
+            The values of every series, keyed by (name, labels).
+        """
+        with self._lock:
+            merged = {key: list(values) for key, values in self._retired.items()}
+            live = []
+            for thread, shard in self._shards:
+                alive = thread.is_alive()
+                for key, values in list(shard.items()):
+                    add_values(merged, key, values)
+                    if not alive:
+                        # The shard of a thread that exited won't change anymore, it is folded into the retired values
+                        add_values(self._retired, key, values)
+                if alive:
+                    live.append((thread, shard))
+            self._shards = live
+        return merged
+
+    def gauges(self):
+        """
+        Reads the callback metrics of this process.
+
+        Returns:
+        -------
+        dict
+            The values of every series, keyed by (name, labels).
+        """
+        values = {}
+        for name, (_, _, callback) in self._collectors.items():
+            value = callback()
+            if isinstance(value, dict):
+                for labels, sample in value.items():
+                    values[(name, tuple(labels))] = sample
+            elif value is not None:
+                values[(name, ())] = value
+        return values
+
+    def __file(self, pid):
+        return os.path.join(self.directory, f'metrics_{pid}.json')
+
+    def flush(self):
+        """
+        Writes the values of this process to its file in `directory`, replacing it atomically.
+        """
+        if not self.directory:
+            return
+        self._flushed_at = time.monotonic()
+        data = {
+            'series': [[name, labels, values] for (name, labels), values in self.collect().items()],
+            'gauges': [[name, labels, value] for (name, labels), value in self.gauges().items()],
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.__file(self._pid)
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(data, f)
+        os.replace(f'{path}.tmp', path)
+
+    def maybe_flush(self):
+        """
+        Writes the values of this process to its file if they were not written for `flush_interval` seconds.
+        """
+        if self.directory and self.enabled and time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def __other_processes(self):
+        """
+        Reads the files of the other worker processes.
+
+        The series of exited workers are kept, so counters never go backwards,
+        while gauges are only those of running workers.
+        """
+        series, gauges = {}, {}
+        if not self.directory or not os.path.isdir(self.directory):
+            return series, gauges
+        for file_name in os.listdir(self.directory):
+            if not (file_name.startswith('metrics_') and file_name.endswith('.json')):
+                continue
+            pid = int(file_name[len('metrics_'):-len('.json')])
+            if pid == self._pid:
+                continue
+            try:
+                with open(os.path.join(self.directory, file_name)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, labels, values in data['series']:
+                add_values(series, (name, tuple(tuple(pair) for pair in labels)), values)
+            if process_alive(pid):
+                for name, labels, value in data['gauges']:
+                    key = (name, tuple(tuple(pair) for pair in labels))
+                    gauges[key] = gauges.get(key, 0) + value
+        return series, gauges
+
+    def export(self):
+        """
+        Exports the metrics of every worker process in the Prometheus text format.
+
+        Returns:
+        -------
+        str
+            The exposition, one HELP and TYPE header per metric followed by its samples.
+        """
+        series, gauges = self.__other_processes()
+        for key, values in self.collect().items():
+            add_values(series, key, values)
+        for key, value in self.gauges().items():
+            gauges[key] = gauges.get(key, 0) + value
+
+        lines = []
+        for name, (type, help, buckets) in self._families.items():
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {type}')
+            for (series_name, labels), values in sorted(series.items()):
+                if series_name != name:
+                    continue
+                if type == 'histogram':
+                    cumulative = 0
+                    for bound, count in zip(buckets + ('+Inf',), values):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{format_labels(labels, [("le", bound)])} {cumulative}')
+                    lines.append(f'{name}_sum{format_labels(labels)} {format_value(values[-2])}')
+                    lines.append(f'{name}_count{format_labels(labels)} {values[-1]}')
+                else:
+                    lines.append(f'{name}{format_labels(labels)} {format_value(values[0])}')
+        for name, (type, help, _) in self._collectors.items():
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {type}')
+            for (series_name, labels), value in sorted(gauges.items()):
+                if series_name == name:
+                    lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        """
+        Drops the values recorded by this process.
+        """
+        with self._lock:
+            for _, shard in self._shards:
+                shard.clear()
+            self._retired = {}
+
+def add_values(target, key, values):
+    """
+    Adds the values of a series to those of the same series in `target`.
+    """
+    current = target.get(key)
+    if current is None:
+        target[key] = list(values)
+    else:
+        for i, value in enumerate(values):
+            current[i] += value
+
+# Global instance of the MetricsRegistry class
+metrics = MetricsRegistry()
+
+# The metrics recorded by the app. Pool and cache occupancy are read from their counters when exported (see routes/metrics.py).
+metrics.histogram('habit_http_request_duration_seconds', 'Latency of the API requests, by route, method and status.')
+metrics.histogram('habit_http_request_rows', 'Rows fetched from SQLite per API request, by route.', ROW_BUCKETS)
+metrics.histogram('habit_sqlite_statement_duration_seconds', 'Latency of the SQL statements executed through cursors, by statement type.')
+metrics.histogram('habit_sqlite_lock_wait_seconds', 'Time spent waiting for the database write lock (BEGIN IMMEDIATE), by writer.')
+metrics.histogram('habit_sqlite_commit_duration_seconds', 'Latency of the commits of write transactions, by writer.')
+metrics.counter('habit_sqlite_busy_errors_total', 'Writes that failed because the database stayed locked (SQLITE_BUSY), by writer.')
+
+# The values of this process are written one last time when it exits
+atexit.register(lambda: metrics.enabled and metrics.flush())
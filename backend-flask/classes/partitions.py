@@ -0,0 +1,301 @@
+import datetime
+import os
+import threading
+import time
+from db.db import squlite_db
+from classes.metrics import ThreadCounters
+from classes.streaks import TIMESTAMP_FORMAT, epoch_seconds
+
+# The table every check-off is inserted into. It only keeps the completions that were not archived yet.
+HOT_TABLE = 'habit_tracker'
+
+# View over the hot table and every archive table, for the queries that need the full history
+HISTORY_VIEW = 'habit_tracker_history'
+
+# Archive tables are named after the year they cover, e.g. habit_tracker_archive_2023
+ARCHIVE_TABLE_PREFIX = 'habit_tracker_archive_'
+
+def tracker_columns(connection):
+    """
+    Gets the columns of the hot table but its row ID: the columns of every partition, and of the history view over them.
+    Archive tables mirror the hot table, so columns added to it, like the client event IDs, move with each completion.
+
+    Parameters:
+    ----------
+    connection : sqlite3.Connection
+        The connection to the database.
+
+    Returns:
+    -------
+    list
+        The (name, declared type) of each column.
+    """
+    return [(row[1], row[2]) for row in connection.execute(f"PRAGMA table_info({HOT_TABLE})") if row[1] != 'id']
+
+# Tracker Partitions class that routes habit_tracker queries to the partitions they need.
+# Cold completions are moved out of the hot habit_tracker table into yearly archive tables (archive_tracker),
+# so the table written by every check-off stays small however long the history grows.
+class TrackerPartitions:
+    """
+    An in-process cache of the habit_tracker_partitions registry, used to pick the partitions a query reads.
+
+    The hot table can hold completions of any time (late synced check-offs), so it is always read.
+    Archive tables are only read when their [starts_at, ends_at) range overlaps the queried time range.
+    Like the habit catalog, every write to the registry bumps the 'partitions' row of the data_versions
+    table, and the cache checks that version at most once every `check_interval` seconds.
+
+    Attributes:
+    ----------
+    db : SqliteDB
+        The database the registry is loaded from.
+    check_interval : float
+        Seconds between two checks of the partitions version.
+    """
+
+    def __init__(self, db, check_interval=None):
+        self.db = db
+        if check_interval is None:
+            check_interval = float(os.getenv("TRACKER_PARTITIONS_CHECK_INTERVAL", 1))
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        # (version, archive partitions newest first), swapped in one assignment on reload
+        self._snapshot = None
+        self._checked_at = 0.0
+        # Counted per thread, as partitions are routed without the lock
+        self._stats = ThreadCounters(('reloads', 'version_checks', 'archives_read', 'archives_skipped'))
+
+    def __current_version(self):
+        """
+        Fetches the partitions version and the schema version of the database.
+
+        Returns:
+        -------
+        tuple
+            The (partitions version, schema version).
+        """
+        data = self.db.cursor_for('tuple').execute("SELECT (SELECT version FROM data_versions WHERE scope = 'partitions'), schema_version FROM pragma_schema_version")
+        return data.fetchone()
+
+    def __fresh_snapshot(self):
+        """
+        Gets the cached archive partitions, reloading them if they are missing or the partitions version changed.
+        """
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return snapshot
+
+        with self._lock:
+            version = self.__current_version()
+            self._stats.inc('version_checks')
+            if self._snapshot is None or self._snapshot[0] != version:
+                data = self.db.cursor_for('tuple').execute("SELECT name, starts_at, ends_at FROM habit_tracker_partitions ORDER BY starts_at DESC")
+                self._snapshot = (version, data.fetchall())
+                self._stats.inc('reloads')
+            self._checked_at = time.monotonic()
+            return self._snapshot
+
+    def tables(self, since=None, before=None):
+        """
+        Gets the partitions that may hold completions in a time range, newest first.
+
+        Parameters:
+        ----------
+        since : str, optional
+            Only completions at or after this timestamp are needed.
+        before : str, optional
+            Only completions before this timestamp are needed.
+
+        Returns:
+        -------
+        list
+            The table names, starting with the hot table.
+        """
+        tables = [HOT_TABLE]
+        for name, starts_at, ends_at in self.__fresh_snapshot()[1]:
+            if (since is not None and ends_at <= since) or (before is not None and starts_at >= before):
+                self._stats.inc('archives_skipped')
+                continue
+            self._stats.inc('archives_read')
+            tables.append(name)
+        return tables
+
+    def select(self, columns, where, since=None, before=None):
+        """
+        Builds a query over the partitions that may hold completions in a time range.
+
+        Parameters:
+        ----------
+        columns : str
+            The columns to select from each partition, e.g. "completed_at, completed_epoch".
+        where : str
+            The condition on each partition, with ? placeholders.
+        since : str, optional
+            Only completions at or after this timestamp are needed.
+        before : str, optional
+            Only completions before this timestamp are needed.
+
+        Returns:
+        -------
+        tuple
+            The query (one SELECT per partition, combined with UNION ALL) and the number of partitions,
+            i.e. how many times the parameters of `where` must be repeated.
+        """
+        tables = self.tables(since, before)
+        query = " UNION ALL ".join(f"SELECT {columns} FROM {table} WHERE {where}" for table in tables)
+        return query, len(tables)
+
+    def invalidate(self):
+        """
+        Drops the cached partitions, so the next query reloads them. Called after an archival.
+        """
+        with self._lock:
+            self._snapshot = None
+
+    def metrics(self):
+        """
+        Gets the routing counters.
+
+        Returns:
+        -------
+        dict
+            Reloads, version checks, archive partitions read and skipped by queries, and the cached partitions.
+        """
+        stats = self._stats.totals()
+        snapshot = self._snapshot
+        stats['partitions'] = [name for name, _, _ in snapshot[1]] if snapshot is not None else None
+        return stats
+
+def month_start(now, months_back):
+    """
+    Gets the first day of the month `months_back` months before the month of `now`.
+
+    Returns:
+    -------
+    datetime.datetime
+        Midnight of that day.
+    """
+    months = now.year * 12 + now.month - 1 - months_back
+    return datetime.datetime(months // 12, months % 12 + 1, 1)
+
+def archive_tracker(connection, before):
+    """
+    Moves the habit_tracker completions older than `before` into yearly archive tables, in one transaction.
+
+    Archive tables are created (and registered in habit_tracker_partitions) the first time a year is archived,
+    with the columns habit_tracker has then, and archive tables missing columns added to habit_tracker since are
+    given them. The habit_tracker_history view is recreated over all partitions. The summary table and the streaks are
+    not touched, as they already account for the archived completions.
+
+    Parameters:
+    ----------
+    connection : sqlite3.Connection
+        The connection to the database.
+    before : datetime.datetime
+        Completions before this time are archived.
+
+    Returns:
+    -------
+    dict
+        The number of completions moved into each archive table.
+    """
+    cutoff = epoch_seconds(before)
+    moved = {}
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        columns = tracker_columns(connection)
+        names = ', '.join(name for name, _ in columns)
+        # Archive tables created before a column was added to the hot table get it now
+        for (table,) in connection.execute("SELECT name FROM habit_tracker_partitions").fetchall():
+            add_missing_columns(connection, table, columns)
+
+        years = connection.execute(
+            f"SELECT DISTINCT CAST(strftime('%Y', completed_at) AS INTEGER) FROM {HOT_TABLE} WHERE completed_epoch < ? ORDER BY 1", (cutoff,)
+        ).fetchall()
+        for (year,) in years:
+            table = f'{ARCHIVE_TABLE_PREFIX}{year}'
+            starts_at = datetime.datetime(year, 1, 1)
+            ends_at = datetime.datetime(year + 1, 1, 1)
+            connection.execute(
+                f"""CREATE TABLE IF NOT EXISTS {table} (
+                       id INTEGER PRIMARY KEY,
+                       user_habit_id INTEGER NOT NULL,
+                       completed_at TIMESTAMP NOT NULL
+                    )"""
+            )
+            add_missing_columns(connection, table, columns)
+            cur = connection.execute(
+                f"""INSERT INTO {table} ({names})
+                    SELECT {names} FROM {HOT_TABLE} WHERE completed_epoch >= ? AND completed_epoch < ?""",
+                (epoch_seconds(starts_at), min(epoch_seconds(ends_at), cutoff))
+            )
+            connection.execute(
+                """INSERT INTO habit_tracker_partitions (name, starts_at, ends_at, row_count) VALUES (?, ?, ?, ?)
+                   ON CONFLICT (name) DO UPDATE SET row_count = row_count + excluded.row_count, archived_at = CURRENT_TIMESTAMP""",
+                (table, starts_at.strftime(TIMESTAMP_FORMAT), ends_at.strftime(TIMESTAMP_FORMAT), cur.rowcount)
+            )
+            moved[table] = cur.rowcount
+        connection.execute(f"DELETE FROM {HOT_TABLE} WHERE completed_epoch < ?", (cutoff,))
+
+        tables = [HOT_TABLE] + [row[0] for row in connection.execute("SELECT name FROM habit_tracker_partitions ORDER BY starts_at DESC")]
+        connection.execute(f"DROP VIEW IF EXISTS {HISTORY_VIEW}")
+        connection.execute(
+            f"CREATE VIEW {HISTORY_VIEW} AS "
+            + " UNION ALL ".join(f"SELECT {names} FROM {table}" for table in tables)
+        )
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    return moved
+
+def add_missing_columns(connection, table, columns):
+    """
+    Adds the columns of the hot table an archive table doesn't have yet, and the indexes of the archive tables.
+
+    Parameters:
+    ----------
+    connection : sqlite3.Connection
+        The connection to the database, in a write transaction.
+    table : str
+        The archive table.
+    columns : list
+        The (name, declared type) of the columns of the hot table, see tracker_columns.
+    """
+    existing = {row[1] for row in connection.execute(f"PRAGMA table_info({table})")}
+    for name, column_type in columns:
+        if name not in existing:
+            connection.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+    connection.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_user_habit_id_completed_epoch ON {table} (user_habit_id, completed_epoch)")
+    connection.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_user_habit_id_event_id ON {table} (user_habit_id, event_id) WHERE event_id IS NOT NULL")
+
+# Partition registries of the other database files, created on first use (see db/shards.py and db/readers.py)
+_shard_partitions = {}
+_shard_partitions_lock = threading.Lock()
+
+def partitions_for(db):
+    """
+    Gets the partition registry of a database file: each shard archives its own completions.
+    Databases over the same file, like the read-only readers of a shard, share its registry.
+
+    Parameters:
+    ----------
+    db : SqliteDB
+        The database to query.
+
+    Returns:
+    -------
+    TrackerPartitions
+        The global instance for the primary database file, one created on first use for the other files.
+    """
+    database = db.pool.database
+    if db is tracker_partitions.db or database == tracker_partitions.db.pool.database:
+        return tracker_partitions
+    with _shard_partitions_lock:
+        partitions = _shard_partitions.get(database)
+        if partitions is None:
+            partitions = _shard_partitions[database] = TrackerPartitions(db)
+        return partitions
+
+# Global instance of the TrackerPartitions class
+tracker_partitions = TrackerPartitions(squlite_db)
@@ -0,0 +1,394 @@
+import bisect
+import datetime
+import threading
+import zoneinfo
+import numpy as np
+from classes.streak_engine import compute_streaks, period_keys
+from classes.streaks import EPOCH_ORDINAL, SECONDS_PER_DAY, epoch_seconds, format_epoch, week_key
+
+# Timezone of the users who never set one
+DEFAULT_TIMEZONE = 'UTC'
+
+# Offset transitions are precomputed for completions in these years, others ask zoneinfo directly
+TRANSITIONS_FROM = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+TRANSITIONS_UNTIL = datetime.datetime(2070, 1, 1, tzinfo=datetime.timezone.utc)
+
+# Transitions are computed one span of this many seconds (about a year) at a time, the first time a completion falls in it
+SPAN_SECONDS = 365 * SECONDS_PER_DAY
+
+def is_timezone(name):
+    """
+    Checks whether a name is an IANA timezone (e.g. 'Europe/Berlin') known to zoneinfo.
+    """
+    if not isinstance(name, str) or not name:
+        return False
+    try:
+        zoneinfo.ZoneInfo(name)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        return False
+    return True
+
+# Zone Offsets class holding the UTC offset transitions of one timezone, so the local day of a completion is found
+# with a binary search over the transitions of its year instead of a zoneinfo lookup, and whole arrays of
+# completions with one numpy.searchsorted call.
+class ZoneOffsets:
+
+    def __init__(self, name):
+        """
+        Holds the offset transitions of a timezone between TRANSITIONS_FROM and TRANSITIONS_UNTIL.
+
+        Nothing is computed up front: the transitions of each span of SPAN_SECONDS are found the first time
+        an instant in it is looked up, so a new timezone costs about a millisecond per year its completions
+        cover instead of a century's worth of lookups on the first request.
+
+        Parameters:
+        ----------
+        name : str
+            The IANA name of the timezone.
+        """
+        self.name = name
+        self.zone = zoneinfo.ZoneInfo(name)
+        self.start = int(TRANSITIONS_FROM.timestamp())
+        self.end = int(TRANSITIONS_UNTIL.timestamp())
+        # span index -> (starts, offsets), starts[i] being the first second at which offsets[i] applies
+        self._spans = {}
+
+    def __offset(self, epoch):
+        """
+        Gets the UTC offset in seconds of the timezone at an instant, from zoneinfo.
+        """
+        return int(datetime.datetime.fromtimestamp(epoch, self.zone).utcoffset().total_seconds())
+
+    def __span(self, index):
+        """
+        Gets the transitions of a span, finding them on first use.
+
+        Offsets are sampled once per day and every change is narrowed down to the second by bisection,
+        so zones changing their offset twice within a day are the only ones that could be misread.
+        Two threads may compute the same span at once, they find the same transitions.
+        """
+        span = self._spans.get(index)
+        if span is not None:
+            return span
+
+        moment = self.start + index * SPAN_SECONDS
+        end = min(moment + SPAN_SECONDS, self.end)
+        starts = [moment]
+        offsets = [self.__offset(moment)]
+        while moment < end:
+            following = min(moment + SECONDS_PER_DAY, end)
+            offset = self.__offset(following)
+            if offset != offsets[-1]:
+                low, high = moment, following
+                while high - low > 1:
+                    middle = (low + high) // 2
+                    if self.__offset(middle) == offsets[-1]:
+                        low = middle
+                    else:
+                        high = middle
+                starts.append(high)
+                offsets.append(offset)
+            moment = following
+
+        span = self._spans[index] = (starts, offsets)
+        return span
+
+    def offset(self, epoch):
+        """
+        Gets the UTC offset in seconds of the timezone at an instant.
+
+        Parameters:
+        ----------
+        epoch : int
+            Seconds since 1970-01-01 00:00:00 UTC.
+
+        Returns:
+        -------
+        int
+            The offset, e.g. 7200 for UTC+2.
+        """
+        if not self.start <= epoch < self.end:
+            return self.__offset(epoch)
+        starts, offsets = self.__span((epoch - self.start) // SPAN_SECONDS)
+        return offsets[bisect.bisect_right(starts, epoch) - 1]
+
+    def offsets_of(self, epochs):
+        """
+        Gets the UTC offsets in seconds of the timezone at every instant of an array.
+
+        Parameters:
+        ----------
+        epochs : numpy.ndarray
+            Seconds since 1970-01-01 00:00:00 UTC.
+
+        Returns:
+        -------
+        numpy.ndarray
+            The offset at each instant.
+        """
+        inside = (epochs >= self.start) & (epochs < self.end)
+        offsets = np.zeros(len(epochs), dtype=np.int64)
+        if inside.any():
+            # The transitions of the spans the instants fall in, one after the other: each span starts with
+            # an entry at its first second, so an instant never picks an entry of an earlier span
+            spans = [self.__span(int(index)) for index in np.unique((epochs[inside] - self.start) // SPAN_SECONDS)]
+            starts = np.array([start for span_starts, _ in spans for start in span_starts], dtype=np.int64)
+            span_offsets = np.array([offset for _, span_offsets in spans for offset in span_offsets], dtype=np.int64)
+            offsets[inside] = span_offsets[np.searchsorted(starts, epochs[inside], side='right') - 1]
+        if not inside.all():
+            offsets[~inside] = [self.__offset(int(epoch)) for epoch in epochs[~inside]]
+        return offsets
+
+# Period Engine class that turns completion instants into the day and week keys of the user's own timezone.
+# Completion times are stored in UTC; the keys a completion counts for are those of the local day it happened on,
+# so a check-off late in the evening in New York doesn't land on the next UTC day. The transitions of each
+# timezone are computed once per process, a year at a time as completions need them, and shared by every user in it.
+class PeriodEngine:
+
+    def __init__(self):
+        self._zones = {}
+        self._lock = threading.Lock()
+
+    def zone(self, name):
+        """
+        Gets the offset transitions of a timezone, computing them on first use.
+
+        Parameters:
+        ----------
+        name : str
+            The IANA name of the timezone.
+
+        Returns:
+        -------
+        ZoneOffsets
+            The transitions of the timezone.
+        """
+        zone = self._zones.get(name)
+        if zone is None:
+            with self._lock:
+                zone = self._zones.get(name)
+                if zone is None:
+                    zone = ZoneOffsets(name)
+                    self._zones[name] = zone
+        return zone
+
+    def day_key(self, epoch, timezone=None):
+        """
+        Gets the local day key of an instant.
+
+        Parameters:
+        ----------
+        epoch : int
+            Seconds since 1970-01-01 00:00:00 UTC.
+        timezone : str, optional
+            The IANA name of the timezone. Defaults to UTC.
+
+        Returns:
+        -------
+        int
+            Days from 1970-01-01 to the local day of the instant.
+        """
+        if timezone is None or timezone == DEFAULT_TIMEZONE:
+            return epoch // SECONDS_PER_DAY
+        return (epoch + self.zone(timezone).offset(epoch)) // SECONDS_PER_DAY
+
+    def day_keys(self, epochs, timezone=None):
+        """
+        Gets the local day keys of an array of instants, for bulk rebuilds.
+
+        Parameters:
+        ----------
+        epochs : numpy.ndarray
+            Seconds since 1970-01-01 00:00:00 UTC.
+        timezone : str, optional
+            The IANA name of the timezone. Defaults to UTC.
+
+        Returns:
+        -------
+        numpy.ndarray
+            The local day key of each instant.
+        """
+        epochs = np.asarray(epochs, dtype=np.int64)
+        if timezone is None or timezone == DEFAULT_TIMEZONE:
+            return epochs // SECONDS_PER_DAY
+        return (epochs + self.zone(timezone).offsets_of(epochs)) // SECONDS_PER_DAY
+
+    def completion_keys(self, moment, timezone=None):
+        """
+        Gets the columns stored with a completion in habit_tracker.
+
+        Parameters:
+        ----------
+        moment : datetime.datetime
+            The time of the completion. A naive datetime is a local time of the timezone.
+        timezone : str, optional
+            The IANA name of the user's timezone. Defaults to UTC.
+
+        Returns:
+        -------
+        tuple
+            The (completed_at, completed_epoch, day_key, iso_week_key) of the completion, where
+            completed_at is the UTC time formatted as '%Y-%m-%d %H:%M:%S'.
+        """
+        if moment.tzinfo is None and timezone is not None and timezone != DEFAULT_TIMEZONE:
+            moment = moment.replace(tzinfo=self.zone(timezone).zone)
+        if moment.tzinfo is None:
+            epoch = epoch_seconds(moment)
+        else:
+            epoch = int(moment.timestamp())
+        day = self.day_key(epoch, timezone)
+        return format_epoch(epoch), epoch, day, week_key(day)
+
+    def today(self, timezone=None, now=None):
+        """
+        Gets the day key of the current local day in a timezone.
+
+        Parameters:
+        ----------
+        timezone : str, optional
+            The IANA name of the timezone. Defaults to UTC.
+        now : datetime.datetime, optional
+            The current time, aware. Defaults to now.
+
+        Returns:
+        -------
+        int
+            Days from 1970-01-01 to the local day.
+        """
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        return self.day_key(int(now.timestamp()), timezone)
+
+    def day_start(self, day, timezone=None):
+        """
+        Gets the instant a local day starts at.
+
+        Parameters:
+        ----------
+        day : int
+            Days since 1970-01-01.
+        timezone : str, optional
+            The IANA name of the timezone. Defaults to UTC.
+
+        Returns:
+        -------
+        int
+            Seconds since 1970-01-01 00:00:00 UTC of the local midnight (or the first local time of the day,
+            when midnight is skipped by a DST change).
+        """
+        if timezone is None or timezone == DEFAULT_TIMEZONE:
+            return day * SECONDS_PER_DAY
+        midnight = datetime.datetime.fromordinal(day + EPOCH_ORDINAL).replace(tzinfo=self.zone(timezone).zone)
+        return int(midnight.timestamp())
+
+def user_timezone(cur, user_name):
+    """
+    Gets the stored timezone of a user.
+
+    Parameters:
+    ----------
+    cur : sqlite3.Cursor
+        A tuple cursor on the database.
+    user_name : str
+        The name of the user.
+
+    Returns:
+    -------
+    str or None
+        The IANA name of the timezone, or None if the user is in UTC.
+    """
+    row = cur.execute("SELECT timezone FROM user_timezones WHERE user_name = ?", (user_name,)).fetchone()
+    return row[0] if row is not None else None
+
+def rekey_user(connection, user_name, timezone):
+    """
+    Recomputes the day and week keys of every completion of a user for a timezone, archived partitions included,
+    and then the streaks, last day keys and daily rollup that depend on them. Runs in the caller's transaction.
+
+    The keys of each partition are computed with one vectorized lookup, so the cost is linear in the user's history.
+
+    Parameters:
+    ----------
+    connection : sqlite3.Connection
+        The connection to the database, in a write transaction.
+    user_name : str
+        The name of the user.
+    timezone : str or None
+        The IANA name of the user's timezone, None for UTC.
+
+    Returns:
+    -------
+    list
+        The (user_habit_id, user_name, habit_id, (current_streak, longest_streak)) of the tracked habits whose streaks changed.
+    """
+    cur = connection.cursor()
+    cur.row_factory = None
+    user_habits = cur.execute(
+        """SELECT
+               user_habits.id,
+               user_habits.habit_id,
+               user_habits.current_streak,
+               user_habits.longest_streak,
+               habits.periodicity = 'WEEKLY'
+            FROM
+               user_habits
+            JOIN
+               habits ON user_habits.habit_id = habits.id
+            WHERE
+               user_habits.user_name = ?""",
+        (user_name,)
+    ).fetchall()
+    if not user_habits:
+        return []
+
+    user_habit_filter = "user_habit_id IN (SELECT id FROM user_habits WHERE user_name = ?)"
+    tables = ['habit_tracker'] + [row[0] for row in cur.execute("SELECT name FROM habit_tracker_partitions")]
+    ids = []
+    days = []
+    for table in tables:
+        rows = np.array(cur.execute(f"SELECT id, user_habit_id, completed_epoch, day_key FROM {table} WHERE {user_habit_filter}",
+                                    (user_name,)).fetchall(), dtype=np.int64).reshape(-1, 4)
+        table_days = period_engine.day_keys(rows[:, 2], timezone)
+        changed = table_days != rows[:, 3]
+        cur.executemany(f"UPDATE {table} SET day_key = ?, iso_week_key = ? WHERE id = ?",
+                        zip(table_days[changed].tolist(), ((table_days[changed] + 3) // 7).tolist(), rows[changed, 0].tolist()))
+        ids.append(rows[:, 1])
+        days.append(table_days)
+
+    # Streaks from the new keys, the same way the streak engine recomputes them
+    ids = np.concatenate(ids)
+    days = np.concatenate(days)
+    weekly = {row[0]: bool(row[4]) for row in user_habits}
+    keys = period_keys(days, np.array([weekly[user_habit_id] for user_habit_id in ids.tolist()], dtype=bool))
+    order = np.lexsort((keys, ids))
+    group_ids, group_current, group_longest = compute_streaks(ids[order], keys[order])
+    streaks = {user_habit_id: (current, longest)
+               for user_habit_id, current, longest in zip(group_ids.tolist(), group_current.tolist(), group_longest.tolist())}
+
+    changes = []
+    for user_habit_id, habit_id, current_streak, longest_streak, _ in user_habits:
+        recomputed = streaks.get(user_habit_id, (0, 0))
+        if recomputed != (current_streak, longest_streak):
+            changes.append((user_habit_id, user_name, habit_id, recomputed))
+    cur.executemany("UPDATE user_habits SET current_streak = ?, longest_streak = ? WHERE id = ?",
+                    [(current, longest, user_habit_id) for user_habit_id, _, _, (current, longest) in changes])
+
+    cur.execute(
+        f"""UPDATE user_habit_stats SET last_day_key = (
+               SELECT MAX(day_key) FROM habit_tracker_history WHERE habit_tracker_history.user_habit_id = user_habit_stats.user_habit_id
+            )
+            WHERE {user_habit_filter}""",
+        (user_name,)
+    )
+    cur.execute(f"DELETE FROM user_habit_daily WHERE {user_habit_filter}", (user_name,))
+    cur.execute(
+        f"""INSERT INTO user_habit_daily (user_habit_id, day, completions)
+            SELECT user_habit_id, date(day_key * 86400, 'unixepoch'), COUNT(*)
+            FROM habit_tracker_history
+            WHERE {user_habit_filter}
+            GROUP BY user_habit_id, day_key""",
+        (user_name,)
+    )
+    return changes
+
+# Global instance of the PeriodEngine class
+period_engine = PeriodEngine()
@@ -0,0 +1,138 @@
+import io
+from classes.catalog import replicate_catalog
+from classes.history_file import export_history, import_history
+from classes.partitions import HOT_TABLE
+
+def misplaced_users(router):
+    """
+    Finds the users whose data is not on the shard the router sends them to, e.g. after a shard was added.
+
+    Parameters:
+    ----------
+    router : ShardRouter
+        The shards, in their new order.
+
+    Returns:
+    -------
+    list
+        (user_name, shard the user is on, shard the user belongs to) tuples, by user name.
+    """
+    def users(index, db, connection):
+        cur = db.cursor_for('tuple', connection)
+        data = cur.execute("SELECT user_name FROM user_habits UNION SELECT user_name FROM user_timezones")
+        return [row[0] for row in data.fetchall()]
+
+    moves = []
+    for index, user_names in enumerate(router.fan_out(users)):
+        for user_name in user_names:
+            target = router.shard_index(user_name)
+            if target != index:
+                moves.append((user_name, index, target))
+    return sorted(moves)
+
+def move_user(source, target, user_name):
+    """
+    Moves a user's tracked habits, completions (archived ones included) and timezone from one shard to another.
+
+    The data is first copied, through a history file kept in memory, then deleted from the source, each step
+    in its own transactions. Copying merges with what the target already has, so a move that was interrupted
+    is completed by running it again. The history file only holds completion times, so the client event IDs of
+    the user's check-offs, and the streaks each returned, are copied onto the imported completions afterwards:
+    retries of those check-offs are still recognized once the user is moved.
+
+    Parameters:
+    ----------
+    source : sqlite3.Connection
+        A connection to the shard the user is on.
+    target : sqlite3.Connection
+        A connection to the shard the user belongs to.
+    user_name : str
+        The name of the user.
+
+    Returns:
+    -------
+    dict
+        The number of tracked habits and completions copied to the target.
+    """
+    source_cur = source.cursor()
+    source_cur.row_factory = None
+
+    # The timezone goes first, so the completions are keyed to the user's local days once imported
+    row = source_cur.execute("SELECT timezone FROM user_timezones WHERE user_name = ?", (user_name,)).fetchone()
+    if row is not None:
+        target.execute(
+            """INSERT INTO user_timezones (user_name, timezone) VALUES (?, ?)
+               ON CONFLICT (user_name) DO UPDATE SET timezone = excluded.timezone""",
+            (user_name, row[0])
+        )
+        target.commit()
+
+    history = io.BytesIO()
+    export_history(source, history, [user_name])
+    history.seek(0)
+    imported = import_history(target, history)
+
+    # The imported completions are in the target's hot table, matched to the source's by habit and time
+    events = []
+    for table in [HOT_TABLE] + [row[0] for row in source_cur.execute("SELECT name FROM habit_tracker_partitions").fetchall()]:
+        events += source_cur.execute(
+            f"""SELECT {table}.event_id, {table}.event_current_streak, {table}.event_longest_streak, user_habits.user_name,
+                       user_habits.habit_id, {table}.completed_epoch
+                FROM {table} JOIN user_habits ON user_habits.id = {table}.user_habit_id
+                WHERE user_habits.user_name = ? AND {table}.event_id IS NOT NULL""",
+            (user_name,)
+        ).fetchall()
+    if events:
+        target.executemany(
+            f"""UPDATE OR IGNORE {HOT_TABLE} SET event_id = ?, event_current_streak = ?, event_longest_streak = ?
+                WHERE user_habit_id = (SELECT id FROM user_habits WHERE user_name = ? AND habit_id = ?) AND completed_epoch = ?""",
+            events
+        )
+        target.commit()
+
+    try:
+        source_cur.execute("BEGIN IMMEDIATE")
+        tables = [HOT_TABLE] + [row[0] for row in source_cur.execute("SELECT name FROM habit_tracker_partitions").fetchall()]
+        for table in tables:
+            source_cur.execute(f"DELETE FROM {table} WHERE user_habit_id IN (SELECT id FROM user_habits WHERE user_name = ?)", (user_name,))
+        # Triggers drop the user's summary and rollup rows, and bump the streaks and user versions
+        source_cur.execute("DELETE FROM user_habits WHERE user_name = ?", (user_name,))
+        source_cur.execute("DELETE FROM user_timezones WHERE user_name = ?", (user_name,))
+        source.commit()
+    except Exception:
+        source.rollback()
+        raise
+    return {'user_habits': imported['user_habits'] + imported['merged_user_habits'], 'completions': imported['completions']}
+
+def rebalance(router, dry_run=False):
+    """
+    Moves every misplaced user to the shard the router sends them to, after copying the habits catalog
+    to every shard so the moved habits keep their IDs.
+
+    Parameters:
+    ----------
+    router : ShardRouter
+        The shards, in their new order.
+    dry_run : bool, optional
+        Only find the users to move.
+
+    Returns:
+    -------
+    list
+        (user_name, source shard, target shard, moved counts) tuples, the counts are None on a dry run.
+    """
+    if not dry_run:
+        replicate_catalog(router)
+    moves = []
+    for user_name, source, target in misplaced_users(router):
+        moved = None
+        if not dry_run:
+            source_connection = router.shards[source].pool.acquire()
+            target_connection = router.shards[target].pool.acquire()
+            try:
+                moved = move_user(source_connection, target_connection, user_name)
+            finally:
+                router.shards[target].pool.release(target_connection)
+                router.shards[source].pool.release(source_connection)
+        moves.append((user_name, source, target, moved))
+    return moves
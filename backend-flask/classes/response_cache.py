@@ -0,0 +1,307 @@
+import collections
+import datetime
+import hashlib
+import os
+import threading
+import time
+from db.db import squlite_db
+from db.shards import shard_router
+
+# Version counters of the data_versions table a cached response can depend on.
+# A response can also depend on one user's data, named 'user:<user_name>'.
+VERSION_SCOPES = ('catalog', 'streaks', 'users')
+USER_SCOPE_PREFIX = 'user:'
+
+def user_scope(user_name):
+    """
+    Gets the version scope of a user's data.
+    """
+    return f'{USER_SCOPE_PREFIX}{user_name}'
+
+# Response Cache class that keeps the serialized bodies of read routes and the versions their ETags are built from.
+# A response only depends on the data of its version scopes (the habit catalog, all streaks, or one user's data),
+# so its ETag is a hash of the request and those versions, and a request whose If-None-Match holds the current
+# ETag is answered with 304 before the route runs.
+class ResponseCache:
+    """
+    An LRU cache of serialized response bodies, keyed by request and validated by ETag.
+
+    The versions of the scopes are kept in memory. Like the habit catalog, they are checked against the
+    data_versions table at most once every `check_interval` seconds, in one query, or on the next lookup
+    after this process wrote. When the 'users' counter moved, only the users changed since are read back
+    from user_data_versions. Computing an ETag thus rarely touches SQLite. The versions of at most `max_users`
+    users are kept, the least recently used are read again when next needed.
+
+    Attributes:
+    ----------
+    db : SqliteDB
+        The database the versions are read from.
+    router : ShardRouter, optional
+        The shards the versions are read from instead, each user's from their own shard (see db/shards.py).
+    enabled : bool
+        Whether the read routes use the cache and send ETags.
+    max_bytes : int
+        Total size of the cached bodies above which the least recently used ones are evicted.
+    ttl : float
+        Seconds a cached body is served for, even if its versions didn't change.
+    max_users : int
+        Number of users whose versions are kept in memory.
+    check_interval : float
+        Seconds between two checks of the versions.
+    """
+
+    def __init__(self, db, enabled=None, max_bytes=None, ttl=None, check_interval=None, router=None, max_users=None):
+        self.db = db
+        self.router = router
+        if enabled is None:
+            enabled = os.getenv("RESPONSE_CACHE", "1").lower() in ("1", "true", "yes")
+        if max_bytes is None:
+            max_bytes = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+        if ttl is None:
+            ttl = float(os.getenv("RESPONSE_CACHE_TTL", 300))
+        if check_interval is None:
+            check_interval = float(os.getenv("RESPONSE_CACHE_CHECK_INTERVAL", 1))
+        if max_users is None:
+            max_users = int(os.getenv("RESPONSE_CACHE_MAX_USERS", 100_000))
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_users = max_users
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        self._versions = None
+        self._schema_version = None
+        self._shard_versions = None
+        # user_name -> version, least recently used first
+        self._user_versions = collections.OrderedDict()
+        self._checked_at = 0.0
+        # Bumped by invalidate(), so a refresh that read the versions before a write doesn't mark them fresh
+        self._generation = 0
+        # key -> (etag, body, expires_at), least recently used first
+        self._bodies = collections.OrderedDict()
+        self._bytes = 0
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'not_modified': 0,
+            'stores': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'version_checks': 0,
+            'user_version_loads': 0,
+            'user_evictions': 0,
+        }
+
+    def __refresh(self):
+        """
+        Reads the versions if they were not checked for `check_interval` seconds, and drops the user versions
+        that changed since.
+
+        The queries run without the lock, so lookups of other threads don't wait on SQLite;
+        what they read is swapped in under the lock afterwards.
+        With several shards, each shard's counters are read and summed: counters only ever grow,
+        so the sum moves whenever one of them does.
+
+        Returns:
+        -------
+        dict
+            The current version of every scope.
+        """
+        with self._lock:
+            if self._versions is not None and time.monotonic() - self._checked_at < self.check_interval:
+                return self._versions
+            previous, previous_schema_version, generation = self._shard_versions, self._schema_version, self._generation
+
+        query = ("SELECT " + ", ".join(f"(SELECT version FROM data_versions WHERE scope = '{scope}')" for scope in VERSION_SCOPES)
+                 + ", schema_version FROM pragma_schema_version")
+        checks = []
+        for db in self.__shards():
+            cur = db.cursor_for('tuple')
+            row = cur.execute(query).fetchone()
+            checks.append((cur, dict(zip(VERSION_SCOPES, row[:-1])), row[-1]))
+        versions = {scope: sum(shard_versions[scope] for _, shard_versions, _ in checks) for scope in VERSION_SCOPES}
+        schema_version = tuple(shard_schema_version for _, _, shard_schema_version in checks)
+
+        reset = (previous is None or len(previous) != len(checks) or schema_version != previous_schema_version
+                 or any(shard_versions['users'] < old['users'] for (_, shard_versions, _), old in zip(checks, previous)))
+        changed_users = []
+        if not reset:
+            for (cur, shard_versions, _), old in zip(checks, previous):
+                if shard_versions['users'] != old['users']:
+                    data = cur.execute("SELECT user_name, version FROM user_data_versions WHERE version > ?", (old['users'],))
+                    changed_users.extend(data.fetchall())
+
+        with self._lock:
+            self._stats['version_checks'] += 1
+            if self._shard_versions is not previous and self._versions is not None:
+                # Another thread refreshed meanwhile, from versions at least as recent as these
+                return self._versions
+            if reset or self._shard_versions is not previous:
+                # A new or replaced database (or a cleared cache): nothing known about it can be trusted
+                self._user_versions.clear()
+                self.__clear_bodies()
+            else:
+                for user_name, version in changed_users:
+                    if user_name in self._user_versions:
+                        self._user_versions[user_name] = version
+            self._versions, self._schema_version = versions, schema_version
+            self._shard_versions = [shard_versions for _, shard_versions, _ in checks]
+            # A write of this process after the versions were read must still be seen by the next lookup
+            if self._generation == generation:
+                self._checked_at = time.monotonic()
+            return versions
+
+    def __shards(self):
+        """
+        Gets the databases the versions are read from.
+        """
+        return self.router.shards if self.router is not None else [self.db]
+
+    def __user_version(self, user_name):
+        """
+        Gets the version of a user's data, reading it the first time the user is seen or once it was evicted.
+
+        The version is read without the lock, and only kept if no refresh happened meanwhile: a refresh only
+        updates the users already kept, so a version read before it could otherwise miss a later write.
+        """
+        with self._lock:
+            version = self._user_versions.get(user_name)
+            if version is not None:
+                self._user_versions.move_to_end(user_name)
+                return version
+            shard_versions = self._shard_versions
+
+        db = self.router.db_for(user_name) if self.router is not None else self.db
+        row = db.cursor_for('tuple').execute("SELECT version FROM user_data_versions WHERE user_name = ?", (user_name,)).fetchone()
+        version = row[0] if row else 0
+
+        with self._lock:
+            self._stats['user_version_loads'] += 1
+            if self._shard_versions is shard_versions and shard_versions is not None:
+                self._user_versions[user_name] = version
+                while len(self._user_versions) > self.max_users:
+                    self._user_versions.popitem(last=False)
+                    self._stats['user_evictions'] += 1
+        return version
+
+    def etag(self, key, scopes):
+        """
+        Builds the ETag of a response from the current versions of the scopes it depends on.
+
+        Responses with date ranges defaulting to today depend on the date as well, so it is part of every ETag.
+
+        Parameters:
+        ----------
+        key : str
+            Identifies the request, e.g. its path, query string and Accept header.
+        scopes : tuple
+            The version scopes, e.g. ('catalog', user_scope('Alice')).
+
+        Returns:
+        -------
+        str
+            The (unquoted) ETag.
+        """
+        scope_versions = self.__refresh()
+        versions = [self.__user_version(scope[len(USER_SCOPE_PREFIX):]) if scope.startswith(USER_SCOPE_PREFIX) else scope_versions[scope]
+                    for scope in scopes]
+        digest = hashlib.blake2b(repr((key, versions, datetime.date.today().isoformat())).encode(), digest_size=12)
+        return digest.hexdigest()
+
+    def get(self, key, etag):
+        """
+        Gets the cached body of a request, if it was stored with the same ETag and didn't expire.
+
+        Returns:
+        -------
+        bytes or None
+            The body, or None on a miss.
+        """
+        with self._lock:
+            entry = self._bodies.get(key)
+            if entry is None or entry[0] != etag:
+                self._stats['misses'] += 1
+                return None
+            if entry[2] <= time.monotonic():
+                self.__drop(key)
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._bodies.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[1]
+
+    def put(self, key, etag, body):
+        """
+        Stores the body of a request, evicting the least recently used bodies beyond `max_bytes`.
+        """
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._bodies:
+                self.__drop(key)
+            self._bodies[key] = (etag, body, time.monotonic() + self.ttl)
+            self._bytes += len(body)
+            self._stats['stores'] += 1
+            while self._bytes > self.max_bytes:
+                self.__drop(next(iter(self._bodies)))
+                self._stats['evictions'] += 1
+
+    def not_modified(self):
+        """
+        Counts a request answered with 304 Not Modified.
+        """
+        with self._lock:
+            self._stats['not_modified'] += 1
+
+    def __drop(self, key):
+        _, body, _ = self._bodies.pop(key)
+        self._bytes -= len(body)
+
+    def __clear_bodies(self):
+        self._bodies.clear()
+        self._bytes = 0
+
+    def invalidate(self):
+        """
+        Makes the next lookup check the versions. Called after this process wrote, so its own
+        writes show up right away instead of after `check_interval` seconds.
+        """
+        with self._lock:
+            self._checked_at = 0.0
+            self._generation += 1
+
+    def clear(self):
+        """
+        Drops every cached body and version.
+        """
+        with self._lock:
+            self.__clear_bodies()
+            self._versions = None
+            self._shard_versions = None
+            self._user_versions.clear()
+
+    def metrics(self):
+        """
+        Gets the cache counters.
+
+        Returns:
+        -------
+        dict
+            Hits, misses, 304 answers, stored, evicted and expired bodies, version checks and user version loads,
+            the number and total size of the cached bodies, and the cached versions.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._bodies)
+            stats['bytes'] = self._bytes
+            stats['max_bytes'] = self.max_bytes
+            stats['ttl'] = self.ttl
+            stats['versions'] = dict(self._versions) if self._versions is not None else None
+            stats['users'] = len(self._user_versions)
+            stats['max_users'] = self.max_users
+        return stats
+
+# Global instance of the ResponseCache class
+response_cache = ResponseCache(squlite_db, router=shard_router)
@@ -0,0 +1,202 @@
+import collections
+import os
+import re
+import sys
+import threading
+import time
+from db.db import reset_after_fork
+
+# Characters kept in the names of the files flame data is dumped to
+FILE_NAME_UNSAFE = re.compile(r'[^A-Za-z0-9_.-]+')
+
+# Stack Sampler class, a sampling profiler of the requests being served.
+# A background thread looks at the stack of every thread that is serving a request, every `interval` seconds,
+# and counts the stacks per endpoint in the folded format of flame graph tools (flamegraph.pl, speedscope).
+class StackSampler:
+    """
+    A sampling profiler that collects per endpoint flame data.
+
+    Requests register the thread serving them with begin() and end(). Unlike cProfile, nothing runs in the
+    request threads themselves, so the overhead is the sampling thread's, and it is only started once
+    a request is profiled. When disabled, begin() and end() return right away.
+
+    Attributes:
+    ----------
+    enabled : bool
+        Whether requests are sampled.
+    interval : float
+        Seconds between two samples.
+    max_depth : int
+        Deepest stack frames kept, counted from the innermost frame.
+    """
+
+    def __init__(self, enabled=None, interval=None, max_depth=64):
+        if enabled is None:
+            enabled = os.getenv("PROFILE_SAMPLER", "0").lower() in ("1", "true", "yes")
+        if interval is None:
+            interval = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", 5)) / 1000
+        self.enabled = enabled
+        self.interval = interval
+        self.max_depth = max_depth
+
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+        # thread id -> endpoint of the request it is serving
+        self._active = {}
+        # endpoint -> Counter of folded stacks
+        self._stacks = collections.defaultdict(collections.Counter)
+        self._stats = {'samples': 0, 'sample_time': 0.0}
+        reset_after_fork(self, StackSampler._after_fork)
+
+    def _after_fork(self):
+        """
+        Starts a forked process without samples or a sampling thread, which is started again by the next profiled request.
+        """
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+        self._active = {}
+        self._stacks = collections.defaultdict(collections.Counter)
+        self._stats = {'samples': 0, 'sample_time': 0.0}
+
+    def begin(self, name):
+        """
+        Starts sampling the current thread under an endpoint name.
+        """
+        if not self.enabled:
+            return
+        self.__start()
+        self._active[threading.get_ident()] = name
+
+    def end(self):
+        """
+        Stops sampling the current thread.
+        """
+        if self._active:
+            self._active.pop(threading.get_ident(), None)
+
+    def __start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self.__run, name='stack-sampler', daemon=True)
+                self._thread.start()
+
+    def __run(self):
+        while not self._stopping.wait(self.interval):
+            if not self._active:
+                continue
+            start = time.perf_counter()
+            frames = sys._current_frames()
+            samples = []
+            for thread_id, name in list(self._active.items()):
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    samples.append((name, self.__fold(frame)))
+            with self._lock:
+                for name, stack in samples:
+                    self._stacks[name][stack] += 1
+                self._stats['samples'] += len(samples)
+                self._stats['sample_time'] += time.perf_counter() - start
+
+    def __fold(self, frame):
+        """
+        Folds a stack into one line, outermost frame first, e.g. "app.py:wsgi_app;habits.py:check_off_habit".
+        """
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def endpoints(self):
+        """
+        Gets the number of samples taken per endpoint.
+
+        Returns:
+        -------
+        dict
+            The samples, keyed by endpoint.
+        """
+        with self._lock:
+            return {name: sum(stacks.values()) for name, stacks in self._stacks.items()}
+
+    def folded(self, name):
+        """
+        Gets the flame data of an endpoint, in the folded format: one "stack samples" line per distinct stack.
+
+        Returns:
+        -------
+        str or None
+            The folded stacks, most sampled first, or None if the endpoint was never sampled.
+        """
+        with self._lock:
+            stacks = self._stacks.get(name)
+            if stacks is None:
+                return None
+            return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+
+    def dump(self, directory):
+        """
+        Writes the flame data of every sampled endpoint to a <endpoint>.folded file.
+
+        Parameters:
+        ----------
+        directory : str
+            The directory the files are written to. It is created if needed.
+
+        Returns:
+        -------
+        list
+            The paths of the written files.
+        """
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for name in self.endpoints():
+            path = os.path.join(directory, f"{FILE_NAME_UNSAFE.sub('_', name)}.folded")
+            with open(path, 'w') as f:
+                f.write(self.folded(name))
+            paths.append(path)
+        return paths
+
+    def reset(self):
+        """
+        Drops the samples taken so far.
+        """
+        with self._lock:
+            self._stacks.clear()
+            self._stats = {'samples': 0, 'sample_time': 0.0}
+
+    def stop(self, timeout=None):
+        """
+        Stops the sampling thread. It starts again with the next profiled request.
+        """
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self._stopping.set()
+            thread.join(timeout)
+
+    def metrics(self):
+        """
+        Gets the sampler counters.
+
+        Returns:
+        -------
+        dict
+            Whether sampling is enabled, the interval, the samples taken, the seconds spent taking them, and the samples per endpoint.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats['enabled'] = self.enabled
+        stats['interval'] = self.interval
+        stats['endpoints'] = self.endpoints()
+        return stats
+
+# Global instance of the StackSampler class
+stack_sampler = StackSampler()
@@ -0,0 +1,171 @@
+import itertools
+import numpy as np
+
+# Streak Engine that rebuilds current_streak and longest_streak of user_habits from the habit_tracker history
+# (the habit_tracker_history view, so archived completions count too).
+# It follows the same rules as classes/streaks.py (consecutive day or Monday-start week periods),
+# but works on whole arrays of completions at once instead of one completion at a time.
+
+# Number of completions read from SQLite at a time
+CHUNK_SIZE = 100_000
+
+# Period keys are stored in the low 32 bits of a sort key, shifted by this offset so they are never negative
+KEY_OFFSET = 1 << 31
+
+def compute_streaks(user_habit_ids, keys):
+    """
+    Computes the current and longest streak of every user habit in a batch of completions.
+
+    Parameters:
+    ----------
+    user_habit_ids : numpy.ndarray
+        The user habit of each completion, grouped together (e.g. sorted).
+    keys : numpy.ndarray
+        The period of each completion, sorted within each user habit.
+
+    Returns:
+    -------
+    tuple
+        Three arrays: the user habit IDs, their current streaks (the run of consecutive periods
+        ending at the last completion) and their longest streaks.
+    """
+    if len(keys) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+
+    # Completions in the same period count once
+    distinct = np.ones(len(keys), dtype=bool)
+    distinct[1:] = (user_habit_ids[1:] != user_habit_ids[:-1]) | (keys[1:] != keys[:-1])
+    user_habit_ids = user_habit_ids[distinct]
+    keys = keys[distinct]
+
+    # A run of consecutive periods starts at every new user habit and at every gap
+    run_starts = np.ones(len(keys), dtype=bool)
+    run_starts[1:] = (user_habit_ids[1:] != user_habit_ids[:-1]) | (np.diff(keys) != 1)
+    run_start_indexes = np.flatnonzero(run_starts)
+    run_lengths = np.diff(np.append(run_start_indexes, len(keys)))
+    run_user_habit_ids = user_habit_ids[run_start_indexes]
+
+    # Runs of the same user habit are next to each other, the last one is the current streak
+    group_starts = np.ones(len(run_lengths), dtype=bool)
+    group_starts[1:] = run_user_habit_ids[1:] != run_user_habit_ids[:-1]
+    group_start_indexes = np.flatnonzero(group_starts)
+    group_end_indexes = np.append(group_start_indexes[1:], len(run_lengths)) - 1
+
+    longest_streaks = np.maximum.reduceat(run_lengths, group_start_indexes)
+    current_streaks = run_lengths[group_end_indexes]
+    return run_user_habit_ids[group_start_indexes], current_streaks, longest_streaks
+
+def period_keys(days, weekly):
+    """
+    Turns day keys into period keys.
+
+    Parameters:
+    ----------
+    days : numpy.ndarray
+        Days since 1970-01-01 of each completion.
+    weekly : numpy.ndarray
+        Whether each completion belongs to a WEEKLY habit.
+
+    Returns:
+    -------
+    numpy.ndarray
+        The day key for DAILY habits, the Monday-start week key for WEEKLY habits.
+    """
+    return np.where(weekly, (days + 3) // 7, days)
+
+def recompute_streaks(connection, user_habit_ids=None, chunk_size=CHUNK_SIZE):
+    """
+    Recomputes the streaks of user habits from their habit_tracker history and writes back the ones that drifted.
+
+    The history is read in one sequential pass, straight into int64 arrays a chunk of completions at a time,
+    then sorted once by user habit and period. Memory grows with the number of completions, about 8 bytes each.
+    All updates are written with executemany in one transaction.
+
+    Parameters:
+    ----------
+    connection : sqlite3.Connection
+        The connection to the database.
+    user_habit_ids : list, optional
+        The user habits to recompute. Defaults to all of them.
+    chunk_size : int, optional
+        Number of completions read at a time.
+
+    Returns:
+    -------
+    dict
+        The number of user habits and tracker rows read, and the number of user habits updated.
+    """
+    cur = connection.cursor()
+    cur.row_factory = None
+
+    where = ''
+    params = ()
+    if user_habit_ids is not None:
+        user_habit_ids = sorted(set(user_habit_ids))
+        where = f"WHERE user_habits.id IN ({', '.join('?' * len(user_habit_ids))})"
+        params = tuple(user_habit_ids)
+
+    data = cur.execute(
+        f"""SELECT
+               user_habits.id,
+               user_habits.current_streak,
+               user_habits.longest_streak,
+               habits.periodicity = 'WEEKLY'
+            FROM
+               user_habits
+            JOIN
+               habits ON user_habits.habit_id = habits.id
+            {where}""",
+        params
+    )
+    user_habits = np.array(data.fetchall(), dtype=np.int64).reshape(-1, 4)
+    if len(user_habits) == 0:
+        return {'user_habits': 0, 'tracker_rows': 0, 'updated': 0}
+
+    # Lookup tables indexed by user habit ID
+    size = int(user_habits[:, 0].max()) + 1
+    weekly = np.zeros(size, dtype=bool)
+    weekly[user_habits[:, 0]] = user_habits[:, 3].astype(bool)
+    current_streaks = np.zeros(size, dtype=np.int64)
+    longest_streaks = np.zeros(size, dtype=np.int64)
+
+    # The completions are read as plain integer pairs, without a row per user habit or text to parse.
+    # Completions without a day key can't be placed in a period, so they are left out.
+    tracker_where = where.replace('user_habits.id', 'user_habit_id')
+    tracker_where = f"{tracker_where} AND day_key IS NOT NULL" if tracker_where else "WHERE day_key IS NOT NULL"
+    data = cur.execute(f"SELECT user_habit_id, day_key FROM habit_tracker_history {tracker_where}", params)
+
+    tracker_rows = 0
+    sort_keys = []
+    while True:
+        rows = data.fetchmany(chunk_size)
+        if not rows:
+            break
+        pairs = np.fromiter(itertools.chain.from_iterable(rows), dtype=np.int64, count=2 * len(rows)).reshape(-1, 2)
+        # Skip rows of user habits that no longer exist
+        pairs = pairs[pairs[:, 0] < size]
+        tracker_rows += len(pairs)
+        keys = period_keys(pairs[:, 1], weekly[pairs[:, 0]])
+        # One int64 per completion, ordered by user habit then period
+        sort_keys.append((pairs[:, 0] << 32) | (keys + KEY_OFFSET))
+
+    if sort_keys:
+        sort_keys = np.sort(np.concatenate(sort_keys))
+        group_ids, group_current, group_longest = compute_streaks(sort_keys >> 32, (sort_keys & 0xFFFFFFFF) - KEY_OFFSET)
+        current_streaks[group_ids] = group_current
+        longest_streaks[group_ids] = group_longest
+
+    ids = user_habits[:, 0]
+    drifted = (user_habits[:, 1] != current_streaks[ids]) | (user_habits[:, 2] != longest_streaks[ids])
+    updates = [(int(current_streaks[user_habit_id]), int(longest_streaks[user_habit_id]), int(user_habit_id))
+               for user_habit_id in ids[drifted]]
+
+    try:
+        cur.executemany("UPDATE user_habits SET current_streak = ?, longest_streak = ? WHERE id = ?", updates)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+
+    return {'user_habits': len(user_habits), 'tracker_rows': tracker_rows, 'updated': len(updates)}
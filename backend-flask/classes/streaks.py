@@ -0,0 +1,168 @@
+import calendar
+import datetime
+
+# Format of the completed_at timestamps stored in the habit_tracker table
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+SECONDS_PER_DAY = 86400
+
+# Streak rules shared by every part of the app that checks off habits or recomputes streaks.
+# A completion falls into a period (a day for DAILY habits, a Monday-start week for WEEKLY habits).
+# Periods are numbered with consecutive integers, so a streak continues when a completion
+# lands in the period right after the previous one.
+
+def day_key(moment):
+    """
+    Gets the number of the day a date or datetime falls on.
+
+    Parameters:
+    ----------
+    moment : datetime.date or datetime.datetime
+        The date or datetime.
+
+    Returns:
+    -------
+    int
+        Days since 1970-01-01.
+    """
+    return moment.toordinal() - EPOCH_ORDINAL
+
+def week_key(day):
+    """
+    Gets the number of the Monday-start week a day key falls in.
+
+    Parameters:
+    ----------
+    day : int
+        Days since 1970-01-01, as returned by day_key.
+
+    Returns:
+    -------
+    int
+        Weeks since the week of 1970-01-01 (a Thursday).
+    """
+    return (day + 3) // 7
+
+def period_from_day(day, periodicity):
+    """
+    Gets the number of the period a day key falls in.
+
+    Parameters:
+    ----------
+    day : int
+        Days since 1970-01-01, as returned by day_key or stored in habit_tracker.day_key.
+    periodicity : str
+        The periodicity of the habit (e.g., 'DAILY', 'WEEKLY').
+
+    Returns:
+    -------
+    int
+        The day key for DAILY habits, the week key for WEEKLY habits.
+    """
+    if periodicity == 'WEEKLY':
+        return week_key(day)
+    return day
+
+def period_key(moment, periodicity):
+    """
+    Gets the number of the period a date or datetime falls in.
+
+    Parameters:
+    ----------
+    moment : datetime.date or datetime.datetime
+        The date or datetime.
+    periodicity : str
+        The periodicity of the habit (e.g., 'DAILY', 'WEEKLY').
+
+    Returns:
+    -------
+    int
+        The day key for DAILY habits, the week key for WEEKLY habits.
+    """
+    return period_from_day(day_key(moment), periodicity)
+
+def epoch_seconds(moment):
+    """
+    Gets the completed_epoch value of a date or datetime.
+
+    Completion times are stored without a timezone, so the wall-clock time is counted as if it were UTC,
+    which keeps completed_epoch // 86400 equal to day_key(moment).
+
+    Parameters:
+    ----------
+    moment : datetime.date or datetime.datetime
+        The date or datetime. A date counts as its midnight.
+
+    Returns:
+    -------
+    int
+        Seconds since 1970-01-01 00:00:00.
+    """
+    return calendar.timegm(moment.timetuple())
+
+def format_epoch(epoch):
+    """
+    Formats a completed_epoch value like the completed_at timestamps, in UTC.
+
+    Parameters:
+    ----------
+    epoch : int
+        Seconds since 1970-01-01 00:00:00 UTC.
+
+    Returns:
+    -------
+    str
+        The timestamp, formatted as '%Y-%m-%d %H:%M:%S'.
+    """
+    return datetime.datetime.fromtimestamp(epoch, datetime.timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+def next_streak(last_key, key, current_streak, longest_streak):
+    """
+    Computes the streaks after a completion in period `key`.
+
+    Parameters:
+    ----------
+    last_key : int or None
+        The period of the previous completion, or None if there is none.
+    key : int
+        The period of the new completion.
+    current_streak : int
+        The current streak before the completion.
+    longest_streak : int
+        The longest streak before the completion.
+
+    Returns:
+    -------
+    tuple or None
+        The new (current_streak, longest_streak), or None if the period is already completed.
+    """
+    if last_key is not None and key == last_key:
+        return None
+    if last_key is not None and key == last_key + 1:
+        current_streak += 1
+    else:
+        current_streak = 1
+    return current_streak, max(longest_streak, current_streak)
+
+def streaks_from_keys(keys):
+    """
+    Computes the streaks of a full completion history.
+
+    Parameters:
+    ----------
+    keys : list
+        The sorted, distinct periods of every completion.
+
+    Returns:
+    -------
+    tuple
+        The (current_streak, longest_streak), where the current streak is the run ending at the last completion.
+    """
+    current_streak = longest_streak = 0
+    last_key = None
+    for key in keys:
+        current_streak, longest_streak = next_streak(last_key, key, current_streak, longest_streak)
+        last_key = key
+    return current_streak, longest_streak
@@ -0,0 +1,86 @@
+# Summary helpers for the per-user analytics dashboard.
+# Totals come from the user_habit_stats table, which triggers keep up to date on every check-off,
+# and completion rates from a bounded window of the habit_tracker index, so a summary costs
+# the same number of queries however long the history is.
+
+# Windows, in days, of the completion rates in a summary
+COMPLETION_RATE_WINDOWS = (7, 30)
+
+def expected_completions(periodicity, days):
+    """
+    Gets how many completions a habit needs to be kept for every period of a window.
+
+    Parameters:
+    ----------
+    periodicity : str
+        The periodicity of the habit (e.g., 'DAILY', 'WEEKLY').
+    days : int
+        The length of the window in days.
+
+    Returns:
+    -------
+    float
+        The number of periods in the window.
+    """
+    if periodicity == 'WEEKLY':
+        return days / 7
+    return days
+
+def rebuild_user_habit_stats(connection):
+    """
+    Rebuilds the user_habit_stats table from the habit_tracker history, archived partitions included, in one transaction.
+
+    Parameters:
+    ----------
+    connection : sqlite3.Connection
+        The connection to the database.
+
+    Returns:
+    -------
+    int
+        The number of tracked habits summarized.
+    """
+    try:
+        connection.execute("DELETE FROM user_habit_stats")
+        cur = connection.execute(
+            """INSERT INTO user_habit_stats (user_habit_id, completion_count, first_completed_at, last_completed_at, last_day_key)
+               SELECT habit_tracker_history.user_habit_id, COUNT(*), MIN(habit_tracker_history.completed_at), MAX(habit_tracker_history.completed_at),
+                      MAX(habit_tracker_history.day_key)
+               FROM habit_tracker_history
+               JOIN user_habits ON user_habits.id = habit_tracker_history.user_habit_id
+               GROUP BY habit_tracker_history.user_habit_id"""
+        )
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    return cur.rowcount
+
+def rebuild_user_habit_daily(connection):
+    """
+    Rebuilds the user_habit_daily rollup from the habit_tracker history, archived partitions included, in one transaction.
+
+    Parameters:
+    ----------
+    connection : sqlite3.Connection
+        The connection to the database.
+
+    Returns:
+    -------
+    int
+        The number of (tracked habit, day) rows rolled up.
+    """
+    try:
+        connection.execute("DELETE FROM user_habit_daily")
+        cur = connection.execute(
+            """INSERT INTO user_habit_daily (user_habit_id, day, completions)
+               SELECT habit_tracker_history.user_habit_id, date(habit_tracker_history.day_key * 86400, 'unixepoch'), COUNT(*)
+               FROM habit_tracker_history
+               JOIN user_habits ON user_habits.id = habit_tracker_history.user_habit_id
+               GROUP BY habit_tracker_history.user_habit_id, habit_tracker_history.day_key"""
+        )
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    return cur.rowcount
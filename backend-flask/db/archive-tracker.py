@@ -0,0 +1,62 @@
+import argparse
+import datetime
+import os
+import sys
+import time
+from dotenv import load_dotenv
+import sqlite3
+
+# Load environment variables from a .env file
+load_dotenv()
+
+__location__ = os.path.realpath(
+    os.path.join(os.getcwd(), os.path.dirname(__file__)))
+
+# Make the app's packages importable when this script is run directly
+sys.path.insert(0, os.path.dirname(__location__))
+
+from classes.partitions import archive_tracker, month_start
+from db.migrate import databaseFiles
+
+def archiveTracker(before):
+    """
+    Moves the habit_tracker completions older than `before` into the yearly archive tables, on every shard.
+
+    Parameters:
+    ----------
+    before : datetime.datetime
+        Completions before this time are archived.
+
+    Raises:
+    -------
+    sqlite3.Error
+        If an error occurs during the database connection or the archival.
+    """
+    # Each shard archives the completions of its own users
+    for DB_FILE_NAME in databaseFiles():
+        sqliteConnection = None
+        try:
+            # Connect to SQLite DB
+            sqliteConnection = sqlite3.connect(DB_FILE_NAME, check_same_thread=False)
+
+            start = time.perf_counter()
+            moved = archive_tracker(sqliteConnection, before)
+            elapsed = time.perf_counter() - start
+            for table, rows in moved.items():
+                print(f'Archived {rows} completions into {table}')
+            print(f"Archived {sum(moved.values())} completions of {DB_FILE_NAME} before {before:%Y-%m-%d} in {elapsed:.2f}s")
+        except sqlite3.Error as error:
+            print('Error occurred - ', error)
+        finally:
+            if sqliteConnection:
+                sqliteConnection.close()
+
+parser = argparse.ArgumentParser(description='Move cold habit_tracker completions into yearly archive tables.')
+parser.add_argument('--keep-months', type=int, default=12,
+                    help='months of completions, besides the current one, kept in the hot habit_tracker table')
+parser.add_argument('--before', type=datetime.datetime.fromisoformat,
+                    help='archive the completions before this date instead, e.g. 2024-01-01')
+args = parser.parse_args()
+
+# Command to run this script -> python3 ./db/archive-tracker.py --keep-months 12
+archiveTracker(args.before or month_start(datetime.datetime.now(), args.keep_months))
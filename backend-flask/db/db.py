@@ -1,54 +1,499 @@
 import os
+import pathlib
+import queue
 import sqlite3
-from flask import current_app as app
+import threading
+import time
+import weakref
+from collections import namedtuple
+from flask import current_app as app, g, has_app_context
 
-# This is the SQLite Connection Class. 
+
+class PoolTimeoutError(sqlite3.OperationalError):
+    """
+    Raised when no pooled connection becomes available within the pool timeout.
+    """
+
+
+# Connections a forked process inherited from its parent. They are kept referenced so the child never
+# closes them: closing one could checkpoint and remove the WAL files the parent is still using.
+inherited_connections = []
+
+def reset_after_fork(instance, reset):
+    """
+    Calls `reset(instance)` in the child process after every fork, for as long as the instance exists.
+    Connections, locks and threads of the parent must not be used by a forked worker (e.g. with gunicorn --preload).
+
+    Parameters:
+    ----------
+    instance : object
+        The object to reset. Only a weak reference to it is kept.
+    reset : callable
+        Resets the instance, e.g. an unbound method of its class.
+    """
+    if not hasattr(os, 'register_at_fork'):
+        return
+    ref = weakref.ref(instance)
+
+    def after_in_child():
+        target = ref()
+        if target is not None:
+            reset(target)
+    os.register_at_fork(after_in_child=after_in_child)
+
+
+# Row factories.
+# Rows are returned as dictionaries by default. Lookups that only need a column or two can use
+# plain tuples or sqlite3.Row instead, which are built in C without any Python code per row.
+
+def dict_factory(cursor, row):
+    """
+    Convert a SQLite row to a dictionary.
+    The column names are worked out once per statement and cached on the cursor.
+
+    Parameters:
+    ----------
+    cursor : sqlite3.Cursor
+        The SQLite cursor object.
+    row : tuple
+        The SQLite row.
+
+    Returns:
+    -------
+    dict
+        A dictionary representing the row data.
+    """
+    description = cursor.description
+    try:
+        if cursor._description is not description:
+            cursor._description = description
+            cursor._fields = tuple(col[0] for col in description)
+        return dict(zip(cursor._fields, row))
+    except AttributeError:
+        # Plain sqlite3.Cursor objects can't hold the cache
+        return dict(zip([col[0] for col in description], row))
+
+def namedtuple_factory(cursor, row):
+    """
+    Convert a SQLite row to a named tuple.
+    The named tuple class is created once per statement and cached on the cursor.
+
+    Returns:
+    -------
+    namedtuple
+        A named tuple representing the row data.
+    """
+    description = cursor.description
+    if getattr(cursor, '_namedtuple_description', None) is not description:
+        cursor._namedtuple_description = description
+        cursor._namedtuple = namedtuple('Row', [col[0] for col in description], rename=True)
+    return cursor._namedtuple._make(row)
+
+def rows_to_dicts(cursor, rows):
+    """
+    Convert tuple rows fetched from a cursor to dictionaries, e.g. right before they are serialized to JSON.
+
+    Parameters:
+    ----------
+    cursor : sqlite3.Cursor
+        The cursor the rows were fetched from.
+    rows : list
+        The tuple rows.
+
+    Returns:
+    -------
+    list
+        A list of dictionaries representing the rows.
+    """
+    fields = [col[0] for col in cursor.description]
+    return [dict(zip(fields, row)) for row in rows]
+
+ROW_FACTORIES = {
+    'dict': dict_factory,
+    'row': sqlite3.Row,
+    'tuple': None,
+    'namedtuple': namedtuple_factory,
+}
+
+class RowModeCursor(sqlite3.Cursor):
+    """
+    A cursor that can cache the column names of its current statement for the row factories.
+    """
+    _description = None
+    _fields = ()
+
+class RowModeConnection(sqlite3.Connection):
+    """
+    A connection whose cursors are RowModeCursor objects.
+    """
+    def cursor(self, factory=RowModeCursor):
+        return super().cursor(factory)
+
+
+# This is the Connection Pool Class.
+# It hands out SQLite connections to callers and takes them back once they are done,
+# never keeping more than `size` connections open at the same time.
+class ConnectionPool:
+    """
+    A bounded pool of SQLite connections with checkout and return.
+
+    Attributes:
+    ----------
+    database : str
+        Path to the SQLite database file.
+    size : int
+        Maximum number of connections that can be checked out at the same time.
+    timeout : float
+        Seconds a caller waits for a free connection before PoolTimeoutError is raised.
+    busy_timeout : int
+        Milliseconds SQLite waits on a locked database before raising "database is locked".
+    journal_mode : str
+        Journal mode set on every new connection (e.g., 'WAL').
+    synchronous : str
+        Value of PRAGMA synchronous set on every new connection (e.g., 'NORMAL').
+    row_factory : callable
+        Row factory set on every new connection.
+    factory : type
+        The sqlite3.Connection subclass of every new connection.
+    read_only : bool
+        Whether connections are opened with a `mode=ro` URI. They can't write, nor change the journal mode,
+        so the database must already be in WAL mode for them not to block writers.
+    """
+
+    def __init__(self, database, size=5, timeout=30.0, busy_timeout=5000,
+                 journal_mode='WAL', synchronous='NORMAL', row_factory=None, factory=RowModeConnection, read_only=False):
+        self.database = database
+        self.read_only = read_only
+        self.size = size
+        self.timeout = timeout
+        self.busy_timeout = busy_timeout
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.row_factory = row_factory
+        self.factory = factory
+
+        self._reset()
+        reset_after_fork(self, ConnectionPool._after_fork)
+
+    def _reset(self):
+        """
+        Sets up an empty pool, without any connection yet.
+        """
+        # Idle connections are reused most-recently-returned first, which keeps a warm page cache
+        self._idle = queue.LifoQueue()
+        # One slot per connection that may be checked out at the same time
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._stats_lock = threading.Lock()
+        # Every connection opened by this pool, idle, checked out or dedicated
+        self._opened = weakref.WeakSet()
+        self._stats = {
+            'checkouts': 0,
+            'hits': 0,
+            'misses': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'timeouts': 0,
+            'in_use': 0,
+        }
+
+    def _after_fork(self):
+        """
+        Starts a forked process with an empty pool: it opens its own connections on first use.
+        """
+        inherited_connections.extend(self._opened)
+        self._reset()
+
+    def _connect(self):
+        """
+        Open a new SQLite connection and apply the pool's connection settings.
+
+        Returns:
+        -------
+        sqlite3.Connection
+            The new connection.
+        """
+        if self.read_only:
+            conn = sqlite3.connect(f"{pathlib.Path(self.database).resolve().as_uri()}?mode=ro", uri=True,
+                                   timeout=self.busy_timeout / 1000, check_same_thread=False, factory=self.factory)
+        else:
+            conn = sqlite3.connect(self.database, timeout=self.busy_timeout / 1000, check_same_thread=False,
+                                   factory=self.factory)
+        conn.row_factory = self.row_factory
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+        # Read-only connections keep the journal mode the database is in, and never write
+        if self.journal_mode and not self.read_only:
+            conn.execute(f"PRAGMA journal_mode = {self.journal_mode}")
+        if self.synchronous and not self.read_only:
+            conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        self._opened.add(conn)
+        return conn
+
+    def connect(self):
+        """
+        Open a connection with the pool's settings that does not take a pool slot,
+        for a long-lived thread like the write coordinator's. The caller closes it.
+
+        Returns:
+        -------
+        sqlite3.Connection
+            The new connection.
+        """
+        return self._connect()
+
+    def acquire(self):
+        """
+        Check out a connection, waiting up to `timeout` seconds if the pool is exhausted.
+
+        Returns:
+        -------
+        sqlite3.Connection
+            A connection that belongs to the caller until it is released.
+
+        Raises:
+        -------
+        PoolTimeoutError
+            If no connection became available within the timeout.
+        """
+        waited = 0.0
+        if not self._slots.acquire(blocking=False):
+            start = time.perf_counter()
+            acquired = self._slots.acquire(timeout=self.timeout)
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self._stats['waits'] += 1
+                self._stats['wait_time'] += waited
+                if not acquired:
+                    self._stats['timeouts'] += 1
+            if not acquired:
+                raise PoolTimeoutError(f"No database connection available after {self.timeout} seconds")
+
+        try:
+            conn = self._idle.get_nowait()
+            hit = True
+        except queue.Empty:
+            try:
+                conn = self._connect()
+            except Exception:
+                self._slots.release()
+                raise
+            hit = False
+
+        with self._stats_lock:
+            self._stats['checkouts'] += 1
+            self._stats['hits' if hit else 'misses'] += 1
+            self._stats['in_use'] += 1
+        return conn
+
+    def release(self, conn):
+        """
+        Return a checked out connection to the pool.
+        Any transaction the caller left open is rolled back first.
+
+        Parameters:
+        ----------
+        conn : sqlite3.Connection
+            The connection to return.
+        """
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+        except sqlite3.Error:
+            # A broken connection is dropped, its slot is freed for a new one
+            conn.close()
+        finally:
+            with self._stats_lock:
+                self._stats['in_use'] -= 1
+            self._slots.release()
+
+    def close(self):
+        """
+        Close every idle connection in the pool.
+        """
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def metrics(self):
+        """
+        Get the pool usage counters.
+
+        Returns:
+        -------
+        dict
+            Checkouts, hits (idle connection reused), misses (new connection opened),
+            waits and total wait time in seconds, timeouts, and current in-use/idle counts.
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['size'] = self.size
+        stats['idle'] = self._idle.qsize()
+        return stats
+
+
+# This is the SQLite Connection Class.
 # From this class, all parts of the app can have access to the Database.
 class SqliteDB:
-    def __init__(self, testDB=None):
+    def __init__(self, testDB=None, read_only=False):
         """
         Initialize the SqliteDB class and set up the connection pool.
+        With `read_only`, the pool opens read-only connections, e.g. for the analytics readers (see db/readers.py).
         """
         self.testDB = testDB
+        self.read_only = read_only
+        self._local = threading.local()
         self.init_pool()
-    
-    def __row_to_dict(self, cursor: sqlite3.Cursor, row: sqlite3.Row) -> dict:
+        reset_after_fork(self, SqliteDB._after_fork)
+
+    def _after_fork(self):
+        """
+        Forgets the connection the forking thread held, which belongs to the parent process.
+        """
+        self._local = threading.local()
+
+    def init_pool(self):
+        """
+        Initialize the connection pool for the SQLite database.
+        Connections are opened lazily, in WAL mode, with a busy timeout,
+        and with the row factory set to return rows as dictionaries.
+
+        The pool is configured through the following environment variables:
+        - DB_POOL_SIZE: maximum number of connections checked out at once (default 5).
+        - DB_READ_POOL_SIZE: the same for read-only pools (defaults to DB_POOL_SIZE).
+        - DB_POOL_TIMEOUT: seconds to wait for a free connection (default 30).
+        - DB_BUSY_TIMEOUT: milliseconds SQLite waits on a locked database (default 5000).
+        - DB_JOURNAL_MODE: journal mode of the database (default WAL).
+        - DB_SYNCHRONOUS: PRAGMA synchronous of each connection (default NORMAL).
+        - REQUEST_PROFILING, METRICS: when either is enabled, connections time their statements and count
+          their rows into the profile of the current request and the metrics (see db/instrumentation.py).
         """
-        Convert a SQLite row object to a dictionary.
+        factory = RowModeConnection
+        if any(os.getenv(name, "0").lower() in ("1", "true", "yes") for name in ("REQUEST_PROFILING", "METRICS")):
+            # Imported here, as db.instrumentation builds on the classes of this module
+            from db.instrumentation import InstrumentedConnection
+            factory = InstrumentedConnection
+        size = int(os.getenv("DB_POOL_SIZE", 5))
+        if self.read_only:
+            size = int(os.getenv("DB_READ_POOL_SIZE", size))
+        self.pool = ConnectionPool(
+            self.testDB or os.getenv("DB_FILE_NAME"),
+            size=size,
+            timeout=float(os.getenv("DB_POOL_TIMEOUT", 30)),
+            busy_timeout=int(os.getenv("DB_BUSY_TIMEOUT", 5000)),
+            journal_mode=os.getenv("DB_JOURNAL_MODE", "WAL"),
+            synchronous=os.getenv("DB_SYNCHRONOUS", "NORMAL"),
+            row_factory=dict_factory,
+            factory=factory,
+            read_only=self.read_only,
+        )
+
+    def use_database(self, database):
+        """
+        Points the pool at another database file. The idle connections to the previous one are closed.
 
         Parameters:
         ----------
-        cursor : sqlite3.Cursor
-            The SQLite cursor object.
-        row : sqlite3.Row
-            The SQLite row object.
+        database : str
+            Path to the SQLite database file.
+        """
+        if database == self.pool.database:
+            return
+        self.release_thread_connection()
+        self.pool.close()
+        self.testDB = database
+        self.init_pool()
+
+    def init_app(self, app):
+        """
+        Wire the pool into a Flask application so that every app context (i.e. every request)
+        checks out its own connection and returns it when the context is torn down.
+        Calling this more than once for the same app is a no-op.
+
+        Parameters:
+        ----------
+        app : Flask
+            The Flask application instance.
+        """
+        apps = app.extensions.setdefault('sqlite_db', [])
+        if self in apps:
+            return
+        apps.append(self)
+        app.teardown_appcontext(self.teardown)
+
+    def get_connection(self):
+        """
+        Get the connection of the current request, or of the current thread outside of a request.
 
         Returns:
         -------
-        dict
-            A dictionary representing the row data.
+        sqlite3.Connection
+            A connection checked out from the pool.
         """
-        data = {}
-        for idx, col in enumerate(cursor.description):
-            data[col[0]] = row[idx]
-        return data
-    
-    def init_pool(self):
+        if has_app_context() and self in app.extensions.get('sqlite_db', []):
+            connections = g.setdefault('_sqlite_connections', {})
+            conn = connections.get(self)
+            if conn is None:
+                conn = connections[self] = self.pool.acquire()
+            return conn
+
+        # Scripts and apps without init_app keep one connection per thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self.pool.acquire()
+        return conn
+
+    def release_thread_connection(self):
         """
-        Initialize the connection pool by connecting to the SQLite database 
-        and setting the row factory to return rows as dictionaries.
+        Return the current thread's connection to the pool, if it holds one.
         """
-        try:
-            # Connect to DB and create a cursor
-            
-            conn = sqlite3.connect(os.getenv("DB_FILE_NAME"), check_same_thread=False)
-            conn.row_factory = self.__row_to_dict
-
-            self.conn = conn
-            self.cursor = conn.cursor()
-        # Handle error
-        except sqlite3.Error as error:
-            print('Error occurred - ', error)
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.conn = None
+            self.pool.release(conn)
+
+    def teardown(self, exception=None):
+        """
+        Return the connection of the ending app context to the pool.
+        """
+        connections = g.get('_sqlite_connections')
+        if connections and self in connections:
+            self.pool.release(connections.pop(self))
+
+    @property
+    def conn(self):
+        """
+        The connection of the current request or thread.
+        """
+        return self.get_connection()
+
+    @property
+    def cursor(self):
+        """
+        A new cursor on the connection of the current request or thread.
+        """
+        return self.get_connection().cursor()
+
+    def cursor_for(self, row_mode, connection=None):
+        """
+        Get a new cursor that returns rows in the given mode.
+
+        Parameters:
+        ----------
+        row_mode : str
+            'dict', 'row' (sqlite3.Row), 'tuple' or 'namedtuple'.
+        connection : sqlite3.Connection, optional
+            The connection to open the cursor on. Defaults to the connection of the current request or thread.
+
+        Returns:
+        -------
+        sqlite3.Cursor
+            A cursor on the connection.
+        """
+        cur = (connection or self.get_connection()).cursor()
+        cur.row_factory = ROW_FACTORIES[row_mode]
+        return cur
 
 # Global instance of the SqliteDB class
 squlite_db = SqliteDB()
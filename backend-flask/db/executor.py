@@ -0,0 +1,124 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from db.db import reset_after_fork, squlite_db
+from db.readers import read_routing
+from db.shards import shard_router
+
+# This is the DB Executor Class.
+# Async code can't call SQLite directly without blocking its event loop, so it hands the DB work to
+# a small, fixed set of threads instead: one writer thread, so writes never wait on each other's locks,
+# and a few reader threads, which WAL mode lets run next to the writer.
+class DBExecutor:
+    """
+    Runs DB work for async code on a bounded set of threads (one writer, many readers).
+
+    Each call checks out a connection from the pool for the thread it runs on and returns it once the
+    call is done, so no connection is held while the event loop waits, however many requests are in flight.
+
+    Attributes:
+    ----------
+    db : SqliteDB
+        The database the work runs against.
+    readers : int
+        Number of reader threads.
+    """
+
+    def __init__(self, db, readers=None):
+        self.db = db
+        if readers is None:
+            # The writer keeps one pooled connection for itself
+            readers = int(os.getenv("DB_EXECUTOR_READERS", max(1, db.pool.size - 1)))
+        self.readers = readers
+
+        self._reset()
+        reset_after_fork(self, DBExecutor._reset)
+
+    def _reset(self):
+        """
+        Forgets the thread pools, which are started again on first use. A forked process starts from here,
+        as the parent's threads don't exist in it.
+        """
+        self._lock = threading.Lock()
+        self._reader = None
+        self._writer = None
+
+    def __executors(self):
+        """
+        Gets the reader and writer thread pools, starting them on first use (e.g. again after a shutdown).
+
+        Returns:
+        -------
+        tuple
+            The reader and writer executors.
+        """
+        with self._lock:
+            if self._reader is None:
+                self._reader = ThreadPoolExecutor(self.readers, thread_name_prefix='db-reader')
+                self._writer = ThreadPoolExecutor(1, thread_name_prefix='db-writer')
+            return self._reader, self._writer
+
+    def __run(self, fn, args):
+        """
+        Runs a function on an executor thread, then returns the thread's connections to their pools,
+        including those of the other shards and of the analytics readers the function used.
+        """
+        try:
+            return fn(*args)
+        finally:
+            self.db.release_thread_connection()
+            shard_router.release_thread_connections()
+            read_routing.release_thread_connections()
+
+    async def read(self, fn, *args):
+        """
+        Runs read-only DB work on a reader thread.
+
+        Parameters:
+        ----------
+        fn : callable
+            The function to run. It uses the DB through the thread's connection (e.g. by creating a Habit).
+        *args
+            The arguments of the function.
+
+        Returns:
+        -------
+        object
+            What the function returned.
+        """
+        reader, _ = self.__executors()
+        return await asyncio.get_running_loop().run_in_executor(reader, self.__run, fn, args)
+
+    async def write(self, fn, *args):
+        """
+        Runs DB work that writes on the writer thread, one call at a time.
+
+        Parameters:
+        ----------
+        fn : callable
+            The function to run.
+        *args
+            The arguments of the function.
+
+        Returns:
+        -------
+        object
+            What the function returned.
+        """
+        _, writer = self.__executors()
+        return await asyncio.get_running_loop().run_in_executor(writer, self.__run, fn, args)
+
+    def shutdown(self, wait=True):
+        """
+        Stops the reader and writer threads once their queued work is done.
+        """
+        with self._lock:
+            reader, writer = self._reader, self._writer
+            self._reader = self._writer = None
+        if reader is not None:
+            reader.shutdown(wait=wait)
+            writer.shutdown(wait=wait)
+
+# Global instance of the DBExecutor class
+db_executor = DBExecutor(squlite_db)
@@ -0,0 +1,60 @@
+import argparse
+import os
+import sys
+import time
+from dotenv import load_dotenv
+import sqlite3
+
+# Load environment variables from a .env file
+load_dotenv()
+
+__location__ = os.path.realpath(
+    os.path.join(os.getcwd(), os.path.dirname(__file__)))
+
+# Make the app's packages importable when this script is run directly
+sys.path.insert(0, os.path.dirname(__location__))
+
+from classes.history_file import export_history
+
+def exportHistory(file_path, user_names=None):
+    """
+    Streams the tracked habits and their completions of the SQLite database named in the .env file to a history file.
+
+    Parameters:
+    ----------
+    file_path : str
+        The history file to write.
+    user_names : list, optional
+        Only export the habits tracked by these users.
+
+    Raises:
+    -------
+    sqlite3.Error
+        If an error occurs during the database connection or the export.
+    """
+    sqliteConnection = None
+    try:
+        # Connect to SQLite DB
+        DB_FILE_NAME = os.getenv("DB_FILE_NAME")
+
+        sqliteConnection = sqlite3.connect(DB_FILE_NAME, check_same_thread=False)
+
+        start = time.perf_counter()
+        with open(file_path, 'wb') as file:
+            exported = export_history(sqliteConnection, file, user_names)
+        elapsed = time.perf_counter() - start
+        print(f"Exported {exported['user_habits']} tracked habits and {exported['completions']} completions "
+              f"to {file_path} ({os.path.getsize(file_path):,} bytes) in {elapsed:.2f}s")
+    except sqlite3.Error as error:
+        print('Error occurred - ', error)
+    finally:
+        if sqliteConnection:
+            sqliteConnection.close()
+
+parser = argparse.ArgumentParser(description='Export tracked habits and their completions to a compact columnar file.')
+parser.add_argument('file', help='the history file to write')
+parser.add_argument('--users', nargs='+', help='only export the habits tracked by these users')
+args = parser.parse_args()
+
+# Command to run this script -> python3 ./db/export-history.py history.bin [--users Alice Bob]
+exportHistory(args.file, args.users)
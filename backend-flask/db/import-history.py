@@ -0,0 +1,57 @@
+import argparse
+import os
+import sys
+import time
+from dotenv import load_dotenv
+import sqlite3
+
+# Load environment variables from a .env file
+load_dotenv()
+
+__location__ = os.path.realpath(
+    os.path.join(os.getcwd(), os.path.dirname(__file__)))
+
+# Make the app's packages importable when this script is run directly
+sys.path.insert(0, os.path.dirname(__location__))
+
+from classes.history_file import HistoryFileError, import_history
+
+def importHistory(file_path):
+    """
+    Bulk loads a history file written by export-history.py into the SQLite database named in the .env file.
+
+    Parameters:
+    ----------
+    file_path : str
+        The history file to load.
+
+    Raises:
+    -------
+    sqlite3.Error
+        If an error occurs during the database connection or the import.
+    """
+    sqliteConnection = None
+    try:
+        # Connect to SQLite DB
+        DB_FILE_NAME = os.getenv("DB_FILE_NAME")
+
+        sqliteConnection = sqlite3.connect(DB_FILE_NAME, check_same_thread=False)
+
+        start = time.perf_counter()
+        with open(file_path, 'rb') as file:
+            imported = import_history(sqliteConnection, file)
+        elapsed = time.perf_counter() - start
+        print(f"Imported {imported['user_habits']} tracked habits ({imported['merged_user_habits']} merged) and "
+              f"{imported['completions']} completions in {elapsed:.2f}s")
+    except (sqlite3.Error, HistoryFileError) as error:
+        print('Error occurred - ', error)
+    finally:
+        if sqliteConnection:
+            sqliteConnection.close()
+
+parser = argparse.ArgumentParser(description='Bulk load a history file written by export-history.py.')
+parser.add_argument('file', help='the history file to load')
+args = parser.parse_args()
+
+# Command to run this script -> python3 ./db/import-history.py history.bin
+importHistory(args.file)
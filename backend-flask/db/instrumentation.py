@@ -0,0 +1,235 @@
+import contextvars
+import re
+import time
+from collections import defaultdict
+from db.db import RowModeConnection, RowModeCursor
+from classes.metrics import metrics
+
+# The profile of the request the current thread (or task) is serving, None when nothing is profiled
+current_profile = contextvars.ContextVar('current_profile', default=None)
+
+# Literals replaced by ? in normalized SQL, so statements that only differ by their values are counted together
+SQL_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+SQL_WHITESPACE = re.compile(r'\s+')
+# Statement types the statement latency histogram is labelled with, anything else is 'OTHER'
+SQL_FIRST_WORD = re.compile(r'\s*(\w+)')
+STATEMENT_TYPES = frozenset(('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'BEGIN', 'COMMIT', 'ROLLBACK',
+                             'SAVEPOINT', 'RELEASE', 'PRAGMA'))
+
+def normalize_sql(sql):
+    """
+    Normalizes a SQL statement: whitespace is collapsed and string and number literals are replaced by ?.
+
+    Parameters:
+    ----------
+    sql : str
+        The statement, with ? placeholders or with its bound values expanded.
+
+    Returns:
+    -------
+    str
+        The normalized statement.
+    """
+    return SQL_LITERAL.sub('?', SQL_WHITESPACE.sub(' ', sql).strip())
+
+def statement_type(sql):
+    """
+    Gets the type of a SQL statement from its first keyword, e.g. 'SELECT' or 'INSERT'.
+    """
+    match = SQL_FIRST_WORD.match(sql)
+    word = match.group(1).upper() if match else ''
+    return word if word in STATEMENT_TYPES else 'OTHER'
+
+class RequestProfile:
+    """
+    The SQL activity of one request: statements run by SQLite, queries executed through cursors, rows fetched
+    and the time spent in SQLite, in total and per normalized statement.
+
+    Attributes:
+    ----------
+    name : str
+        What is profiled, e.g. the endpoint of the request.
+    statements : int
+        Statements SQLite ran, including the BEGIN and COMMIT of transactions.
+    queries : int
+        execute and executemany calls.
+    rows : int
+        Rows fetched.
+    sql_time : float
+        Seconds spent executing queries and fetching their rows.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.queries = 0
+        self.rows = 0
+        self.sql_time = 0.0
+        # normalized SQL -> [statements, seconds]
+        self.sql = defaultdict(lambda: [0, 0.0])
+        self._last_sql = None
+        # Statements reported by the trace callback, normalized only when the summary is built
+        self._traced = []
+
+    def record_statement(self, sql):
+        """
+        Counts a statement reported by SQLite's trace callback.
+        """
+        self.statements += 1
+        self._traced.append(sql)
+
+    def record_query(self, sql, elapsed):
+        """
+        Adds the time of an execute or executemany call to its statement.
+        """
+        self.queries += 1
+        self.sql_time += elapsed
+        self._last_sql = normalize_sql(sql)
+        self.sql[self._last_sql][1] += elapsed
+
+    def record_rows(self, count, elapsed):
+        """
+        Adds fetched rows, and the time spent stepping through them to the statement they came from.
+        """
+        self.rows += count
+        self.sql_time += elapsed
+        if self._last_sql is not None:
+            self.sql[self._last_sql][1] += elapsed
+
+    def elapsed(self):
+        """
+        Seconds since the profile started.
+        """
+        return time.perf_counter() - self.started
+
+    def summary(self, top=5):
+        """
+        Gets the counters of the profile.
+
+        Parameters:
+        ----------
+        top : int, optional
+            The number of statements to list, slowest first.
+
+        Returns:
+        -------
+        dict
+            The counters, with the times in milliseconds, and the slowest statements.
+        """
+        for sql in self._traced:
+            self.sql[normalize_sql(sql)][0] += 1
+        self._traced = []
+        slowest = sorted(self.sql.items(), key=lambda item: item[1][1], reverse=True)[:top]
+        return {
+            'name': self.name,
+            'duration_ms': round(self.elapsed() * 1000, 3),
+            'sql_ms': round(self.sql_time * 1000, 3),
+            'statements': self.statements,
+            'queries': self.queries,
+            'rows': self.rows,
+            'slowest_sql': [{'sql': sql, 'count': count, 'ms': round(seconds * 1000, 3)} for sql, (count, seconds) in slowest],
+        }
+
+# Instrumented Cursor and Connection classes.
+# The pool only opens connections of these classes when request profiling or metrics are enabled, so the
+# Python-level wrappers cost nothing otherwise.
+class InstrumentedCursor(RowModeCursor):
+    """
+    A cursor that times its statements and counts the rows it fetches into the current request profile,
+    and records the latency of its statements in the metrics.
+    """
+
+    def execute(self, sql, parameters=()):
+        profile = current_profile.get()
+        if profile is None and not metrics.enabled:
+            return super().execute(sql, parameters)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_query(profile, sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        profile = current_profile.get()
+        if profile is None and not metrics.enabled:
+            return super().executemany(sql, seq_of_parameters)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record_query(profile, sql, time.perf_counter() - start)
+
+    def fetchone(self):
+        profile = current_profile.get()
+        if profile is None:
+            return super().fetchone()
+        start = time.perf_counter()
+        row = super().fetchone()
+        profile.record_rows(row is not None, time.perf_counter() - start)
+        return row
+
+    def fetchmany(self, size=None):
+        if size is None:
+            size = self.arraysize
+        profile = current_profile.get()
+        if profile is None:
+            return super().fetchmany(size)
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        profile.record_rows(len(rows), time.perf_counter() - start)
+        return rows
+
+    def fetchall(self):
+        profile = current_profile.get()
+        if profile is None:
+            return super().fetchall()
+        start = time.perf_counter()
+        rows = super().fetchall()
+        profile.record_rows(len(rows), time.perf_counter() - start)
+        return rows
+
+    def __next__(self):
+        profile = current_profile.get()
+        if profile is None:
+            return super().__next__()
+        start = time.perf_counter()
+        row = super().__next__()
+        profile.record_rows(1, time.perf_counter() - start)
+        return row
+
+class InstrumentedConnection(RowModeConnection):
+    """
+    A connection whose cursors are InstrumentedCursor objects, and whose statements, as reported by
+    SQLite's trace callback, are counted into the current request profile.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_trace_callback(trace_statement)
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # Connection.execute and executemany open a plain sqlite3.Cursor, so they go through cursor() here
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+def record_query(profile, sql, elapsed):
+    """
+    Records the time of an execute or executemany call into the request profile, if any, and the metrics.
+    """
+    if profile is not None:
+        profile.record_query(sql, elapsed)
+    metrics.observe('habit_sqlite_statement_duration_seconds', elapsed, statement=statement_type(sql))
+
+def trace_statement(sql):
+    """
+    The trace callback of instrumented connections.
+    """
+    profile = current_profile.get()
+    if profile is not None:
+        profile.record_statement(sql)
@@ -11,8 +11,8 @@ def loadSchema():
 
     This function:
     - Reads the schema SQL file from the 'sql' directory.
-    - Connects to the SQLite database using the file name specified in the .env file.
-    - Executes the schema SQL script to create the necessary tables and structure in the database.
+    - Connects to the SQLite database using the file name specified in the .env file, and to every other shard in DB_SHARDS.
+    - Executes the schema SQL script to create the necessary tables and structure in each database.
     
     Raises:
     -------
@@ -27,20 +27,24 @@ def loadSchema():
     # Read the schema.sql file
     schema_str = open(schema_file_path).read()
     
-    try:
-        # Connect to SQLite DB
-        DB_FILE_NAME = os.getenv("DB_FILE_NAME")
-    
-        sqliteConnection = sqlite3.connect(DB_FILE_NAME, check_same_thread=False)
-    
-        # Execute the schema and load it in
-        sqliteConnection.cursor().executescript(schema_str)
-        sqliteConnection.commit()
-    except sqlite3.Error as error:
-        print('Error occurred - ', error)
-    finally:
-        if sqliteConnection:
-            sqliteConnection.close()
+    # The primary database, then the other shards listed in DB_SHARDS, each gets the whole schema
+    DB_FILE_NAME = os.getenv("DB_FILE_NAME")
+    shards = [path.strip() for path in os.getenv("DB_SHARDS", "").split(",") if path.strip()]
+
+    for database in [DB_FILE_NAME] + [path for path in shards if path != DB_FILE_NAME]:
+        sqliteConnection = None
+        try:
+            # Connect to SQLite DB
+            sqliteConnection = sqlite3.connect(database, check_same_thread=False)
+
+            # Execute the schema and load it in
+            sqliteConnection.cursor().executescript(schema_str)
+            sqliteConnection.commit()
+        except sqlite3.Error as error:
+            print('Error occurred - ', error)
+        finally:
+            if sqliteConnection:
+                sqliteConnection.close()
     
     print('Schema loaded')
 
@@ -0,0 +1,156 @@
+import importlib.util
+import os
+import re
+from dotenv import load_dotenv
+import sqlite3
+
+# We need this requirement to be able to read the SQLite DB file name from our .env file
+load_dotenv()
+
+__location__ = os.path.realpath(
+    os.path.join(os.getcwd(), os.path.dirname(__file__)))
+
+MIGRATIONS_DIR = os.path.join(__location__, 'sql', 'migrations')
+
+# Migration files are named <version>_<description>.sql, e.g. 0001_add_indexes.sql. Migrations that SQL alone
+# can't express (e.g. one statement per archive table) are <version>_<description>.py files defining upgrade(connection)
+MIGRATION_FILE_PATTERN = re.compile(r'^(\d+)_.+\.(sql|py)$')
+
+def getMigrations(migrations_dir=MIGRATIONS_DIR):
+    """
+    Lists the migration files in the migrations directory, ordered by version.
+
+    Parameters:
+    ----------
+    migrations_dir : str, optional
+        The directory holding the migration files.
+
+    Returns:
+    -------
+    list
+        A list of (version, file path) tuples.
+    """
+    migrations = []
+    for file_name in os.listdir(migrations_dir):
+        match = MIGRATION_FILE_PATTERN.match(file_name)
+        if match:
+            migrations.append((int(match.group(1)), os.path.join(migrations_dir, file_name)))
+    return sorted(migrations)
+
+def latestVersion(migrations_dir=MIGRATIONS_DIR):
+    """
+    Gets the version the database will be at once every migration is applied.
+
+    Returns:
+    -------
+    int
+        The highest migration version, or 0 if there are no migrations.
+    """
+    migrations = getMigrations(migrations_dir)
+    return migrations[-1][0] if migrations else 0
+
+def runMigrations(connection, migrations_dir=MIGRATIONS_DIR):
+    """
+    Applies every migration newer than the database's schema version.
+
+    The schema version is kept in `PRAGMA user_version`. Each migration runs in its own
+    transaction together with the version bump, so a failing migration leaves the
+    database at the previous version without dropping or losing any data.
+
+    Parameters:
+    ----------
+    connection : sqlite3.Connection
+        The connection to the database to migrate.
+    migrations_dir : str, optional
+        The directory holding the migration files.
+
+    Returns:
+    -------
+    list
+        The versions that were applied.
+
+    Raises:
+    -------
+    sqlite3.Error
+        If a migration fails, after its transaction has been rolled back.
+    """
+    current_version = connection.execute("PRAGMA user_version").fetchone()[0]
+    applied = []
+
+    for version, migration_file_path in getMigrations(migrations_dir):
+        if version <= current_version:
+            continue
+
+        try:
+            if migration_file_path.endswith('.py'):
+                runPythonMigration(connection, migration_file_path, version)
+            else:
+                migration_str = open(migration_file_path).read()
+                connection.executescript(f"BEGIN;\n{migration_str}\nPRAGMA user_version = {version};\nCOMMIT;")
+        except sqlite3.Error:
+            if connection.in_transaction:
+                connection.rollback()
+            raise
+        applied.append(version)
+
+    return applied
+
+def runPythonMigration(connection, migration_file_path, version):
+    """
+    Runs the upgrade(connection) function of a Python migration file, in one transaction with the version bump.
+
+    Parameters:
+    ----------
+    connection : sqlite3.Connection
+        The connection to the database to migrate.
+    migration_file_path : str
+        The path of the migration file.
+    version : int
+        The version of the migration.
+    """
+    spec = importlib.util.spec_from_file_location(f'migration_{version}', migration_file_path)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+
+    connection.execute("BEGIN")
+    migration.upgrade(connection)
+    connection.execute(f"PRAGMA user_version = {version}")
+    connection.commit()
+
+def databaseFiles():
+    """
+    Gets the SQLite databases named in the .env file: DB_FILE_NAME, then the other shards listed in DB_SHARDS.
+
+    Returns:
+    -------
+    list
+        The paths of the database files, the primary first.
+    """
+    shards = [path.strip() for path in os.getenv("DB_SHARDS", "").split(",") if path.strip()]
+    DB_FILE_NAME = os.getenv("DB_FILE_NAME")
+    return [DB_FILE_NAME] + [path for path in shards if path != DB_FILE_NAME]
+
+def migrate():
+    """
+    Runs the pending migrations on every SQLite database named in the .env file.
+    """
+    for DB_FILE_NAME in databaseFiles():
+        sqliteConnection = None
+        try:
+            # Connect to SQLite DB
+            sqliteConnection = sqlite3.connect(DB_FILE_NAME, check_same_thread=False)
+
+            applied = runMigrations(sqliteConnection)
+            if applied:
+                print(DB_FILE_NAME, '- applied migrations', ', '.join(str(version) for version in applied))
+            else:
+                print(DB_FILE_NAME, '- database is up to date')
+        except sqlite3.Error as error:
+            print('Error occurred - ', error)
+        finally:
+            if sqliteConnection:
+                sqliteConnection.close()
+
+# Command to run this script -> python3 ./db/migrate.py
+if __name__ == "__main__":
+    migrate()
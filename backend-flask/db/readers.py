@@ -0,0 +1,370 @@
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+import weakref
+from db.db import SqliteDB, reset_after_fork
+from db.shards import shard_router
+
+# Classes of analytics queries, each routed on its own:
+# - dashboard: the user summary and heatmaps
+# - history: tracked habits, longest streaks and completion timestamps of a user
+# - stats: the per-habit counts over every user
+QUERY_CLASSES = ('dashboard', 'history', 'stats')
+
+# Where a query class reads from: the pool the writes use, read-only connections to the same database file,
+# or read-only connections to a snapshot copy of it
+READ_MODES = ('primary', 'replica', 'snapshot')
+
+def parse_read_routes(value):
+    """
+    Parses the routes of the query classes, e.g. 'replica' or 'replica,stats=snapshot': a mode alone applies
+    to every class, and class=mode pairs override it for one class. Classes not named read from the replica.
+
+    Parameters:
+    ----------
+    value : str
+        The routes, comma separated.
+
+    Returns:
+    -------
+    dict
+        The read mode of every query class.
+
+    Raises:
+    -------
+    ValueError
+        If a query class or a read mode is unknown.
+    """
+    routes = dict.fromkeys(QUERY_CLASSES, 'replica')
+    overrides = {}
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        query_class, _, mode = item.rpartition('=')
+        query_class, mode = query_class.strip(), mode.strip()
+        if mode not in READ_MODES:
+            raise ValueError(f"Unknown read mode {mode!r}, expected one of {', '.join(READ_MODES)}")
+        if not query_class:
+            routes = dict.fromkeys(QUERY_CLASSES, mode)
+        elif query_class in QUERY_CLASSES:
+            overrides[query_class] = mode
+        else:
+            raise ValueError(f"Unknown query class {query_class!r}, expected one of {', '.join(QUERY_CLASSES)}")
+    routes.update(overrides)
+    return routes
+
+def snapshot_path(database, directory=None):
+    """
+    Gets the path of the snapshot copy of a database, e.g. habits.snapshot.db for habits.db.
+
+    Parameters:
+    ----------
+    database : str
+        Path to the SQLite database file.
+    directory : str, optional
+        The directory of the copy. Defaults to the directory of the database.
+
+    Returns:
+    -------
+    str
+        The path of the copy.
+    """
+    path = pathlib.Path(database)
+    if directory:
+        path = pathlib.Path(directory) / path.name
+    return str(path.with_name(f"{path.stem}.snapshot{path.suffix or '.db'}"))
+
+# This is the Snapshot Class.
+# It keeps a copy of a database, rewritten every `interval` seconds with the SQLite online backup API.
+# The backup reads the source in one read transaction, which never blocks its writers in WAL mode,
+# and writes the copy in WAL mode too, so the readers of the copy keep reading the previous version meanwhile.
+class Snapshot:
+    """
+    A periodically refreshed copy of a SQLite database, for reads that can lag behind the writes.
+
+    Every worker process refreshes the copy from its own thread, unless another process refreshed it
+    less than half an interval ago.
+
+    Attributes:
+    ----------
+    source : str
+        Path to the database that is copied.
+    path : str
+        Path to the copy.
+    interval : float
+        Seconds between two refreshes.
+    """
+
+    def __init__(self, source, path, interval):
+        self.source = source
+        self.path = path
+        self.interval = interval
+
+        self._reset()
+        reset_after_fork(self, Snapshot._reset)
+
+    def _reset(self):
+        """
+        Sets up the snapshot without a refresh thread. A forked process starts from here.
+        """
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._stats = {'refreshes': 0, 'failed_refreshes': 0, 'refresh_time': 0.0}
+
+    def age(self):
+        """
+        Gets the seconds since the copy was last written, by any process.
+
+        Returns:
+        -------
+        float or None
+            The age of the copy, or None if there is no copy yet.
+        """
+        written = [os.path.getmtime(path) for path in (self.path, f'{self.path}-wal') if os.path.exists(path)]
+        if not written:
+            return None
+        return max(0.0, time.time() - max(written))
+
+    def refresh(self):
+        """
+        Copies the source database over the copy.
+
+        Raises:
+        -------
+        sqlite3.Error
+            If the source can't be read or the copy written.
+        """
+        start = time.perf_counter()
+        source = sqlite3.connect(f"{pathlib.Path(self.source).resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+        target = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        try:
+            target.execute("PRAGMA journal_mode = WAL")
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        self._stats['refreshes'] += 1
+        self._stats['refresh_time'] += time.perf_counter() - start
+
+    def ensure(self):
+        """
+        Makes sure the copy exists, and that its refresh thread is running.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            age = self.age()
+            if age is None or age >= self.interval:
+                self.refresh()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.__run, name='db-snapshot', daemon=True)
+            self._thread.start()
+
+    def __run(self):
+        """
+        Refreshes the copy every `interval` seconds, until stopped.
+        """
+        while not self._stop.wait(self.interval):
+            age = self.age()
+            if age is not None and age < self.interval / 2:
+                # Another worker process just refreshed it
+                continue
+            try:
+                self.refresh()
+            except sqlite3.Error:
+                self._stats['failed_refreshes'] += 1
+
+    def stop(self):
+        """
+        Stops the refresh thread. The copy is left in place.
+        """
+        self._stop.set()
+
+    def metrics(self):
+        """
+        Gets the refresh counters.
+
+        Returns:
+        -------
+        dict
+            Refreshes done by this process, failed ones, the seconds they took, and the age of the copy.
+        """
+        stats = dict(self._stats)
+        stats['age'] = self.age()
+        stats['interval'] = self.interval
+        return stats
+
+# This is the Read Routing Class.
+# Analytics queries can run long, and on the pool the writes use they hold connections check-offs wait for.
+# Each class of analytics queries is routed to the primary pool, to a pool of read-only connections
+# to the same file (fresh data, and in WAL mode readers and writers never wait on each other), or to a pool of
+# read-only connections to a snapshot copy (stale by up to the refresh interval, but it also keeps long reads
+# from holding back the checkpoints of the live database). Every shard gets its own readers.
+class ReadRouting:
+    """
+    Picks the database each class of analytics queries reads from.
+
+    Attributes:
+    ----------
+    router : ShardRouter
+        The shards the readers are opened on.
+    routes : dict
+        The read mode of every query class, see parse_read_routes.
+    snapshot_dir : str or None
+        The directory of the snapshot copies, next to each database when None.
+    snapshot_interval : float
+        Seconds between two refreshes of a snapshot copy.
+    """
+
+    def __init__(self, router, routes=None, snapshot_dir=None, snapshot_interval=None):
+        if routes is None:
+            routes = parse_read_routes(os.getenv("ANALYTICS_READS", "replica"))
+        if snapshot_dir is None:
+            snapshot_dir = os.getenv("ANALYTICS_SNAPSHOT_DIR") or None
+        if snapshot_interval is None:
+            snapshot_interval = float(os.getenv("ANALYTICS_SNAPSHOT_INTERVAL", 60))
+        self.router = router
+        self.routes = routes
+        self.snapshot_dir = snapshot_dir
+        self.snapshot_interval = snapshot_interval
+
+        self._lock = threading.Lock()
+        # (id of the shard, read mode) -> (database file of the shard, reader SqliteDB, Snapshot or None)
+        self._readers = {}
+        self._apps = weakref.WeakSet()
+
+    def configure(self, routes):
+        """
+        Changes the routes of the query classes, e.g. 'replica,stats=snapshot'. See parse_read_routes.
+        """
+        self.routes = parse_read_routes(routes) if isinstance(routes, str) else dict(routes)
+
+    def reader(self, db, query_class):
+        """
+        Gets the database a class of queries reads from on a shard, opened on first use.
+
+        Parameters:
+        ----------
+        db : SqliteDB
+            The shard.
+        query_class : str
+            One of QUERY_CLASSES.
+
+        Returns:
+        -------
+        SqliteDB
+            The shard itself, or a read-only database over it or over its snapshot copy.
+        """
+        mode = self.routes[query_class]
+        if mode == 'primary':
+            return db
+        database = db.pool.database
+        key = (id(db), mode)
+        with self._lock:
+            entry = self._readers.get(key)
+            if entry is None or entry[0] != database:
+                if entry is not None:
+                    self.__close(entry)
+                snapshot = None
+                if mode == 'snapshot':
+                    snapshot = Snapshot(database, snapshot_path(database, self.snapshot_dir), self.snapshot_interval)
+                reader = SqliteDB(snapshot.path if snapshot else database, read_only=True)
+                for app in self._apps:
+                    app.extensions['sqlite_db'].append(reader)
+                entry = self._readers[key] = (database, reader, snapshot)
+        if entry[2] is not None:
+            entry[2].ensure()
+        return entry[1]
+
+    def db_for(self, user_name, query_class):
+        """
+        Gets the database a class of queries about a user reads from: a reader of the user's shard.
+        """
+        return self.reader(self.router.db_for(user_name), query_class)
+
+    def __readers(self):
+        with self._lock:
+            return [reader for _, reader, _ in self._readers.values()]
+
+    def __close(self, entry):
+        _, reader, snapshot = entry
+        if snapshot is not None:
+            snapshot.stop()
+        reader.release_thread_connection()
+        reader.pool.close()
+
+    def init_app(self, app):
+        """
+        Wires the readers into a Flask application, so each request returns the reader connections it used
+        when it ends, including those of readers opened after this call.
+        """
+        apps = app.extensions.setdefault('sqlite_db', [])
+        if app in self._apps:
+            return
+        self._apps.add(app)
+        apps.extend(self.__readers())
+        app.teardown_appcontext(self.teardown)
+
+    def teardown(self, exception=None):
+        """
+        Returns the reader connections of the ending app context to their pools.
+        """
+        for reader in self.__readers():
+            reader.teardown(exception)
+
+    def release_thread_connections(self):
+        """
+        Returns the current thread's reader connections to their pools.
+        """
+        for reader in self.__readers():
+            reader.release_thread_connection()
+
+    def refresh_snapshots(self):
+        """
+        Refreshes every snapshot copy now, e.g. right after a bulk import.
+
+        Returns:
+        -------
+        int
+            The number of copies refreshed.
+        """
+        with self._lock:
+            snapshots = [snapshot for _, _, snapshot in self._readers.values() if snapshot is not None]
+        for snapshot in snapshots:
+            snapshot.refresh()
+        return len(snapshots)
+
+    def close(self):
+        """
+        Closes every reader and stops the snapshot refreshes. Readers are opened again on next use.
+        """
+        with self._lock:
+            entries, self._readers = list(self._readers.values()), {}
+        for entry in entries:
+            self.__close(entry)
+
+    def metrics(self):
+        """
+        Gets the routes and the counters of every reader.
+
+        Returns:
+        -------
+        dict
+            The read mode of every query class, and the database, pool counters and snapshot counters of each reader.
+        """
+        with self._lock:
+            entries = [(mode, entry) for (_, mode), entry in self._readers.items()]
+        readers = []
+        for mode, (database, reader, snapshot) in entries:
+            readers.append({'database': database, 'mode': mode, 'path': reader.pool.database, 'pool': reader.pool.metrics(),
+                            'snapshot': snapshot.metrics() if snapshot is not None else None})
+        return {'routes': dict(self.routes), 'readers': readers}
+
+# Global instance of the ReadRouting class
+read_routing = ReadRouting(shard_router)
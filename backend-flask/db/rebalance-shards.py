@@ -0,0 +1,57 @@
+import argparse
+import os
+import sys
+import time
+from dotenv import load_dotenv
+import sqlite3
+
+# Load environment variables from a .env file
+load_dotenv()
+
+__location__ = os.path.realpath(
+    os.path.join(os.getcwd(), os.path.dirname(__file__)))
+
+# Make the app's packages importable when this script is run directly
+sys.path.insert(0, os.path.dirname(__location__))
+
+from classes.history_file import HistoryFileError
+from classes.rebalance import rebalance
+from db.shards import shard_router
+
+def rebalanceShards(dry_run=False):
+    """
+    Moves every user whose data is not on the shard DB_SHARDS now sends them to, e.g. after a shard was added
+    at the end of DB_SHARDS. Run python3 ./db/load-schema.py (or ./db/migrate.py) on the new shards first.
+
+    Parameters:
+    ----------
+    dry_run : bool, optional
+        Only print the users that would move.
+
+    Raises:
+    -------
+    sqlite3.Error
+        If an error occurs during the database connection or a move.
+    """
+    try:
+        start = time.perf_counter()
+        moves = rebalance(shard_router, dry_run)
+        elapsed = time.perf_counter() - start
+        for user_name, source, target, moved in moves:
+            if moved is None:
+                print(f'Would move {user_name} from shard {source} to shard {target}')
+            else:
+                print(f"Moved {user_name} from shard {source} to shard {target}: "
+                      f"{moved['user_habits']} tracked habits, {moved['completions']} completions")
+        print(f"{'Found' if dry_run else 'Moved'} {len(moves)} users over {len(shard_router.shards)} shards in {elapsed:.2f}s")
+    except (sqlite3.Error, HistoryFileError) as error:
+        print('Error occurred - ', error)
+    finally:
+        shard_router.release_thread_connections()
+
+parser = argparse.ArgumentParser(description='Move users to the shard DB_SHARDS assigns them to.')
+parser.add_argument('--dry-run', action='store_true', help='only print the users that would move')
+args = parser.parse_args()
+
+# Command to run this script -> python3 ./db/rebalance-shards.py [--dry-run]
+rebalanceShards(args.dry_run)
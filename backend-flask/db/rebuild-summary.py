@@ -0,0 +1,46 @@
+import os
+import sys
+from dotenv import load_dotenv
+import sqlite3
+
+# Load environment variables from a .env file
+load_dotenv()
+
+__location__ = os.path.realpath(
+    os.path.join(os.getcwd(), os.path.dirname(__file__)))
+
+# Make the app's packages importable when this script is run directly
+sys.path.insert(0, os.path.dirname(__location__))
+
+from classes.summary import rebuild_user_habit_stats, rebuild_user_habit_daily
+from db.migrate import databaseFiles
+
+def rebuildSummary():
+    """
+    Rebuilds the per tracked habit analytics summary (user_habit_stats) and the daily rollup
+    of the heatmaps (user_habit_daily) from the habit_tracker history.
+
+    Raises:
+    -------
+    sqlite3.Error
+        If an error occurs during the database connection or the rebuild.
+    """
+    # Each shard summarizes the completions of its own users
+    for DB_FILE_NAME in databaseFiles():
+        sqliteConnection = None
+        try:
+            # Connect to SQLite DB
+            sqliteConnection = sqlite3.connect(DB_FILE_NAME, check_same_thread=False)
+
+            summarized = rebuild_user_habit_stats(sqliteConnection)
+            print(f'Summarized {summarized} tracked habits')
+            rolled_up = rebuild_user_habit_daily(sqliteConnection)
+            print(f'Rolled up {rolled_up} days of completions')
+        except sqlite3.Error as error:
+            print('Error occurred - ', error)
+        finally:
+            if sqliteConnection:
+                sqliteConnection.close()
+
+# Command to run this script -> python3 ./db/rebuild-summary.py
+rebuildSummary()
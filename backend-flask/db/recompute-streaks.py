@@ -0,0 +1,52 @@
+import os
+import sys
+import time
+from dotenv import load_dotenv
+import sqlite3
+
+# Load environment variables from a .env file
+load_dotenv()
+
+__location__ = os.path.realpath(
+    os.path.join(os.getcwd(), os.path.dirname(__file__)))
+
+# Make the app's packages importable when this script is run directly
+sys.path.insert(0, os.path.dirname(__location__))
+
+from classes.streak_engine import recompute_streaks
+from db.migrate import databaseFiles
+
+def recomputeStreaks():
+    """
+    Rebuilds the current and longest streak of every tracked habit from the habit_tracker history.
+
+    This function:
+    - Connects to the SQLite database named in the .env file, and to every other shard in DB_SHARDS.
+    - Reads every completion in one pass and computes the streaks with the streak engine.
+    - Writes back the streaks that drifted from the history.
+
+    Raises:
+    -------
+    sqlite3.Error
+        If an error occurs during the database connection or the recompute.
+    """
+    # Each shard holds the streaks of its own users
+    for DB_FILE_NAME in databaseFiles():
+        sqliteConnection = None
+        try:
+            # Connect to SQLite DB
+            sqliteConnection = sqlite3.connect(DB_FILE_NAME, check_same_thread=False)
+
+            start = time.perf_counter()
+            result = recompute_streaks(sqliteConnection)
+            elapsed = time.perf_counter() - start
+            print(f"Recomputed {result['user_habits']} tracked habits from {result['tracker_rows']} completions "
+                  f"in {elapsed:.2f}s, {result['updated']} updated")
+        except sqlite3.Error as error:
+            print('Error occurred - ', error)
+        finally:
+            if sqliteConnection:
+                sqliteConnection.close()
+
+# Command to run this script -> python3 ./db/recompute-streaks.py
+recomputeStreaks()
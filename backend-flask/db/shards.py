@@ -0,0 +1,210 @@
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from db.db import SqliteDB, reset_after_fork, squlite_db
+from db.writer import WriteCoordinator, write_coordinator
+
+def shard_weight(shard, user_name):
+    """
+    Gets the rendezvous hashing weight of a user on a shard: the user lives on the shard with the highest weight.
+
+    Parameters:
+    ----------
+    shard : int
+        The position of the shard in the shard list.
+    user_name : str
+        The name of the user.
+
+    Returns:
+    -------
+    int
+        A 64-bit weight, the same in every process.
+    """
+    digest = hashlib.blake2b(f'{shard}:{user_name}'.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+# This is the Shard Router Class.
+# Every user's data (user_habits, habit_tracker and the tables derived from them) lives in one SQLite file,
+# picked by hashing the user name, so users on different shards never share a write lock.
+# The habits catalog is written to the first shard (DB_FILE_NAME) and replicated to the others,
+# so every shard can join its tracked habits with it. With a single shard the router is a no-op.
+class ShardRouter:
+    """
+    Routes each user to the SQLite database holding their data, and runs queries on every shard in parallel.
+
+    Users are placed with rendezvous (highest random weight) hashing over the shard positions, so adding
+    a shard at the end of the list only moves the users who now weigh most on it (see classes/rebalance.py).
+
+    Attributes:
+    ----------
+    primary : SqliteDB
+        The first shard, which also holds the authoritative habits catalog.
+    shards : list
+        Every shard, the primary first.
+    """
+
+    def __init__(self, primary, databases=None):
+        if databases is None:
+            databases = [path.strip() for path in os.getenv("DB_SHARDS", "").split(",") if path.strip()]
+        self.primary = primary
+        self._coordinators = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self.use_shards(databases)
+        reset_after_fork(self, ShardRouter._after_fork)
+
+    def _after_fork(self):
+        """
+        Forgets the fan-out threads, which don't exist in a forked process.
+        """
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def use_shards(self, databases):
+        """
+        Sets the shards after the primary. The pools of the previous shards are closed.
+
+        Parameters:
+        ----------
+        databases : list
+            Paths to the SQLite database files of the other shards, in shard order.
+        """
+        for db in getattr(self, 'shards', [])[1:]:
+            db.release_thread_connection()
+            db.pool.close()
+        with self._lock:
+            for coordinator in self._coordinators.values():
+                coordinator.stop()
+            self._coordinators = {}
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+        self.shards = [self.primary] + [SqliteDB(database) for database in databases if database != self.primary.pool.database]
+
+    @property
+    def sharded(self):
+        """
+        Whether there is more than one shard.
+        """
+        return len(self.shards) > 1
+
+    def shard_index(self, user_name):
+        """
+        Gets the position of the shard a user lives on.
+
+        Parameters:
+        ----------
+        user_name : str
+            The name of the user.
+
+        Returns:
+        -------
+        int
+            The position of the shard in `shards`.
+        """
+        if len(self.shards) == 1:
+            return 0
+        return max(range(len(self.shards)), key=lambda shard: shard_weight(shard, user_name))
+
+    def db_for(self, user_name):
+        """
+        Gets the database a user lives on.
+
+        Returns:
+        -------
+        SqliteDB
+            The shard of the user, the primary if no user is given.
+        """
+        if user_name is None:
+            return self.primary
+        return self.shards[self.shard_index(user_name)]
+
+    def index_of(self, db):
+        """
+        Gets the position of a shard, 0 for databases that are not a shard.
+        """
+        for index, shard in enumerate(self.shards):
+            if shard is db:
+                return index
+        return 0
+
+    def coordinator_for(self, db):
+        """
+        Gets the write coordinator of a shard. Each shard has its own writer thread, as each has its own write lock.
+
+        Returns:
+        -------
+        WriteCoordinator
+            The global write coordinator for the primary, one created on first use for the other shards.
+        """
+        if db is self.primary:
+            return write_coordinator
+        with self._lock:
+            coordinator = self._coordinators.get(id(db))
+            if coordinator is None:
+                coordinator = self._coordinators[id(db)] = WriteCoordinator(db)
+            return coordinator
+
+    def init_app(self, app):
+        """
+        Wires every shard's pool into a Flask application, so each request checks out its connections
+        to the shards it uses and returns them when it ends.
+        """
+        for db in self.shards:
+            db.init_app(app)
+
+    def release_thread_connections(self):
+        """
+        Returns the current thread's connection of every shard to its pool.
+        """
+        for db in self.shards:
+            db.release_thread_connection()
+
+    def fan_out(self, query, via=None):
+        """
+        Runs a query on every shard, in parallel threads when there is more than one shard.
+
+        Each call gets a connection checked out from its shard's pool for the duration of the call.
+
+        Parameters:
+        ----------
+        query : callable
+            Called as query(shard index, db, connection), e.g. to aggregate per shard.
+        via : callable, optional
+            Maps each shard to the database the query runs on instead, e.g. a read-only reader of it (see db/readers.py).
+
+        Returns:
+        -------
+        list
+            What each call returned, in shard order.
+        """
+        def run(index):
+            db = self.shards[index] if via is None else via(self.shards[index])
+            connection = db.pool.acquire()
+            try:
+                return query(index, db, connection)
+            finally:
+                db.pool.release(connection)
+
+        if len(self.shards) == 1:
+            return [run(0)]
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(len(self.shards), thread_name_prefix='db-shard')
+            executor = self._executor
+        return list(executor.map(run, range(len(self.shards))))
+
+    def metrics(self):
+        """
+        Gets the shards and the pool counters of each.
+
+        Returns:
+        -------
+        list
+            The database file and pool counters of every shard, in shard order.
+        """
+        return [{'database': db.pool.database, 'pool': db.pool.metrics()} for db in self.shards]
+
+# Global instance of the ShardRouter class
+shard_router = ShardRouter(squlite_db)
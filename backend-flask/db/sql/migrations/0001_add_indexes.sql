@@ -0,0 +1,5 @@
+-- Indexes for the lookups done on every request
+CREATE UNIQUE INDEX IF NOT EXISTS idx_habits_name ON habits (name);
+CREATE INDEX IF NOT EXISTS idx_habits_periodicity ON habits (periodicity);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_user_habits_user_name_habit_id ON user_habits (user_name, habit_id);
+CREATE INDEX IF NOT EXISTS idx_habit_tracker_user_habit_id_completed_at ON habit_tracker (user_habit_id, completed_at);
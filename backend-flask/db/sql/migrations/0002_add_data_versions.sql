@@ -0,0 +1,22 @@
+-- Version counters, bumped on every write to the data they cover
+CREATE TABLE IF NOT EXISTS data_versions (
+    scope VARCHAR(255) PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+INSERT OR IGNORE INTO data_versions (scope, version) VALUES ('catalog', 0);
+
+CREATE TRIGGER IF NOT EXISTS trg_habits_insert_catalog_version AFTER INSERT ON habits
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE scope = 'catalog';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_habits_update_catalog_version AFTER UPDATE ON habits
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE scope = 'catalog';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_habits_delete_catalog_version AFTER DELETE ON habits
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE scope = 'catalog';
+END;
@@ -0,0 +1,30 @@
+-- Per tracked habit summary, kept up to date by triggers in the same transaction as each check-off
+CREATE TABLE IF NOT EXISTS user_habit_stats (
+    user_habit_id INTEGER PRIMARY KEY,
+    completion_count INTEGER NOT NULL DEFAULT 0,
+    first_completed_at TIMESTAMP,
+    last_completed_at TIMESTAMP,
+    FOREIGN KEY (user_habit_id) REFERENCES user_habits(id)
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_habit_tracker_insert_stats AFTER INSERT ON habit_tracker
+BEGIN
+    INSERT INTO user_habit_stats (user_habit_id, completion_count, first_completed_at, last_completed_at)
+    VALUES (NEW.user_habit_id, 1, NEW.completed_at, NEW.completed_at)
+    ON CONFLICT (user_habit_id) DO UPDATE SET
+        completion_count = completion_count + 1,
+        first_completed_at = MIN(first_completed_at, excluded.first_completed_at),
+        last_completed_at = MAX(last_completed_at, excluded.last_completed_at);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_user_habits_delete_stats AFTER DELETE ON user_habits
+BEGIN
+    DELETE FROM user_habit_stats WHERE user_habit_id = OLD.id;
+END;
+
+-- Summarize the existing history
+INSERT OR REPLACE INTO user_habit_stats (user_habit_id, completion_count, first_completed_at, last_completed_at)
+SELECT habit_tracker.user_habit_id, COUNT(*), MIN(habit_tracker.completed_at), MAX(habit_tracker.completed_at)
+FROM habit_tracker
+JOIN user_habits ON user_habits.id = habit_tracker.user_habit_id
+GROUP BY habit_tracker.user_habit_id;
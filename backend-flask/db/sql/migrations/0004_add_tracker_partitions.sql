@@ -0,0 +1,30 @@
+-- Registry of the archive partitions of habit_tracker: cold completions are moved out of the hot
+-- habit_tracker table into one archive table per year, which covers completions in [starts_at, ends_at)
+CREATE TABLE IF NOT EXISTS habit_tracker_partitions (
+    name VARCHAR(255) PRIMARY KEY,
+    starts_at TIMESTAMP NOT NULL,
+    ends_at TIMESTAMP NOT NULL,
+    row_count INTEGER NOT NULL DEFAULT 0,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+) WITHOUT ROWID;
+
+INSERT OR IGNORE INTO data_versions (scope, version) VALUES ('partitions', 0);
+
+CREATE TRIGGER IF NOT EXISTS trg_habit_tracker_partitions_insert_version AFTER INSERT ON habit_tracker_partitions
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE scope = 'partitions';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_habit_tracker_partitions_update_version AFTER UPDATE ON habit_tracker_partitions
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE scope = 'partitions';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_habit_tracker_partitions_delete_version AFTER DELETE ON habit_tracker_partitions
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE scope = 'partitions';
+END;
+
+-- Full history of every partition, recreated by the archival whenever a partition is added
+CREATE VIEW IF NOT EXISTS habit_tracker_history AS
+SELECT user_habit_id, completed_at FROM habit_tracker;
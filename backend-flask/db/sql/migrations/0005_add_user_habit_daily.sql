@@ -0,0 +1,27 @@
+-- Completions per tracked habit and day, kept up to date by triggers in the same transaction as each check-off
+CREATE TABLE IF NOT EXISTS user_habit_daily (
+    user_habit_id INTEGER NOT NULL,
+    day DATE NOT NULL,
+    completions INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_habit_id, day),
+    FOREIGN KEY (user_habit_id) REFERENCES user_habits(id)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_habit_tracker_insert_daily AFTER INSERT ON habit_tracker
+BEGIN
+    INSERT INTO user_habit_daily (user_habit_id, day, completions)
+    VALUES (NEW.user_habit_id, date(NEW.completed_at), 1)
+    ON CONFLICT (user_habit_id, day) DO UPDATE SET completions = completions + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_user_habits_delete_daily AFTER DELETE ON user_habits
+BEGIN
+    DELETE FROM user_habit_daily WHERE user_habit_id = OLD.id;
+END;
+
+-- Roll up the existing history, archived partitions included
+INSERT OR REPLACE INTO user_habit_daily (user_habit_id, day, completions)
+SELECT habit_tracker_history.user_habit_id, date(habit_tracker_history.completed_at), COUNT(*)
+FROM habit_tracker_history
+JOIN user_habits ON user_habits.id = habit_tracker_history.user_habit_id
+GROUP BY habit_tracker_history.user_habit_id, date(habit_tracker_history.completed_at);
@@ -0,0 +1,18 @@
+-- Version of the tracked habits' streaks, bumped once per inserted, deleted or streak-updated user_habits row,
+-- so the in-process leaderboards can tell whether they applied every streak change
+INSERT OR IGNORE INTO data_versions (scope, version) VALUES ('streaks', 0);
+
+CREATE TRIGGER IF NOT EXISTS trg_user_habits_insert_streaks_version AFTER INSERT ON user_habits
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE scope = 'streaks';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_user_habits_update_streaks_version AFTER UPDATE OF current_streak, longest_streak ON user_habits
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE scope = 'streaks';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_user_habits_delete_streaks_version AFTER DELETE ON user_habits
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE scope = 'streaks';
+END;
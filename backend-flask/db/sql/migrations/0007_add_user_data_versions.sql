@@ -0,0 +1,37 @@
+-- Version of each user's data, for the ETags of the per-user read routes. Every write to a user's habits or
+-- completions also inserts, updates or deletes one of their user_habits rows, so triggers on user_habits
+-- cover them all. A user's version is the value the 'users' counter had after their last change, so the
+-- users changed since a known 'users' version are found with the index on version.
+CREATE TABLE IF NOT EXISTS user_data_versions (
+    user_name VARCHAR(255) PRIMARY KEY,
+    version INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_user_data_versions_version ON user_data_versions (version);
+
+INSERT OR IGNORE INTO data_versions (scope, version) VALUES ('users', 0);
+
+CREATE TRIGGER IF NOT EXISTS trg_user_habits_insert_user_version AFTER INSERT ON user_habits
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE scope = 'users';
+    INSERT INTO user_data_versions (user_name, version) VALUES (NEW.user_name, (SELECT version FROM data_versions WHERE scope = 'users'))
+    ON CONFLICT (user_name) DO UPDATE SET version = excluded.version;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_user_habits_update_user_version AFTER UPDATE ON user_habits
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE scope = 'users';
+    INSERT INTO user_data_versions (user_name, version) VALUES (NEW.user_name, (SELECT version FROM data_versions WHERE scope = 'users'))
+    ON CONFLICT (user_name) DO UPDATE SET version = excluded.version;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_user_habits_delete_user_version AFTER DELETE ON user_habits
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE scope = 'users';
+    INSERT INTO user_data_versions (user_name, version) VALUES (OLD.user_name, (SELECT version FROM data_versions WHERE scope = 'users'))
+    ON CONFLICT (user_name) DO UPDATE SET version = excluded.version;
+END;
+
+-- Every existing user starts at the current version
+INSERT OR IGNORE INTO user_data_versions (user_name, version)
+SELECT DISTINCT user_name, (SELECT version FROM data_versions WHERE scope = 'users') FROM user_habits;
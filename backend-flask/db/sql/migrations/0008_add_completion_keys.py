@@ -0,0 +1,77 @@
+# Integer completion keys: completed_epoch (seconds since 1970-01-01), day_key (days since 1970-01-01) and
+# iso_week_key (Monday-start weeks since the week of 1970-01-01), precomputed from completed_at in habit_tracker
+# and every archive table, so range scans, grouping and streaks compare integers instead of parsing timestamps.
+# A Python migration, as the archive tables are only known from the habit_tracker_partitions registry.
+# Every step can be repeated, so it also applies to tables that already have the columns.
+
+COMPLETION_KEY_COLUMNS = ('completed_epoch', 'day_key', 'iso_week_key')
+
+EPOCH = "CAST(strftime('%s', completed_at) AS INTEGER)"
+
+def addCompletionKeys(connection, table):
+    """
+    Adds the completion key columns to a habit_tracker partition, fills them from completed_at and
+    replaces its (user_habit_id, completed_at) index with a (user_habit_id, completed_epoch) one.
+    """
+    columns = {row[1] for row in connection.execute(f"PRAGMA table_info({table})")}
+    for column in COMPLETION_KEY_COLUMNS:
+        if column not in columns:
+            connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} INTEGER")
+    connection.execute(
+        f"""UPDATE {table} SET
+               completed_epoch = {EPOCH},
+               day_key = {EPOCH} / 86400,
+               iso_week_key = ({EPOCH} / 86400 + 3) / 7
+            WHERE completed_epoch IS NULL"""
+    )
+    connection.execute(f"DROP INDEX IF EXISTS idx_{table}_user_habit_id_completed_at")
+    connection.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_user_habit_id_completed_epoch ON {table} (user_habit_id, completed_epoch)")
+
+def upgrade(connection):
+    """
+    Adds the completion keys to every partition, the last day key to user_habit_stats, and recreates
+    the triggers and the habit_tracker_history view that read them.
+    """
+    archives = [row[0] for row in connection.execute("SELECT name FROM habit_tracker_partitions ORDER BY starts_at DESC")]
+    tables = ['habit_tracker'] + archives
+    for table in tables:
+        addCompletionKeys(connection, table)
+
+    # The app fills the integer columns on insert, rows inserted with only completed_at get them here
+    connection.execute("DROP TRIGGER IF EXISTS trg_habit_tracker_insert_keys")
+    connection.execute(
+        """CREATE TRIGGER trg_habit_tracker_insert_keys AFTER INSERT ON habit_tracker WHEN NEW.completed_epoch IS NULL
+           BEGIN
+               UPDATE habit_tracker SET
+                   completed_epoch = CAST(strftime('%s', NEW.completed_at) AS INTEGER),
+                   day_key = CAST(strftime('%s', NEW.completed_at) AS INTEGER) / 86400,
+                   iso_week_key = (CAST(strftime('%s', NEW.completed_at) AS INTEGER) / 86400 + 3) / 7
+               WHERE id = NEW.id;
+           END"""
+    )
+
+    # The day of each tracked habit's last completion, so check-offs compare period keys without parsing last_completed_at
+    columns = {row[1] for row in connection.execute("PRAGMA table_info(user_habit_stats)")}
+    if 'last_day_key' not in columns:
+        connection.execute("ALTER TABLE user_habit_stats ADD COLUMN last_day_key INTEGER")
+    connection.execute("UPDATE user_habit_stats SET last_day_key = CAST(strftime('%s', last_completed_at) AS INTEGER) / 86400")
+    connection.execute("DROP TRIGGER IF EXISTS trg_habit_tracker_insert_stats")
+    connection.execute(
+        """CREATE TRIGGER trg_habit_tracker_insert_stats AFTER INSERT ON habit_tracker
+           BEGIN
+               INSERT INTO user_habit_stats (user_habit_id, completion_count, first_completed_at, last_completed_at, last_day_key)
+               VALUES (NEW.user_habit_id, 1, NEW.completed_at, NEW.completed_at,
+                       COALESCE(NEW.day_key, CAST(strftime('%s', NEW.completed_at) AS INTEGER) / 86400))
+               ON CONFLICT (user_habit_id) DO UPDATE SET
+                   completion_count = completion_count + 1,
+                   first_completed_at = MIN(first_completed_at, excluded.first_completed_at),
+                   last_completed_at = MAX(last_completed_at, excluded.last_completed_at),
+                   last_day_key = MAX(last_day_key, excluded.last_day_key);
+           END"""
+    )
+
+    connection.execute("DROP VIEW IF EXISTS habit_tracker_history")
+    connection.execute(
+        "CREATE VIEW habit_tracker_history AS "
+        + " UNION ALL ".join(f"SELECT user_habit_id, completed_at, completed_epoch, day_key, iso_week_key FROM {table}" for table in tables)
+    )
@@ -0,0 +1,31 @@
+-- Timezone of each user, so days and weeks of their streaks start at their local midnight.
+-- Users without a row are in UTC.
+CREATE TABLE IF NOT EXISTS user_timezones (
+    user_name VARCHAR(255) PRIMARY KEY,
+    timezone VARCHAR(64) NOT NULL
+) WITHOUT ROWID;
+
+-- A new timezone changes the user's streaks and day keys, so it is a change of their data
+CREATE TRIGGER IF NOT EXISTS trg_user_timezones_insert_user_version AFTER INSERT ON user_timezones
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE scope = 'users';
+    INSERT INTO user_data_versions (user_name, version) VALUES (NEW.user_name, (SELECT version FROM data_versions WHERE scope = 'users'))
+    ON CONFLICT (user_name) DO UPDATE SET version = excluded.version;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_user_timezones_update_user_version AFTER UPDATE ON user_timezones
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE scope = 'users';
+    INSERT INTO user_data_versions (user_name, version) VALUES (NEW.user_name, (SELECT version FROM data_versions WHERE scope = 'users'))
+    ON CONFLICT (user_name) DO UPDATE SET version = excluded.version;
+END;
+
+-- The daily rollup counts completions on the user's local day, i.e. their day_key
+DROP TRIGGER IF EXISTS trg_habit_tracker_insert_daily;
+
+CREATE TRIGGER trg_habit_tracker_insert_daily AFTER INSERT ON habit_tracker
+BEGIN
+    INSERT INTO user_habit_daily (user_habit_id, day, completions)
+    VALUES (NEW.user_habit_id, date(COALESCE(NEW.day_key, CAST(strftime('%s', NEW.completed_at) AS INTEGER) / 86400) * 86400, 'unixepoch'), 1)
+    ON CONFLICT (user_habit_id, day) DO UPDATE SET completions = completions + 1;
+END;
@@ -0,0 +1,37 @@
+# Client event IDs of check-offs: optional event_id, event_current_streak and event_longest_streak columns in
+# habit_tracker and in every archive table, each with a unique partial index on (user_habit_id, event_id), so a
+# check-off retried with the same ID is recognized by one index probe, and gets the streaks the first one returned.
+# Archival keeps the columns, and the habit_tracker_history view is recreated with them.
+# A Python migration, as the archive tables are only known from the habit_tracker_partitions registry.
+# Every step can be repeated, so it also applies to tables that already have the columns.
+
+EVENT_COLUMNS = (('event_id', 'VARCHAR(64)'), ('event_current_streak', 'INTEGER'), ('event_longest_streak', 'INTEGER'))
+
+def addEventColumns(connection, table):
+    """
+    Adds the event columns and the unique event index to a habit_tracker partition.
+    """
+    columns = {row[1] for row in connection.execute(f"PRAGMA table_info({table})")}
+    for column, column_type in EVENT_COLUMNS:
+        if column not in columns:
+            connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+    connection.execute(
+        f"""CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_user_habit_id_event_id
+            ON {table} (user_habit_id, event_id) WHERE event_id IS NOT NULL"""
+    )
+
+def upgrade(connection):
+    """
+    Adds the event columns to every partition and recreates the habit_tracker_history view with them.
+    """
+    archives = [row[0] for row in connection.execute("SELECT name FROM habit_tracker_partitions ORDER BY starts_at DESC")]
+    tables = ['habit_tracker'] + archives
+    for table in tables:
+        addEventColumns(connection, table)
+
+    columns = 'user_habit_id, completed_at, completed_epoch, day_key, iso_week_key, event_id, event_current_streak, event_longest_streak'
+    connection.execute("DROP VIEW IF EXISTS habit_tracker_history")
+    connection.execute(
+        "CREATE VIEW habit_tracker_history AS "
+        + " UNION ALL ".join(f"SELECT {columns} FROM {table}" for table in tables)
+    )
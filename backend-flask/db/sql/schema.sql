@@ -1,6 +1,13 @@
+DROP VIEW IF EXISTS habit_tracker_history;
 DROP TABLE IF EXISTS habits;
 DROP TABLE IF EXISTS user_habits;
 DROP TABLE IF EXISTS habit_tracker;
+DROP TABLE IF EXISTS data_versions;
+DROP TABLE IF EXISTS user_habit_stats;
+DROP TABLE IF EXISTS habit_tracker_partitions;
+DROP TABLE IF EXISTS user_habit_daily;
+DROP TABLE IF EXISTS user_data_versions;
+DROP TABLE IF EXISTS user_timezones;
 
 CREATE TABLE habits (
     id INTEGER UNIQUE PRIMARY KEY,
@@ -20,9 +27,217 @@ CREATE TABLE user_habits (
     FOREIGN KEY (habit_id) REFERENCES habits(id)
 );
 
+-- completed_epoch (seconds since 1970-01-01), day_key (days since 1970-01-01) and iso_week_key (Monday-start weeks
+-- since the week of 1970-01-01) are precomputed from completed_at, so ranges, grouping and streaks compare integers
 CREATE TABLE habit_tracker (
     id INTEGER UNIQUE PRIMARY KEY,
     user_habit_id INTEGER NOT NULL,
     completed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    completed_epoch INTEGER,
+    day_key INTEGER,
+    iso_week_key INTEGER,
+    event_id VARCHAR(64),
+    -- Streaks returned by a check-off sent with an event_id, so its retries get the same response
+    event_current_streak INTEGER,
+    event_longest_streak INTEGER,
     FOREIGN KEY (user_habit_id) REFERENCES user_habits(id)
-);
\ No newline at end of file
+);
+
+-- Indexes for the lookups done on every request
+CREATE UNIQUE INDEX idx_habits_name ON habits (name);
+CREATE INDEX idx_habits_periodicity ON habits (periodicity);
+CREATE UNIQUE INDEX idx_user_habits_user_name_habit_id ON user_habits (user_name, habit_id);
+CREATE INDEX idx_habit_tracker_user_habit_id_completed_epoch ON habit_tracker (user_habit_id, completed_epoch);
+-- Client event IDs of check-offs, so a retried check-off is found with one probe and not inserted twice
+CREATE UNIQUE INDEX idx_habit_tracker_user_habit_id_event_id ON habit_tracker (user_habit_id, event_id) WHERE event_id IS NOT NULL;
+
+-- The app fills the integer columns on insert, rows inserted with only completed_at get them here
+CREATE TRIGGER trg_habit_tracker_insert_keys AFTER INSERT ON habit_tracker WHEN NEW.completed_epoch IS NULL
+BEGIN
+    UPDATE habit_tracker SET
+        completed_epoch = CAST(strftime('%s', NEW.completed_at) AS INTEGER),
+        day_key = CAST(strftime('%s', NEW.completed_at) AS INTEGER) / 86400,
+        iso_week_key = (CAST(strftime('%s', NEW.completed_at) AS INTEGER) / 86400 + 3) / 7
+    WHERE id = NEW.id;
+END;
+
+-- Version counters, bumped on every write to the data they cover
+CREATE TABLE data_versions (
+    scope VARCHAR(255) PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+INSERT INTO data_versions (scope, version) VALUES ('catalog', 0);
+
+CREATE TRIGGER trg_habits_insert_catalog_version AFTER INSERT ON habits
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE scope = 'catalog';
+END;
+
+CREATE TRIGGER trg_habits_update_catalog_version AFTER UPDATE ON habits
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE scope = 'catalog';
+END;
+
+CREATE TRIGGER trg_habits_delete_catalog_version AFTER DELETE ON habits
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE scope = 'catalog';
+END;
+
+-- Per tracked habit summary, kept up to date by triggers in the same transaction as each check-off
+CREATE TABLE user_habit_stats (
+    user_habit_id INTEGER PRIMARY KEY,
+    completion_count INTEGER NOT NULL DEFAULT 0,
+    first_completed_at TIMESTAMP,
+    last_completed_at TIMESTAMP,
+    last_day_key INTEGER,
+    FOREIGN KEY (user_habit_id) REFERENCES user_habits(id)
+);
+
+CREATE TRIGGER trg_habit_tracker_insert_stats AFTER INSERT ON habit_tracker
+BEGIN
+    INSERT INTO user_habit_stats (user_habit_id, completion_count, first_completed_at, last_completed_at, last_day_key)
+    VALUES (NEW.user_habit_id, 1, NEW.completed_at, NEW.completed_at,
+            COALESCE(NEW.day_key, CAST(strftime('%s', NEW.completed_at) AS INTEGER) / 86400))
+    ON CONFLICT (user_habit_id) DO UPDATE SET
+        completion_count = completion_count + 1,
+        first_completed_at = MIN(first_completed_at, excluded.first_completed_at),
+        last_completed_at = MAX(last_completed_at, excluded.last_completed_at),
+        last_day_key = MAX(last_day_key, excluded.last_day_key);
+END;
+
+CREATE TRIGGER trg_user_habits_delete_stats AFTER DELETE ON user_habits
+BEGIN
+    DELETE FROM user_habit_stats WHERE user_habit_id = OLD.id;
+END;
+
+-- Completions per tracked habit and day, kept up to date by triggers in the same transaction as each check-off
+CREATE TABLE user_habit_daily (
+    user_habit_id INTEGER NOT NULL,
+    day DATE NOT NULL,
+    completions INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_habit_id, day),
+    FOREIGN KEY (user_habit_id) REFERENCES user_habits(id)
+) WITHOUT ROWID;
+
+-- Completions count on the user's local day, i.e. their day_key
+CREATE TRIGGER trg_habit_tracker_insert_daily AFTER INSERT ON habit_tracker
+BEGIN
+    INSERT INTO user_habit_daily (user_habit_id, day, completions)
+    VALUES (NEW.user_habit_id, date(COALESCE(NEW.day_key, CAST(strftime('%s', NEW.completed_at) AS INTEGER) / 86400) * 86400, 'unixepoch'), 1)
+    ON CONFLICT (user_habit_id, day) DO UPDATE SET completions = completions + 1;
+END;
+
+CREATE TRIGGER trg_user_habits_delete_daily AFTER DELETE ON user_habits
+BEGIN
+    DELETE FROM user_habit_daily WHERE user_habit_id = OLD.id;
+END;
+
+-- Registry of the archive partitions of habit_tracker: cold completions are moved out of the hot
+-- habit_tracker table into one archive table per year, which covers completions in [starts_at, ends_at)
+CREATE TABLE habit_tracker_partitions (
+    name VARCHAR(255) PRIMARY KEY,
+    starts_at TIMESTAMP NOT NULL,
+    ends_at TIMESTAMP NOT NULL,
+    row_count INTEGER NOT NULL DEFAULT 0,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+) WITHOUT ROWID;
+
+INSERT INTO data_versions (scope, version) VALUES ('partitions', 0);
+
+CREATE TRIGGER trg_habit_tracker_partitions_insert_version AFTER INSERT ON habit_tracker_partitions
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE scope = 'partitions';
+END;
+
+CREATE TRIGGER trg_habit_tracker_partitions_update_version AFTER UPDATE ON habit_tracker_partitions
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE scope = 'partitions';
+END;
+
+CREATE TRIGGER trg_habit_tracker_partitions_delete_version AFTER DELETE ON habit_tracker_partitions
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE scope = 'partitions';
+END;
+
+-- Full history of every partition, recreated by the archival whenever a partition is added
+CREATE VIEW habit_tracker_history AS
+SELECT user_habit_id, completed_at, completed_epoch, day_key, iso_week_key, event_id, event_current_streak, event_longest_streak FROM habit_tracker;
+
+-- Version of the tracked habits' streaks, bumped once per inserted, deleted or streak-updated user_habits row,
+-- so the in-process leaderboards can tell whether they applied every streak change
+INSERT INTO data_versions (scope, version) VALUES ('streaks', 0);
+
+CREATE TRIGGER trg_user_habits_insert_streaks_version AFTER INSERT ON user_habits
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE scope = 'streaks';
+END;
+
+CREATE TRIGGER trg_user_habits_update_streaks_version AFTER UPDATE OF current_streak, longest_streak ON user_habits
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE scope = 'streaks';
+END;
+
+CREATE TRIGGER trg_user_habits_delete_streaks_version AFTER DELETE ON user_habits
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE scope = 'streaks';
+END;
+
+-- Version of each user's data, for the ETags of the per-user read routes. Every write to a user's habits or
+-- completions also inserts, updates or deletes one of their user_habits rows, so triggers on user_habits
+-- cover them all. A user's version is the value the 'users' counter had after their last change, so the
+-- users changed since a known 'users' version are found with the index on version.
+CREATE TABLE user_data_versions (
+    user_name VARCHAR(255) PRIMARY KEY,
+    version INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE INDEX idx_user_data_versions_version ON user_data_versions (version);
+
+INSERT INTO data_versions (scope, version) VALUES ('users', 0);
+
+CREATE TRIGGER trg_user_habits_insert_user_version AFTER INSERT ON user_habits
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE scope = 'users';
+    INSERT INTO user_data_versions (user_name, version) VALUES (NEW.user_name, (SELECT version FROM data_versions WHERE scope = 'users'))
+    ON CONFLICT (user_name) DO UPDATE SET version = excluded.version;
+END;
+
+CREATE TRIGGER trg_user_habits_update_user_version AFTER UPDATE ON user_habits
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE scope = 'users';
+    INSERT INTO user_data_versions (user_name, version) VALUES (NEW.user_name, (SELECT version FROM data_versions WHERE scope = 'users'))
+    ON CONFLICT (user_name) DO UPDATE SET version = excluded.version;
+END;
+
+CREATE TRIGGER trg_user_habits_delete_user_version AFTER DELETE ON user_habits
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE scope = 'users';
+    INSERT INTO user_data_versions (user_name, version) VALUES (OLD.user_name, (SELECT version FROM data_versions WHERE scope = 'users'))
+    ON CONFLICT (user_name) DO UPDATE SET version = excluded.version;
+END;
+
+-- Timezone of each user, so days and weeks of their streaks start at their local midnight.
+-- Users without a row are in UTC.
+CREATE TABLE user_timezones (
+    user_name VARCHAR(255) PRIMARY KEY,
+    timezone VARCHAR(64) NOT NULL
+) WITHOUT ROWID;
+
+-- A new timezone changes the user's streaks and day keys, so it is a change of their data
+CREATE TRIGGER trg_user_timezones_insert_user_version AFTER INSERT ON user_timezones
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE scope = 'users';
+    INSERT INTO user_data_versions (user_name, version) VALUES (NEW.user_name, (SELECT version FROM data_versions WHERE scope = 'users'))
+    ON CONFLICT (user_name) DO UPDATE SET version = excluded.version;
+END;
+
+CREATE TRIGGER trg_user_timezones_update_user_version AFTER UPDATE ON user_timezones
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE scope = 'users';
+    INSERT INTO user_data_versions (user_name, version) VALUES (NEW.user_name, (SELECT version FROM data_versions WHERE scope = 'users'))
+    ON CONFLICT (user_name) DO UPDATE SET version = excluded.version;
+END;
+
+-- Version of the schema, migrations in db/sql/migrations with a higher number are applied by db/migrate.py
+PRAGMA user_version = 10;
@@ -0,0 +1,347 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from db.db import reset_after_fork, squlite_db
+from classes.metrics import metrics
+
+def is_busy(error):
+    """
+    Whether an error is SQLite's SQLITE_BUSY, i.e. the database stayed locked beyond the busy timeout.
+    """
+    return isinstance(error, sqlite3.OperationalError) and ('locked' in str(error) or 'busy' in str(error))
+
+# This is the Write Coordinator Class.
+# SQLite allows one writer at a time, so instead of every request thread taking the write lock and
+# committing on its own, request threads queue their writes and a single writer thread applies them.
+# The writer drains the queue in batches and commits each batch once (group commit): one lock
+# acquisition and one WAL sync for up to `batch_size` operations.
+class WriteCoordinator:
+    """
+    A queue of write operations applied by a single writer thread with group commit.
+
+    A write operation is a function that takes a sqlite3.Connection, runs its statements on it without
+    committing, and returns its result. Each operation runs inside its own savepoint, so an operation
+    that raises is rolled back on its own while the rest of its batch still commits. Callers get their
+    operation's result (or exception) once the batch is committed.
+
+    Attributes:
+    ----------
+    db : SqliteDB
+        The database the writes go to. The writer thread opens its own connection, outside of the pool.
+    enabled : bool
+        Whether Habit writes go through the coordinator.
+    batch_size : int
+        Maximum number of operations committed together.
+    max_latency : float
+        Seconds the writer waits for more operations after the first one of a batch arrives.
+    """
+
+    def __init__(self, db, enabled=None, batch_size=None, max_latency=None):
+        self.db = db
+        if enabled is None:
+            enabled = os.getenv("DB_WRITE_COORDINATOR", "0").lower() in ("1", "true", "yes")
+        if batch_size is None:
+            batch_size = int(os.getenv("DB_WRITE_BATCH_SIZE", 64))
+        if max_latency is None:
+            max_latency = float(os.getenv("DB_WRITE_MAX_LATENCY_MS", 2)) / 1000
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+
+        self._reset()
+        reset_after_fork(self, WriteCoordinator._reset)
+
+    def _reset(self):
+        """
+        Sets up an empty queue without a writer thread. A forked process starts from here,
+        as the parent's writer thread and its queued operations stay in the parent.
+        """
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'operations': 0,
+            'failed_operations': 0,
+            'batches': 0,
+            'failed_batches': 0,
+            'max_batch_size': 0,
+            'max_queue_depth': 0,
+            'commit_time': 0.0,
+        }
+
+    def __start(self):
+        """
+        Starts the writer thread, if it is not running yet. Its connection is opened first, on the caller's thread,
+        so a database that can't be opened fails the caller instead of the writer thread.
+
+        Raises:
+        -------
+        sqlite3.Error
+            If the writer's connection can't be opened.
+        """
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                # A dedicated connection: taking a pool slot could wait forever on request threads that hold
+                # every slot while they wait for their writes
+                connection = self.db.pool.connect()
+                self._thread = threading.Thread(target=self.__run, args=(connection,), name='db-write-coordinator', daemon=True)
+                self._thread.start()
+
+    def submit(self, operation):
+        """
+        Queues a write operation.
+
+        Parameters:
+        ----------
+        operation : callable
+            A function that takes a sqlite3.Connection, runs its statements and returns its result.
+
+        Returns:
+        -------
+        concurrent.futures.Future
+            Resolved with the operation's result once its batch is committed.
+
+        Raises:
+        -------
+        sqlite3.Error
+            If the writer thread is not running and its connection can't be opened.
+        """
+        future = Future()
+        self.__start()
+        self._queue.put((operation, future))
+        depth = self._queue.qsize()
+        with self._stats_lock:
+            self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], depth)
+        return future
+
+    def execute(self, operation, timeout=None):
+        """
+        Queues a write operation and waits for its result.
+
+        Parameters:
+        ----------
+        operation : callable
+            A function that takes a sqlite3.Connection, runs its statements and returns its result.
+        timeout : float, optional
+            Seconds to wait for the result.
+
+        Returns:
+        -------
+        object
+            What the operation returned.
+
+        Raises:
+        -------
+        Exception
+            What the operation raised, or the error that made its batch fail to commit.
+        """
+        return self.submit(operation).result(timeout)
+
+    def __next_batch(self, first):
+        """
+        Collects up to `batch_size` operations, waiting at most `max_latency` seconds after the first one.
+
+        Returns:
+        -------
+        tuple
+            The operations of the batch, and whether the coordinator was asked to stop.
+        """
+        batch = [first]
+        deadline = time.perf_counter() + self.max_latency
+        while len(batch) < self.batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def __apply(self, connection, batch):
+        """
+        Applies a batch of operations in one transaction and resolves their futures.
+        """
+        outcomes = []
+        start = time.perf_counter()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            metrics.observe('habit_sqlite_lock_wait_seconds', time.perf_counter() - start, writer='coordinator')
+            for operation, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                connection.execute("SAVEPOINT write_operation")
+                try:
+                    outcomes.append((future, operation(connection), None))
+                    connection.execute("RELEASE write_operation")
+                except Exception as error:
+                    connection.execute("ROLLBACK TO write_operation")
+                    connection.execute("RELEASE write_operation")
+                    outcomes.append((future, None, error))
+            committing = time.perf_counter()
+            connection.commit()
+            metrics.observe('habit_sqlite_commit_duration_seconds', time.perf_counter() - committing, writer='coordinator')
+        except Exception as error:
+            # The batch could not be committed (e.g. the database stayed locked), so none of it was written
+            if is_busy(error):
+                metrics.inc('habit_sqlite_busy_errors_total', writer='coordinator')
+            if connection.in_transaction:
+                connection.rollback()
+            with self._stats_lock:
+                self._stats['failed_batches'] += 1
+                self._stats['failed_operations'] += len(batch)
+            for _, future in batch:
+                if not future.done():
+                    if not future.running():
+                        future.set_running_or_notify_cancel()
+                    future.set_exception(error)
+            return
+
+        with self._stats_lock:
+            self._stats['batches'] += 1
+            self._stats['operations'] += len(outcomes)
+            self._stats['failed_operations'] += sum(1 for _, _, error in outcomes if error is not None)
+            self._stats['max_batch_size'] = max(self._stats['max_batch_size'], len(batch))
+            self._stats['commit_time'] += time.perf_counter() - start
+
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def __run(self, connection):
+        """
+        The writer thread: applies queued operations batch by batch until stopped. If the thread fails,
+        the operations still queued fail with its error rather than wait for a writer that is gone.
+        """
+        try:
+            stopping = False
+            while not stopping:
+                first = self._queue.get()
+                if first is None:
+                    break
+                batch, stopping = self.__next_batch(first)
+                self.__apply(connection, batch)
+        except BaseException as error:
+            self.__fail_queued(error)
+            raise
+        finally:
+            connection.close()
+
+    def __fail_queued(self, error):
+        """
+        Fails the operations waiting in the queue with an error.
+        """
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is None:
+                continue
+            _, future = item
+            if future.set_running_or_notify_cancel():
+                future.set_exception(error)
+
+    def stop(self, timeout=None):
+        """
+        Applies the operations already queued, then stops the writer thread.
+        """
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def metrics(self):
+        """
+        Get the write coordinator counters.
+
+        Returns:
+        -------
+        dict
+            Operations applied and failed, batches committed and failed, current and highest queue depth,
+            mean and highest batch size, and total seconds spent applying and committing batches.
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['queue_depth'] = self._queue.qsize()
+        stats['mean_batch_size'] = stats['operations'] / stats['batches'] if stats['batches'] else 0.0
+        stats['batch_size'] = self.batch_size
+        stats['max_latency'] = self.max_latency
+        return stats
+
+def run_write(connection, operation):
+    """
+    Runs a write operation in its own transaction on the given connection, for when the write coordinator is disabled.
+
+    Parameters:
+    ----------
+    connection : sqlite3.Connection
+        The connection of the current request or thread.
+    operation : callable
+        A function that takes a sqlite3.Connection, runs its statements and returns its result.
+
+    Returns:
+    -------
+    object
+        What the operation returned.
+    """
+    start = time.perf_counter()
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+    except Exception as error:
+        if is_busy(error):
+            metrics.inc('habit_sqlite_busy_errors_total', writer='direct')
+        raise
+    metrics.observe('habit_sqlite_lock_wait_seconds', time.perf_counter() - start, writer='direct')
+    try:
+        result = operation(connection)
+        start = time.perf_counter()
+        connection.commit()
+        metrics.observe('habit_sqlite_commit_duration_seconds', time.perf_counter() - start, writer='direct')
+    except Exception as error:
+        if is_busy(error):
+            metrics.inc('habit_sqlite_busy_errors_total', writer='direct')
+        connection.rollback()
+        raise
+    return result
+
+def write(connection, operation, coordinator=None):
+    """
+    Runs a write operation through the write coordinator when it is enabled,
+    otherwise in its own transaction on the given connection.
+
+    Parameters:
+    ----------
+    connection : sqlite3.Connection
+        The connection of the current request or thread.
+    operation : callable
+        A function that takes a sqlite3.Connection, runs its statements and returns its result.
+    coordinator : WriteCoordinator, optional
+        The coordinator of the database the connection belongs to (see db/shards.py). Defaults to the global one.
+
+    Returns:
+    -------
+    object
+        What the operation returned.
+    """
+    coordinator = coordinator or write_coordinator
+    if coordinator.enabled:
+        return coordinator.execute(operation)
+    return run_write(connection, operation)
+
+# Global instance of the WriteCoordinator class
+write_coordinator = WriteCoordinator(squlite_db)
@@ -0,0 +1,191 @@
+import functools
+import hmac
+import os
+
+from classes.catalog import habit_catalog
+from classes.check_off_events import recent_check_offs
+from classes.leaderboard import leaderboard
+from classes.partitions import tracker_partitions
+from classes.response_cache import response_cache
+from classes.sampler import stack_sampler
+from db.readers import read_routing
+from db.shards import shard_router
+
+# flask
+from flask import Response, request
+
+def admin_token(config=None):
+    """
+    Gets the token the admin routes require, from the app's ADMIN_TOKEN setting or the ADMIN_TOKEN environment variable.
+
+    Returns:
+    -------
+    str or None
+        The token, or None if the admin routes are disabled.
+    """
+    return (config or {}).get('ADMIN_TOKEN') or os.getenv("ADMIN_TOKEN") or None
+
+def authorized(headers, token):
+    """
+    Checks that a request carries the admin token, as an `Authorization: Bearer <token>` header.
+    """
+    scheme, _, value = headers.get('Authorization', '').partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(value.strip().encode(), token.encode())
+
+# Answer of an admin route called without the token
+UNAUTHORIZED = {'error': 'Unauthorized'}, 401
+
+def cache_stats():
+    """
+    Gets the counters of the in-process caches.
+
+    Returns:
+    -------
+    dict
+        The response cache, habit catalog, tracker partitions, leaderboard and recent check-offs counters.
+    """
+    return {
+        'responses': response_cache.metrics(),
+        'catalog': habit_catalog.metrics(),
+        'partitions': tracker_partitions.metrics(),
+        'leaderboard': leaderboard.metrics(),
+        'check_off_events': recent_check_offs.metrics(),
+    }
+
+# This function will load the admin routes into the Flask app that is passed as a param
+def load(app):
+    """
+    Load the admin routes into the given Flask application.
+
+    The routes expose the internals of the worker and drop its caches, so they are only registered when
+    an admin token is configured (ADMIN_TOKEN), and every request must send it as a bearer token.
+
+    Parameters:
+    ----------
+    app : Flask
+        The Flask application instance where the routes will be registered.
+    """
+    token = admin_token(app.config)
+    if token is None:
+        return
+
+    def admin_only(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not authorized(request.headers, token):
+                return UNAUTHORIZED
+            return view(*args, **kwargs)
+        return wrapper
+
+    @app.route("/api/admin/cache", methods=["GET"])
+    @admin_only
+    def get_cache_stats():
+        """
+        Get the hit, miss and eviction counters of the response cache and the other in-process caches of this worker.
+
+        Returns:
+        -------
+        dict
+            A dictionary containing the counters of each cache.
+        int
+            The HTTP status code.
+        """
+        return {'data': cache_stats()}, 200
+
+    @app.route("/api/admin/cache", methods=["DELETE"])
+    @admin_only
+    def clear_response_cache():
+        """
+        Drop the cached response bodies of this worker.
+
+        Returns:
+        -------
+        dict
+            A success message.
+        int
+            The HTTP status code.
+        """
+        response_cache.clear()
+        return {'message': 'Response cache cleared'}, 200
+
+    @app.route("/api/admin/shards", methods=["GET"])
+    @admin_only
+    def get_shards():
+        """
+        Get the database file and connection pool counters of every shard, the primary first.
+
+        Returns:
+        -------
+        dict
+            A dictionary containing one entry per shard.
+        int
+            The HTTP status code.
+        """
+        return {'data': shard_router.metrics()}, 200
+
+    @app.route("/api/admin/readers", methods=["GET"])
+    @admin_only
+    def get_readers():
+        """
+        Get the read mode of every class of analytics queries, and the pool and snapshot counters of each reader.
+
+        Returns:
+        -------
+        dict
+            A dictionary containing the routes and the readers opened by this worker.
+        int
+            The HTTP status code.
+        """
+        return {'data': read_routing.metrics()}, 200
+
+    @app.route("/api/admin/profile", methods=["GET"])
+    @admin_only
+    def get_profile_stats():
+        """
+        Get the counters of the stack sampler of this worker, with the samples taken per endpoint.
+
+        Returns:
+        -------
+        dict
+            A dictionary containing the sampler counters.
+        int
+            The HTTP status code.
+        """
+        return {'data': stack_sampler.metrics()}, 200
+
+    @app.route("/api/admin/profile/<endpoint>", methods=["GET"])
+    @admin_only
+    def get_endpoint_profile(endpoint):
+        """
+        Get the flame data of an endpoint, as folded stacks for flamegraph.pl or speedscope.
+
+        Parameters:
+        ----------
+        endpoint : str
+            The name of the endpoint, as listed by /api/admin/profile.
+
+        Returns:
+        -------
+        Response
+            The folded stacks as plain text, or a 404 error if the endpoint was never sampled.
+        """
+        folded = stack_sampler.folded(endpoint)
+        if folded is None:
+            return {'error': 'Endpoint not sampled'}, 404
+        return Response(folded, mimetype='text/plain')
+
+    @app.route("/api/admin/profile", methods=["DELETE"])
+    @admin_only
+    def reset_profile():
+        """
+        Drop the samples taken by the stack sampler of this worker.
+
+        Returns:
+        -------
+        dict
+            A success message.
+        int
+            The HTTP status code.
+        """
+        stack_sampler.reset()
+        return {'message': 'Profile samples dropped'}, 200
@@ -1,5 +1,112 @@
+import datetime
+import json
+
 # flask
-from db.db import squlite_db
+from flask import Response, request, stream_with_context
+
+from db.readers import read_routing
+from db.shards import shard_router
+from classes.analytics import Analytics, HEATMAP_BUCKET_DAYS
+from classes.leaderboard import METRICS
+from classes.catalog import habit_catalog
+from routes.caching import cached_response
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# Number of timestamps fetched from the DB and sent at a time when streaming
+STREAM_CHUNK_SIZE = 1000
+
+# Largest page of timestamps that can be requested with `limit`
+MAX_TIMESTAMPS_PAGE_SIZE = 10000
+
+# Days in a heatmap when no `start` is given, and longest heatmap date range
+DEFAULT_HEATMAP_DAYS = 365
+MAX_HEATMAP_DAYS = 3660
+
+# Leaderboard entries returned when no `limit` is given, and largest `limit`
+DEFAULT_LEADERBOARD_SIZE = 10
+MAX_LEADERBOARD_SIZE = 100
+
+def parse_heatmap_args(args):
+    """
+    Parses the `start`, `end` and `bucket` query parameters of the heatmap routes.
+
+    Parameters:
+    ----------
+    args : MultiDict
+        The query string parameters.
+
+    Returns:
+    -------
+    tuple
+        The (start date, end date, bucket) and None, or None and the error response.
+    """
+    bucket = args.get('bucket', 'day')
+    if bucket not in HEATMAP_BUCKET_DAYS:
+        return None, ({'message': f"bucket must be one of {', '.join(HEATMAP_BUCKET_DAYS)}"}, 400)
+    try:
+        end = datetime.date.fromisoformat(args['end']) if 'end' in args else datetime.date.today()
+        start = datetime.date.fromisoformat(args['start']) if 'start' in args else end - datetime.timedelta(days=DEFAULT_HEATMAP_DAYS - 1)
+    except ValueError:
+        return None, ({'message': 'start and end must be dates formatted as YYYY-MM-DD'}, 400)
+    if not 0 <= (end - start).days < MAX_HEATMAP_DAYS:
+        return None, ({'message': f'end must be on or after start, and at most {MAX_HEATMAP_DAYS} days after it'}, 400)
+    return (start, end, bucket), None
+
+def parse_leaderboard_args(args):
+    """
+    Parses the `metric` and `limit` query parameters of the leaderboard routes.
+
+    Parameters:
+    ----------
+    args : MultiDict
+        The query string parameters.
+
+    Returns:
+    -------
+    tuple
+        The (metric, limit) and None, or None and the error response.
+    """
+    metric = args.get('metric', 'longest')
+    if metric not in METRICS:
+        return None, ({'message': f"metric must be one of {', '.join(METRICS)}"}, 400)
+    limit = args.get('limit', str(DEFAULT_LEADERBOARD_SIZE))
+    if not limit.isdigit() or not 0 < int(limit) <= MAX_LEADERBOARD_SIZE:
+        return None, ({'message': f'limit must be between 1 and {MAX_LEADERBOARD_SIZE}'}, 400)
+    return (metric, int(limit)), None
+
+def wants_stream(request):
+    """
+    Checks whether a timestamps request asks for a stream, with `stream=1` or an `Accept: application/x-ndjson` header.
+    """
+    return request.args.get('stream') == '1' or request.accept_mimetypes.best == NDJSON_MIMETYPE
+
+def parse_timestamps_args(args):
+    """
+    Parses the `before` and `limit` query parameters of the tracked timestamps routes.
+
+    Parameters:
+    ----------
+    args : MultiDict
+        The query string parameters.
+
+    Returns:
+    -------
+    tuple
+        The (before, limit) and None, or None and the error response.
+    """
+    before = args.get('before')
+    if before is not None:
+        try:
+            datetime.datetime.fromisoformat(before)
+        except ValueError:
+            return None, ({'message': 'before must be a timestamp formatted as YYYY-MM-DD HH:MM:SS'}, 400)
+    limit = args.get('limit')
+    if limit is not None:
+        if not limit.isdigit() or not 0 < int(limit) <= MAX_TIMESTAMPS_PAGE_SIZE:
+            return None, ({'message': f'limit must be between 1 and {MAX_TIMESTAMPS_PAGE_SIZE}'}, 400)
+        limit = int(limit)
+    return (before, limit), None
 
 # This function will load all the analytics routes into the Flask app that is passed as a param
 def load(app):
@@ -11,8 +118,13 @@ def load(app):
     app : Flask
         The Flask application instance where the routes will be registered.
     """
+    # Every request checks out its own connection from the pool of each shard it uses,
+    # and the analytics queries from the pool of the reader their query class is routed to
+    shard_router.init_app(app)
+    read_routing.init_app(app)
     
     @app.route("/api/analytics/habits/tracking/<string:user_name>", methods=["GET"])
+    @cached_response('catalog', 'user')
     def get_user_tracked_habits(user_name):
         """
         Get all habits tracked by a specific user.
@@ -29,10 +141,11 @@ def load(app):
         int
             The HTTP status code.
         """
-        data = squlite_db.cursor.execute("SELECT * FROM user_habits WHERE user_name = ?", (user_name,))
-        return {'user': user_name, 'trackedHabits': data.fetchall()}, 200
+        analytics = Analytics()
+        return {'user': user_name, 'trackedHabits': analytics.get_user_tracked_habits(user_name)}, 200
 
     @app.route("/api/analytics/user/<string:user_name>/longest-streak", methods=["GET"])
+    @cached_response('catalog', 'user')
     def get_all_user_habits_longest_streak(user_name):
         """
         Get the longest streak for all habits tracked by a specific user.
@@ -49,22 +162,11 @@ def load(app):
         int
             The HTTP status code.
         """
-        data = squlite_db.cursor.execute(
-            """SELECT 
-                   user_habits.user_name,
-                   habits.name AS habit_name,
-                   user_habits.longest_streak 
-                FROM 
-                   user_habits 
-                JOIN 
-                   habits ON user_habits.habit_id = habits.id
-                WHERE 
-                   user_name = ?""",
-            (user_name,)
-        )
-        return {'data': data.fetchall()}, 200
+        analytics = Analytics()
+        return {'data': analytics.get_user_longest_streaks(user_name)}, 200
 
     @app.route("/api/analytics/user/<string:user_name>/longest-streak/<string:habit_name>", methods=["GET"])
+    @cached_response('catalog', 'user')
     def find_user_habit_longest_streak(user_name, habit_name):
         """
         Get the longest streak for a specific habit tracked by a specific user.
@@ -83,21 +185,175 @@ def load(app):
         int
             The HTTP status code.
         """
-        
-        _habit_id = squlite_db.cursor.execute("SELECT id FROM habits WHERE name = ?", (habit_name,))
-        habit = _habit_id.fetchone()
-        if habit is None:
-            return {'message': 'Habit not found'}, 404
-        
-        habit_id = habit['id']
+        analytics = Analytics()
+        response = analytics.get_user_habit_longest_streak(user_name, habit_name)
+        if response is not None and response.get('error'):
+            return {'message': response['error']}, response['code']
+        return {'data': response}, 200
+
+    @app.route("/api/analytics/user/<string:user_name>/summary", methods=["GET"])
+    @cached_response('catalog', 'user')
+    def get_user_summary(user_name):
+        """
+        Get the dashboard summary of a user: totals, and for every tracked habit its completions,
+        first and last completion, streaks and 7/30-day completion rates.
+        Answered with two queries however long the user's history is.
+
+        Parameters:
+        ----------
+        user_name : str
+            The name of the user.
+
+        Returns:
+        -------
+        dict
+            A dictionary containing the user's totals and per habit summaries.
+        int
+            The HTTP status code.
+        """
+        analytics = Analytics()
+        return analytics.get_user_summary(user_name), 200
+
+    @app.route("/api/analytics/user/<string:user_name>/heatmap", methods=["GET"])
+    @app.route("/api/analytics/user/<string:user_name>/heatmap/<string:habit_name>", methods=["GET"])
+    @cached_response('catalog', 'user')
+    def get_user_heatmap(user_name, habit_name=None):
+        """
+        Get the completions of a user's habits per day or week of a date range, to draw a contribution calendar.
+
+        Query Parameters:
+        ----------
+        start : str, optional
+            The first day, formatted as YYYY-MM-DD. Defaults to 365 days before `end`.
+        end : str, optional
+            The last day, formatted as YYYY-MM-DD. Defaults to today.
+        bucket : str, optional
+            'day' (default) or 'week' (Monday-start weeks).
+
+        Parameters:
+        ----------
+        user_name : str
+            The name of the user.
+        habit_name : str, optional
+            Only count this habit. Defaults to every habit the user tracks.
 
-        data = squlite_db.cursor.execute("SELECT longest_streak FROM user_habits WHERE user_name = ? AND habit_id = ?", (user_name, habit_id,))
-        return {'data': data.fetchone()}, 200
+        Returns:
+        -------
+        dict
+            A dictionary containing the range, one array of counts per habit (one count per bucket) and their totals.
+        int
+            The HTTP status code.
+        """
+        heatmap_args, error = parse_heatmap_args(request.args)
+        if error:
+            return error
+
+        response = Analytics().get_user_heatmap(user_name, *heatmap_args, habit_name=habit_name)
+        if response.get('error'):
+            return {'message': response['error']}, response['code']
+        return {'data': response}, 200
+
+    @app.route("/api/analytics/leaderboard", methods=["GET"])
+    @app.route("/api/analytics/leaderboard/<string:habit_name>", methods=["GET"])
+    @cached_response('catalog', 'streaks')
+    def get_leaderboard(habit_name=None):
+        """
+        Get the users with the highest streaks.
+
+        Query Parameters:
+        ----------
+        metric : str, optional
+            'longest' (default) or 'current'.
+        limit : int, optional
+            The number of entries. Defaults to 10.
+
+        Parameters:
+        ----------
+        habit_name : str, optional
+            Only rank the users tracking this habit. Defaults to every tracked habit.
+
+        Returns:
+        -------
+        dict
+            A dictionary containing the ranked entries, highest streak first. Users with the same streak share a rank.
+        int
+            The HTTP status code.
+        """
+        leaderboard_args, error = parse_leaderboard_args(request.args)
+        if error:
+            return error
+
+        response = Analytics().get_leaderboard(*leaderboard_args, habit_name=habit_name)
+        if response.get('error'):
+            return {'message': response['error']}, response['code']
+        return {'data': response}, 200
+
+    @app.route("/api/analytics/user/<string:user_name>/rank", methods=["GET"])
+    @app.route("/api/analytics/user/<string:user_name>/rank/<string:habit_name>", methods=["GET"])
+    @cached_response('catalog', 'streaks')
+    def get_user_rank(user_name, habit_name=None):
+        """
+        Get the rank of a user on a leaderboard.
+
+        Query Parameters:
+        ----------
+        metric : str, optional
+            'longest' (default) or 'current'.
+
+        Parameters:
+        ----------
+        user_name : str
+            The name of the user.
+        habit_name : str, optional
+            Rank the user among the users tracking this habit. Defaults to the user's best habit among every tracked habit.
+
+        Returns:
+        -------
+        dict
+            A dictionary containing the user's rank, the number of ranked entries, and the ranked habit and streak.
+        int
+            The HTTP status code.
+        """
+        leaderboard_args, error = parse_leaderboard_args(request.args)
+        if error:
+            return error
+
+        response = Analytics().get_user_rank(user_name, leaderboard_args[0], habit_name=habit_name)
+        if response.get('error'):
+            return {'message': response['error']}, response['code']
+        return {'data': response}, 200
+
+    @app.route("/api/analytics/habits/stats", methods=["GET"])
+    @cached_response('catalog', 'users')
+    def get_habit_stats():
+        """
+        Get the number of users tracking each habit, those on a streak and their completions.
+        With several shards, every shard is counted in parallel.
+
+        Returns:
+        -------
+        dict
+            A dictionary containing one entry per habit and the number of shards counted.
+        int
+            The HTTP status code.
+        """
+        return {'data': Analytics().get_habit_stats()}, 200
 
     @app.route("/api/analytics/user/<string:user_name>/tracked-timestamps/<string:habit_name>", methods=["GET"])
+    @cached_response('catalog', 'user', etag_only=wants_stream)
     def get_all_habits_tracked_timestamps(user_name, habit_name):
         """
-        Get all tracked timestamps for a specific habit tracked by a specific user.
+        Get all tracked timestamps for a specific habit tracked by a specific user, newest first.
+
+        Query Parameters:
+        ----------
+        before : str, optional
+            Only return timestamps older than this one (keyset pagination, pass the previous page's `next_before`).
+        limit : int, optional
+            Maximum number of timestamps to return.
+        stream : str, optional
+            When '1', the timestamps are streamed as newline-delimited JSON, one {"completed_at": ...} object
+            per line. Sending an `Accept: application/x-ndjson` header does the same.
 
         Parameters:
         ----------
@@ -108,28 +364,38 @@ def load(app):
 
         Returns:
         -------
-        dict
-            A dictionary containing the user's name, the habit, and the tracked timestamps.
+        dict or Response
+            A dictionary containing the user's name, the habit, the tracked timestamps and, when a page is full,
+            the `next_before` cursor of the next page; or the streamed timestamps.
         int
             The HTTP status code.
         """
-        _habit_id = squlite_db.cursor.execute("SELECT id FROM habits WHERE name = ?", (habit_name,))
-        habit = _habit_id.fetchone()
+        habit = habit_catalog.by_name(habit_name)
         if habit is None:
             return {'message': 'Habit not found'}, 404
         
         habit_id = habit['id']
 
-        data = squlite_db.cursor.execute(
-            """SELECT 
-                   habit_tracker.completed_at
-                FROM 
-                   user_habits 
-                JOIN 
-                   habit_tracker ON user_habits.id = habit_tracker.user_habit_id
-                WHERE 
-                   user_name = ? AND habit_id = ?
-                ORDER BY habit_tracker.completed_at DESC""",
-            (user_name, habit_id,)
-        )
-        return {'data': {'user_name': user_name, 'habit': habit_name, 'timestamps': data.fetchall()}}, 200
+        timestamps_args, error = parse_timestamps_args(request.args)
+        if error:
+            return error
+        before, limit = timestamps_args
+
+        data = Analytics().get_tracked_timestamps(user_name, habit_id, before, limit)
+
+        if wants_stream(request):
+            def generate():
+                while True:
+                    rows = data.fetchmany(STREAM_CHUNK_SIZE)
+                    if not rows:
+                        break
+                    yield ''.join('{"completed_at": %s}\n' % json.dumps(row[0]) for row in rows)
+
+            # The request's connection stays checked out until the last chunk is sent
+            return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+        timestamps = [{'completed_at': row[0]} for row in data.fetchall()]
+        response = {'user_name': user_name, 'habit': habit_name, 'timestamps': timestamps}
+        if limit is not None:
+            response['next_before'] = timestamps[-1]['completed_at'] if len(timestamps) == limit else None
+        return {'data': response}, 200
@@ -0,0 +1,259 @@
+import json
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+# werkzeug (installed with flask): URL rules, headers and errors behave exactly like in the Flask app
+from werkzeug.datastructures import Headers, MIMEAccept, MultiDict
+from werkzeug.exceptions import BadRequest, HTTPException, UnsupportedMediaType
+from werkzeug.http import parse_accept_header
+from werkzeug.routing import Map, Rule
+
+JSON_MIMETYPE = 'application/json'
+
+# A minimal ASGI application for the async serving mode.
+# It only covers what the habit and analytics routes need: URL rules with converters, JSON bodies,
+# query strings, JSON and streamed responses, and the lifespan events.
+
+class AsyncRequest:
+    """
+    The request an async route handler is called with.
+
+    Attributes:
+    ----------
+    method : str
+        The HTTP method.
+    path : str
+        The URL path.
+    args : MultiDict
+        The query string parameters.
+    headers : Headers
+        The request headers.
+    body : bytes
+        The request body.
+    """
+
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = MultiDict(parse_qsl(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True))
+        self.headers = Headers([(key.decode('latin-1'), value.decode('latin-1')) for key, value in scope.get('headers', [])])
+        self.body = body
+
+    @property
+    def accept_mimetypes(self):
+        """
+        The mimetypes the client accepts, parsed from the Accept header.
+        """
+        return parse_accept_header(self.headers.get('Accept'), MIMEAccept)
+
+    @property
+    def json(self):
+        """
+        The parsed JSON body. Like Flask's request.json, a body that is not JSON is answered with 415
+        and invalid JSON with 400.
+        """
+        if self.headers.get('Content-Type', '').split(';')[0].strip() != JSON_MIMETYPE:
+            raise UnsupportedMediaType()
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            raise BadRequest()
+
+class StreamingResponse:
+    """
+    A response whose body is sent in chunks as an async iterator produces them.
+
+    Attributes:
+    ----------
+    chunks : async iterator
+        The chunks of the body, as str or bytes.
+    mimetype : str
+        The mimetype of the body.
+    status : int
+        The HTTP status code.
+    """
+
+    def __init__(self, chunks, mimetype, status=200):
+        self.chunks = chunks
+        self.mimetype = mimetype
+        self.status = status
+
+def json_body(data):
+    """
+    Serializes a response body the way Flask does (sorted keys, compact, trailing newline).
+    """
+    return (json.dumps(data, separators=(',', ':'), sort_keys=True) + '\n').encode()
+
+class AsyncApp:
+    """
+    A minimal ASGI application with Flask-style route registration.
+
+    Route handlers are coroutines that take an AsyncRequest and the URL values, and return
+    a (body, status) tuple, a body (sent with 200), or a StreamingResponse.
+    """
+
+    def __init__(self):
+        self.url_map = Map()
+        self.view_functions = {}
+        self._startup = []
+        self._shutdown = []
+
+    def route(self, rule, methods=("GET",)):
+        """
+        Registers a route handler for a URL rule, e.g. "/api/habits/<string:habit_name>".
+        """
+        def decorator(handler):
+            endpoint = f'{handler.__module__}.{handler.__qualname__}'
+            self.url_map.add(Rule(rule, endpoint=endpoint, methods=list(methods)))
+            self.view_functions[endpoint] = handler
+            return handler
+        return decorator
+
+    def on_startup(self, callback):
+        """
+        Registers a function called when the server starts.
+        """
+        self._startup.append(callback)
+        return callback
+
+    def on_shutdown(self, callback):
+        """
+        Registers a function called when the server shuts down.
+        """
+        self._shutdown.append(callback)
+        return callback
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.__lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.__http(scope, receive, send)
+
+    async def __lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                for callback in self._startup:
+                    callback()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for callback in self._shutdown:
+                    callback()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def __http(self, scope, receive, send):
+        body = b''
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body += message.get('body', b'')
+            if not message.get('more_body', False):
+                break
+
+        request = AsyncRequest(scope, body)
+        try:
+            endpoint, values = self.url_map.bind('localhost').match(request.path, request.method)
+            response = await self.view_functions[endpoint](request, **values)
+        except HTTPException as error:
+            response = {'message': error.description}, error.code
+
+        if isinstance(response, StreamingResponse):
+            await send({'type': 'http.response.start', 'status': response.status,
+                        'headers': [(b'content-type', response.mimetype.encode())]})
+            async for chunk in response.chunks:
+                await send({'type': 'http.response.body', 'body': chunk.encode() if isinstance(chunk, str) else chunk,
+                            'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+
+        data, status = response if isinstance(response, tuple) else (response, 200)
+        payload = json_body(data)
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', JSON_MIMETYPE.encode()),
+                                (b'content-length', str(len(payload)).encode())]})
+        await send({'type': 'http.response.body', 'body': payload})
+
+    def test_client(self):
+        """
+        Creates a client that calls the app in process, like Flask's test client.
+        """
+        return AsyncTestClient(self)
+
+class AsyncTestResponse:
+    """
+    A response received by the AsyncTestClient.
+    """
+
+    def __init__(self, status_code, headers, data):
+        self.status_code = status_code
+        self.headers = headers
+        self.data = data
+        self.mimetype = headers.get('Content-Type')
+
+    def get_json(self):
+        return json.loads(self.data)
+
+class AsyncTestClient:
+    """
+    Calls an ASGI app in process, without a server.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def open(self, path, method='GET', json=None, headers=None):
+        """
+        Sends a request to the app.
+
+        Parameters:
+        ----------
+        path : str
+            The URL path, with an optional query string. It may be percent-encoded.
+        method : str, optional
+            The HTTP method.
+        json : object, optional
+            A body to send as JSON.
+        headers : dict, optional
+            Extra request headers.
+
+        Returns:
+        -------
+        AsyncTestResponse
+            The status, headers and the whole body of the response.
+        """
+        url = urlsplit(path)
+        request_headers = dict(headers or {})
+        body = b''
+        if json is not None:
+            body = json_body(json)
+            request_headers['Content-Type'] = JSON_MIMETYPE
+        scope = {
+            'type': 'http',
+            'method': method,
+            'path': unquote(url.path),
+            'query_string': url.query.encode(),
+            'headers': [(key.lower().encode('latin-1'), value.encode('latin-1')) for key, value in request_headers.items()],
+        }
+
+        messages = [{'type': 'http.request', 'body': body}]
+        async def receive():
+            return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+        sent = []
+        async def send(message):
+            sent.append(message)
+
+        await self.app(scope, receive, send)
+        start = sent[0]
+        response_headers = Headers([(key.decode('latin-1'), value.decode('latin-1')) for key, value in start['headers']])
+        return AsyncTestResponse(start['status'], response_headers, b''.join(message.get('body', b'') for message in sent[1:]))
+
+    async def get(self, path, **kwargs):
+        return await self.open(path, 'GET', **kwargs)
+
+    async def post(self, path, **kwargs):
+        return await self.open(path, 'POST', **kwargs)
+
+    async def delete(self, path, **kwargs):
+        return await self.open(path, 'DELETE', **kwargs)
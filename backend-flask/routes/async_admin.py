@@ -0,0 +1,44 @@
+import functools
+
+from classes.response_cache import response_cache
+from routes.admin import UNAUTHORIZED, admin_token, authorized, cache_stats
+
+# This function will load the admin routes into the async (ASGI) app that is passed as a param
+# The URLs, responses and the ADMIN_TOKEN check are the same as in routes/admin.py
+def load(app):
+    """
+    Load the async admin routes into the given ASGI application.
+
+    Parameters:
+    ----------
+    app : AsyncApp
+        The ASGI application instance where the routes will be registered.
+    """
+    token = admin_token()
+    if token is None:
+        return
+
+    def admin_only(handler):
+        @functools.wraps(handler)
+        async def wrapper(request, *args, **kwargs):
+            if not authorized(request.headers, token):
+                return UNAUTHORIZED
+            return await handler(request, *args, **kwargs)
+        return wrapper
+
+    @app.route("/api/admin/cache", methods=["GET"])
+    @admin_only
+    async def get_cache_stats(request):
+        """
+        Get the counters of the response cache and the other in-process caches of this worker.
+        """
+        return {'data': cache_stats()}, 200
+
+    @app.route("/api/admin/cache", methods=["DELETE"])
+    @admin_only
+    async def clear_response_cache(request):
+        """
+        Drop the cached response bodies of this worker.
+        """
+        response_cache.clear()
+        return {'message': 'Response cache cleared'}, 200
@@ -0,0 +1,149 @@
+import json
+
+from classes.async_analytics import AsyncAnalytics
+from routes.analytics import NDJSON_MIMETYPE, STREAM_CHUNK_SIZE, parse_heatmap_args, parse_leaderboard_args, parse_timestamps_args, wants_stream
+from routes.asgi import StreamingResponse
+
+# This function will load all the analytics routes into the async (ASGI) app that is passed as a param
+# The URLs, query parameters and responses are the same as in routes/analytics.py
+def load(app):
+    """
+    Load the async analytics routes into the given ASGI application.
+
+    Parameters:
+    ----------
+    app : AsyncApp
+        The ASGI application instance where the routes will be registered.
+    """
+
+    @app.route("/api/analytics/habits/tracking/<string:user_name>", methods=["GET"])
+    async def get_user_tracked_habits(request, user_name):
+        """
+        Get all habits tracked by a specific user.
+        """
+        analytics = AsyncAnalytics()
+        return {'user': user_name, 'trackedHabits': await analytics.get_user_tracked_habits(user_name)}, 200
+
+    @app.route("/api/analytics/user/<string:user_name>/longest-streak", methods=["GET"])
+    async def get_all_user_habits_longest_streak(request, user_name):
+        """
+        Get the longest streak for all habits tracked by a specific user.
+        """
+        analytics = AsyncAnalytics()
+        return {'data': await analytics.get_user_longest_streaks(user_name)}, 200
+
+    @app.route("/api/analytics/user/<string:user_name>/longest-streak/<string:habit_name>", methods=["GET"])
+    async def find_user_habit_longest_streak(request, user_name, habit_name):
+        """
+        Get the longest streak for a specific habit tracked by a specific user.
+        """
+        analytics = AsyncAnalytics()
+        response = await analytics.get_user_habit_longest_streak(user_name, habit_name)
+        if response is not None and response.get('error'):
+            return {'message': response['error']}, response['code']
+        return {'data': response}, 200
+
+    @app.route("/api/analytics/user/<string:user_name>/summary", methods=["GET"])
+    async def get_user_summary(request, user_name):
+        """
+        Get the dashboard summary of a user.
+        """
+        analytics = AsyncAnalytics()
+        return await analytics.get_user_summary(user_name), 200
+
+    @app.route("/api/analytics/user/<string:user_name>/heatmap", methods=["GET"])
+    @app.route("/api/analytics/user/<string:user_name>/heatmap/<string:habit_name>", methods=["GET"])
+    async def get_user_heatmap(request, user_name, habit_name=None):
+        """
+        Get the completions of a user's habits per day or week of a date range.
+        Takes the same `start`, `end` and `bucket` query parameters as the WSGI route.
+        """
+        heatmap_args, error = parse_heatmap_args(request.args)
+        if error:
+            return error
+
+        analytics = AsyncAnalytics()
+        response = await analytics.get_user_heatmap(user_name, *heatmap_args, habit_name=habit_name)
+        if response.get('error'):
+            return {'message': response['error']}, response['code']
+        return {'data': response}, 200
+
+    @app.route("/api/analytics/leaderboard", methods=["GET"])
+    @app.route("/api/analytics/leaderboard/<string:habit_name>", methods=["GET"])
+    async def get_leaderboard(request, habit_name=None):
+        """
+        Get the users with the highest streaks.
+        Takes the same `metric` and `limit` query parameters as the WSGI route.
+        """
+        leaderboard_args, error = parse_leaderboard_args(request.args)
+        if error:
+            return error
+
+        analytics = AsyncAnalytics()
+        response = await analytics.get_leaderboard(*leaderboard_args, habit_name=habit_name)
+        if response.get('error'):
+            return {'message': response['error']}, response['code']
+        return {'data': response}, 200
+
+    @app.route("/api/analytics/user/<string:user_name>/rank", methods=["GET"])
+    @app.route("/api/analytics/user/<string:user_name>/rank/<string:habit_name>", methods=["GET"])
+    async def get_user_rank(request, user_name, habit_name=None):
+        """
+        Get the rank of a user on a leaderboard.
+        Takes the same `metric` query parameter as the WSGI route.
+        """
+        leaderboard_args, error = parse_leaderboard_args(request.args)
+        if error:
+            return error
+
+        analytics = AsyncAnalytics()
+        response = await analytics.get_user_rank(user_name, leaderboard_args[0], habit_name=habit_name)
+        if response.get('error'):
+            return {'message': response['error']}, response['code']
+        return {'data': response}, 200
+
+    @app.route("/api/analytics/habits/stats", methods=["GET"])
+    async def get_habit_stats(request):
+        """
+        Get the number of users tracking each habit and their completions, over every shard.
+        """
+        analytics = AsyncAnalytics()
+        return {'data': await analytics.get_habit_stats()}, 200
+
+    @app.route("/api/analytics/user/<string:user_name>/tracked-timestamps/<string:habit_name>", methods=["GET"])
+    async def get_all_habits_tracked_timestamps(request, user_name, habit_name):
+        """
+        Get all tracked timestamps for a specific habit tracked by a specific user, newest first.
+        Takes the same `before`, `limit` and `stream` query parameters as the WSGI route.
+        """
+        analytics = AsyncAnalytics()
+        habit = await analytics.get_habit(habit_name)
+        if habit is None:
+            return {'message': 'Habit not found'}, 404
+
+        habit_id = habit['id']
+
+        timestamps_args, error = parse_timestamps_args(request.args)
+        if error:
+            return error
+        before, limit = timestamps_args
+
+        if wants_stream(request):
+            async def generate():
+                sent = 0
+                async for timestamps in analytics.iter_tracked_timestamps(user_name, habit_id, before, STREAM_CHUNK_SIZE):
+                    if limit is not None:
+                        timestamps = timestamps[:limit - sent]
+                    sent += len(timestamps)
+                    yield ''.join('{"completed_at": %s}\n' % json.dumps(timestamp) for timestamp in timestamps)
+                    if limit is not None and sent >= limit:
+                        break
+
+            return StreamingResponse(generate(), NDJSON_MIMETYPE)
+
+        timestamps = [{'completed_at': timestamp}
+                      for timestamp in await analytics.get_tracked_timestamps(user_name, habit_id, before, limit)]
+        response = {'user_name': user_name, 'habit': habit_name, 'timestamps': timestamps}
+        if limit is not None:
+            response['next_before'] = timestamps[-1]['completed_at'] if len(timestamps) == limit else None
+        return {'data': response}, 200
@@ -0,0 +1,169 @@
+# class
+from classes.async_habits import AsyncHabit
+from classes.habits import MAX_BATCH_EVENTS
+
+# This function will load all the habits routes into the async (ASGI) app that is passed as a param
+# The URLs, bodies and responses are the same as in routes/habits.py
+
+#The individual routes just interact using the AsyncHabit Class
+def load(app):
+    """
+    Load the async habit-related routes into the given ASGI application.
+
+    Parameters:
+    ----------
+    app : AsyncApp
+        The ASGI application instance where the routes will be registered.
+    """
+
+    @app.route("/api/habits", methods=["GET"])
+    async def get_habits(request):
+        """
+        Get all habits.
+        """
+        habit = AsyncHabit()
+        habits = await habit.get_all_habits()
+        return {'habits': habits}, 200
+
+    @app.route("/api/habits/<string:habit_name>", methods=["GET"])
+    async def get_habit(request, habit_name):
+        """
+        Get a specific habit by name.
+        """
+        habit = AsyncHabit()
+        habit_data = await habit.get_habit(habit_name)
+        if habit_data.get('error'):
+            return {'error': habit_data['error']}, habit_data['code']
+        return {'habit': habit_data}, 200
+
+    @app.route("/api/habits/periodicity/<string:periodicity>", methods=["GET"])
+    async def get_habit_by_periodicity(request, periodicity):
+        """
+        Get habits by periodicity.
+        """
+        habit = AsyncHabit()
+        habits = await habit.get_habit_by_periodicity(periodicity)
+        return {'habits': habits}, 200
+
+    @app.route("/api/habits/create", methods=["POST"])
+    async def createNewHabit(request):
+        """
+        Create a new habit.
+        """
+        habit_name = request.json.get('habit_name', None)
+        description = request.json.get('description', None)
+        periodicity = request.json.get('periodicity', None)
+
+        habit = AsyncHabit()
+        response = await habit.create_habit(habit_name, description, periodicity)
+        if response.get('error'):
+            return {'error': response['error']}, response['code']
+        return {'message': 'Habit Created'}, 201
+
+    @app.route("/api/habits/track/<string:habit_name>", methods=["POST"])
+    async def track_habit(request, habit_name):
+        """
+        Start tracking a habit for a user.
+        """
+        user_name = request.json.get('username', None)
+        if user_name is None:
+            return {'message': 'User name is required'}, 400
+
+        habit = AsyncHabit(user_name)
+        response = await habit.track_habit(habit_name)
+        if response.get('error'):
+            return {'error': response['error']}, response['code']
+        return {'message': response['message']}, 200
+
+    @app.route("/api/habits/untrack/<string:habit_name>", methods=["DELETE"])
+    async def untrack_habit(request, habit_name):
+        """
+        Stop tracking a habit for a user.
+        """
+        user_name = request.json.get('username', None)
+        if user_name is None:
+            return {'message': 'User name is required'}, 400
+
+        habit = AsyncHabit(user_name)
+        response = await habit.untrack_habit(habit_name)
+        if response is not None and response['error']:
+            return {'error': response['error']}, response['code']
+        return {'message': 'Habit Untracked'}, 200
+
+    @app.route("/api/habits/check-off/<string:habit_name>", methods=["POST"])
+    async def check_off_habit(request, habit_name):
+        """
+        Check off a habit for a user, once per client "event_id" if the body has one.
+        """
+        user_name = request.json.get('username', None)
+        if user_name is None:
+            return {'message': 'User name is required'}, 400
+
+        habit = AsyncHabit(user_name)
+        response = await habit.check_off_habit(habit_name, event_id=request.json.get('event_id', None))
+        if response.get('error'):
+            return {'error': response['error']}, response['code']
+        return {'message': 'Habit checked off',
+                'current_streak': response['current_streak'],
+                'longest_streak': response['longest_streak'],
+                'duplicate': response.get('duplicate', False)
+                }, 200
+
+    @app.route("/api/habits/check-off/batch", methods=["POST"])
+    async def check_off_habits_batch(request):
+        """
+        Check off a batch of habits. The body is {"events": [{"username": ..., "habit_name": ..., "completed_at": ...}, ...]}.
+        """
+        events = request.json.get('events', None)
+        if not isinstance(events, list):
+            return {'message': 'A list of events is required'}, 400
+        if len(events) > MAX_BATCH_EVENTS:
+            return {'message': f'A batch takes at most {MAX_BATCH_EVENTS} events'}, 413
+
+        habit = AsyncHabit()
+        results = await habit.check_off_many([
+            # Events that are not objects fail on their own with a 400
+            (event.get('username'), event.get('habit_name'), event.get('completed_at')) if isinstance(event, dict) else None
+            for event in events
+        ])
+        checked_off = sum(1 for result in results if not result.get('error'))
+        return {'results': results,
+                'checked_off': checked_off,
+                'failed': len(results) - checked_off
+                }, 200
+
+    @app.route("/api/habits/user/<string:user_name>/streaks/<string:habit_name>", methods=["GET"])
+    async def get_user_streaks(request, user_name, habit_name):
+        """
+        Get the current and longest streaks for a specific habit tracked by a user.
+        """
+        habit = AsyncHabit(user_name)
+        current_streak_data, longest_streak_data = await habit.get_habit_streaks(habit_name)
+        return {'habit_name': habit_name,
+                'user_name': user_name,
+                'current_streak': current_streak_data['current_streak'],
+                'longest_streak': longest_streak_data['longest_streak']
+                }, 200
+
+    @app.route("/api/habits/user/<string:user_name>/timezone", methods=["GET"])
+    async def get_user_timezone(request, user_name):
+        """
+        Get the timezone a user's days and weeks are counted in.
+        """
+        habit = AsyncHabit(user_name)
+        return await habit.get_timezone(), 200
+
+    @app.route("/api/habits/user/<string:user_name>/timezone", methods=["PUT"])
+    async def set_user_timezone(request, user_name):
+        """
+        Set the timezone a user's days and weeks are counted in. The body is {"timezone": "America/New_York"}.
+        """
+        timezone = request.json.get('timezone', None)
+        if timezone is None:
+            return {'message': 'Timezone is required'}, 400
+
+        habit = AsyncHabit(user_name)
+        response = await habit.set_timezone(timezone)
+        if response.get('error'):
+            return {'error': response['error']}, response['code']
+        return {'message': response['message'], 'timezone': response['timezone']}, 200
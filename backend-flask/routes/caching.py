@@ -0,0 +1,64 @@
+import functools
+
+# flask
+from flask import Response, request, make_response
+
+from classes.response_cache import response_cache, user_scope
+
+# Read routes are revalidated by clients on every use, with the ETag they got
+CACHE_CONTROL = 'no-cache'
+
+def cached_response(*scopes, etag_only=None):
+    """
+    Decorates a read route so its responses carry an ETag, requests holding the current ETag are answered
+    with 304 Not Modified without running the route, and its JSON bodies are served from the response cache.
+
+    Only 200 JSON responses are cached. Requests matched by `etag_only` (e.g. streams, whose bodies can be
+    arbitrarily large) are only validated: they get an ETag and 304 answers, but their bodies are never looked up,
+    buffered or stored. Put it below the @app.route decorators.
+
+    Parameters:
+    ----------
+    *scopes : str
+        The data the response depends on: 'catalog', 'streaks', or 'user' for the data of the route's `user_name`.
+    etag_only : callable, optional
+        Takes the request and returns whether its response must not go through the body cache.
+
+    Returns:
+    -------
+    callable
+        The decorator.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**values):
+            if not response_cache.enabled:
+                return view(**values)
+
+            key = f"{request.full_path}|{request.headers.get('Accept', '')}"
+            etag = response_cache.etag(key, tuple(user_scope(values['user_name']) if scope == 'user' else scope for scope in scopes))
+            if request.if_none_match.contains(etag):
+                response_cache.not_modified()
+                response = Response(status=304)
+            elif etag_only is not None and etag_only(request):
+                response = make_response(view(**values))
+                if response.status_code != 200:
+                    return response
+            else:
+                body = response_cache.get(key, etag)
+                if body is not None:
+                    response = Response(body, mimetype='application/json')
+                    response.headers['X-Cache'] = 'HIT'
+                else:
+                    response = make_response(view(**values))
+                    if response.status_code != 200:
+                        return response
+                    if not response.is_streamed and response.mimetype == 'application/json':
+                        response_cache.put(key, etag, response.get_data())
+                    response.headers['X-Cache'] = 'MISS'
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = CACHE_CONTROL
+            response.vary.add('Accept')
+            return response
+        return wrapper
+    return decorator
@@ -3,7 +3,11 @@ from flask import request, g
 from flask_cors import cross_origin
 
 # class
-from classes.habits import Habit
+from classes.habits import MAX_BATCH_EVENTS, Habit
+
+# db
+from db.shards import shard_router
+from routes.caching import cached_response
 
 # This function will load all the habits routes into the Flask app that is passed as a param
 
@@ -17,8 +21,11 @@ def load(app):
     app : Flask
         The Flask application instance where the routes will be registered.
     """
+    # Every request checks out its own connection from the pool of each shard it uses
+    shard_router.init_app(app)
     
     @app.route("/api/habits", methods=["GET"])
+    @cached_response('catalog')
     def get_habits():
         """
         Get all habits.
@@ -35,6 +42,7 @@ def load(app):
         return {'habits': habits}, 200
 
     @app.route("/api/habits/<string:habit_name>", methods=["GET"])
+    @cached_response('catalog')
     def get_habit(habit_name):
         """
         Get a specific habit by name.
@@ -58,6 +66,7 @@ def load(app):
         return {'habit': habit_data}, 200
 
     @app.route("/api/habits/periodicity/<string:periodicity>", methods=["GET"])
+    @cached_response('catalog')
     def get_habit_by_periodicity(periodicity):
         """
         Get habits by periodicity.
@@ -157,7 +166,8 @@ def load(app):
     @app.route("/api/habits/check-off/<string:habit_name>", methods=["POST"])
     def check_off_habit(habit_name):
         """
-        Check off a habit for a user.
+        Check off a habit for a user. The body may carry an "event_id" picked by the client, so retries
+        of the request are answered with the result of the first check-off instead of counting again.
 
         Parameters:
         ----------
@@ -167,7 +177,8 @@ def load(app):
         Returns:
         -------
         dict
-            A success message or an error message if the user name is not provided.
+            A success message, with whether it is a retry of an earlier check-off, or an error message
+            if the user name is not provided.
         int
             The HTTP status code.
         """
@@ -176,12 +187,50 @@ def load(app):
             return {'message': 'User name is required'}, 400
         
         habit = Habit(user_name)
-        response = habit.check_off_habit(habit_name)
-        if response is not None and response['error']:
+        response = habit.check_off_habit(habit_name, event_id=request.json.get('event_id', None))
+        if response.get('error'):
             return {'error': response['error']}, response['code']
-        return {'message': 'Habit checked off'}, 200
+        return {'message': 'Habit checked off',
+                'current_streak': response['current_streak'],
+                'longest_streak': response['longest_streak'],
+                'duplicate': response.get('duplicate', False)
+                }, 200
+
+    @app.route("/api/habits/check-off/batch", methods=["POST"])
+    def check_off_habits_batch():
+        """
+        Check off a batch of habits, e.g. offline check-offs synced by a mobile client.
+        The body is {"events": [{"username": ..., "habit_name": ..., "completed_at": ...}, ...]}.
+
+        At most CHECK_OFF_BATCH_MAX_EVENTS (default 1000) events are taken, larger batches get a 413.
+
+        Returns:
+        -------
+        dict
+            One result per event, in the order of the events, and the number of events checked off and failed.
+        int
+            The HTTP status code.
+        """
+        events = request.json.get('events', None)
+        if not isinstance(events, list):
+            return {'message': 'A list of events is required'}, 400
+        if len(events) > MAX_BATCH_EVENTS:
+            return {'message': f'A batch takes at most {MAX_BATCH_EVENTS} events'}, 413
+
+        habit = Habit()
+        results = habit.check_off_many([
+            # Events that are not objects fail on their own with a 400
+            (event.get('username'), event.get('habit_name'), event.get('completed_at')) if isinstance(event, dict) else None
+            for event in events
+        ])
+        checked_off = sum(1 for result in results if not result.get('error'))
+        return {'results': results,
+                'checked_off': checked_off,
+                'failed': len(results) - checked_off
+                }, 200
 
     @app.route("/api/habits/user/<string:user_name>/streaks/<string:habit_name>", methods=["GET"])
+    @cached_response('catalog', 'user')
     def get_user_streaks(user_name, habit_name):
         """
         Get the current and longest streaks for a specific habit tracked by a user.
@@ -211,3 +260,52 @@ def load(app):
                 'current_streak': current_streak_data['current_streak'],
                 'longest_streak': longest_streak_data['longest_streak']
                 }, 200
+
+    @app.route("/api/habits/user/<string:user_name>/timezone", methods=["GET"])
+    @cached_response('user')
+    def get_user_timezone(user_name):
+        """
+        Get the timezone a user's days and weeks are counted in.
+
+        Parameters:
+        ----------
+        user_name : str
+            The name of the user.
+
+        Returns:
+        -------
+        dict
+            The user's name and timezone (UTC if they never set one).
+        int
+            The HTTP status code.
+        """
+        habit = Habit(user_name)
+        return habit.get_timezone(), 200
+
+    @app.route("/api/habits/user/<string:user_name>/timezone", methods=["PUT"])
+    def set_user_timezone(user_name):
+        """
+        Set the timezone a user's days and weeks are counted in. The body is {"timezone": "America/New_York"}.
+        The user's day and week keys and streaks are recomputed for it.
+
+        Parameters:
+        ----------
+        user_name : str
+            The name of the user.
+
+        Returns:
+        -------
+        dict
+            A success message and the timezone, or an error message if the timezone is missing or unknown.
+        int
+            The HTTP status code.
+        """
+        timezone = request.json.get('timezone', None)
+        if timezone is None:
+            return {'message': 'Timezone is required'}, 400
+
+        habit = Habit(user_name)
+        response = habit.set_timezone(timezone)
+        if response.get('error'):
+            return {'error': response['error']}, response['code']
+        return {'message': response['message'], 'timezone': response['timezone']}, 200
@@ -0,0 +1,106 @@
+import time
+
+# flask
+from flask import Response, request, g
+
+from classes.catalog import habit_catalog
+from classes.leaderboard import leaderboard
+from classes.metrics import metrics
+from classes.response_cache import response_cache
+from db.db import squlite_db
+from db.instrumentation import InstrumentedConnection, RequestProfile, current_profile
+from db.writer import write_coordinator
+
+# Content type of the Prometheus text format
+METRICS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def pool_connections():
+    """
+    Gets the connections of the pool by state.
+    """
+    stats = squlite_db.pool.metrics()
+    return {(('state', 'in_use'),): stats['in_use'], (('state', 'idle'),): stats['idle']}
+
+def cache_counter(name):
+    """
+    Gets a callback reading a counter of every in-process cache that keeps it, labelled by cache.
+    """
+    def callback():
+        caches = {'responses': response_cache.metrics(), 'catalog': habit_catalog.metrics()}
+        return {(('cache', cache),): stats[name] for cache, stats in caches.items()}
+    return callback
+
+def register_collectors():
+    """
+    Declares the metrics read from the counters of the connection pool, the caches and the write coordinator.
+    """
+    metrics.collector('habit_db_pool_connections', 'Connections of the pool, checked out or idle.', pool_connections)
+    metrics.collector('habit_db_pool_size', 'Maximum number of connections checked out at once.', lambda: squlite_db.pool.size)
+    metrics.collector('habit_db_pool_waits_total', 'Checkouts that waited for a free connection.',
+                      lambda: squlite_db.pool.metrics()['waits'], type='counter')
+    metrics.collector('habit_db_pool_wait_seconds_total', 'Seconds spent waiting for a free connection.',
+                      lambda: squlite_db.pool.metrics()['wait_time'], type='counter')
+    metrics.collector('habit_db_pool_timeouts_total', 'Checkouts that gave up waiting for a free connection.',
+                      lambda: squlite_db.pool.metrics()['timeouts'], type='counter')
+    metrics.collector('habit_cache_hits_total', 'Lookups answered from an in-process cache, by cache.', cache_counter('hits'), type='counter')
+    metrics.collector('habit_cache_misses_total', 'Lookups an in-process cache could not answer, by cache.', cache_counter('misses'), type='counter')
+    metrics.collector('habit_response_cache_entries', 'Response bodies in the response cache.', lambda: response_cache.metrics()['entries'])
+    metrics.collector('habit_response_cache_bytes', 'Total size of the response bodies in the response cache.', lambda: response_cache.metrics()['bytes'])
+    metrics.collector('habit_leaderboard_entries', 'Tracked habits ranked by the in-memory leaderboards.', lambda: leaderboard.metrics()['entries'])
+    metrics.collector('habit_write_queue_depth', 'Writes waiting in the write coordinator queue.', lambda: write_coordinator.metrics()['queue_depth'])
+
+# This function will load the metrics route and hooks into the Flask app that is passed as a param
+def load(app):
+    """
+    Load the /metrics route into the given Flask application, and, when METRICS is enabled,
+    the hooks recording the latency and the rows of every request.
+
+    Parameters:
+    ----------
+    app : Flask
+        The Flask application instance where the route and hooks will be registered.
+    """
+    register_collectors()
+
+    if metrics.enabled:
+        # The rows of a request are counted by its profile, which only instrumented connections fill
+        counts_rows = issubclass(squlite_db.pool.factory, InstrumentedConnection)
+
+        @app.before_request
+        def start_timer():
+            g._metrics_started = time.perf_counter()
+            if counts_rows and current_profile.get() is None:
+                g._metrics_profile_token = current_profile.set(RequestProfile(request.endpoint))
+
+        @app.after_request
+        def record_request(response):
+            started = g.get('_metrics_started')
+            if started is not None:
+                # Requests matching no route are counted together, so unknown URLs don't make new series
+                route = request.endpoint or 'unmatched'
+                metrics.observe('habit_http_request_duration_seconds', time.perf_counter() - started,
+                                route=route, method=request.method, status=response.status_code)
+                profile = current_profile.get()
+                if profile is not None:
+                    metrics.observe('habit_http_request_rows', profile.rows, route=route)
+            metrics.maybe_flush()
+            return response
+
+        @app.teardown_request
+        def end_profile(exception=None):
+            token = g.pop('_metrics_profile_token', None)
+            if token is not None:
+                current_profile.reset(token)
+
+    @app.route("/metrics", methods=["GET"])
+    def get_metrics():
+        """
+        Get the metrics of every worker process, in the Prometheus text format.
+
+        Returns:
+        -------
+        Response
+            The request, statement, commit and lock wait latency histograms, the busy errors,
+            and the pool, cache and write queue occupancy.
+        """
+        return Response(metrics.export(), content_type=METRICS_MIMETYPE)
@@ -0,0 +1,89 @@
+import atexit
+import json
+import logging
+import os
+
+# flask
+from flask import request, g
+
+from classes.sampler import stack_sampler
+from db.instrumentation import RequestProfile, current_profile
+
+def server_timing(summary):
+    """
+    Builds the Server-Timing header of a request profile: the time spent in SQLite, the rest of the
+    time spent in the app, and the total.
+
+    Parameters:
+    ----------
+    summary : dict
+        The summary of the request profile.
+
+    Returns:
+    -------
+    str
+        The header value, e.g. 'sql;dur=1.2;desc="3 statements, 10 rows", app;dur=0.8, total;dur=2.0'.
+    """
+    app_ms = max(summary['duration_ms'] - summary['sql_ms'], 0.0)
+    return (f'sql;dur={summary["sql_ms"]};desc="{summary["statements"]} statements, {summary["rows"]} rows", '
+            f'app;dur={round(app_ms, 3)}, total;dur={summary["duration_ms"]}')
+
+# This function will load the profiling hooks into the Flask app that is passed as a param
+def load(app):
+    """
+    Load the request profiling hooks into the given Flask application.
+
+    Nothing is registered unless request profiling (REQUEST_PROFILING) or the stack sampler
+    (PROFILE_SAMPLER) is enabled, so requests pay nothing for them otherwise.
+
+    Parameters:
+    ----------
+    app : Flask
+        The Flask application instance where the hooks will be registered.
+    """
+    profiling = os.getenv("REQUEST_PROFILING", "0").lower() in ("1", "true", "yes")
+    if not profiling and not stack_sampler.enabled:
+        return
+
+    # The profile lines are logged at INFO, which Flask's logger drops unless its level is set
+    if profiling and app.logger.level == logging.NOTSET:
+        app.logger.setLevel(logging.INFO)
+
+    # The flame data of each endpoint is written to PROFILE_DIR when the worker exits
+    if stack_sampler.enabled and os.getenv("PROFILE_DIR"):
+        atexit.register(stack_sampler.dump, os.getenv("PROFILE_DIR"))
+
+    @app.before_request
+    def start_profile():
+        name = request.endpoint or request.path
+        if profiling:
+            g._profile_token = current_profile.set(RequestProfile(name))
+        stack_sampler.begin(name)
+
+    @app.after_request
+    def finish_profile(response):
+        """
+        Add the Server-Timing header to the response and log the profile of the request as one JSON line.
+
+        The SQL of streamed bodies runs after this hook, so it is not part of the profile.
+        """
+        stack_sampler.end()
+        profile = current_profile.get()
+        if profile is not None:
+            summary = profile.summary()
+            response.headers['Server-Timing'] = server_timing(summary)
+            app.logger.info(json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                **summary,
+            }))
+        return response
+
+    @app.teardown_request
+    def end_profile(exception=None):
+        # Also runs when the route raised, in which case after_request did not
+        stack_sampler.end()
+        token = g.pop('_profile_token', None)
+        if token is not None:
+            current_profile.reset(token)
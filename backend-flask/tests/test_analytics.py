@@ -1,3 +1,4 @@
+import json
 import os
 import pytest
 import tempfile
@@ -110,3 +111,120 @@ def test_get_all_habits_tracked_timestamps_no_habit(client):
     data = response.get_json()
     assert 'message' in data
     assert data['message'] == 'Habit not found'
+
+def test_get_all_habits_tracked_timestamps_pages(client):
+    """Test paging through the tracked timestamps with a keyset cursor."""
+    response = client.get("/api/analytics/user/Alice/tracked-timestamps/Read?limit=5")
+    assert response.status_code == 200
+    data = response.get_json()['data']
+    assert len(data['timestamps']) == 5
+    assert data['timestamps'][0]['completed_at'] == '2024-07-13 09:00:00'
+
+    timestamps = data['timestamps']
+    while data['next_before'] is not None:
+        response = client.get(f"/api/analytics/user/Alice/tracked-timestamps/Read?limit=5&before={data['next_before']}")
+        data = response.get_json()['data']
+        timestamps += data['timestamps']
+
+    assert len(timestamps) == 12
+    assert timestamps == sorted(timestamps, key=lambda timestamp: timestamp['completed_at'], reverse=True)
+
+def test_get_all_habits_tracked_timestamps_invalid_limit(client):
+    """Test that an invalid page size is rejected."""
+    response = client.get("/api/analytics/user/Alice/tracked-timestamps/Read?limit=0")
+    assert response.status_code == 400
+
+def test_get_all_habits_tracked_timestamps_invalid_before(client):
+    """Test that a cursor that is not a timestamp is rejected."""
+    response = client.get("/api/analytics/user/Alice/tracked-timestamps/Read?before=yesterday")
+    assert response.status_code == 400
+
+def test_get_all_habits_tracked_timestamps_stream(client):
+    """Test streaming the tracked timestamps as newline-delimited JSON."""
+    response = client.get("/api/analytics/user/Alice/tracked-timestamps/Read?stream=1")
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = response.get_data(as_text=True).splitlines()
+    assert len(lines) == 12
+    assert json.loads(lines[0]) == {'completed_at': '2024-07-13 09:00:00'}
+
+    response = client.get("/api/analytics/user/Alice/tracked-timestamps/Read?before=2024-07-10 09:00:00",
+                          headers={'Accept': 'application/x-ndjson'})
+    assert len(response.get_data(as_text=True).splitlines()) == 8
+
+def test_get_user_summary(client):
+    """Test the dashboard summary of a user, before and after a check-off."""
+    response = client.get("/api/analytics/user/Alice/summary")
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['totals']['tracked_habits'] == 2
+    assert data['totals']['completions'] == 15
+    assert data['totals']['best_streak'] == 8
+
+    read = next(habit for habit in data['habits'] if habit['habit_name'] == 'Read')
+    assert read['completions'] == 12
+    assert read['first_completed_at'] == '2024-06-29 09:00:00'
+    assert read['last_completed_at'] == '2024-07-13 09:00:00'
+    assert read['completion_rate_7d'] == 0
+
+    client.post("/api/habits/check-off/Read", json={'username': 'Alice'})
+    data = client.get("/api/analytics/user/Alice/summary").get_json()
+    read = next(habit for habit in data['habits'] if habit['habit_name'] == 'Read')
+    assert read['completions'] == 13
+    assert read['completion_rate_7d'] == round(1 / 7, 4)
+    assert read['completion_rate_30d'] == round(1 / 30, 4)
+    assert data['totals']['completions_7d'] == 1
+
+def test_get_user_summary_no_user(client):
+    """Test the summary of a user that tracks no habits."""
+    response = client.get("/api/analytics/user/nonexistentuser/summary")
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['totals']['tracked_habits'] == 0
+    assert data['habits'] == []
+
+def test_get_user_heatmap(client):
+    """Test the daily and weekly completion counts of a user's habits."""
+    response = client.get("/api/analytics/user/Alice/heatmap?start=2024-07-08&end=2024-07-14")
+    assert response.status_code == 200
+    data = response.get_json()['data']
+    assert (data['start'], data['end'], data['bucket']) == ('2024-07-08', '2024-07-14', 'day')
+    assert data['habits'] == [
+        {'habit': 'Read', 'periodicity': 'DAILY', 'counts': [0, 0, 1, 1, 1, 1, 0]},
+        {'habit': 'Exercise', 'periodicity': 'WEEKLY', 'counts': [0, 0, 0, 0, 0, 1, 0]},
+    ]
+    assert data['totals'] == [0, 0, 1, 1, 1, 2, 0]
+
+    # Weeks start on the Monday of the first day's week
+    data = client.get("/api/analytics/user/Alice/heatmap/Read?start=2024-06-30&end=2024-07-14&bucket=week").get_json()['data']
+    assert data['start'] == '2024-06-24'
+    assert data['habits'] == [{'habit': 'Read', 'periodicity': 'DAILY', 'counts': [2, 6, 4]}]
+
+    client.post("/api/habits/check-off/batch", json={'events': [
+        {'username': 'Alice', 'habit_name': 'Read', 'completed_at': '2024-07-14 09:00:00'}]})
+    data = client.get("/api/analytics/user/Alice/heatmap/Read?start=2024-07-08&end=2024-07-14").get_json()['data']
+    assert data['totals'] == [0, 0, 1, 1, 1, 1, 1]
+
+def test_get_user_heatmap_without_rollup(client, monkeypatch):
+    """Test that grouping the raw completions by day gives the same heatmaps as the daily rollup."""
+    urls = [
+        "/api/analytics/user/Alice/heatmap?start=2024-06-01&end=2024-07-31",
+        "/api/analytics/user/Bob/heatmap?start=2024-06-01&end=2024-07-31&bucket=week",
+        "/api/analytics/user/Bob/heatmap/Park%20Walk?start=2024-06-10&end=2024-07-06",
+        "/api/analytics/user/Carol/heatmap",
+    ]
+    expected = [client.get(url).get_json() for url in urls]
+    monkeypatch.setattr('classes.analytics.HEATMAP_USE_ROLLUP', False)
+    assert [client.get(url).get_json() for url in urls] == expected
+
+def test_get_user_heatmap_errors(client):
+    """Test heatmaps of unknown or untracked habits and invalid ranges."""
+    assert client.get("/api/analytics/user/Alice/heatmap/Unknown").status_code == 404
+    assert client.get("/api/analytics/user/Alice/heatmap/Journal").get_json()['message'] == 'Habit Not Tracked By User'
+    assert client.get("/api/analytics/user/Alice/heatmap?bucket=month").status_code == 400
+    assert client.get("/api/analytics/user/Alice/heatmap?start=07/01/2024").status_code == 400
+    assert client.get("/api/analytics/user/Alice/heatmap?start=2024-07-14&end=2024-07-01").status_code == 400
+    assert client.get("/api/analytics/user/Alice/heatmap?start=2000-01-01&end=2024-07-01").status_code == 400
+
+    data = client.get("/api/analytics/user/nonexistentuser/heatmap").get_json()['data']
+    assert data['habits'] == [] and len(data['totals']) == 365
@@ -0,0 +1,152 @@
+import asyncio
+import os
+import threading
+import pytest
+from flask import Flask
+from db.db import SqliteDB, squlite_db
+from db.executor import DBExecutor, db_executor
+from routes.asgi import AsyncApp
+from routes.analytics import load as load_analytics
+from routes.habits import load as load_habits
+from routes.async_analytics import load as load_async_analytics
+from routes.async_habits import load as load_async_habits
+
+@pytest.fixture
+def app():
+    """Create a Flask app and seed the database."""
+    app = Flask(__name__)
+    app.config.update({
+        "TESTING": True,
+        "DATABASE": os.getenv("DB_FILE_NAME")
+    })
+
+    # Load the schema and seed the database
+    with app.app_context():
+        with open(os.path.join(os.path.dirname(__file__), '../db/sql/schema.sql'), 'r') as f:
+            SqliteDB().cursor.executescript(f.read())
+        with open(os.path.join(os.path.dirname(__file__), '../db/sql/seed.sql'), 'r') as f:
+            SqliteDB().cursor.executescript(f.read())
+
+    load_analytics(app)
+    load_habits(app)
+
+    yield app
+
+@pytest.fixture
+def client(app):
+    """A test client for the Flask app."""
+    return app.test_client()
+
+@pytest.fixture
+def async_client(app):
+    """A test client for an ASGI app with the same routes, on the same database."""
+    async_app = AsyncApp()
+    load_async_habits(async_app)
+    load_async_analytics(async_app)
+    yield async_app.test_client()
+    db_executor.shutdown()
+
+def test_async_routes_match_wsgi_routes(client, async_client):
+    """Test that the async routes answer read requests exactly like the Flask routes."""
+    urls = [
+        "/api/habits",
+        "/api/habits/Read",
+        "/api/habits/Unknown",
+        "/api/habits/periodicity/WEEKLY",
+        "/api/habits/user/Alice/streaks/Read",
+        "/api/analytics/habits/tracking/Bob",
+        "/api/analytics/user/Bob/longest-streak",
+        "/api/analytics/user/Alice/longest-streak/Read",
+        "/api/analytics/user/Alice/longest-streak/Unknown",
+        "/api/analytics/user/Bob/summary",
+        "/api/analytics/user/Alice/heatmap?start=2024-06-01&end=2024-07-14",
+        "/api/analytics/user/Bob/heatmap/Park%20Walk?start=2024-06-01&end=2024-07-14&bucket=week",
+        "/api/analytics/user/Alice/heatmap/Journal",
+        "/api/analytics/user/Alice/heatmap?bucket=month",
+        "/api/analytics/leaderboard",
+        "/api/analytics/leaderboard/Exercise?metric=current&limit=1",
+        "/api/analytics/leaderboard?limit=1000",
+        "/api/analytics/user/Bob/rank",
+        "/api/analytics/user/Alice/rank/Journal",
+        "/api/analytics/habits/stats",
+        "/api/analytics/user/Alice/tracked-timestamps/Read",
+        "/api/analytics/user/Alice/tracked-timestamps/Read?limit=3",
+        "/api/analytics/user/Alice/tracked-timestamps/Read?limit=0",
+        "/api/analytics/user/Bob/tracked-timestamps/Park%20Walk?before=2024-07-01%2000:00:00",
+    ]
+    for url in urls:
+        expected = client.get(url)
+        response = asyncio.run(async_client.get(url))
+        assert response.status_code == expected.status_code, url
+        assert response.get_json() == expected.get_json(), url
+
+def test_async_stream_matches_wsgi_stream(client, async_client, monkeypatch):
+    """Test that streamed timestamps are the same in both serving modes, also across chunks."""
+    monkeypatch.setattr('routes.async_analytics.STREAM_CHUNK_SIZE', 2)
+    for url in ["/api/analytics/user/Alice/tracked-timestamps/Read?stream=1",
+                "/api/analytics/user/Alice/tracked-timestamps/Read?stream=1&limit=5"]:
+        expected = client.get(url)
+        response = asyncio.run(async_client.get(url))
+        assert response.mimetype == 'application/x-ndjson'
+        assert response.data == expected.data
+
+    response = asyncio.run(async_client.get("/api/analytics/user/Alice/tracked-timestamps/Read",
+                                            headers={'Accept': 'application/x-ndjson'}))
+    assert response.data == client.get("/api/analytics/user/Alice/tracked-timestamps/Read?stream=1").data
+
+def test_async_writes(async_client):
+    """Test tracking, checking off and untracking a habit through the async routes."""
+    async def scenario():
+        response = await async_client.post("/api/habits/track/Meditate", json={'username': 'Carol'})
+        assert response.status_code == 200
+        response = await async_client.post("/api/habits/check-off/Meditate", json={'username': 'Carol'})
+        assert response.get_json()['current_streak'] == 1
+        response = await async_client.post("/api/habits/check-off/Meditate", json={'username': 'Carol'})
+        assert response.status_code == 400
+        response = await async_client.post("/api/habits/check-off/batch", json={'events': [
+            {'username': 'Carol', 'habit_name': 'Meditate', 'completed_at': '2020-01-01 09:00:00'},
+            {'username': 'Carol'},
+            {'username': 5, 'habit_name': 'Meditate', 'completed_at': '2020-01-02 09:00:00'},
+        ]})
+        assert [result.get('code') for result in response.get_json()['results']] == [None, 400, 400]
+        response = await async_client.post("/api/habits/create", json={'habit_name': 'Stretch', 'description': 'Stretch', 'periodicity': 'DAILY'})
+        assert response.status_code == 201
+        response = await async_client.delete("/api/habits/untrack/Meditate", json={'username': 'Carol'})
+        assert response.status_code == 200
+        response = await async_client.get("/api/analytics/habits/tracking/Carol")
+        assert response.get_json()['trackedHabits'] == []
+    asyncio.run(scenario())
+
+def test_async_request_errors(async_client):
+    """Test unknown URLs, wrong methods and bodies that are not JSON."""
+    assert asyncio.run(async_client.get("/api/unknown")).status_code == 404
+    assert asyncio.run(async_client.delete("/api/habits")).status_code == 405
+    assert asyncio.run(async_client.post("/api/habits/track/Read")).status_code == 415
+
+def test_concurrent_requests_use_bounded_threads(async_client):
+    """Test that many requests in flight are served by the executor's fixed set of threads and connections."""
+    async def burst():
+        return await asyncio.gather(*[async_client.get(f"/api/analytics/user/{name}/summary")
+                                      for name in ['Alice', 'Bob'] * 250])
+
+    threads_before = threading.active_count()
+    responses = asyncio.run(burst())
+    assert all(response.status_code == 200 for response in responses)
+    assert threading.active_count() - threads_before <= db_executor.readers + 1
+    assert squlite_db.pool.metrics()['in_use'] == 0
+
+def test_executor_writes_on_a_single_thread(tmp_path):
+    """Test that writes run one at a time on the writer thread and reads on reader threads."""
+    db = SqliteDB(str(tmp_path / 'executor.db'))
+    executor = DBExecutor(db, readers=3)
+
+    async def run():
+        writes = await asyncio.gather(*[executor.write(lambda: threading.current_thread().name) for _ in range(20)])
+        reads = await asyncio.gather(*[executor.read(lambda: threading.current_thread().name) for _ in range(20)])
+        return writes, reads
+
+    writes, reads = asyncio.run(run())
+    executor.shutdown()
+    assert len(set(writes)) == 1 and writes[0].startswith('db-writer')
+    assert all(name.startswith('db-reader') for name in reads)
+    assert len(set(reads)) <= 3
@@ -0,0 +1,60 @@
+import os
+import sqlite3
+import pytest
+from flask import Flask
+from db.db import SqliteDB, squlite_db
+from classes.catalog import HabitCatalog
+from classes.habits import Habit
+
+@pytest.fixture
+def app():
+    """Create an app on a freshly seeded database."""
+    app = Flask(__name__)
+    app.config.update({"TESTING": True})
+
+    with app.app_context():
+        with open(os.path.join(os.path.dirname(__file__), '../db/sql/schema.sql'), 'r') as f:
+            SqliteDB().cursor.executescript(f.read())
+        with open(os.path.join(os.path.dirname(__file__), '../db/sql/seed.sql'), 'r') as f:
+            SqliteDB().cursor.executescript(f.read())
+
+    squlite_db.init_app(app)
+    yield app
+
+def test_catalog_lookups(app):
+    """Test looking habits up by name, id and periodicity."""
+    catalog = HabitCatalog(squlite_db, check_interval=60)
+    with app.app_context():
+        assert len(catalog.all()) == 5
+        assert catalog.by_name('Read')['periodicity'] == 'DAILY'
+        assert catalog.by_id(catalog.by_name('Exercise')['id'])['name'] == 'Exercise'
+        assert {habit['name'] for habit in catalog.by_periodicity('WEEKLY')} == {'Exercise', 'Park Walk'}
+        assert catalog.by_name('NonExistentHabit') is None
+
+    metrics = catalog.metrics()
+    assert metrics['misses'] == 1
+    assert metrics['hits'] == 5
+    assert metrics['reloads'] == 1
+
+def test_catalog_sees_writes_of_other_processes(app):
+    """Test that a habit inserted through another connection shows up once the version is checked."""
+    catalog = HabitCatalog(squlite_db, check_interval=0)
+    with app.app_context():
+        assert catalog.by_name('Stretch') is None
+
+        connection = sqlite3.connect(os.getenv("DB_FILE_NAME"))
+        connection.execute("INSERT INTO habits (name, periodicity) VALUES ('Stretch', 'DAILY')")
+        connection.commit()
+        connection.close()
+
+        assert catalog.by_name('Stretch') is not None
+        assert catalog.metrics()['reloads'] == 2
+
+def test_create_habit_updates_catalog(app):
+    """Test that a habit created through the Habit class is visible right away."""
+    with app.app_context():
+        habit = Habit()
+        assert habit.get_habit('Stretch').get('error')
+        habit.create_habit('Stretch', 'Stretch for ten minutes', 'DAILY')
+        assert habit.get_habit('Stretch')['description'] == 'Stretch for ten minutes'
+        assert habit.create_habit('Stretch', 'Again', 'DAILY')['code'] == 400
@@ -0,0 +1,105 @@
+import threading
+import pytest
+from flask import Flask
+from db.db import SqliteDB, ConnectionPool, PoolTimeoutError, rows_to_dicts
+
+@pytest.fixture
+def pool(tmp_path):
+    """Create a small pool on a temporary database file."""
+    pool = ConnectionPool(str(tmp_path / 'pool.db'), size=2, timeout=0.05)
+    yield pool
+    pool.close()
+
+def test_pool_reuses_released_connection(pool):
+    """Test that a returned connection is handed out again."""
+    conn = pool.acquire()
+    pool.release(conn)
+    assert pool.acquire() is conn
+    metrics = pool.metrics()
+    assert metrics['checkouts'] == 2
+    assert metrics['misses'] == 1
+    assert metrics['hits'] == 1
+
+def test_pool_is_bounded(pool):
+    """Test that checking out more connections than the pool size times out."""
+    first = pool.acquire()
+    pool.acquire()
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+    metrics = pool.metrics()
+    assert metrics['waits'] == 1
+    assert metrics['timeouts'] == 1
+    assert metrics['in_use'] == 2
+
+    pool.release(first)
+    assert pool.acquire() is first
+
+def test_pool_connection_settings(pool):
+    """Test that new connections are in WAL mode with a busy timeout."""
+    conn = pool.acquire()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+    assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == pool.busy_timeout
+
+def test_pool_rolls_back_open_transaction(pool):
+    """Test that a transaction left open by a caller is rolled back on release."""
+    conn = pool.acquire()
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.commit()
+    conn.execute("INSERT INTO t VALUES (1)")
+    pool.release(conn)
+    assert not conn.in_transaction
+    assert pool.acquire().execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+
+def test_each_request_gets_its_own_connection(tmp_path):
+    """Test that app contexts check out their own connection and return it on teardown."""
+    db = SqliteDB(str(tmp_path / 'app.db'))
+    app = Flask(__name__)
+    db.init_app(app)
+    db.init_app(app)
+
+    with app.app_context():
+        outer = db.conn
+        assert db.conn is outer
+        assert db.cursor.connection is outer
+        with app.app_context():
+            assert db.conn is not outer
+        assert db.pool.metrics()['in_use'] == 1
+    assert db.pool.metrics()['in_use'] == 0
+
+def test_each_thread_gets_its_own_connection(tmp_path):
+    """Test that threads outside of a request do not share a connection."""
+    db = SqliteDB(str(tmp_path / 'threads.db'))
+    connections = []
+
+    def worker():
+        connections.append(db.conn)
+        db.release_thread_connection()
+
+    threads = [threading.Thread(target=worker) for _ in range(2)]
+    main_conn = db.conn
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert main_conn not in connections
+    db.release_thread_connection()
+    assert db.pool.metrics()['in_use'] == 0
+
+def test_row_modes(tmp_path):
+    """Test that cursors return rows as dicts by default and in the requested mode otherwise."""
+    db = SqliteDB(str(tmp_path / 'rows.db'))
+    db.conn.execute("CREATE TABLE t (a INTEGER, b TEXT)")
+    db.conn.executemany("INSERT INTO t VALUES (?, ?)", [(1, 'x'), (2, 'y')])
+
+    assert db.cursor.execute("SELECT * FROM t").fetchall() == [{'a': 1, 'b': 'x'}, {'a': 2, 'b': 'y'}]
+    assert db.cursor.execute("SELECT b FROM t").fetchone() == {'b': 'x'}
+    assert db.conn.execute("SELECT a AS c FROM t").fetchone() == {'c': 1}
+    assert db.cursor_for('tuple').execute("SELECT * FROM t").fetchall() == [(1, 'x'), (2, 'y')]
+    assert db.cursor_for('row').execute("SELECT * FROM t").fetchone()['b'] == 'x'
+    assert db.cursor_for('namedtuple').execute("SELECT * FROM t").fetchone().b == 'x'
+
+    cur = db.cursor_for('tuple')
+    rows = cur.execute("SELECT * FROM t").fetchall()
+    assert rows_to_dicts(cur, rows) == [{'a': 1, 'b': 'x'}, {'a': 2, 'b': 'y'}]
+    db.release_thread_connection()
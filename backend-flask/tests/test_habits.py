@@ -1,8 +1,11 @@
 import os
+import datetime
 import pytest
 import tempfile
 from flask import Flask
-from db.db import SqliteDB
+from db.db import SqliteDB, squlite_db
+from classes.check_off_events import recent_check_offs
+from classes.habits import MAX_BATCH_EVENTS, Habit
 from routes.habits import load as load_habits
 
 @pytest.fixture
@@ -111,4 +114,233 @@ def test_check_off_habit(client):
     response = client.post("/api/habits/check-off/Read", json={'username': 'testuser'})
     assert response.status_code == 200
     data = response.get_json()
-    assert data['message'] == 'Habit checked off'
\ No newline at end of file
+    assert data['message'] == 'Habit checked off'
+
+def test_check_off_habit_twice_in_a_day(client):
+    """Test that a daily habit can only be checked off once a day."""
+    client.post("/api/habits/track/Read", json={'username': 'testuser'})
+    client.post("/api/habits/check-off/Read", json={'username': 'testuser'})
+    response = client.post("/api/habits/check-off/Read", json={'username': 'testuser'})
+    assert response.status_code == 400
+    data = response.get_json()
+    assert data['error'] == 'Habit already checked off today'
+
+def test_check_off_habit_not_tracked(client):
+    """Test checking off a habit the user does not track."""
+    response = client.post("/api/habits/check-off/Read", json={'username': 'testuser'})
+    assert response.status_code == 404
+    data = response.get_json()
+    assert data['error'] == 'Habit Not Tracked By User'
+
+def test_check_off_habit_streaks(app):
+    """Test that consecutive periods extend the streak and a gap resets it."""
+    with app.app_context():
+        habit = Habit('testuser')
+        habit.track_habit('Read')
+        habit.track_habit('Exercise')
+
+        for day in (1, 2, 3, 5):
+            response = habit.check_off_habit('Read', datetime.datetime(2024, 8, day, 9, 0, 0))
+        assert response['current_streak'] == 1
+        assert response['longest_streak'] == 3
+
+        # 2024-08-05 and 2024-08-11 are the Monday and Sunday of the same week
+        habit.check_off_habit('Exercise', datetime.datetime(2024, 7, 31, 18, 0, 0))
+        response = habit.check_off_habit('Exercise', datetime.datetime(2024, 8, 5, 18, 0, 0))
+        assert response['current_streak'] == 2
+        response = habit.check_off_habit('Exercise', datetime.datetime(2024, 8, 11, 18, 0, 0))
+        assert response['error'] == 'Habit already checked off this week'
+
+def test_check_off_stores_completion_keys(app):
+    """Test that check-offs store the epoch, day and week keys of their completion time."""
+    with app.app_context():
+        habit = Habit('testuser')
+        habit.track_habit('Read')
+        habit.check_off_habit('Read', datetime.datetime(2024, 8, 4, 23, 59, 59))
+        Habit().check_off_many([('testuser', 'Read', '2024-08-05 00:00:00')])
+
+        rows = squlite_db.cursor_for('tuple').execute(
+            """SELECT completed_at, completed_epoch, day_key, iso_week_key FROM habit_tracker
+               WHERE user_habit_id = (SELECT id FROM user_habits WHERE user_name = 'testuser') ORDER BY completed_epoch"""
+        ).fetchall()
+
+    # Sunday 2024-08-04 and Monday 2024-08-05 are consecutive days of different weeks
+    assert rows == [('2024-08-04 23:59:59', 1722815999, 19939, 2848),
+                    ('2024-08-05 00:00:00', 1722816000, 19940, 2849)]
+
+def test_set_timezone_rekeys_history_and_streaks(client, app):
+    """Test that setting a timezone moves the user's completions to their local days and recomputes their streaks."""
+    utc = datetime.timezone.utc
+    with app.app_context():
+        habit = Habit('testuser')
+        habit.track_habit('Read')
+        habit.check_off_habit('Read', datetime.datetime(2024, 8, 1, 12, 0, 0, tzinfo=utc))
+        # 22:00 on August 2nd in New York, but already August 3rd in UTC
+        response = habit.check_off_habit('Read', datetime.datetime(2024, 8, 3, 2, 0, 0, tzinfo=utc))
+        assert (response['current_streak'], response['longest_streak']) == (1, 1)
+
+    assert client.get("/api/habits/user/testuser/timezone").json == {'user_name': 'testuser', 'timezone': 'UTC'}
+    response = client.put("/api/habits/user/testuser/timezone", json={'timezone': 'America/New_York'})
+    assert response.status_code == 200
+    assert response.json == {'message': 'Timezone updated', 'timezone': 'America/New_York'}
+    assert client.get("/api/habits/user/testuser/timezone").json['timezone'] == 'America/New_York'
+
+    response = client.get("/api/habits/user/testuser/streaks/Read")
+    assert (response.json['current_streak'], response.json['longest_streak']) == (2, 2)
+    with app.app_context():
+        cur = squlite_db.cursor_for('tuple')
+        rows = cur.execute(
+            """SELECT completed_at, day_key FROM habit_tracker
+               WHERE user_habit_id = (SELECT id FROM user_habits WHERE user_name = 'testuser') ORDER BY completed_epoch"""
+        ).fetchall()
+        days = cur.execute(
+            "SELECT day FROM user_habit_daily WHERE user_habit_id = (SELECT id FROM user_habits WHERE user_name = 'testuser') ORDER BY day"
+        ).fetchall()
+        # Another check-off on the same local day is refused
+        response = Habit('testuser').check_off_habit('Read', datetime.datetime(2024, 8, 2, 23, 30, 0))
+        assert response['error'] == 'Habit already checked off today'
+
+    # Completion times stay in UTC
+    assert rows == [('2024-08-01 12:00:00', 19936), ('2024-08-03 02:00:00', 19937)]
+    assert days == [('2024-08-01',), ('2024-08-02',)]
+
+def test_set_unknown_timezone(client):
+    """Test that unknown timezones are refused."""
+    response = client.put("/api/habits/user/testuser/timezone", json={'timezone': 'Mars/Olympus_Mons'})
+    assert response.status_code == 400
+    assert response.json['error'] == 'Unknown timezone'
+    response = client.put("/api/habits/user/testuser/timezone", json={})
+    assert response.status_code == 400
+
+def test_check_off_with_event_id_is_idempotent(client, app):
+    """Test that retries of a check-off with the same event ID get its result without counting again."""
+    recent_check_offs.clear()
+    client.post("/api/habits/track/Read", json={'username': 'testuser'})
+
+    response = client.post("/api/habits/check-off/Read", json={'username': 'testuser', 'event_id': 'phone-1'})
+    assert response.status_code == 200
+    assert (response.json['current_streak'], response.json['duplicate']) == (1, False)
+    response = client.post("/api/habits/check-off/Read", json={'username': 'testuser', 'event_id': 'phone-1'})
+    assert response.status_code == 200
+    assert (response.json['current_streak'], response.json['duplicate']) == (1, True)
+    assert recent_check_offs.metrics()['hits'] == 1
+
+    with app.app_context():
+        # A retry this process doesn't remember is found by the lookup, even on another day
+        recent_check_offs.clear()
+        habit = Habit('testuser')
+        statements = []
+        habit.con.set_trace_callback(statements.append)
+        tomorrow = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=1)
+        response = habit.check_off_habit('Read', tomorrow, event_id='phone-1')
+        habit.con.set_trace_callback(None)
+        rows = squlite_db.cursor_for('tuple').execute(
+            "SELECT COUNT(*) FROM habit_tracker WHERE user_habit_id = (SELECT id FROM user_habits WHERE user_name = 'testuser')"
+        ).fetchone()
+
+    assert response == {'message': 'Habit checked off', 'current_streak': 1, 'longest_streak': 1, 'duplicate': True}
+    # The lookup found it, so nothing was written
+    assert not [sql for sql in statements if sql.lstrip().startswith(('INSERT', 'UPDATE'))]
+    assert rows == (1,)
+
+    # Once a later check-off moved the streaks on, a retry still gets the streaks of the first one
+    tomorrow = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=1)
+    with app.app_context():
+        assert Habit('testuser').check_off_habit('Read', tomorrow)['current_streak'] == 2
+    recent_check_offs.clear()
+    response = client.post("/api/habits/check-off/Read", json={'username': 'testuser', 'event_id': 'phone-1'})
+    assert (response.json['current_streak'], response.json['longest_streak'], response.json['duplicate']) == (1, 1, True)
+
+def test_check_off_with_invalid_event_id(client):
+    """Test that event IDs must be short strings."""
+    client.post("/api/habits/track/Read", json={'username': 'testuser'})
+    for event_id in (12, '', 'x' * 65):
+        response = client.post("/api/habits/check-off/Read", json={'username': 'testuser', 'event_id': event_id})
+        assert response.status_code == 400
+
+def test_check_off_habit_is_one_transaction(app):
+    """Test that a check-off runs at most three statements and commits once."""
+    with app.app_context():
+        habit = Habit('Alice')
+        statements = []
+        habit.con.set_trace_callback(statements.append)
+        response = habit.check_off_habit('Read')
+        habit.con.set_trace_callback(None)
+
+    assert response['message'] == 'Habit checked off'
+    # Habit lookups are answered by the habit catalog, outside of the transaction.
+    # Statements run by triggers are reported with the SQL of the statement that fired them.
+    transaction = [sql for i, sql in enumerate(statements) if i == 0 or sql != statements[i - 1]]
+    transaction = transaction[transaction.index('BEGIN IMMEDIATE'):]
+    queries = [sql for sql in transaction if not sql.startswith(('BEGIN', 'COMMIT'))]
+    assert len(queries) <= 3
+    assert transaction[-1] == 'COMMIT'
+    assert statements.count('COMMIT') == 1
+
+def test_check_off_batch(client):
+    """Test checking off a batch of events for several users, out of order."""
+    client.post("/api/habits/track/Read", json={'username': 'testuser'})
+    response = client.post("/api/habits/check-off/batch", json={'events': [
+        {'username': 'testuser', 'habit_name': 'Read', 'completed_at': '2024-08-03 09:00:00'},
+        {'username': 'testuser', 'habit_name': 'Read', 'completed_at': '2024-08-01 09:00:00'},
+        {'username': 'testuser', 'habit_name': 'Read', 'completed_at': '2024-08-02T21:30:00'},
+        {'username': 'testuser', 'habit_name': 'Read', 'completed_at': '2024-08-02 07:00:00'},
+        {'username': 'Bob', 'habit_name': 'Exercise', 'completed_at': '2024-07-15 18:00:00'},
+        {'username': 'Bob', 'habit_name': 'Read', 'completed_at': '2024-07-15 18:00:00'},
+        {'username': 'Bob', 'habit_name': 'NonExistentHabit', 'completed_at': '2024-07-15 18:00:00'},
+        {'username': 'Bob', 'habit_name': 'Exercise'},
+    ]})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['checked_off'] == 4
+    assert data['failed'] == 4
+
+    results = data['results']
+    assert [result.get('code') for result in results] == [None, None, 400, None, None, 404, 404, 400]
+    assert results[0]['current_streak'] == 3
+    assert results[4]['current_streak'] == 6
+    assert results[4]['longest_streak'] == 6
+
+    response = client.get("/api/habits/user/testuser/streaks/Read")
+    assert response.get_json()['current_streak'] == 3
+
+def test_check_off_batch_rejects_malformed_events(client):
+    """Test that events with names that are not strings fail on their own, next to valid events."""
+    client.post("/api/habits/track/Read", json={'username': 'testuser'})
+    response = client.post("/api/habits/check-off/batch", json={'events': [
+        {'username': 'testuser', 'habit_name': 'Read', 'completed_at': '2024-08-01 09:00:00'},
+        {'username': 5, 'habit_name': 'Read', 'completed_at': '2024-08-01 09:00:00'},
+        {'username': 'testuser', 'habit_name': ['Read'], 'completed_at': '2024-08-02 09:00:00'},
+        {'username': 'Bob', 'habit_name': 'Exercise', 'completed_at': '2024-07-15 18:00:00'},
+    ]})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [result.get('code') for result in data['results']] == [None, 400, 400, None]
+    assert (data['checked_off'], data['failed']) == (2, 2)
+    assert client.get("/api/habits/user/testuser/streaks/Read").get_json()['current_streak'] == 1
+
+def test_check_off_batch_rejects_events_that_are_not_objects(client):
+    """Test that events sent as lists fail on their own, and that batches above the limit are refused."""
+    response = client.post("/api/habits/check-off/batch", json={'events': [
+        ['Bob', 'Exercise', '2024-07-15 18:00:00'],
+        {'username': 'Bob', 'habit_name': 'Exercise', 'completed_at': '2024-07-15 18:00:00'},
+    ]})
+    assert [result.get('code') for result in response.get_json()['results']] == [400, None]
+
+    response = client.post("/api/habits/check-off/batch", json={'events': [{}] * (MAX_BATCH_EVENTS + 1)})
+    assert response.status_code == 413
+
+def test_check_off_batch_recomputes_streaks_for_late_events(app):
+    """Test that an event older than the last completion fills a gap in the streak."""
+    with app.app_context():
+        habit = Habit('testuser')
+        habit.track_habit('Read')
+        habit.check_off_habit('Read', datetime.datetime(2024, 8, 1, 9, 0, 0))
+        habit.check_off_habit('Read', datetime.datetime(2024, 8, 3, 9, 0, 0))
+
+        results = Habit().check_off_many([('testuser', 'Read', datetime.datetime(2024, 8, 2, 9, 0, 0)),
+                                          ('testuser', 'Read', '2024-08-01 20:00:00')])
+
+        assert results[0]['current_streak'] == 3
+        assert results[0]['longest_streak'] == 3
+        assert results[1]['error'] == 'Habit already checked off today'
@@ -0,0 +1,133 @@
+import datetime
+import io
+import os
+import sqlite3
+import pytest
+from classes.history_file import HistoryFileError, export_history, import_history
+from classes.partitions import archive_tracker
+from classes.streak_engine import recompute_streaks
+
+SCHEMA_FILE_PATH = os.path.join(os.path.dirname(__file__), '../db/sql/schema.sql')
+SEED_FILE_PATH = os.path.join(os.path.dirname(__file__), '../db/sql/seed.sql')
+
+def create_db(path, seed=True):
+    connection = sqlite3.connect(str(path))
+    connection.executescript(open(SCHEMA_FILE_PATH).read())
+    if seed:
+        connection.executescript(open(SEED_FILE_PATH).read())
+    connection.commit()
+    return connection
+
+def history(connection, user_names=None):
+    """Every tracked habit and completion, by user and habit name."""
+    where = f"WHERE user_habits.user_name IN ({', '.join('?' * len(user_names))})" if user_names else ''
+    params = user_names or []
+    user_habits = connection.execute(
+        f"""SELECT user_name, habits.name, current_streak, longest_streak, user_habits.created_at,
+                   completion_count, first_completed_at, last_completed_at
+            FROM user_habits JOIN habits ON habits.id = user_habits.habit_id
+            LEFT JOIN user_habit_stats ON user_habit_stats.user_habit_id = user_habits.id
+            {where} ORDER BY 1, 2""", params).fetchall()
+    completions = connection.execute(
+        f"""SELECT user_name, habits.name, completed_at
+            FROM habit_tracker_history JOIN user_habits ON user_habits.id = habit_tracker_history.user_habit_id
+            JOIN habits ON habits.id = user_habits.habit_id
+            {where} ORDER BY 1, 2, 3""", params).fetchall()
+    return user_habits, completions
+
+@pytest.fixture
+def source(tmp_path):
+    connection = create_db(tmp_path / 'source.db')
+    # Users with names that need more than ASCII, and completions in an archived partition
+    connection.executemany("INSERT INTO user_habits (habit_id, user_name) VALUES (?, ?)", [(4, 'Zoë'), (1, 'Zoë')])
+    connection.executemany("INSERT INTO habit_tracker (user_habit_id, completed_at) SELECT id, ? FROM user_habits WHERE user_name = 'Zoë'",
+                           [('2023-05-01 08:00:00',), ('2023-05-02 08:00:00',), ('2024-07-01 21:15:09',)])
+    connection.commit()
+    archive_tracker(connection, datetime.datetime(2024, 1, 1))
+    # The seeded streaks don't all match the seeded history
+    recompute_streaks(connection)
+    yield connection
+    connection.close()
+
+def test_round_trip(source, tmp_path):
+    """Test that an export loaded into an empty database gives back the same habits and history."""
+    file = io.BytesIO()
+    exported = export_history(source, file, chunk_size=3)
+    user_habits, completions = history(source)
+    assert exported == {'user_habits': len(user_habits), 'completions': len(completions)}
+
+    target = create_db(tmp_path / 'target.db', seed=False)
+    file.seek(0)
+    assert import_history(target, file, commit_rows=5) == dict(exported, merged_user_habits=0)
+
+    assert history(target) == history(source)
+    assert target.execute("SELECT name, description, periodicity FROM habits ORDER BY id").fetchall() == \
+        source.execute("SELECT name, description, periodicity FROM habits ORDER BY id").fetchall()
+    # The bulk load settings are restored
+    assert target.execute("PRAGMA synchronous").fetchone()[0] == 2
+    target.close()
+
+def test_move_users_into_a_database_with_data(source, tmp_path):
+    """Test exporting some users and merging them into another database."""
+    file = io.BytesIO()
+    user_habits, completions = history(source, ['Zoë', 'Bob'])
+    assert export_history(source, file, user_names=['Zoë', 'Bob']) == {'user_habits': len(user_habits), 'completions': len(completions)}
+
+    target = create_db(tmp_path / 'target.db')
+    # The target numbers its habits differently, and already has Bob's Journal habit with another completion
+    target.execute("UPDATE habits SET name = 'Read more' WHERE name = 'Read'")
+    target.execute("INSERT INTO habits (name, periodicity) VALUES ('Read', 'DAILY')")
+    target.execute("DELETE FROM habit_tracker WHERE user_habit_id IN (SELECT id FROM user_habits WHERE user_name = 'Bob' AND habit_id != 5)")
+    target.execute("DELETE FROM user_habits WHERE user_name = 'Bob' AND habit_id != 5")
+    target.execute("INSERT INTO habit_tracker (user_habit_id, completed_at) SELECT id, '2024-07-14 09:00:00' FROM user_habits WHERE user_name = 'Bob' AND habit_id = 5")
+    target.commit()
+    alice = history(target, ['Alice'])
+
+    file.seek(0)
+    assert import_history(target, file) == {'user_habits': len(user_habits) - 1, 'merged_user_habits': 1, 'completions': len(completions) - 1}
+
+    assert history(target, ['Zoë']) == history(source, ['Zoë'])
+    assert history(target, ['Alice']) == alice
+    # Bob's Journal completion that both databases have is loaded once
+    bob_user_habits, bob_completions = history(target, ['Bob'])
+    assert len(bob_completions) == len(history(source, ['Bob'])[1]) + 1
+    journal = [row for row in bob_user_habits if row[1] == 'Journal'][0]
+    assert journal[5] == 2 and journal[7] == '2024-07-14 09:00:00'
+
+    # Loading the same file again changes nothing
+    file.seek(0)
+    assert import_history(target, file)['completions'] == 0
+    assert history(target, ['Bob']) == (bob_user_habits, bob_completions)
+    target.close()
+
+def test_import_rekeys_users_with_a_timezone(source, tmp_path):
+    """Test that the completions of a user with a stored timezone are loaded on their local days."""
+    file = io.BytesIO()
+    export_history(source, file, user_names=['Zoë'])
+
+    target = create_db(tmp_path / 'target.db', seed=False)
+    target.execute("INSERT INTO user_timezones (user_name, timezone) VALUES ('Zoë', 'Asia/Tokyo')")
+    target.commit()
+    file.seek(0)
+    import_history(target, file)
+
+    # 2024-07-01 21:15:09 UTC is already July 2nd in Tokyo, 2023-05-01 08:00:00 UTC is still May 1st
+    assert target.execute(
+        """SELECT DISTINCT completed_at, date(day_key * 86400, 'unixepoch') FROM habit_tracker_history ORDER BY 1"""
+    ).fetchall() == [('2023-05-01 08:00:00', '2023-05-01'), ('2023-05-02 08:00:00', '2023-05-02'), ('2024-07-01 21:15:09', '2024-07-02')]
+    assert target.execute("SELECT DISTINCT day FROM user_habit_daily ORDER BY 1").fetchall() == [('2023-05-01',), ('2023-05-02',), ('2024-07-02',)]
+    target.close()
+
+def test_invalid_files(source, tmp_path):
+    """Test that files that are not complete history files are rejected."""
+    target = create_db(tmp_path / 'target.db', seed=False)
+    with pytest.raises(HistoryFileError):
+        import_history(target, io.BytesIO(b'not a history file'))
+
+    file = io.BytesIO()
+    export_history(source, file)
+    with pytest.raises(HistoryFileError):
+        import_history(target, io.BytesIO(file.getvalue()[:-10]))
+    # Nothing of the truncated file is loaded
+    assert target.execute("SELECT COUNT(*) FROM habit_tracker").fetchone()[0] == 0
+    target.close()
@@ -0,0 +1,121 @@
+import datetime
+import os
+import sqlite3
+import pytest
+from flask import Flask
+from db.db import SqliteDB
+from classes.habits import Habit
+from classes.leaderboard import RankedStreaks, leaderboard
+from routes.analytics import load as load_analytics
+from routes.habits import load as load_habits
+
+@pytest.fixture
+def app():
+    """Create an app with the analytics and habit routes on a freshly seeded database."""
+    app = Flask(__name__)
+    app.config.update({"TESTING": True, "DATABASE": os.getenv("DB_FILE_NAME")})
+
+    with app.app_context():
+        with open(os.path.join(os.path.dirname(__file__), '../db/sql/schema.sql'), 'r') as f:
+            SqliteDB().cursor.executescript(f.read())
+        with open(os.path.join(os.path.dirname(__file__), '../db/sql/seed.sql'), 'r') as f:
+            SqliteDB().cursor.executescript(f.read())
+
+    load_analytics(app)
+    load_habits(app)
+    yield app
+
+@pytest.fixture
+def client(app):
+    """A test client for the app."""
+    return app.test_client()
+
+def entries(client, url):
+    return [(entry['rank'], entry['user_name'], entry['habit'], entry['streak']) for entry in client.get(url).get_json()['data']['entries']]
+
+def test_ranked_streaks():
+    """Test ranks, ties and the top entries, past the initial size of the counts tree."""
+    ranking = RankedStreaks(size=4)
+    for key, streak in [('a', 3), ('b', 7), ('c', 3), ('d', 0), ('e', 100)]:
+        ranking.add(key, streak)
+
+    assert len(ranking) == 5
+    assert [ranking.rank(streak) for streak in (100, 7, 3, 0)] == [1, 2, 3, 5]
+    assert ranking.rank(50) == 2
+    assert ranking.top(4) == [('e', 100, 1), ('b', 7, 2), ('a', 3, 3), ('c', 3, 3)]
+
+    ranking.remove('e', 100)
+    ranking.remove('a', 3)
+    ranking.add('a', 8)
+    assert ranking.top(10) == [('a', 8, 1), ('b', 7, 2), ('c', 3, 3), ('d', 0, 4)]
+    assert ranking.rank(3) == 3
+
+def test_get_leaderboard(client):
+    """Test the overall and per habit leaderboards of both streaks."""
+    assert entries(client, "/api/analytics/leaderboard") == [
+        (1, 'Alice', 'Read', 8), (2, 'Bob', 'Exercise', 5), (3, 'Alice', 'Exercise', 3), (4, 'Bob', 'Park Walk', 2), (5, 'Bob', 'Journal', 1)]
+    assert entries(client, "/api/analytics/leaderboard?metric=current&limit=3") == [
+        (1, 'Bob', 'Exercise', 5), (2, 'Alice', 'Read', 4), (3, 'Alice', 'Exercise', 3)]
+    assert entries(client, "/api/analytics/leaderboard/Exercise?metric=current") == [
+        (1, 'Bob', 'Exercise', 5), (2, 'Alice', 'Exercise', 3)]
+
+    assert client.get("/api/analytics/leaderboard/Unknown").status_code == 404
+    assert client.get("/api/analytics/leaderboard?metric=total").status_code == 400
+    assert client.get("/api/analytics/leaderboard?limit=0").status_code == 400
+
+def test_get_user_rank(client):
+    """Test the rank of a user's best habit overall and of one habit."""
+    data = client.get("/api/analytics/user/Bob/rank").get_json()['data']
+    assert (data['rank'], data['ranked'], data['habit'], data['streak']) == (2, 5, 'Exercise', 5)
+    data = client.get("/api/analytics/user/Alice/rank/Exercise?metric=current").get_json()['data']
+    assert (data['rank'], data['ranked'], data['streak']) == (2, 2, 3)
+
+    assert client.get("/api/analytics/user/Alice/rank/Journal").get_json()['message'] == 'Habit Not Tracked By User'
+    assert client.get("/api/analytics/user/nonexistentuser/rank").status_code == 404
+
+def test_writes_update_the_leaderboards_without_reloading(app, client):
+    """Test that the streak changes of this process's writes are applied in place."""
+    client.get("/api/analytics/leaderboard")
+    reloads = leaderboard.metrics()['reloads']
+
+    client.post("/api/habits/track/Read", json={'username': 'Dave'})
+    client.post("/api/habits/check-off/Read", json={'username': 'Dave'})
+    with app.app_context():
+        Habit('Bob').untrack_habit('Journal')
+        Habit().check_off_many([('Bob', 'Exercise', datetime.datetime(2024, 7, 15, 9, 0, 0))])
+
+    assert entries(client, "/api/analytics/leaderboard/Read?metric=current") == [(1, 'Alice', 'Read', 4), (2, 'Dave', 'Read', 1)]
+    assert entries(client, "/api/analytics/leaderboard?limit=2") == [(1, 'Alice', 'Read', 8), (2, 'Bob', 'Exercise', 6)]
+    assert client.get("/api/analytics/user/Bob/rank/Journal").status_code == 404
+    metrics = leaderboard.metrics()
+    assert metrics['reloads'] == reloads
+    assert metrics['entries'] == 5
+
+def test_other_writers_reload_the_leaderboards(client):
+    """Test that streaks changed by another process are picked up from the streaks version."""
+    client.get("/api/analytics/leaderboard")
+    reloads = leaderboard.metrics()['reloads']
+
+    connection = sqlite3.connect(os.getenv("DB_FILE_NAME"))
+    connection.execute("UPDATE user_habits SET longest_streak = 20 WHERE user_name = 'Bob' AND habit_id = (SELECT id FROM habits WHERE name = 'Journal')")
+    connection.commit()
+    connection.close()
+
+    assert entries(client, "/api/analytics/leaderboard?limit=1") == [(1, 'Bob', 'Journal', 20)]
+    assert leaderboard.metrics()['reloads'] == reloads + 1
+
+def test_changes_reported_out_of_order(client):
+    """Test that changes are applied in version order whatever order their writes report them in."""
+    client.get("/api/analytics/leaderboard")
+    version = leaderboard.metrics()['version']
+
+    # Two writes to Alice's Read habit, the second one reported first
+    leaderboard.record(version + 2, [(1, 'Alice', 1, (6, 12))])
+    assert leaderboard.metrics()['pending'] == 1
+    leaderboard.record(version + 1, [(1, 'Alice', 1, (5, 10))])
+    metrics = leaderboard.metrics()
+    assert (metrics['version'], metrics['pending']) == (version + 2, 0)
+
+    # Changes the leaderboards already include are ignored
+    leaderboard.record(version + 1, [(1, 'Alice', 1, (5, 10))])
+    assert leaderboard.metrics()['version'] == version + 2
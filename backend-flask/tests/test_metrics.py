@@ -0,0 +1,142 @@
+import json
+import os
+import threading
+import pytest
+from flask import Flask
+from db.db import SqliteDB, squlite_db
+from classes.metrics import MetricsRegistry, ThreadCounters, metrics
+from routes.habits import load as load_habits
+from routes.metrics import load as load_metrics
+
+@pytest.fixture
+def registry(tmp_path):
+    """An enabled registry sharing its values through a temporary directory."""
+    registry = MetricsRegistry(enabled=True, directory=str(tmp_path / 'metrics'), flush_interval=0)
+    registry.histogram('latency_seconds', 'Latency.', buckets=(0.1, 1.0))
+    registry.counter('errors_total', 'Errors.')
+    return registry
+
+@pytest.fixture
+def client(monkeypatch):
+    """A test client of an app with the habit routes and the metrics on instrumented connections."""
+    monkeypatch.setenv("METRICS", "1")
+    monkeypatch.setattr(metrics, 'enabled', True)
+    metrics.reset()
+    squlite_db.release_thread_connection()
+    pool = squlite_db.pool
+    squlite_db.init_pool()
+
+    app = Flask(__name__)
+    app.config.update({"TESTING": True, "DATABASE": os.getenv("DB_FILE_NAME")})
+    with app.app_context():
+        with open(os.path.join(os.path.dirname(__file__), '../db/sql/schema.sql'), 'r') as f:
+            SqliteDB().cursor.executescript(f.read())
+        with open(os.path.join(os.path.dirname(__file__), '../db/sql/seed.sql'), 'r') as f:
+            SqliteDB().cursor.executescript(f.read())
+
+    load_habits(app)
+    load_metrics(app)
+    yield app.test_client()
+    squlite_db.pool.close()
+    squlite_db.pool = pool
+    metrics.reset()
+
+def samples(exposition):
+    """Parses the samples of an exposition into a dict keyed by series."""
+    return {line.rsplit(' ', 1)[0]: float(line.rsplit(' ', 1)[1])
+            for line in exposition.splitlines() if line and not line.startswith('#')}
+
+def test_histograms_and_counters_are_merged_across_threads(registry):
+    """Test that the shards of every thread, including threads that exited, are merged into cumulative buckets."""
+    def record(value):
+        registry.observe('latency_seconds', value, route='a')
+        registry.inc('errors_total', route='a')
+
+    threads = [threading.Thread(target=record, args=(value,)) for value in (0.05, 0.5, 5.0)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    record(0.1)
+
+    exported = samples(registry.export())
+    assert exported['latency_seconds_bucket{route="a",le="0.1"}'] == 2
+    assert exported['latency_seconds_bucket{route="a",le="1.0"}'] == 3
+    assert exported['latency_seconds_bucket{route="a",le="+Inf"}'] == 4
+    assert exported['latency_seconds_count{route="a"}'] == 4
+    assert exported['latency_seconds_sum{route="a"}'] == pytest.approx(5.65)
+    assert exported['errors_total{route="a"}'] == 4
+    # Exited threads were folded, so exporting again gives the same values
+    assert samples(registry.export()) == exported
+
+def test_disabled_registry_records_nothing():
+    """Test that observations of a disabled registry are dropped."""
+    registry = MetricsRegistry(enabled=False, directory=None)
+    registry.counter('errors_total', 'Errors.')
+    registry.inc('errors_total')
+    assert samples(registry.export()) == {}
+
+def test_worker_processes_are_aggregated(registry, tmp_path):
+    """Test that the export sums the files of the other workers, keeping the counters of exited workers but not their gauges."""
+    registry.collector('connections', 'Connections.', lambda: 2)
+    registry.inc('errors_total')
+    registry.observe('latency_seconds', 0.5)
+
+    directory = str(tmp_path / 'metrics')
+    os.makedirs(directory, exist_ok=True)
+    # A running worker (this process's parent) and a worker that exited
+    for pid in (os.getppid(), 2 ** 22 + 1):
+        with open(os.path.join(directory, f'metrics_{pid}.json'), 'w') as f:
+            json.dump({
+                'series': [['errors_total', [], [3]], ['latency_seconds', [], [1, 0, 0, 0.05, 1]]],
+                'gauges': [['connections', [], 5]],
+            }, f)
+
+    exported = samples(registry.export())
+    assert exported['errors_total'] == 7
+    assert exported['latency_seconds_count'] == 3
+    assert exported['latency_seconds_bucket{le="0.1"}'] == 2
+    assert exported['connections'] == 7
+
+    registry.flush()
+    with open(os.path.join(directory, f'metrics_{os.getpid()}.json')) as f:
+        data = json.load(f)
+    assert ['errors_total', [], [1]] in data['series']
+    assert ['connections', [], 2] in data['gauges']
+
+def test_metrics_endpoint(client):
+    """Test that requests, statements and commits of the app are exported, with the pool occupancy."""
+    assert client.get("/api/habits").status_code == 200
+    client.post("/api/habits/check-off/Read", json={'username': 'Alice'})
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    exported = samples(response.get_data(as_text=True))
+    assert exported['habit_http_request_duration_seconds_count{method="GET",route="get_habits",status="200"}'] == 1
+    assert exported['habit_http_request_rows_count{route="get_habits"}'] == 1
+    assert exported['habit_sqlite_statement_duration_seconds_count{statement="SELECT"}'] >= 1
+    assert exported['habit_sqlite_commit_duration_seconds_count{writer="direct"}'] == 1
+    assert exported['habit_sqlite_lock_wait_seconds_count{writer="direct"}'] == 1
+    assert exported['habit_db_pool_size'] == squlite_db.pool.size
+    assert 'habit_db_pool_connections{state="in_use"}' in exported
+
+def test_thread_counters_lose_no_increments():
+    """Test that counters incremented by many threads at once sum to every increment, also after the threads exited."""
+    counters = ThreadCounters(('hits', 'misses'))
+
+    def count():
+        for _ in range(10000):
+            counters.inc('hits')
+        counters.inc('misses', 2)
+
+    threads = [threading.Thread(target=count) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counters.totals() == {'hits': 80000, 'misses': 16}
+    # The counts of the exited threads are kept
+    counters.inc('hits')
+    assert counters.totals() == {'hits': 80001, 'misses': 16}
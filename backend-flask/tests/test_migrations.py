@@ -0,0 +1,167 @@
+import os
+import sqlite3
+import pytest
+from db.migrate import runMigrations, latestVersion
+from classes.summary import rebuild_user_habit_stats
+
+SCHEMA_FILE_PATH = os.path.join(os.path.dirname(__file__), '../db/sql/schema.sql')
+SEED_FILE_PATH = os.path.join(os.path.dirname(__file__), '../db/sql/seed.sql')
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    """Create a seeded database as it was before any migration was applied."""
+    connection = sqlite3.connect(str(tmp_path / 'legacy.db'))
+    connection.executescript(open(SCHEMA_FILE_PATH).read())
+    connection.executescript(open(SEED_FILE_PATH).read())
+    for (index_name,) in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'").fetchall():
+        connection.execute(f"DROP INDEX {index_name}")
+    connection.execute("PRAGMA user_version = 0")
+    connection.commit()
+    yield connection
+    connection.close()
+
+def index_names(connection):
+    return {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'")}
+
+def test_schema_is_at_latest_version(tmp_path):
+    """Test that a freshly loaded schema needs no migrations."""
+    connection = sqlite3.connect(str(tmp_path / 'fresh.db'))
+    connection.executescript(open(SCHEMA_FILE_PATH).read())
+    assert connection.execute("PRAGMA user_version").fetchone()[0] == latestVersion()
+    assert runMigrations(connection) == []
+
+def test_migrations_upgrade_existing_database(legacy_db):
+    """Test that migrations add the indexes without losing any data."""
+    tracker_rows = legacy_db.execute("SELECT COUNT(*) FROM habit_tracker").fetchone()[0]
+
+    applied = runMigrations(legacy_db)
+
+    assert applied[-1] == latestVersion()
+    assert legacy_db.execute("PRAGMA user_version").fetchone()[0] == latestVersion()
+    assert {'idx_habits_name', 'idx_user_habits_user_name_habit_id', 'idx_habit_tracker_user_habit_id_completed_epoch'} <= index_names(legacy_db)
+    assert legacy_db.execute("SELECT COUNT(*) FROM habit_tracker").fetchone()[0] == tracker_rows
+    assert runMigrations(legacy_db) == []
+
+def test_failed_migration_is_rolled_back(legacy_db):
+    """Test that a migration that cannot be applied leaves the database untouched."""
+    legacy_db.execute("INSERT INTO habits (name, periodicity) VALUES ('Read', 'DAILY')")
+    legacy_db.commit()
+
+    with pytest.raises(sqlite3.IntegrityError):
+        runMigrations(legacy_db)
+
+    assert legacy_db.execute("PRAGMA user_version").fetchone()[0] == 0
+    assert index_names(legacy_db) == set()
+
+def test_migrations_summarize_existing_history(legacy_db):
+    """Test that the summary table is filled from the existing history when it is added."""
+    legacy_db.execute("DROP TABLE user_habit_stats")
+    legacy_db.commit()
+
+    runMigrations(legacy_db)
+
+    assert legacy_db.execute("SELECT completion_count, first_completed_at, last_completed_at FROM user_habit_stats WHERE user_habit_id = 1").fetchone() == \
+        (12, '2024-06-29 09:00:00', '2024-07-13 09:00:00')
+
+def test_rebuild_user_habit_stats(legacy_db):
+    """Test rebuilding the summary table from the history."""
+    legacy_db.execute("UPDATE user_habit_stats SET completion_count = 0")
+    legacy_db.commit()
+
+    assert rebuild_user_habit_stats(legacy_db) == 5
+    assert legacy_db.execute("SELECT SUM(completion_count) FROM user_habit_stats").fetchone()[0] == 26
+
+def test_migrations_add_completion_keys(legacy_db):
+    """Test that the integer completion keys are added and filled in the hot and archive tables of a version 7 database."""
+    legacy_db.executescript(
+        """DROP VIEW habit_tracker_history;
+           DROP TRIGGER trg_habit_tracker_insert_keys;
+           DROP TRIGGER trg_habit_tracker_insert_stats;
+           DROP TRIGGER trg_habit_tracker_insert_daily;
+           CREATE TRIGGER trg_habit_tracker_insert_daily AFTER INSERT ON habit_tracker
+           BEGIN
+               INSERT INTO user_habit_daily (user_habit_id, day, completions) VALUES (NEW.user_habit_id, date(NEW.completed_at), 1)
+               ON CONFLICT (user_habit_id, day) DO UPDATE SET completions = completions + 1;
+           END;
+           ALTER TABLE habit_tracker DROP COLUMN completed_epoch;
+           ALTER TABLE habit_tracker DROP COLUMN day_key;
+           ALTER TABLE habit_tracker DROP COLUMN iso_week_key;
+           ALTER TABLE user_habit_stats DROP COLUMN last_day_key;
+           CREATE TABLE habit_tracker_archive_2023 (id INTEGER PRIMARY KEY, user_habit_id INTEGER NOT NULL, completed_at TIMESTAMP NOT NULL);
+           INSERT INTO habit_tracker_archive_2023 (user_habit_id, completed_at) VALUES (1, '2023-12-31 23:30:00');
+           INSERT INTO habit_tracker_partitions (name, starts_at, ends_at, row_count) VALUES ('habit_tracker_archive_2023', '2023-01-01 00:00:00', '2024-01-01 00:00:00', 1);
+           CREATE VIEW habit_tracker_history AS
+           SELECT user_habit_id, completed_at FROM habit_tracker UNION ALL SELECT user_habit_id, completed_at FROM habit_tracker_archive_2023;
+           PRAGMA user_version = 7;"""
+    )
+
+    assert runMigrations(legacy_db) == [8, 9, 10]
+
+    # 2023-12-31 is a Sunday: day 19722, in the week starting on Monday 2023-12-25
+    assert legacy_db.execute(
+        "SELECT completed_epoch, day_key, iso_week_key FROM habit_tracker_history WHERE completed_at = '2023-12-31 23:30:00'"
+    ).fetchone() == (1704065400, 19722, 2817)
+    assert legacy_db.execute("SELECT COUNT(*) FROM habit_tracker_history WHERE completed_epoch IS NULL").fetchone()[0] == 0
+    assert {'idx_habit_tracker_user_habit_id_completed_epoch', 'idx_habit_tracker_archive_2023_user_habit_id_completed_epoch'} <= index_names(legacy_db)
+    assert legacy_db.execute("SELECT last_day_key FROM user_habit_stats WHERE user_habit_id = 1").fetchone()[0] == 19917
+
+    # Rows inserted with only completed_at get their keys from the trigger
+    legacy_db.execute("INSERT INTO habit_tracker (user_habit_id, completed_at) VALUES (1, '2024-07-15 08:00:00')")
+    assert legacy_db.execute("SELECT day_key, iso_week_key FROM habit_tracker WHERE completed_at = '2024-07-15 08:00:00'").fetchone() == (19919, 2846)
+    assert legacy_db.execute("SELECT last_day_key FROM user_habit_stats WHERE user_habit_id = 1").fetchone()[0] == 19919
+
+def test_migrations_add_user_timezones(legacy_db):
+    """Test that a version 8 database gets the user_timezones table and a daily rollup counting local days."""
+    legacy_db.executescript(
+        """DROP TABLE user_timezones;
+           PRAGMA user_version = 8;"""
+    )
+
+    assert runMigrations(legacy_db) == [9, 10]
+
+    legacy_db.execute("INSERT INTO user_timezones (user_name, timezone) VALUES ('Alice', 'America/New_York')")
+    # 2024-07-15 02:00 UTC is still July 14th in New York
+    legacy_db.execute("INSERT INTO habit_tracker (user_habit_id, completed_at, completed_epoch, day_key, iso_week_key) VALUES (1, '2024-07-15 02:00:00', 1721008800, 19918, 2845)")
+    assert legacy_db.execute("SELECT completions FROM user_habit_daily WHERE user_habit_id = 1 AND day = '2024-07-14'").fetchone() == (1,)
+    assert legacy_db.execute("SELECT COUNT(*) FROM user_habit_daily WHERE user_habit_id = 1 AND day = '2024-07-15'").fetchone() == (0,)
+
+def test_migrations_add_check_off_event_ids(legacy_db):
+    """Test that a version 9 database gets the event_id column and its unique index."""
+    legacy_db.executescript(
+        """DROP VIEW habit_tracker_history;
+           CREATE VIEW habit_tracker_history AS SELECT user_habit_id, completed_at, completed_epoch, day_key, iso_week_key FROM habit_tracker;
+           ALTER TABLE habit_tracker DROP COLUMN event_id;
+           ALTER TABLE habit_tracker DROP COLUMN event_current_streak;
+           ALTER TABLE habit_tracker DROP COLUMN event_longest_streak;
+           PRAGMA user_version = 9;"""
+    )
+
+    assert runMigrations(legacy_db) == [10]
+
+    assert 'idx_habit_tracker_user_habit_id_event_id' in index_names(legacy_db)
+    insert = "INSERT INTO habit_tracker (user_habit_id, completed_at, event_id) VALUES (1, '2024-07-15 08:00:00', ?) ON CONFLICT DO NOTHING"
+    assert legacy_db.execute(insert, ('retried',)).rowcount == 1
+    assert legacy_db.execute(insert, ('retried',)).rowcount == 0
+    # Rows without an event ID are never duplicates
+    assert legacy_db.execute(insert, (None,)).rowcount == 1
+    assert legacy_db.execute(insert, (None,)).rowcount == 1
+
+def test_migrations_add_archive_event_ids(legacy_db):
+    """Test that the archive tables of a version 9 database get the event columns, and its history view too."""
+    runMigrations(legacy_db)
+    legacy_db.executescript(
+        """CREATE TABLE habit_tracker_archive_2023 (id INTEGER PRIMARY KEY, user_habit_id INTEGER NOT NULL, completed_at TIMESTAMP NOT NULL,
+                                                   completed_epoch INTEGER, day_key INTEGER, iso_week_key INTEGER);
+           INSERT INTO habit_tracker_partitions (name, starts_at, ends_at, row_count) VALUES ('habit_tracker_archive_2023', '2023-01-01 00:00:00', '2024-01-01 00:00:00', 0);
+           DROP VIEW habit_tracker_history;
+           CREATE VIEW habit_tracker_history AS
+           SELECT user_habit_id, completed_at, completed_epoch, day_key, iso_week_key FROM habit_tracker
+           UNION ALL SELECT user_habit_id, completed_at, completed_epoch, day_key, iso_week_key FROM habit_tracker_archive_2023;
+           PRAGMA user_version = 9;"""
+    )
+
+    assert runMigrations(legacy_db) == [10]
+
+    assert 'idx_habit_tracker_archive_2023_user_habit_id_event_id' in index_names(legacy_db)
+    columns = [row[1] for row in legacy_db.execute("PRAGMA table_info(habit_tracker_history)")]
+    assert columns[-3:] == ['event_id', 'event_current_streak', 'event_longest_streak']
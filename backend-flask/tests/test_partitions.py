@@ -0,0 +1,157 @@
+import datetime
+import os
+import sqlite3
+import pytest
+from flask import Flask
+from db.db import SqliteDB
+from classes.check_off_events import recent_check_offs
+from classes.partitions import archive_tracker, month_start, tracker_partitions
+from classes.streak_engine import recompute_streaks
+from routes.analytics import load as load_analytics
+from routes.habits import load as load_habits
+
+URLS = [
+    "/api/analytics/user/Alice/tracked-timestamps/Read",
+    "/api/analytics/user/Alice/tracked-timestamps/Read?limit=3",
+    "/api/analytics/user/Alice/tracked-timestamps/Read?before=2024-07-02%2000:00:00&limit=4",
+    "/api/analytics/user/Alice/tracked-timestamps/Read?before=2024-01-01%2000:00:00",
+    "/api/analytics/user/Alice/tracked-timestamps/Read?stream=1",
+    "/api/analytics/user/Bob/tracked-timestamps/Park%20Walk",
+    "/api/analytics/user/Bob/summary",
+    "/api/analytics/user/Alice/summary",
+]
+
+@pytest.fixture
+def connection():
+    """Seed the database, with some completions of an older year, and drop the archive tables afterwards."""
+    app = Flask(__name__)
+    app.config.update({"TESTING": True, "DATABASE": os.getenv("DB_FILE_NAME")})
+    with app.app_context():
+        with open(os.path.join(os.path.dirname(__file__), '../db/sql/schema.sql'), 'r') as f:
+            SqliteDB().cursor.executescript(f.read())
+        with open(os.path.join(os.path.dirname(__file__), '../db/sql/seed.sql'), 'r') as f:
+            SqliteDB().cursor.executescript(f.read())
+
+    connection = sqlite3.connect(os.getenv("DB_FILE_NAME"))
+    connection.executemany("INSERT INTO habit_tracker (user_habit_id, completed_at) VALUES (1, ?)",
+                           [('2023-03-01 09:00:00',), ('2023-12-31 09:00:00',)])
+    connection.commit()
+    yield connection
+
+    tables = connection.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'habit_tracker_archive_%'").fetchall()
+    for (table,) in tables:
+        connection.execute(f"DROP TABLE {table}")
+    connection.commit()
+    connection.close()
+
+@pytest.fixture
+def client(connection):
+    app = Flask(__name__)
+    app.config.update({"TESTING": True, "DATABASE": os.getenv("DB_FILE_NAME")})
+    load_analytics(app)
+    load_habits(app)
+    return app.test_client()
+
+def responses(client):
+    return [client.get(url).data for url in URLS]
+
+def test_reads_are_the_same_after_archival(connection, client):
+    """Test that timestamp pages, streams and summaries return the full history once it is archived."""
+    expected = responses(client)
+    stats = connection.execute("SELECT * FROM user_habit_stats ORDER BY user_habit_id").fetchall()
+
+    moved = archive_tracker(connection, datetime.datetime(2024, 7, 1))
+
+    assert moved == {'habit_tracker_archive_2023': 2, 'habit_tracker_archive_2024': 9}
+    assert connection.execute("SELECT MIN(completed_at) FROM habit_tracker").fetchone()[0] >= '2024-07-01 00:00:00'
+    assert connection.execute("SELECT COUNT(*) FROM habit_tracker_history").fetchone()[0] == 28
+    assert connection.execute("SELECT * FROM user_habit_stats ORDER BY user_habit_id").fetchall() == stats
+    assert responses(client) == expected
+
+def test_archival_is_incremental(connection):
+    """Test that archiving again appends to the existing yearly partitions."""
+    archive_tracker(connection, datetime.datetime(2024, 1, 1))
+    archive_tracker(connection, datetime.datetime(2024, 7, 1))
+    assert archive_tracker(connection, datetime.datetime(2024, 7, 1)) == {}
+
+    partitions = connection.execute("SELECT name, starts_at, ends_at, row_count FROM habit_tracker_partitions ORDER BY name").fetchall()
+    assert partitions == [
+        ('habit_tracker_archive_2023', '2023-01-01 00:00:00', '2024-01-01 00:00:00', 2),
+        ('habit_tracker_archive_2024', '2024-01-01 00:00:00', '2025-01-01 00:00:00', 9),
+    ]
+    assert connection.execute("SELECT COUNT(*) FROM habit_tracker").fetchone()[0] == 17
+
+def test_history_writes_see_archived_completions(connection, client):
+    """Test that recomputing streaks and checking off inside the history use the archived completions."""
+    recompute_streaks(connection)
+    archive_tracker(connection, datetime.datetime(2024, 7, 12))
+
+    result = recompute_streaks(connection)
+    assert result['tracker_rows'] == 28 and result['updated'] == 0
+
+    # Filling the gap before the current streak joins it with the archived longest streak
+    for day in (7, 8, 9):
+        response = client.post("/api/habits/check-off/batch", json={'events': [
+            {'username': 'Alice', 'habit_name': 'Read', 'completed_at': f'2024-07-0{day} 09:00:00'}]})
+        assert response.status_code == 200
+    assert response.get_json()['results'][0]['longest_streak'] == 15
+
+def test_queries_only_read_the_partitions_they_need(connection, client):
+    """Test that archive partitions outside the queried time range are skipped."""
+    archive_tracker(connection, datetime.datetime(2024, 7, 1))
+    before = tracker_partitions.metrics()
+
+    client.get("/api/analytics/user/Alice/tracked-timestamps/Read?before=2024-01-01%2000:00:00")
+    client.get("/api/analytics/user/Alice/summary")
+
+    after = tracker_partitions.metrics()
+    assert after['partitions'] == ['habit_tracker_archive_2024', 'habit_tracker_archive_2023']
+    # The page reads the 2023 archive only, the summary's recent windows no archive at all
+    assert after['archives_read'] - before['archives_read'] == 1
+    assert after['archives_skipped'] - before['archives_skipped'] == 3
+
+def test_month_start():
+    """Test the default archival cutoff."""
+    assert month_start(datetime.datetime(2024, 7, 14, 9, 30), 12) == datetime.datetime(2023, 7, 1)
+    assert month_start(datetime.datetime(2024, 1, 31), 1) == datetime.datetime(2023, 12, 1)
+    assert month_start(datetime.datetime(2024, 3, 5), 0) == datetime.datetime(2024, 3, 1)
+
+def test_archived_check_off_events_are_not_counted_again(connection, client):
+    """Test that a check-off retried after its completion was archived is still a duplicate."""
+    response = client.post("/api/habits/check-off/Read", json={'username': 'Alice', 'event_id': 'phone-1'})
+    streaks = (response.json['current_streak'], response.json['longest_streak'])
+
+    archive_tracker(connection, datetime.datetime.now() + datetime.timedelta(days=2))
+    assert connection.execute("SELECT COUNT(*) FROM habit_tracker").fetchone()[0] == 0
+    tracker_partitions.invalidate()
+    recent_check_offs.clear()
+
+    response = client.post("/api/habits/check-off/Read", json={'username': 'Alice', 'event_id': 'phone-1'})
+    assert (response.json['current_streak'], response.json['longest_streak'], response.json['duplicate']) == streaks + (True,)
+    assert connection.execute("SELECT COUNT(*) FROM habit_tracker_history WHERE event_id = 'phone-1'").fetchone()[0] == 1
+
+def test_check_off_events_only_probe_recent_archives(connection, client):
+    """Test that a check-off with an event ID doesn't probe the archive tables that end before its retry window."""
+    archive_tracker(connection, datetime.datetime(2024, 7, 1))
+    tracker_partitions.invalidate()
+    tracker_partitions.tables()
+    before = tracker_partitions.metrics()
+
+    response = client.post("/api/habits/check-off/Read", json={'username': 'Alice', 'event_id': 'phone-2'})
+    assert response.status_code == 200
+    after = tracker_partitions.metrics()
+    assert after['archives_read'] == before['archives_read']
+    assert after['archives_skipped'] == before['archives_skipped'] + 2
+
+def test_archive_tables_follow_the_hot_table_columns(connection):
+    """Test that archive tables get the columns added to habit_tracker, including those created before."""
+    archive_tracker(connection, datetime.datetime(2024, 1, 1))
+    connection.execute("ALTER TABLE habit_tracker ADD COLUMN source VARCHAR(16)")
+    connection.execute("UPDATE habit_tracker SET source = 'phone'")
+    connection.commit()
+
+    archive_tracker(connection, datetime.datetime(2024, 7, 1))
+    for table in ('habit_tracker_archive_2023', 'habit_tracker_archive_2024'):
+        assert 'source' in [row[1] for row in connection.execute(f"PRAGMA table_info({table})")]
+    assert connection.execute("SELECT COUNT(*) FROM habit_tracker_archive_2024 WHERE source = 'phone'").fetchone()[0] == 9
+    assert connection.execute("SELECT COUNT(*) FROM habit_tracker_history WHERE source IS NULL").fetchone()[0] == 2
@@ -0,0 +1,71 @@
+import datetime
+import random
+import numpy as np
+from classes.periods import PeriodEngine, is_timezone
+from classes.streaks import day_key, week_key
+
+UTC = datetime.timezone.utc
+
+def epoch(*args):
+    return int(datetime.datetime(*args, tzinfo=UTC).timestamp())
+
+def test_offsets_change_at_the_dst_transition():
+    """Test that the offset of New York changes on the second clocks go forward."""
+    zone = PeriodEngine().zone('America/New_York')
+
+    # 2024-03-10 02:00 EST is 07:00 UTC
+    assert zone.offset(epoch(2024, 3, 10, 6, 59, 59)) == -5 * 3600
+    assert zone.offset(epoch(2024, 3, 10, 7, 0, 0)) == -4 * 3600
+    assert zone.offset(epoch(2024, 11, 3, 6, 0, 0)) == -5 * 3600
+
+def test_vectorized_day_keys_match_the_scalar_ones():
+    """Test that whole arrays get the same day keys as one instant at a time, outside the precomputed years too."""
+    engine = PeriodEngine()
+    generator = random.Random(0)
+    epochs = [generator.randrange(epoch(1960, 1, 1), epoch(2100, 1, 1)) for _ in range(2000)]
+    # Around the transitions of 2024
+    epochs += [epoch(2024, 3, 10, 7, 0, 0) + delta for delta in range(-3, 3)]
+    epochs += [epoch(2024, 11, 3, 6, 0, 0) + delta for delta in range(-3, 3)]
+
+    for timezone in ('America/New_York', 'Australia/Lord_Howe', 'Asia/Kolkata', None):
+        keys = engine.day_keys(np.array(epochs), timezone)
+        assert keys.tolist() == [engine.day_key(value, timezone) for value in epochs]
+
+def test_completion_keys_of_a_late_evening_in_new_york():
+    """Test that a check-off at 22:00 in New York is stored in UTC but counts for the local day."""
+    engine = PeriodEngine()
+
+    keys = engine.completion_keys(datetime.datetime(2024, 8, 4, 22, 0, 0), 'America/New_York')
+
+    local_day = day_key(datetime.date(2024, 8, 4))
+    assert keys == ('2024-08-05 02:00:00', epoch(2024, 8, 5, 2, 0, 0), local_day, week_key(local_day))
+    # The same instant, given as an aware time
+    assert engine.completion_keys(datetime.datetime(2024, 8, 5, 2, 0, 0, tzinfo=UTC), 'America/New_York') == keys
+    # Without a timezone it is the next (UTC) day, a Monday of another week
+    assert engine.completion_keys(datetime.datetime(2024, 8, 5, 2, 0, 0))[2:] == (local_day + 1, week_key(local_day) + 1)
+
+def test_day_start_and_today():
+    """Test that days start at the local midnight."""
+    engine = PeriodEngine()
+    day = day_key(datetime.date(2024, 3, 10))
+
+    assert engine.day_start(day, 'America/New_York') == epoch(2024, 3, 10, 5, 0, 0)
+    assert engine.day_start(day + 1, 'America/New_York') == epoch(2024, 3, 11, 4, 0, 0)
+    assert engine.day_start(day) == epoch(2024, 3, 10, 0, 0, 0)
+    assert engine.today('America/New_York', now=datetime.datetime(2024, 3, 11, 3, 59, 59, tzinfo=UTC)) == day
+
+def test_is_timezone():
+    """Test that only IANA timezone names are accepted."""
+    assert is_timezone('Europe/Berlin')
+    assert is_timezone('UTC')
+    assert not is_timezone('Mars/Olympus_Mons')
+    assert not is_timezone('../etc/passwd')
+    assert not is_timezone('')
+    assert not is_timezone(None)
+
+def test_transitions_are_computed_for_the_years_used():
+    """Test that a timezone's transitions are only computed for the spans its lookups fall in."""
+    zone = PeriodEngine().zone('Europe/Berlin')
+    assert zone.offset(epoch(2024, 7, 1)) == 2 * 3600
+    zone.offsets_of(np.array([epoch(2024, 1, 1, 12), epoch(2024, 2, 1)]))
+    assert len(zone._spans) == 1
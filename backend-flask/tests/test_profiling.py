@@ -0,0 +1,123 @@
+import json
+import logging
+import os
+import threading
+import time
+import pytest
+from flask import Flask
+from db.db import SqliteDB, squlite_db
+from db.instrumentation import InstrumentedConnection, RequestProfile, current_profile, normalize_sql
+from classes.sampler import StackSampler
+from routes.habits import load as load_habits
+from routes.profiling import load as load_profiling
+
+@pytest.fixture
+def profiled_pool(monkeypatch):
+    """Swaps the pool of the app for one of instrumented connections, as REQUEST_PROFILING=1 does."""
+    monkeypatch.setenv("REQUEST_PROFILING", "1")
+    squlite_db.release_thread_connection()
+    pool = squlite_db.pool
+    squlite_db.init_pool()
+    yield squlite_db.pool
+    squlite_db.pool.close()
+    squlite_db.pool = pool
+
+@pytest.fixture
+def client(profiled_pool):
+    """A test client of an app with the habit routes and the profiling hooks on a freshly seeded database."""
+    app = Flask(__name__)
+    app.config.update({"TESTING": True, "DATABASE": os.getenv("DB_FILE_NAME")})
+
+    with app.app_context():
+        with open(os.path.join(os.path.dirname(__file__), '../db/sql/schema.sql'), 'r') as f:
+            SqliteDB().cursor.executescript(f.read())
+        with open(os.path.join(os.path.dirname(__file__), '../db/sql/seed.sql'), 'r') as f:
+            SqliteDB().cursor.executescript(f.read())
+
+    load_habits(app)
+    load_profiling(app)
+    return app.test_client()
+
+def test_normalize_sql():
+    """Test that statements differing only by their literals normalize to the same text."""
+    assert normalize_sql("SELECT *\n  FROM habits WHERE name = 'Read' AND id = 12") == "SELECT * FROM habits WHERE name = ? AND id = ?"
+    assert normalize_sql("SELECT 'it''s', 1.5") == "SELECT ?, ?"
+
+def test_instrumented_connection_counts_statements_and_rows(profiled_pool):
+    """Test that queries, traced statements and fetched rows are counted into the current profile only."""
+    connection = profiled_pool.acquire()
+    try:
+        assert isinstance(connection, InstrumentedConnection)
+        connection.execute("SELECT 1").fetchall()
+
+        profile = RequestProfile('test')
+        token = current_profile.set(profile)
+        try:
+            rows = connection.execute("SELECT name FROM habits WHERE periodicity = ?", ('DAILY',)).fetchall()
+            cur = connection.cursor()
+            cur.execute("SELECT name FROM habits")
+            fetched = len(list(cur))
+        finally:
+            current_profile.reset(token)
+        connection.execute("SELECT 1").fetchall()
+    finally:
+        profiled_pool.release(connection)
+
+    assert (profile.queries, profile.statements, profile.rows) == (2, 2, len(rows) + fetched)
+    summary = profile.summary()
+    assert summary['sql_ms'] > 0
+    assert {item['sql'] for item in summary['slowest_sql']} == {
+        "SELECT name FROM habits WHERE periodicity = ?",
+        "SELECT name FROM habits",
+    }
+
+def test_server_timing_and_log_line(client, caplog):
+    """Test that profiled requests get a Server-Timing header and log one JSON line with their counters."""
+    with caplog.at_level(logging.INFO):
+        response = client.get("/api/habits/Read")
+    assert response.status_code == 200
+    timing = response.headers['Server-Timing']
+    assert timing.startswith('sql;dur=') and 'app;dur=' in timing and 'total;dur=' in timing
+
+    lines = [json.loads(record.getMessage()) for record in caplog.records if record.getMessage().startswith('{')]
+    line = lines[-1]
+    assert (line['method'], line['path'], line['status'], line['name']) == ('GET', '/api/habits/Read', 200, 'get_habit')
+    assert line['statements'] >= 1 and line['rows'] >= 1
+    assert f'desc="{line["statements"]} statements, {line["rows"]} rows"' in timing
+    assert current_profile.get() is None
+
+def test_stack_sampler_folds_stacks_per_endpoint(tmp_path):
+    """Test that the sampler only samples registered threads, and dumps their folded stacks per endpoint."""
+    sampler = StackSampler(enabled=True, interval=0.001)
+    done = threading.Event()
+
+    def slow_endpoint():
+        sampler.begin('slow')
+        deadline = time.monotonic() + 5
+        while not sampler.endpoints().get('slow', 0) >= 3 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        sampler.end()
+        done.set()
+
+    thread = threading.Thread(target=slow_endpoint)
+    thread.start()
+    thread.join()
+    sampler.stop()
+
+    assert done.is_set()
+    assert set(sampler.endpoints()) == {'slow'}
+    stacks = dict(line.rsplit(' ', 1) for line in sampler.folded('slow').splitlines())
+    assert all('test_profiling.py:slow_endpoint' in stack for stack in stacks)
+    assert sum(int(count) for count in stacks.values()) >= 3
+    assert sampler.folded('other') is None
+
+    paths = sampler.dump(str(tmp_path / 'profiles'))
+    assert [os.path.basename(path) for path in paths] == ['slow.folded']
+
+def test_disabled_sampler_is_a_no_op():
+    """Test that a disabled sampler starts no thread."""
+    sampler = StackSampler(enabled=False)
+    sampler.begin('endpoint')
+    sampler.end()
+    assert sampler.metrics()['samples'] == 0
+    assert sampler._thread is None
@@ -0,0 +1,89 @@
+import os
+import re
+import sqlite3
+import pytest
+from flask import Flask
+from db.db import SqliteDB, squlite_db
+from routes.analytics import load as load_analytics
+from routes.habits import load as load_habits
+
+# Statements that read the whole (small) habits catalog or partitions registry, or load the leaderboards, on purpose
+FULL_SCAN_ALLOWED = re.compile(r'^(SELECT \* FROM habits ORDER BY id|SELECT name, starts_at, ends_at FROM habit_tracker_partitions ORDER BY starts_at DESC'
+                               r'|SELECT id, user_name, habit_id, current_streak, longest_streak FROM user_habits)$')
+
+@pytest.fixture
+def statements(monkeypatch):
+    """Record every SQL statement run on a pooled connection."""
+    recorded = []
+    acquire = squlite_db.pool.acquire
+    release = squlite_db.pool.release
+
+    def traced_acquire():
+        conn = acquire()
+        conn.set_trace_callback(recorded.append)
+        return conn
+
+    def traced_release(conn):
+        conn.set_trace_callback(None)
+        release(conn)
+
+    monkeypatch.setattr(squlite_db.pool, 'acquire', traced_acquire)
+    monkeypatch.setattr(squlite_db.pool, 'release', traced_release)
+    return recorded
+
+@pytest.fixture
+def client():
+    """Create an app with every route loaded on a freshly seeded database."""
+    app = Flask(__name__)
+    app.config.update({"TESTING": True})
+
+    with app.app_context():
+        with open(os.path.join(os.path.dirname(__file__), '../db/sql/schema.sql'), 'r') as f:
+            SqliteDB().cursor.executescript(f.read())
+        with open(os.path.join(os.path.dirname(__file__), '../db/sql/seed.sql'), 'r') as f:
+            SqliteDB().cursor.executescript(f.read())
+
+    load_analytics(app)
+    load_habits(app)
+    return app.test_client()
+
+def exercise_all_routes(client):
+    """Call every habit and analytics route once."""
+    client.get("/api/habits")
+    client.get("/api/habits/Read")
+    client.get("/api/habits/periodicity/DAILY")
+    client.post("/api/habits/create", json={'habit_name': 'Stretch', 'description': 'Stretch', 'periodicity': 'DAILY'})
+    client.post("/api/habits/track/Meditate", json={'username': 'Alice'})
+    client.post("/api/habits/check-off/Meditate", json={'username': 'Alice'})
+    client.post("/api/habits/check-off/Read", json={'username': 'Alice'})
+    client.post("/api/habits/check-off/Exercise", json={'username': 'Alice', 'event_id': 'query-plans'})
+    client.get("/api/habits/user/Alice/streaks/Read")
+    client.delete("/api/habits/untrack/Meditate", json={'username': 'Alice'})
+    client.get("/api/analytics/habits/tracking/Alice")
+    client.get("/api/analytics/user/Alice/longest-streak")
+    client.get("/api/analytics/user/Alice/longest-streak/Read")
+    client.get("/api/analytics/user/Alice/tracked-timestamps/Read")
+    client.get("/api/analytics/user/Alice/tracked-timestamps/Read?before=2024-07-10 09:00:00&limit=5")
+    client.get("/api/analytics/user/Alice/tracked-timestamps/Read?stream=1")
+    client.get("/api/analytics/user/Alice/summary")
+    client.get("/api/analytics/user/Alice/heatmap?start=2024-06-01&end=2024-07-14")
+    client.get("/api/analytics/user/Alice/heatmap/Read?start=2024-06-01&end=2024-07-14&bucket=week")
+    client.get("/api/analytics/leaderboard?metric=current")
+    client.get("/api/analytics/leaderboard/Read")
+    client.get("/api/analytics/user/Alice/rank/Read")
+
+def test_every_query_uses_an_index(client, statements):
+    """Test that no query of the habit and analytics routes scans a whole table."""
+    exercise_all_routes(client)
+
+    queries = {sql.strip() for sql in statements if re.match(r'^\s*(SELECT|UPDATE|DELETE)\b', sql, re.IGNORECASE)}
+    assert queries
+
+    connection = sqlite3.connect(os.getenv("DB_FILE_NAME"))
+    for sql in queries:
+        plan = [row[3] for row in connection.execute(f"EXPLAIN QUERY PLAN {sql}")]
+        table_scans = [detail for detail in plan if detail.startswith('SCAN ') and ' VIRTUAL TABLE' not in detail]
+        if FULL_SCAN_ALLOWED.match(' '.join(sql.split())):
+            continue
+        assert not table_scans, f"{sql} does not use an index: {plan}"
+    connection.close()
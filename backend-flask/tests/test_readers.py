@@ -0,0 +1,115 @@
+import os
+import sqlite3
+import pytest
+from flask import Flask
+from db.db import SqliteDB, squlite_db
+from db.readers import parse_read_routes, read_routing, snapshot_path
+from classes.analytics import Analytics
+from routes.admin import load as load_admin
+from routes.analytics import load as load_analytics
+from routes.habits import load as load_habits
+
+ADMIN_TOKEN = "test-admin-token"
+ADMIN_HEADERS = {"Authorization": f"Bearer {ADMIN_TOKEN}"}
+
+@pytest.fixture
+def app(tmp_path):
+    """Create an app with the analytics, habit and admin routes on a freshly seeded database."""
+    app = Flask(__name__)
+    app.config.update({"TESTING": True, "DATABASE": os.getenv("DB_FILE_NAME"), "ADMIN_TOKEN": ADMIN_TOKEN})
+
+    with app.app_context():
+        with open(os.path.join(os.path.dirname(__file__), '../db/sql/schema.sql'), 'r') as f:
+            SqliteDB().cursor.executescript(f.read())
+        with open(os.path.join(os.path.dirname(__file__), '../db/sql/seed.sql'), 'r') as f:
+            SqliteDB().cursor.executescript(f.read())
+
+    routes, snapshot_dir = dict(read_routing.routes), read_routing.snapshot_dir
+    read_routing.snapshot_dir = str(tmp_path)
+    load_analytics(app)
+    load_habits(app)
+    load_admin(app)
+    yield app
+
+    read_routing.close()
+    read_routing.configure(routes)
+    read_routing.snapshot_dir = snapshot_dir
+
+@pytest.fixture
+def client(app):
+    """A test client for the app."""
+    return app.test_client()
+
+def test_parse_read_routes():
+    """Test a mode for every query class, overrides per class, and unknown names."""
+    assert parse_read_routes('') == {'dashboard': 'replica', 'history': 'replica', 'stats': 'replica'}
+    assert parse_read_routes('primary') == {'dashboard': 'primary', 'history': 'primary', 'stats': 'primary'}
+    assert parse_read_routes('stats=snapshot, primary') == {'dashboard': 'primary', 'history': 'primary', 'stats': 'snapshot'}
+    with pytest.raises(ValueError):
+        parse_read_routes('dashboard=copy')
+    with pytest.raises(ValueError):
+        parse_read_routes('reports=replica')
+    assert snapshot_path('/data/habits.db') == '/data/habits.snapshot.db'
+    assert snapshot_path('/data/habits.db', '/tmp') == '/tmp/habits.snapshot.db'
+
+def test_replica_is_read_only(app):
+    """Test that analytics queries get read-only connections to the same file, outside of the writers' pool."""
+    read_routing.configure('replica')
+    with app.app_context():
+        reader = read_routing.db_for('Alice', 'history')
+        assert reader is not squlite_db
+        assert reader.pool.database == squlite_db.pool.database
+        with pytest.raises(sqlite3.OperationalError):
+            reader.cursor_for('tuple').execute("DELETE FROM user_habits")
+
+    read_routing.configure('primary')
+    assert read_routing.db_for('Alice', 'history') is squlite_db
+
+def test_check_offs_do_not_wait_on_dashboard_reads(client):
+    """Test that a check-off commits while every reader connection is checked out, in an open read transaction."""
+    read_routing.configure('replica')
+    reader = read_routing.db_for('Alice', 'dashboard')
+    held = [reader.pool.acquire() for _ in range(reader.pool.size)]
+    try:
+        for connection in held:
+            connection.execute("BEGIN")
+            connection.execute("SELECT COUNT(*) FROM habit_tracker").fetchone()
+
+        response = client.post("/api/habits/check-off/Read", json={'username': 'Alice'})
+        assert response.status_code == 200
+        assert reader.pool.metrics()['waits'] == 0
+    finally:
+        for connection in held:
+            reader.pool.release(connection)
+
+    summary = client.get("/api/analytics/user/Alice/summary").get_json()
+    assert summary['totals']['completions_7d'] == 1
+
+def test_snapshot_reads_lag_until_refreshed(client, tmp_path):
+    """Test that snapshot readers see the data of the last refresh."""
+    read_routing.configure('history=snapshot')
+    assert Analytics().get_tracked_timestamps('Alice', 1, limit=1).fetchall()[0][0] == '2024-07-13 09:00:00'
+    snapshot = read_routing.metrics()['readers'][0]
+    assert snapshot['path'] == str(tmp_path / 'test_db.snapshot.db')
+    assert snapshot['snapshot']['refreshes'] == 1
+
+    client.post("/api/habits/check-off/Read", json={'username': 'Alice'})
+    read_routing.release_thread_connections()
+    assert Analytics().get_tracked_timestamps('Alice', 1, limit=1).fetchall()[0][0] == '2024-07-13 09:00:00'
+
+    # Dashboards are still on the replica, which is up to date
+    assert Analytics().get_user_summary('Alice')['totals']['completions_7d'] == 1
+
+    assert read_routing.refresh_snapshots() == 1
+    assert Analytics().get_tracked_timestamps('Alice', 1, limit=1).fetchall()[0][0] != '2024-07-13 09:00:00'
+    read_routing.release_thread_connections()
+
+def test_readers_stats(client):
+    """Test that the admin route lists the routes and the readers of this worker."""
+    read_routing.configure('replica,stats=primary')
+    client.get("/api/analytics/habits/stats")
+    client.get("/api/analytics/user/Alice/summary")
+    data = client.get("/api/admin/readers", headers=ADMIN_HEADERS).get_json()['data']
+    assert data['routes'] == {'dashboard': 'replica', 'history': 'replica', 'stats': 'primary'}
+    assert [(reader['mode'], reader['snapshot']) for reader in data['readers']] == [('replica', None)]
+    assert data['readers'][0]['pool']['in_use'] == 0
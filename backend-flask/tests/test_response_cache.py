@@ -0,0 +1,170 @@
+import os
+import sqlite3
+import pytest
+from flask import Flask
+from db.db import SqliteDB, squlite_db
+from classes.analytics import Analytics
+from classes.response_cache import ResponseCache, response_cache, user_scope
+from routes.admin import load as load_admin
+from routes.analytics import load as load_analytics
+from routes.habits import load as load_habits
+
+ADMIN_TOKEN = "test-admin-token"
+ADMIN_HEADERS = {"Authorization": f"Bearer {ADMIN_TOKEN}"}
+
+@pytest.fixture
+def client():
+    """A test client of an app with the habit, analytics and admin routes on a freshly seeded database."""
+    app = Flask(__name__)
+    app.config.update({"TESTING": True, "DATABASE": os.getenv("DB_FILE_NAME"), "ADMIN_TOKEN": ADMIN_TOKEN})
+
+    with app.app_context():
+        with open(os.path.join(os.path.dirname(__file__), '../db/sql/schema.sql'), 'r') as f:
+            SqliteDB().cursor.executescript(f.read())
+        with open(os.path.join(os.path.dirname(__file__), '../db/sql/seed.sql'), 'r') as f:
+            SqliteDB().cursor.executescript(f.read())
+
+    load_habits(app)
+    load_analytics(app)
+    load_admin(app)
+    return app.test_client()
+
+def test_etag_and_not_modified(client, monkeypatch):
+    """Test that bodies are served from the cache and a request with the current ETag gets a 304 without running the route."""
+    first = client.get("/api/analytics/user/Alice/summary")
+    assert first.status_code == 200
+    assert first.headers['X-Cache'] == 'MISS'
+    assert first.headers['Cache-Control'] == 'no-cache'
+    etag = first.headers['ETag']
+
+    def fail(self, user_name):
+        raise AssertionError('the summary was computed again')
+    monkeypatch.setattr(Analytics, 'get_user_summary', fail)
+
+    second = client.get("/api/analytics/user/Alice/summary")
+    assert second.headers['X-Cache'] == 'HIT'
+    assert (second.headers['ETag'], second.get_json()) == (etag, first.get_json())
+
+    response = client.get("/api/analytics/user/Alice/summary", headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response_cache.metrics()['not_modified'] >= 1
+
+def test_writes_change_the_etags_of_their_scope(client, monkeypatch):
+    """Test that a check-off changes the ETags of its user, and creating a habit those of the catalog, right away."""
+    monkeypatch.setattr(response_cache, 'check_interval', 60)
+    alice = client.get("/api/analytics/user/Alice/summary").headers['ETag']
+    bob = client.get("/api/analytics/user/Bob/summary").headers['ETag']
+    habits = client.get("/api/habits").headers['ETag']
+
+    client.post("/api/habits/check-off/Read", json={'username': 'Alice'})
+    response = client.get("/api/analytics/user/Alice/summary", headers={'If-None-Match': alice})
+    assert response.status_code == 200 and response.headers['ETag'] != alice
+    assert client.get("/api/analytics/user/Bob/summary", headers={'If-None-Match': bob}).status_code == 304
+    assert client.get("/api/habits", headers={'If-None-Match': habits}).status_code == 304
+
+    client.post("/api/habits/create", json={'habit_name': 'Stretch', 'description': 'Stretch', 'periodicity': 'DAILY'})
+    response = client.get("/api/habits", headers={'If-None-Match': habits})
+    assert response.status_code == 200
+    assert 'Stretch' in [habit['name'] for habit in response.get_json()['habits']]
+
+def test_other_writers_change_the_etags(client):
+    """Test that writes of another process are seen through the user versions."""
+    etag = client.get("/api/analytics/user/Bob/longest-streak").headers['ETag']
+    assert client.get("/api/analytics/user/Bob/longest-streak", headers={'If-None-Match': etag}).status_code == 304
+
+    connection = sqlite3.connect(os.getenv("DB_FILE_NAME"))
+    connection.execute("UPDATE user_habits SET longest_streak = 9 WHERE user_name = 'Bob'")
+    connection.commit()
+    connection.close()
+
+    response = client.get("/api/analytics/user/Bob/longest-streak", headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['X-Cache'] == 'MISS'
+
+def test_errors_are_not_cached(client):
+    """Test that error responses get no ETag."""
+    response = client.get("/api/habits/Unknown")
+    assert response.status_code == 404
+    assert 'ETag' not in response.headers
+
+def test_eviction_and_expiry(client):
+    """Test that the least recently used bodies are evicted beyond the size bound, and bodies expire after the TTL."""
+    cache = ResponseCache(squlite_db, max_bytes=10, ttl=60, check_interval=0)
+    cache.put('a', 'etag-a', b'aaaa')
+    cache.put('b', 'etag-b', b'bbbb')
+    assert cache.get('a', 'etag-a') == b'aaaa'
+    cache.put('c', 'etag-c', b'cccc')
+    assert cache.get('b', 'etag-b') is None
+    assert cache.get('a', 'etag-a') == b'aaaa'
+    assert cache.get('a', 'stale-etag') is None
+    metrics = cache.metrics()
+    assert (metrics['entries'], metrics['bytes'], metrics['evictions']) == (2, 8, 1)
+
+    cache.ttl = 0
+    cache.put('d', 'etag-d', b'dd')
+    assert cache.get('d', 'etag-d') is None
+    assert cache.metrics()['expirations'] == 1
+
+def test_user_versions_are_bounded(client):
+    """Test that the versions of the least recently used users are evicted beyond the bound, and read again when needed."""
+    cache = ResponseCache(squlite_db, max_users=2, check_interval=60)
+    etags = {user_name: cache.etag('summary', (user_scope(user_name),)) for user_name in ('Alice', 'Bob')}
+    cache.etag('summary', (user_scope('Alice'),))
+    cache.etag('summary', (user_scope('Carol'),))
+    metrics = cache.metrics()
+    assert (metrics['users'], metrics['user_evictions'], metrics['user_version_loads']) == (2, 1, 3)
+
+    # Bob was evicted, his version is read again
+    assert cache.etag('summary', (user_scope('Bob'),)) == etags['Bob']
+    cache.etag('summary', (user_scope('Carol'),))
+    assert cache.metrics()['user_version_loads'] == 4
+
+def test_admin_cache_stats(client):
+    """Test the cache stats of the admin endpoint, and clearing the response cache."""
+    client.get("/api/habits")
+    client.get("/api/habits")
+    data = client.get("/api/admin/cache", headers=ADMIN_HEADERS).get_json()['data']
+    assert {'responses', 'catalog', 'partitions', 'leaderboard'} <= set(data)
+    assert data['responses']['hits'] >= 1
+    assert data['responses']['entries'] >= 1
+
+    assert client.delete("/api/admin/cache", headers=ADMIN_HEADERS).status_code == 200
+    assert client.get("/api/admin/cache", headers=ADMIN_HEADERS).get_json()['data']['responses']['entries'] == 0
+
+def test_admin_routes_need_the_token(client):
+    """Test that the admin routes refuse requests without the admin token, and are not registered without one."""
+    assert client.get("/api/admin/cache").status_code == 401
+    assert client.delete("/api/admin/cache", headers={"Authorization": "Bearer wrong"}).status_code == 401
+
+    app = Flask(__name__)
+    load_admin(app)
+    assert app.test_client().get("/api/admin/cache", headers=ADMIN_HEADERS).status_code == 404
+
+def test_versions_are_read_without_the_lock(client):
+    """Test that the version queries run without holding the cache's lock, so other lookups don't wait on SQLite."""
+    class LockCheckingDB:
+        def cursor_for(self, row_factory):
+            assert not cache._lock.locked()
+            return squlite_db.cursor_for(row_factory)
+
+    cache = ResponseCache(LockCheckingDB(), check_interval=0)
+    first = cache.etag('summary', ('catalog', user_scope('Alice')))
+    assert cache.etag('summary', ('catalog', user_scope('Alice'))) == first
+    assert cache.metrics()['version_checks'] == 2
+
+def test_streams_are_only_validated(client):
+    """Test that streamed timestamps get an ETag and 304 answers, but their bodies never go through the cache."""
+    response_cache.clear()
+    before = response_cache.metrics()
+    url = "/api/analytics/user/Alice/tracked-timestamps/Read?stream=1"
+
+    first = client.get(url)
+    assert first.status_code == 200
+    assert first.is_streamed
+    assert 'X-Cache' not in first.headers
+    assert client.get(url, headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    metrics = response_cache.metrics()
+    assert metrics['entries'] == 0
+    assert (metrics['hits'], metrics['misses'], metrics['stores']) == (before['hits'], before['misses'], before['stores'])
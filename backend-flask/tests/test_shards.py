@@ -0,0 +1,180 @@
+import os
+import sqlite3
+import pytest
+from flask import Flask
+from db.db import SqliteDB, squlite_db
+from db.shards import ShardRouter, shard_router
+from classes.catalog import habit_catalog, replicate_catalog
+from classes.check_off_events import recent_check_offs
+from classes.habits import Habit
+from classes.leaderboard import leaderboard
+from classes.rebalance import misplaced_users, rebalance
+from classes.response_cache import response_cache
+from routes.analytics import load as load_analytics
+from routes.habits import load as load_habits
+
+SQL_DIR = os.path.join(os.path.dirname(__file__), '../db/sql')
+
+def load_sql(connection, file_name):
+    with open(os.path.join(SQL_DIR, file_name), 'r') as f:
+        connection.executescript(f.read())
+
+@pytest.fixture
+def shard_files(tmp_path):
+    """Two more shards with the schema loaded, after a freshly seeded primary database."""
+    with Flask(__name__).app_context():
+        load_sql(SqliteDB().cursor, 'schema.sql')
+        load_sql(SqliteDB().cursor, 'seed.sql')
+
+    paths = [str(tmp_path / f'shard_{index}.db') for index in (1, 2)]
+    for path in paths:
+        connection = sqlite3.connect(path)
+        load_sql(connection, 'schema.sql')
+        connection.close()
+    yield paths
+
+    shard_router.use_shards([])
+    leaderboard.invalidate()
+    response_cache.clear()
+
+@pytest.fixture
+def client(shard_files):
+    """A test client for an app over the three shards, with the seeded users moved to their shard."""
+    shard_router.use_shards(shard_files)
+    rebalance(shard_router)
+    squlite_db.release_thread_connection()
+    leaderboard.invalidate()
+    response_cache.clear()
+
+    app = Flask(__name__)
+    app.config.update({"TESTING": True})
+    load_analytics(app)
+    load_habits(app)
+    return app.test_client()
+
+def rows(path, query, params=()):
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute(query, params).fetchall()
+    finally:
+        connection.close()
+
+def test_routing_is_stable_and_moves_few_users():
+    """Test that users keep their shard, and that adding a shard only moves users onto it."""
+    router = ShardRouter(squlite_db, [])
+    assert not router.sharded
+    assert router.shard_index('Alice') == 0
+    assert router.db_for(None) is squlite_db
+
+    users = [f'user{index}' for index in range(2000)]
+    three = ShardRouter(squlite_db, ['three_1.db', 'three_2.db'])
+    four = ShardRouter(squlite_db, ['three_1.db', 'three_2.db', 'three_3.db'])
+    try:
+        before = [three.shard_index(user) for user in users]
+        assert before == [three.shard_index(user) for user in users]
+        assert all(count > 500 for count in (before.count(0), before.count(1), before.count(2)))
+
+        moved = [(old, four.shard_index(user)) for user, old in zip(users, before) if four.shard_index(user) != old]
+        assert all(new == 3 for _, new in moved)
+        assert 300 < len(moved) < 700
+    finally:
+        three.use_shards([])
+        four.use_shards([])
+
+def test_fan_out_runs_on_every_shard(shard_files):
+    """Test that fan_out queries every shard, each on a connection of its own pool."""
+    shard_router.use_shards(shard_files)
+    databases = shard_router.fan_out(lambda index, db, connection: (index, db.pool.database))
+    assert databases == [(0, squlite_db.pool.database), (1, shard_files[0]), (2, shard_files[1])]
+    assert all(shard['pool']['in_use'] == 0 for shard in shard_router.metrics()[1:])
+
+def test_replicate_catalog(shard_files):
+    """Test that every shard gets the primary's habits with the same IDs."""
+    shard_router.use_shards(shard_files)
+    assert replicate_catalog(shard_router) == 5
+    primary = rows(squlite_db.pool.database, "SELECT id, name, periodicity FROM habits ORDER BY id")
+    for path in shard_files:
+        assert rows(path, "SELECT id, name, periodicity FROM habits ORDER BY id") == primary
+
+    # Unchanged habits are not rewritten
+    version = rows(shard_files[0], "SELECT version FROM data_versions WHERE scope = 'catalog'")
+    replicate_catalog(shard_router)
+    assert rows(shard_files[0], "SELECT version FROM data_versions WHERE scope = 'catalog'") == version
+
+def test_rebalance_moves_users_to_their_shard(shard_files):
+    """Test that rebalancing moves each user's habits, completions and timezone off the primary."""
+    primary = squlite_db.pool.database
+    con = sqlite3.connect(primary)
+    con.execute("INSERT INTO user_timezones (user_name, timezone) VALUES ('Alice', 'Europe/Berlin')")
+    con.commit()
+    con.close()
+    completions = {user: rows(primary, "SELECT COUNT(*) FROM habit_tracker JOIN user_habits ON user_habits.id = user_habit_id WHERE user_name = ?", (user,))[0][0]
+                   for user in ('Alice', 'Bob')}
+
+    shard_router.use_shards(shard_files)
+    assert misplaced_users(shard_router) == [('Alice', 0, 2), ('Bob', 0, 1)]
+    assert [move[:3] for move in rebalance(shard_router, dry_run=True)] == [('Alice', 0, 2), ('Bob', 0, 1)]
+    assert rows(shard_files[0], "SELECT COUNT(*) FROM habits") == [(0,)]
+
+    moves = rebalance(shard_router)
+    squlite_db.release_thread_connection()
+    assert [(user, moved['completions']) for user, _, _, moved in moves] == [('Alice', completions['Alice']), ('Bob', completions['Bob'])]
+    assert misplaced_users(shard_router) == []
+    assert rows(primary, "SELECT COUNT(*) FROM user_habits") == [(0,)]
+    assert rows(primary, "SELECT COUNT(*) FROM habit_tracker") == [(0,)]
+    assert rows(shard_files[1], "SELECT user_name, timezone FROM user_timezones") == [('Alice', 'Europe/Berlin')]
+    assert rows(shard_files[0], "SELECT DISTINCT user_name FROM user_habits") == [('Bob',)]
+    assert rows(shard_files[0], "SELECT SUM(completion_count) FROM user_habit_stats") == [(completions['Bob'],)]
+
+    # Moving again finds nothing to do
+    assert rebalance(shard_router) == []
+
+def test_rebalance_keeps_check_off_event_ids(shard_files):
+    """Test that a check-off retried after its user was moved to another shard is still a duplicate."""
+    recent_check_offs.clear()
+    with Flask(__name__).app_context():
+        first = Habit('Alice').check_off_habit('Read', event_id='moved-1')
+
+    shard_router.use_shards(shard_files)
+    rebalance(shard_router)
+    squlite_db.release_thread_connection()
+    recent_check_offs.clear()
+
+    with Flask(__name__).app_context():
+        assert Habit('Alice').check_off_habit('Read', event_id='moved-1') == dict(first, duplicate=True)
+    assert rows(shard_files[1], "SELECT event_current_streak, event_longest_streak FROM habit_tracker WHERE event_id = 'moved-1'") == [
+        (first['current_streak'], first['longest_streak'])]
+
+def test_sharded_routes(client, shard_files):
+    """Test that check-offs go to the user's shard and that leaderboards and stats span every shard."""
+    response = client.post("/api/habits/check-off/Exercise", json={'username': 'Bob'})
+    assert response.status_code == 200
+    assert rows(shard_files[0], "SELECT COUNT(*) FROM habit_tracker WHERE completed_at >= date('now')") == [(1,)]
+    assert rows(shard_files[1], "SELECT COUNT(*) FROM habit_tracker WHERE completed_at >= date('now')") == [(0,)]
+
+    entries = client.get("/api/analytics/leaderboard?limit=3").get_json()['data']['entries']
+    assert [(entry['rank'], entry['user_name'], entry['streak']) for entry in entries] == [(1, 'Alice', 8), (2, 'Bob', 5), (3, 'Alice', 3)]
+    # The check-off broke Bob's weekly streak, ties of both shards share a rank
+    entries = client.get("/api/analytics/leaderboard?metric=current&limit=4").get_json()['data']['entries']
+    assert [(entry['rank'], entry['user_name'], entry['streak']) for entry in entries] == [(1, 'Alice', 4), (2, 'Alice', 3), (2, 'Bob', 3), (4, 'Bob', 1)]
+    rank = client.get("/api/analytics/user/Bob/rank").get_json()['data']
+    assert (rank['rank'], rank['ranked'], rank['habit'], rank['streak']) == (2, 5, 'Exercise', 5)
+
+    stats = {habit['habit']: habit for habit in client.get("/api/analytics/habits/stats").get_json()['data']['habits']}
+    assert stats['Exercise']['tracked_by'] == 2
+    assert stats['Read']['tracked_by'] == 1
+    assert client.get("/api/analytics/habits/stats").get_json()['data']['shards'] == 3
+
+    summary = client.get("/api/analytics/user/Alice/summary").get_json()
+    assert summary['totals']['tracked_habits'] == 2
+
+def test_created_habit_reaches_every_shard(client, shard_files):
+    """Test that a new habit is replicated with the same ID and can be tracked by users of any shard."""
+    response = client.post("/api/habits/create", json={'habit_name': 'Stretch', 'description': 'Stretch a bit', 'periodicity': 'DAILY'})
+    assert response.status_code == 201
+    habit_id = habit_catalog.by_name('Stretch')['id']
+    for path in shard_files:
+        assert rows(path, "SELECT id FROM habits WHERE name = 'Stretch'") == [(habit_id,)]
+
+    assert client.post("/api/habits/track/Stretch", json={'username': 'Alice'}).status_code == 200
+    assert rows(shard_files[1], "SELECT COUNT(*) FROM user_habits WHERE habit_id = ?", (habit_id,)) == [(1,)]
@@ -0,0 +1,93 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import pytest
+from db.db import ConnectionPool, inherited_connections, squlite_db
+
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), '..')
+
+@pytest.fixture
+def restore_database():
+    """Points the process back at the test database once the test is done, so the next test can create its own app."""
+    import app
+    database = squlite_db.pool.database
+    yield
+    app._database = None
+    app.use_database(database)
+
+def test_import_does_not_touch_the_database(tmp_path):
+    """Test that importing the app module builds no app and opens no connection, so it can be preloaded before forking workers."""
+    db_file_path = str(tmp_path / 'untouched.db')
+    env = dict(os.environ, DB_FILE_NAME=db_file_path)
+    script = "import app; assert 'app' not in vars(app); assert app.app is app.app"
+    result = subprocess.run([sys.executable, '-c', script], cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert not os.path.exists(db_file_path)
+
+def test_create_app_with_database_and_warm_up(restore_database, tmp_path):
+    """Test that create_app serves the configured database, with its connections opened and caches loaded by the warm-up."""
+    from app import create_app
+    db_file_path = str(tmp_path / 'app.db')
+    connection = sqlite3.connect(db_file_path)
+    for file_name in ('schema.sql', 'seed.sql'):
+        with open(os.path.join(BACKEND_DIR, 'db', 'sql', file_name), 'r') as f:
+            connection.executescript(f.read())
+    connection.close()
+
+    app = create_app({'TESTING': True, 'DATABASE': db_file_path, 'SCHEMA_CHECK': True, 'WARM_UP': True, 'WARM_UP_CONNECTIONS': 2})
+    assert squlite_db.pool.database == db_file_path
+    assert squlite_db.pool.metrics()['idle'] == 2
+
+    response = app.test_client().get("/api/habits/Read")
+    assert response.status_code == 200
+    assert response.get_json()['habit']['name'] == 'Read'
+
+def test_schema_check_rejects_an_unmigrated_database(restore_database, tmp_path):
+    """Test that the schema check refuses a database missing migrations."""
+    from app import create_app
+    db_file_path = str(tmp_path / 'old.db')
+    sqlite3.connect(db_file_path).close()
+
+    with pytest.raises(RuntimeError, match='migrate'):
+        create_app({'TESTING': True, 'DATABASE': db_file_path, 'SCHEMA_CHECK': True})
+
+def test_second_app_cannot_serve_another_database(restore_database, tmp_path):
+    """Test that a second app of the process can't point the shared pools and caches at another database."""
+    from app import create_app
+    database = squlite_db.pool.database
+    app = create_app({'TESTING': True, 'DATABASE': database})
+
+    with pytest.raises(RuntimeError, match='one app per process'):
+        create_app({'TESTING': True, 'DATABASE': str(tmp_path / 'other.db')})
+
+    assert squlite_db.pool.database == database
+    assert app.test_client().get("/api/habits/Read").status_code == 200
+    assert create_app({'TESTING': True}).test_client().get("/api/habits/Read").status_code == 200
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs os.fork')
+def test_forked_process_opens_its_own_connections(tmp_path):
+    """Test that a forked process never reuses the connections of its parent."""
+    pool = ConnectionPool(str(tmp_path / 'fork.db'), size=2)
+    parent_connection = pool.acquire()
+    pool.release(parent_connection)
+
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            connection = pool.acquire()
+            reused = connection is parent_connection
+            kept = any(inherited is parent_connection for inherited in inherited_connections)
+            connection.execute("SELECT 1").fetchone()
+            os.write(write_end, f"{int(reused)}{int(kept)}{pool.metrics()['misses']}".encode())
+        finally:
+            os._exit(0)
+    os.close(write_end)
+    result = os.read(read_end, 16).decode()
+    os.waitpid(pid, 0)
+    os.close(read_end)
+
+    assert result == '011'
+    # The parent still uses its own connection
+    assert pool.acquire() is parent_connection
@@ -0,0 +1,74 @@
+import os
+import random
+import sqlite3
+import numpy as np
+import pytest
+from classes.streaks import streaks_from_keys
+from classes.streak_engine import compute_streaks, recompute_streaks
+
+@pytest.fixture
+def connection(tmp_path):
+    """Create a seeded database."""
+    connection = sqlite3.connect(str(tmp_path / 'streaks.db'))
+    with open(os.path.join(os.path.dirname(__file__), '../db/sql/schema.sql'), 'r') as f:
+        connection.executescript(f.read())
+    with open(os.path.join(os.path.dirname(__file__), '../db/sql/seed.sql'), 'r') as f:
+        connection.executescript(f.read())
+    yield connection
+    connection.close()
+
+def streaks_by_user_habit(connection):
+    return {row[0]: (row[1], row[2]) for row in connection.execute("SELECT id, current_streak, longest_streak FROM user_habits")}
+
+def test_compute_streaks_matches_check_off_rules():
+    """Test that the vectorized streaks match the one-completion-at-a-time rules."""
+    generator = random.Random(0)
+    history = {user_habit_id: sorted(generator.sample(range(200), generator.randint(1, 120))) for user_habit_id in range(1, 50)}
+    ids = np.repeat(np.array(list(history.keys())), [len(keys) for keys in history.values()])
+    keys = np.concatenate([np.array(keys) for keys in history.values()])
+    # Every period is completed twice, which must count once
+    ids, keys = np.repeat(ids, 2), np.repeat(keys, 2)
+
+    group_ids, current, longest = compute_streaks(ids, keys)
+
+    assert list(group_ids) == list(history.keys())
+    for user_habit_id, group_current, group_longest in zip(group_ids, current, longest):
+        assert (group_current, group_longest) == streaks_from_keys(history[user_habit_id])
+
+def test_recompute_streaks_fixes_drifted_streaks(connection):
+    """Test that recomputing the seeded history fixes the streaks that don't match it."""
+    connection.execute("UPDATE user_habits SET current_streak = 40, longest_streak = 40 WHERE id = 1")
+    connection.commit()
+
+    result = recompute_streaks(connection, chunk_size=3)
+
+    assert result['tracker_rows'] == 26
+    assert streaks_by_user_habit(connection) == {
+        1: (4, 8),  # Alice's Read
+        2: (3, 3),  # Alice's Exercise
+        3: (5, 5),  # Bob's Exercise
+        4: (2, 3),  # Bob's Park Walk
+        5: (1, 1),  # Bob's Journal
+    }
+    assert recompute_streaks(connection)['updated'] == 0
+
+def test_recompute_streaks_of_some_user_habits(connection):
+    """Test recomputing only some user habits."""
+    connection.execute("UPDATE user_habits SET current_streak = 40")
+    connection.commit()
+
+    result = recompute_streaks(connection, user_habit_ids=[1, 2])
+
+    assert result == {'user_habits': 2, 'tracker_rows': 15, 'updated': 2}
+    assert streaks_by_user_habit(connection)[3] == (40, 5)
+
+def test_recompute_streaks_skips_completions_without_day_key(connection):
+    """Test that a completion without a day key is left out instead of shifting the other completions."""
+    connection.execute("UPDATE habit_tracker SET day_key = NULL WHERE id = (SELECT MIN(id) FROM habit_tracker WHERE user_habit_id = 3)")
+    connection.commit()
+
+    result = recompute_streaks(connection)
+
+    assert result['tracker_rows'] == 25
+    assert streaks_by_user_habit(connection)[1] == (4, 8)
+    assert streaks_by_user_habit(connection)[4] == (2, 3)
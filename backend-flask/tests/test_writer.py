@@ -0,0 +1,173 @@
+import datetime
+import os
+import sqlite3
+import threading
+import pytest
+from flask import Flask
+from db.db import ConnectionPool, SqliteDB
+from db.writer import WriteCoordinator, write_coordinator
+from classes.habits import Habit
+from routes.habits import load as load_habits
+
+class PoolDB:
+    """The part of SqliteDB the write coordinator uses."""
+    def __init__(self, pool):
+        self.pool = pool
+
+@pytest.fixture
+def coordinator(tmp_path):
+    """A write coordinator on a temporary database with a table to write to."""
+    db_file_path = str(tmp_path / 'writer.db')
+    connection = sqlite3.connect(db_file_path)
+    connection.execute("CREATE TABLE t (x INTEGER UNIQUE)")
+    connection.commit()
+    connection.close()
+
+    coordinator = WriteCoordinator(PoolDB(ConnectionPool(db_file_path, size=2, busy_timeout=50)),
+                                   enabled=True, batch_size=50, max_latency=0.05)
+    coordinator.db_file_path = db_file_path
+    yield coordinator
+    coordinator.stop()
+
+def insert(value):
+    def operation(con):
+        con.execute("INSERT INTO t VALUES (?)", (value,))
+        return value
+    return operation
+
+def count_rows(db_file_path):
+    connection = sqlite3.connect(db_file_path)
+    count = connection.execute("SELECT COUNT(*) FROM t").fetchone()[0]
+    connection.close()
+    return count
+
+def test_operations_are_group_committed(coordinator):
+    """Test that queued operations are committed together and each caller gets its own result."""
+    futures = [coordinator.submit(insert(value)) for value in range(20)]
+    assert [future.result(5) for future in futures] == list(range(20))
+    assert count_rows(coordinator.db_file_path) == 20
+
+    metrics = coordinator.metrics()
+    assert metrics['operations'] == 20
+    assert metrics['batches'] < 20
+    assert metrics['max_batch_size'] > 1
+    assert metrics['max_queue_depth'] >= 1
+    assert metrics['queue_depth'] == 0
+
+def test_failing_operation_is_rolled_back_alone(coordinator):
+    """Test that an operation that raises doesn't undo the rest of its batch."""
+    def fail(con):
+        con.execute("INSERT INTO t VALUES (100)")
+        raise ValueError('bad operation')
+
+    futures = [coordinator.submit(insert(1)), coordinator.submit(fail), coordinator.submit(insert(1)), coordinator.submit(insert(2))]
+    assert futures[0].result(5) == 1
+    with pytest.raises(ValueError):
+        futures[1].result(5)
+    with pytest.raises(sqlite3.IntegrityError):
+        futures[2].result(5)
+    assert futures[3].result(5) == 2
+    assert count_rows(coordinator.db_file_path) == 2
+    assert coordinator.metrics()['failed_operations'] == 2
+
+def test_batch_fails_when_database_stays_locked(coordinator):
+    """Test that every caller of a batch gets the error when the batch can't take the write lock."""
+    # The writer thread opens its connection with the first operation
+    assert coordinator.execute(insert(0), timeout=5) == 0
+    locker = sqlite3.connect(coordinator.db_file_path)
+    locker.execute("BEGIN IMMEDIATE")
+    futures = [coordinator.submit(insert(value)) for value in range(1, 4)]
+    for future in futures:
+        with pytest.raises(sqlite3.OperationalError):
+            future.result(5)
+    locker.rollback()
+    locker.close()
+
+    assert coordinator.execute(insert(7), timeout=5) == 7
+    assert coordinator.metrics()['failed_batches'] >= 1
+
+def test_writes_go_through_while_the_pool_is_exhausted(coordinator):
+    """Test that the writer thread doesn't need a pool slot, as callers may hold all of them while they wait."""
+    held = [coordinator.db.pool.acquire() for _ in range(coordinator.db.pool.size)]
+    try:
+        assert coordinator.execute(insert(1), timeout=5) == 1
+    finally:
+        for connection in held:
+            coordinator.db.pool.release(connection)
+
+@pytest.fixture
+def app():
+    """Create an app with the habit routes on a freshly seeded database."""
+    app = Flask(__name__)
+    app.config.update({"TESTING": True, "DATABASE": os.getenv("DB_FILE_NAME")})
+
+    with app.app_context():
+        with open(os.path.join(os.path.dirname(__file__), '../db/sql/schema.sql'), 'r') as f:
+            SqliteDB().cursor.executescript(f.read())
+        with open(os.path.join(os.path.dirname(__file__), '../db/sql/seed.sql'), 'r') as f:
+            SqliteDB().cursor.executescript(f.read())
+
+    load_habits(app)
+    return app
+
+def test_habit_writes_go_through_the_coordinator(app, monkeypatch):
+    """Test that concurrent Habit writes are applied by the write coordinator with the same results."""
+    monkeypatch.setattr(write_coordinator, 'enabled', True)
+    monkeypatch.setattr(write_coordinator, 'max_latency', 0.02)
+    operations_before = write_coordinator.metrics()['operations']
+    client = app.test_client()
+
+    user_names = [f'writer{i}' for i in range(10)]
+    responses = []
+
+    def user_session(user_name):
+        responses.append(client.post("/api/habits/track/Read", json={'username': user_name}).status_code)
+        responses.append(client.post("/api/habits/check-off/Read", json={'username': user_name}).status_code)
+        responses.append(client.post("/api/habits/check-off/Read", json={'username': user_name}).status_code)
+
+    threads = [threading.Thread(target=user_session, args=(user_name,)) for user_name in user_names]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    write_coordinator.stop()
+
+    assert sorted(responses) == [200] * 20 + [400] * 10
+    for user_name in user_names:
+        assert client.get(f"/api/habits/user/{user_name}/streaks/Read").get_json()['current_streak'] == 1
+
+    with app.app_context():
+        assert Habit('Bob').untrack_habit('Exercise') is None
+        assert Habit('Bob').untrack_habit('Exercise')['code'] == 404
+        assert Habit().create_habit('Stretch', 'Stretch', 'DAILY') == {"message": "Habit Created"}
+        results = Habit().check_off_many([('Alice', 'Read', datetime.datetime(2024, 7, 14, 9, 0, 0))])
+        assert results[0]['current_streak'] == 5
+    write_coordinator.stop()
+    assert write_coordinator.metrics()['operations'] - operations_before == 34
+
+def test_batch_check_offs_leave_no_pool_slot_in_use(app, monkeypatch):
+    """Test that the operations of the writer thread don't check out pooled connections they never return."""
+    monkeypatch.setattr(write_coordinator, 'enabled', True)
+    write_coordinator.stop()
+    client = app.test_client()
+    response = client.post("/api/habits/check-off/batch", json={'events': [
+        {'username': 'Alice', 'habit_name': 'Read', 'completed_at': '2024-07-14 09:00:00'},
+        {'username': 'Bob', 'habit_name': 'NonExistentHabit', 'completed_at': '2024-07-14 09:00:00'},
+    ]})
+    assert response.get_json()['checked_off'] == 1
+    response = client.post("/api/habits/check-off/Read", json={'username': 'Alice', 'event_id': 'phone-1'})
+    assert response.status_code == 200
+    write_coordinator.stop()
+    assert write_coordinator.db.pool.metrics()['in_use'] == 0
+
+def test_writer_that_cannot_connect_fails_its_callers(coordinator, monkeypatch):
+    """Test that a writer connection that can't be opened fails the calls instead of leaving them waiting."""
+    def connect():
+        raise sqlite3.OperationalError("unable to open database file")
+    monkeypatch.setattr(coordinator.db.pool, 'connect', connect)
+    for value in (1, 2):
+        with pytest.raises(sqlite3.OperationalError):
+            coordinator.execute(insert(value), timeout=5)
+
+    monkeypatch.undo()
+    assert coordinator.execute(insert(3), timeout=5) == 3